@@ -1,3 +1,7 @@
+# Monkey patching do modo gevent/eventlet: precisa vir antes dos demais imports
+from modo_assincrono import preparar_modo_assincrono, validar_modo_assincrono
+preparar_modo_assincrono()
+
 import os
 from flask import Flask, session, request, redirect, url_for
 from config import get_config
@@ -5,6 +9,7 @@ from flask_login import LoginManager
 from database import db, seed_unidades, User, Chamado, Unidade, ProblemaReportado, ItemInternet, HistoricoTicket, Configuracao
 from setores.ti.routes import ti_bp
 from auth.routes import auth_bp
+from auth.cache_usuarios import carregar_usuario, iniciar_gravacao_acessos
 from principal.routes import main_bp
 from setores.compras.compras import compras_bp
 from setores.financeiro.routes import financeiro_bp
@@ -13,13 +18,14 @@ from setores.marketing.routes import marketing
 from setores.produtos.routes import produtos
 from setores.comercial.routes import comercial
 from setores.outros.routes import outros_bp
-from flask_login import LoginManager, login_required
+from flask_login import LoginManager, login_required, current_user
 from datetime import timedelta, datetime
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 import json
 
 # IMPORTAÇ��ES DE SEGURANÇA
 from security.middleware import SecurityMiddleware
+from security.audit_logger import AuditLogger
 from security.session_security import SessionSecurity
 from security.security_config import SecurityConfig
 
@@ -38,20 +44,29 @@ app.config.from_object(get_config())
 app.config.from_object(SecurityConfig)
 
 # Configuração do Socket.IO
+from setores.ti.tempo_real import opcoes_fila_mensagens, entrar_nas_salas, iniciar_tempo_real, SALA_ADMIN
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
     logger=False,
     engineio_logger=False,
-    async_mode='threading',
+    async_mode=validar_modo_assincrono(app.config['SOCKETIO_ASYNC_MODE']),
     ping_timeout=60,
     ping_interval=25,
-    transports=['polling', 'websocket']
+    transports=['polling', 'websocket'],
+    **opcoes_fila_mensagens(app.config.get('SOCKETIO_MESSAGE_QUEUE'))
 )
 
 # INICIALIZAR MIDDLEWARE DE SEGURANÇA
 security_middleware = SecurityMiddleware(app)
 session_security = SessionSecurity()
+audit_logger = AuditLogger()
+
+@app.after_request
+def registrar_auditoria(response):
+    """Enfileira o registro de auditoria da requisição (gravado em segundo plano)"""
+    audit_logger.log_request(request, response)
+    return response
 
 # Configura o LoginManager
 login_manager = LoginManager()
@@ -86,37 +101,22 @@ def add_missing_structures():
             except Exception as e2:
                 print(f"❌ Erro ao recriar tabelas: {str(e2)}")
 
-        # Adicionar colunas faltantes para novos recursos
-        print("🔄 Verificando colunas faltantes...")
+        # Colunas adicionadas e índices declarados nos modelos (só inspeciona se o esquema mudou)
+        print("🔄 Verificando colunas e índices...")
         try:
-            # Testar se as novas colunas existem fazendo uma query
-            from sqlalchemy import text
-
-            # Lista de colunas que devem existir
-            colunas_necessarias = [
-                ('atribuido_por_id', 'INTEGER'),
-                ('fechado_por_id', 'INTEGER'),
-                ('observacoes', 'TEXT'),
-                ('qtd_reaberturas', 'INTEGER DEFAULT 0'),
-                ('chamado_origem_id', 'INTEGER')
-            ]
-
-            for coluna, tipo in colunas_necessarias:
-                try:
-                    # Tentar fazer SELECT da coluna
-                    db.session.execute(text(f"SELECT {coluna} FROM chamado LIMIT 1"))
-                    print(f"✅ Coluna {coluna} já existe")
-                except Exception:
-                    # Coluna não existe, adicionar
-                    try:
-                        db.session.execute(text(f"ALTER TABLE chamado ADD COLUMN {coluna} {tipo}"))
-                        db.session.commit()
-                        print(f"✅ Coluna {coluna} adicionada")
-                    except Exception as e:
-                        print(f"⚠️ Erro ao adicionar coluna {coluna}: {str(e)}")
-
+            from migracoes import aplicar_migracoes
+            resultado = aplicar_migracoes()
+            if not resultado['verificado']:
+                print("✅ Esquema inalterado desde a última verificação")
+            for coluna in resultado['colunas']:
+                print(f"✅ Coluna {coluna} adicionada")
+            for chave in resultado['chaves']:
+                print(f"✅ Chave estrangeira {chave} recriada com ON DELETE")
+            for indice in resultado['indices']:
+                print(f"✅ Índice {indice} criado")
         except Exception as e:
-            print(f"⚠️ Erro ao verificar colunas: {str(e)}")
+            db.session.rollback()
+            print(f"⚠️ Erro ao verificar colunas e índices: {str(e)}")
 
         print("✅ Verificação e atualização da estrutura do banco concluída!")
 
@@ -139,7 +139,7 @@ def security_before_request():
 # Função para carregar usuário no Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    user = User.query.get(int(user_id))
+    user = carregar_usuario(int(user_id))
     if user and user.bloqueado:
         session['bloqueado'] = True
         return None
@@ -283,11 +283,79 @@ with app.app_context():
         print("   - O servidor MySQL está acessível")
         print("   - As credenciais estão corretas")
 
+# Varredura periódica do snapshot de SLA e agendador de limiares (eventos 'sla_alerta')
+from setores.ti.sla_utils import iniciar_varredura_sla
+from setores.ti.sla_agendador import iniciar_agendador_sla
+iniciar_varredura_sla(app, socketio)
+iniciar_agendador_sla(app, socketio)
+print("✅ Varredura e agendador de SLA iniciados")
+
+# Trabalhadores da fila de e-mails (envio fora da requisição)
+from setores.ti.email_fila import iniciar_trabalhadores_email
+iniciar_trabalhadores_email(app, socketio)
+print("✅ Fila de e-mails iniciada")
+
+# Envios de e-mail em massa (retoma envios interrompidos)
+from setores.ti.email_massa import iniciar_envios_massa
+iniciar_envios_massa(app, socketio)
+print("✅ Envios de e-mail em massa iniciados")
+
+# Gravação em lote do último acesso dos usuários
+iniciar_gravacao_acessos(app, socketio)
+print("✅ Gravação de último acesso iniciada")
+
+# Gravação em lote dos logs de ação e de acesso
+from setores.ti.logs_buffer import iniciar_gravacao_logs
+iniciar_gravacao_logs(app, socketio)
+print("✅ Gravação de logs em lote iniciada")
+
+# Retenção periódica dos logs de acesso e de ações (DIAS_RETENCAO_LOGS)
+from setores.ti.retencao_logs import iniciar_retencao_logs
+if iniciar_retencao_logs(app, socketio):
+    print("✅ Retenção automática de logs iniciada")
+
+# Agrupamento dos eventos Socket.IO em rajada
+iniciar_tempo_real(app, socketio)
+print("✅ Eventos em tempo real por salas iniciados")
+
+# Resumos diários dos painéis (construídos na primeira inicialização, reconciliados periodicamente)
+from setores.ti.resumos_diarios import iniciar_resumos_diarios
+if iniciar_resumos_diarios(app, socketio):
+    print("✅ Construção dos resumos diários iniciada")
+
+# Índice de busca textual (construído na primeira inicialização) e indexação dos logs novos
+from setores.ti.busca import iniciar_busca
+if iniciar_busca(app, socketio):
+    print("✅ Construção do índice de busca iniciada")
+else:
+    print("✅ Indexação da busca textual iniciada")
+
+# Contadores de grupos e agentes (recalculados na primeira inicialização)
+from setores.ti.contadores import iniciar_contadores
+if iniciar_contadores(app):
+    print("✅ Contadores de grupos e agentes recalculados")
+
+# Carga dos agentes em memória para a atribuição de chamados
+from setores.ti.atribuicao_agentes import iniciar_atribuicao
+iniciar_atribuicao(app, socketio)
+print("✅ Motor de atribuição de chamados iniciado")
+
+# Exportações de relatórios cujo processo foi encerrado ficam marcadas como erro
+from setores.ti.relatorios_exportacao import iniciar_exportacoes
+iniciar_exportacoes(app, socketio)
+
+# Backups cujo processo foi encerrado (trava vencida) ficam marcados como erro
+from setores.ti.backup import iniciar_backups
+iniciar_backups(app, socketio)
+
 # Eventos Socket.IO
 @socketio.on('connect')
 def handle_connect():
     print(f'Cliente conectado: {request.sid}')
+    # Cada conexão recebe só os eventos das salas do seu usuário
+    salas = entrar_nas_salas(current_user) if current_user.is_authenticated else []
     emit('connected', {
+        'salas': salas,
         'message': 'Conectado ao servidor Socket.IO',
         'status': 'success',
         'timestamp': datetime.now().isoformat()
@@ -299,7 +367,11 @@ def handle_disconnect():
 
 @socketio.on('join_admin')
 def handle_join_admin(data):
-    print(f'Admin {data.get("user_id")} entrou na sala de administradores')
+    if not current_user.is_authenticated or current_user.nivel_acesso != 'Administrador':
+        emit('admin_joined', {'message': 'Acesso negado', 'status': 'error'})
+        return
+    join_room(SALA_ADMIN)
+    print(f'Admin {current_user.id} entrou na sala de administradores')
     emit('admin_joined', {
         'message': 'Você está recebendo notificações administrativas',
         'status': 'success',
@@ -312,7 +384,7 @@ def handle_test_notification():
         'message': 'Teste de notificação realizado com sucesso!',
         'status': 'success',
         'timestamp': datetime.now().isoformat()
-    }, broadcast=True)
+    })
 
 @socketio.on('ping')
 def handle_ping():
@@ -2,7 +2,7 @@ from functools import wraps
 from flask import redirect, url_for, flash, request, current_app, jsonify
 from flask_login import current_user, logout_user
 from datetime import datetime, timedelta
-from database import db
+from auth.cache_usuarios import registrar_acesso, obter_ultimo_acesso
 
 def is_api_request():
     """Verifica se a requisição é para a API"""
@@ -23,7 +23,8 @@ def setor_required(*setores_necessarios):
             
             # Verificar inatividade (30 minutos para API, 15 para web)
             timeout_minutes = 30 if is_api_request() else 15
-            if current_user.ultimo_acesso is None or (datetime.utcnow() - current_user.ultimo_acesso) > timedelta(minutes=timeout_minutes):
+            ultimo_acesso = obter_ultimo_acesso(current_user)
+            if ultimo_acesso is None or (datetime.utcnow() - ultimo_acesso) > timedelta(minutes=timeout_minutes):
                 logout_user()
                 if is_api_request():
                     return jsonify({
@@ -33,13 +34,8 @@ def setor_required(*setores_necessarios):
                 flash('Sessão expirada por inatividade. Faça login novamente.', 'warning')
                 return redirect(url_for('auth.login', next=request.url))
             
-            # Atualizar último acesso
-            current_user.ultimo_acesso = datetime.utcnow()
-            try:
-                db.session.commit()
-            except Exception as e:
-                current_app.logger.error(f"Erro ao atualizar último acesso: {str(e)}")
-                db.session.rollback()
+            # Atualizar último acesso (gravado em lote por auth.cache_usuarios)
+            registrar_acesso(current_user.id)
             
             # Verifica se o usuário tem acesso a algum dos setores necessários
             # Administradores têm acesso a tudo
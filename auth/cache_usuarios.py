@@ -0,0 +1,155 @@
+"""
+Último acesso com gravação adiada e cache curto do usuário autenticado
+
+- O último acesso de cada requisição fica em memória e é gravado em lote
+  (um UPDATE com vários parâmetros) no máximo uma vez por usuário a cada
+  INTERVALO_GRAVACAO_ACESSO segundos.
+- O load_user do Flask-Login reutiliza, por CACHE_USUARIO_TTL segundos, o
+  usuário carregado anteriormente em vez de consultar o banco a cada
+  requisição. Alterações do usuário (painel, troca de senha) invalidam a entrada na hora;
+  em outros processos a entrada expira pelo TTL.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, or_, update
+
+from database import db, User
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_GRAVACAO_ACESSO = 60  # segundos entre gravações do último acesso de um usuário
+CACHE_USUARIO_TTL = 30  # segundos
+
+# ==================== ÚLTIMO ACESSO ====================
+
+class RegistroUltimoAcesso:
+    """Acumula o último acesso por usuário e grava em lote"""
+
+    def __init__(self, intervalo: int = INTERVALO_GRAVACAO_ACESSO):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._ultimos: Dict[int, datetime] = {}  # último acesso conhecido neste processo
+        self._gravados: Dict[int, datetime] = {}  # último valor gravado no banco
+        self._pendentes = set()
+
+    def registrar(self, user_id: int, instante: Optional[datetime] = None):
+        instante = instante or datetime.utcnow()
+        with self._lock:
+            self._ultimos[user_id] = instante
+            gravado = self._gravados.get(user_id)
+            if gravado is None or (instante - gravado).total_seconds() >= self.intervalo:
+                self._pendentes.add(user_id)
+
+    def ultimo_acesso(self, user_id: int, valor_banco: Optional[datetime]) -> Optional[datetime]:
+        """Último acesso considerando o que ainda não foi gravado"""
+        with self._lock:
+            em_memoria = self._ultimos.get(user_id)
+        if em_memoria is None or (valor_banco is not None and valor_banco > em_memoria):
+            return valor_banco
+        return em_memoria
+
+    def gravar(self) -> int:
+        """Grava os acessos pendentes em um único UPDATE executado em lote"""
+        with self._lock:
+            lote = [{'b_id': user_id, 'b_acesso': self._ultimos[user_id]} for user_id in self._pendentes]
+            self._pendentes.clear()
+        if not lote:
+            return 0
+
+        tabela = User.__table__
+        comando = update(tabela).where(and_(
+            tabela.c.id == bindparam('b_id'),
+            # Nunca sobrescreve um valor mais recente (ex.: login em outro processo)
+            or_(tabela.c.ultimo_acesso.is_(None), tabela.c.ultimo_acesso < bindparam('b_acesso'))
+        )).values(ultimo_acesso=bindparam('b_acesso'))
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(comando, lote)
+        except Exception:
+            with self._lock:
+                self._pendentes.update(item['b_id'] for item in lote)
+            raise
+
+        with self._lock:
+            for item in lote:
+                self._gravados[item['b_id']] = item['b_acesso']
+            # Usuários sem acesso recente deixam de ocupar memória
+            agora = datetime.utcnow()
+            for user_id in [uid for uid, valor in self._gravados.items()
+                            if uid not in self._pendentes and self._ultimos.get(uid) == valor
+                            and (agora - valor).total_seconds() > 2 * self.intervalo]:
+                self._gravados.pop(user_id, None)
+                self._ultimos.pop(user_id, None)
+        return len(lote)
+
+_registro_acesso = RegistroUltimoAcesso()
+
+def registrar_acesso(user_id: int):
+    """Marca o acesso do usuário agora (gravado depois, em lote)"""
+    _registro_acesso.registrar(user_id)
+
+def obter_ultimo_acesso(user) -> Optional[datetime]:
+    """Último acesso do usuário, incluindo o ainda não gravado"""
+    return _registro_acesso.ultimo_acesso(user.id, user.ultimo_acesso)
+
+def _gravacao_periodica(app):
+    while True:
+        time.sleep(_registro_acesso.intervalo)
+        with app.app_context():
+            try:
+                _registro_acesso.gravar()
+            except Exception as e:
+                logger.error(f"Erro ao gravar último acesso: {str(e)}")
+
+def iniciar_gravacao_acessos(app, socketio):
+    """Inicia a gravação periódica do último acesso e a gravação final ao encerrar"""
+    socketio.start_background_task(_gravacao_periodica, app)
+
+    def _gravar_ao_encerrar():
+        try:
+            with app.app_context():
+                _registro_acesso.gravar()
+        except Exception as e:
+            logger.error(f"Erro ao gravar último acesso no encerramento: {str(e)}")
+
+    atexit.register(_gravar_ao_encerrar)
+
+# ==================== CACHE DE USUÁRIOS ====================
+
+_cache_usuarios: Dict[int, Tuple[User, float]] = {}
+_cache_lock = threading.Lock()
+
+def carregar_usuario(user_id: int) -> Optional[User]:
+    """
+    Usuário da sessão atual a partir do cache ou do banco
+
+    O cache guarda uma instância desanexada; cada requisição recebe uma cópia
+    ligada à sua sessão via merge(load=False), sem consulta ao banco.
+    """
+    agora = time.time()
+    with _cache_lock:
+        entrada = _cache_usuarios.get(user_id)
+    if entrada and entrada[1] > agora:
+        return db.session.merge(entrada[0], load=False)
+
+    user = User.query.get(user_id)
+    if user is None:
+        invalidar_cache_usuario(user_id)
+        return None
+    db.session.expunge(user)
+    with _cache_lock:
+        _cache_usuarios[user_id] = (user, agora + CACHE_USUARIO_TTL)
+    return db.session.merge(user, load=False)
+
+def invalidar_cache_usuario(user_id: Optional[int] = None):
+    """Remove o usuário do cache (todos, se user_id não for informado)"""
+    with _cache_lock:
+        if user_id is None:
+            _cache_usuarios.clear()
+        else:
+            _cache_usuarios.pop(user_id, None)
@@ -2,11 +2,13 @@ from flask import render_template, redirect, url_for, flash, request, jsonify, c
 from flask_login import login_user, logout_user, current_user, login_required
 from database import db, User, Chamado, Unidade, AgenteSuporte
 from werkzeug.security import generate_password_hash, check_password_hash
+from modo_assincrono import executar_bloqueante
 from functools import wraps
 import secrets
 import string
 from datetime import datetime
 from . import auth_bp
+from .cache_usuarios import invalidar_cache_usuario
 
 def get_user_redirect_url(user):
     """
@@ -107,6 +109,7 @@ def login():
             # Registrar último acesso
             user.ultimo_acesso = datetime.utcnow()
             db.session.commit()
+            invalidar_cache_usuario(user.id)
 
             current_app.logger.info(f'Login bem-sucedido: {usuario}')
 
@@ -145,9 +148,10 @@ def first_login():
         return render_template('login.html', alterar_senha=True, usuario=usuario)
     
     try:
-        user.senha_hash = generate_password_hash(nova_senha)
+        user.senha_hash = executar_bloqueante(generate_password_hash, nova_senha)
         user.alterar_senha_primeiro_acesso = False
         db.session.commit()
+        invalidar_cache_usuario(user.id)
         
         current_app.logger.info(f'Senha alterada com sucesso para usuário: {usuario}')
         flash('Senha alterada com sucesso. Faça login com sua nova senha.', 'success')
@@ -203,8 +207,9 @@ def alterar_senha():
         return redirect(url_for('auth.perfil'))
 
     try:
-        current_user.senha_hash = generate_password_hash(nova_senha)
+        current_user.senha_hash = executar_bloqueante(generate_password_hash, nova_senha)
         db.session.commit()
+        invalidar_cache_usuario(current_user.id)
         flash('Senha alterada com sucesso', 'success')
         current_app.logger.info(f'Senha alterada com sucesso para usuário: {current_user.usuario}')
     except Exception as e:
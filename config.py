@@ -82,6 +82,12 @@ class Config:
     # Configurações de timezone
     TIMEZONE = os.environ.get('TIMEZONE', 'America/Sao_Paulo')
     
+    # Fila de mensagens do Socket.IO entre processos (redis://, amqp://; local:// em memória)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+
+    # Modo do servidor Socket.IO: threading, gevent ou eventlet (ver modo_assincrono.py)
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading').strip().lower()
+
     # Configurações de cache
     CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
     CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
@@ -183,6 +189,12 @@ class DevelopmentMySQLConfig:
     # Configurações de timezone
     TIMEZONE = os.environ.get('TIMEZONE', 'America/Sao_Paulo')
 
+    # Fila de mensagens do Socket.IO entre processos (redis://, amqp://; local:// em memória)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+
+    # Modo do servidor Socket.IO: threading, gevent ou eventlet (ver modo_assincrono.py)
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading').strip().lower()
+
     # Configurações de cache
     CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
     CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
@@ -225,6 +237,12 @@ class DevelopmentSQLiteConfig:
     # Configurações de timezone
     TIMEZONE = 'America/Sao_Paulo'
 
+    # Fila de mensagens do Socket.IO entre processos (redis://, amqp://; local:// em memória)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+
+    # Modo do servidor Socket.IO: threading, gevent ou eventlet (ver modo_assincrono.py)
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading').strip().lower()
+
     # Configurações de cache
     CACHE_TYPE = 'simple'
     CACHE_DEFAULT_TIMEOUT = 300
@@ -257,6 +275,7 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
     SQLALCHEMY_ENGINE_OPTIONS = {}  # Remove MySQL-specific options for SQLite
+    SOCKETIO_MESSAGE_QUEUE = None  # o test_client do Flask-SocketIO não aceita fila de mensagens
 
     def __init__(self):
         # Override database validation for testing
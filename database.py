@@ -1,10 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, date
+from functools import lru_cache
 import json
 import os
 import pytz
-from sqlalchemy import Numeric
+from sqlalchemy import Numeric, event
 
 db = SQLAlchemy()
 
@@ -33,7 +34,7 @@ def brazil_to_utc(brazil_datetime):
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
-    nome = db.Column(db.String(150), nullable=False)
+    nome = db.Column(db.String(150), nullable=False, index=True)
     sobrenome = db.Column(db.String(150), nullable=False)
     usuario = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -130,13 +131,27 @@ class User(db.Model, UserMixin):
 
     def set_password(self, password):
         from werkzeug.security import generate_password_hash
-        self.senha_hash = generate_password_hash(password)
+        from modo_assincrono import executar_bloqueante
+        self.senha_hash = executar_bloqueante(generate_password_hash, password)
 
     def check_password(self, password):
         from werkzeug.security import check_password_hash
-        return check_password_hash(self.senha_hash, password)
+        from modo_assincrono import executar_bloqueante
+        return executar_bloqueante(check_password_hash, self.senha_hash, password)
 
 class Chamado(db.Model):
+    # Índices para os filtros e ordenações usados pelos painéis e listagens
+    __table_args__ = (
+        db.Index('ix_chamado_status_abertura', 'status', 'data_abertura'),
+        db.Index('ix_chamado_email_abertura', 'email', 'data_abertura'),
+        db.Index('ix_chamado_usuario_abertura', 'usuario_id', 'data_abertura'),
+        db.Index('ix_chamado_unidade_abertura', 'unidade', 'data_abertura'),
+        db.Index('ix_chamado_prioridade_status', 'prioridade', 'status'),
+        db.Index('ix_chamado_problema', 'problema'),
+        db.Index('ix_chamado_data_abertura', 'data_abertura'),
+        db.Index('ix_chamado_data_conclusao', 'data_conclusao'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(20), unique=True, nullable=False)
     protocolo = db.Column(db.String(20), unique=True, nullable=False)
@@ -278,6 +293,9 @@ class HistoricoTicket(db.Model):
 class HistoricoChamado(db.Model):
     """Tabela para registrar histórico de mudanças nos chamados"""
     __tablename__ = 'historico_chamados'
+    __table_args__ = (
+        db.Index('ix_historico_chamados_chamado_data', 'chamado_id', 'data_acao'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     chamado_id = db.Column(db.Integer, db.ForeignKey('chamado.id'), nullable=False)
@@ -315,10 +333,13 @@ class Configuracao(db.Model):
 class LogAcesso(db.Model):
     """Tabela para registrar acessos dos usuários"""
     __tablename__ = 'logs_acesso'
+    __table_args__ = (
+        db.Index('ix_logs_acesso_usuario_ativo_data', 'usuario_id', 'ativo', 'data_acesso'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    data_acesso = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    data_acesso = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None), index=True)
     data_logout = db.Column(db.DateTime, nullable=True)
     ip_address = db.Column(db.String(45), nullable=True)  # IPv6 support
     user_agent = db.Column(db.Text, nullable=True)
@@ -370,6 +391,10 @@ class LogAcesso(db.Model):
 class LogAcao(db.Model):
     """Tabela para registrar ações dos usuários"""
     __tablename__ = 'logs_acoes'
+    __table_args__ = (
+        db.Index('ix_logs_acoes_usuario_data', 'usuario_id', 'data_acao'),
+        db.Index('ix_logs_acoes_categoria_data', 'categoria', 'data_acao'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
@@ -378,7 +403,7 @@ class LogAcao(db.Model):
     detalhes = db.Column(db.Text, nullable=True)
     dados_anteriores = db.Column(db.Text, nullable=True)  # JSON com dados antes da alteração
     dados_novos = db.Column(db.Text, nullable=True)  # JSON com dados após alteração
-    data_acao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    data_acao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None), index=True)
     ip_address = db.Column(db.String(45), nullable=True)
     user_agent = db.Column(db.Text, nullable=True)
     sucesso = db.Column(db.Boolean, default=True)
@@ -398,6 +423,83 @@ class LogAcao(db.Model):
     def __repr__(self):
         return f'<LogAcao {self.acao} - {self.data_acao}>'
 
+class ResumoDiarioChamado(db.Model):
+    """Contadores diários de chamados por unidade, problema, prioridade e status"""
+    __tablename__ = 'resumo_diario_chamados'
+    __table_args__ = (
+        db.UniqueConstraint('dia', 'unidade', 'problema', 'prioridade', 'status', name='uk_resumo_chamados'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False)  # dia da abertura
+    unidade = db.Column(db.String(100), nullable=False, default='')
+    problema = db.Column(db.String(100), nullable=False, default='')
+    prioridade = db.Column(db.String(20), nullable=False, default='')
+    status = db.Column(db.String(20), nullable=False, default='')
+    quantidade = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    com_conclusao = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    segundos_resolucao = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # soma
+    faixa_ate_4h = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    faixa_ate_8h = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    faixa_ate_24h = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    faixa_ate_72h = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    faixa_acima_72h = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<ResumoDiarioChamado {self.dia} {self.status}: {self.quantidade}>'
+
+class ResumoDiarioAcesso(db.Model):
+    """Contadores diários de acessos por usuário, dispositivo e navegador"""
+    __tablename__ = 'resumo_diario_acessos'
+    __table_args__ = (
+        db.UniqueConstraint('dia', 'usuario_id', 'dispositivo', 'navegador', name='uk_resumo_acessos'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False)
+    usuario_id = db.Column(db.Integer, nullable=False, default=0)
+    dispositivo = db.Column(db.String(50), nullable=False, default='')
+    navegador = db.Column(db.String(100), nullable=False, default='')
+    quantidade = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    sessoes_com_duracao = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    minutos_sessao = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # soma
+
+    def __repr__(self):
+        return f'<ResumoDiarioAcesso {self.dia} {self.usuario_id}: {self.quantidade}>'
+
+class ResumoDiarioAcao(db.Model):
+    """Contadores diários de ações por usuário, categoria e resultado"""
+    __tablename__ = 'resumo_diario_acoes'
+    __table_args__ = (
+        db.UniqueConstraint('dia', 'usuario_id', 'categoria', 'sucesso', name='uk_resumo_acoes'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False)
+    usuario_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = sistema
+    categoria = db.Column(db.String(100), nullable=False, default='')
+    sucesso = db.Column(db.Boolean, nullable=False, default=True)
+    quantidade = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<ResumoDiarioAcao {self.dia} {self.categoria}: {self.quantidade}>'
+
+class TermoBusca(db.Model):
+    """Índice invertido da busca textual: um termo de um registro de chamado, usuário ou log de ação"""
+    __tablename__ = 'termos_busca'
+    __table_args__ = (
+        db.Index('ix_termos_busca_registro', 'entidade', 'registro_id'),
+    )
+
+    entidade = db.Column(db.String(20), primary_key=True)  # chamado, usuario, log_acao
+    termo = db.Column(db.String(40), primary_key=True)  # minúsculo e sem acentos
+    registro_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    peso = db.Column(db.SmallInteger, nullable=False, default=1)  # maior peso dos campos em que aparece
+    campos = db.Column(db.Integer, nullable=False, default=0)  # bits dos campos em que aparece
+
+    def __repr__(self):
+        return f'<TermoBusca {self.entidade}:{self.registro_id} {self.termo}>'
+
 class ConfiguracaoAvancada(db.Model):
     """Tabela para configuraç��es avançadas do sistema"""
     __tablename__ = 'configuracoes_avancadas'
@@ -517,7 +619,7 @@ class BackupHistorico(db.Model):
     tamanho_mb = db.Column(db.Float, nullable=True)
     tipo = db.Column(db.String(50), nullable=False)  # completo, dados, configuracoes, logs
     status = db.Column(db.String(20), default='em_progresso')  # em_progresso, concluido, erro, cancelado
-    data_backup = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    data_backup = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None), index=True)
     data_inicio = db.Column(db.DateTime, nullable=True)
     data_fim = db.Column(db.DateTime, nullable=True)
     observacoes = db.Column(db.Text, nullable=True)
@@ -659,6 +761,10 @@ class AgenteSuporte(db.Model):
     data_criacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
     data_atualizacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
 
+    # Contadores mantidos por setores.ti.contadores
+    chamados_ativos_count = db.Column(db.Integer, default=0)
+    notificacoes_nao_lidas_count = db.Column(db.Integer, default=0)
+
     # Relacionamento com usuário
     usuario = db.relationship('User', backref='agente_suporte')
 
@@ -683,18 +789,22 @@ class AgenteSuporte(db.Model):
 
     def get_chamados_ativos(self):
         """Retorna número de chamados ativos atribuídos ao agente"""
-        return ChamadoAgente.query.filter_by(
-            agente_id=self.id,
-            ativo=True
-        ).join(Chamado).filter(
-            Chamado.status.in_(['Aberto', 'Aguardando'])
-        ).count()
+        return self.chamados_ativos_count or 0
+
+    def get_notificacoes_nao_lidas(self):
+        """Retorna número de notificações não lidas do agente"""
+        return self.notificacoes_nao_lidas_count or 0
+
+    def get_carga(self):
+        """Chamados ativos pelo contador em memória do motor de atribuição"""
+        from setores.ti.atribuicao_agentes import motor_atribuicao
+        return motor_atribuicao.carga(self.id)
 
     def pode_receber_chamado(self):
         """Verifica se o agente pode receber um novo chamado"""
         if not self.ativo:
             return False
-        return self.get_chamados_ativos() < self.max_chamados_simultaneos
+        return self.get_carga() < self.max_chamados_simultaneos
 
     def __repr__(self):
         return f'<AgenteSuporte {self.usuario.nome} - {self.nivel_experiencia}>'
@@ -702,6 +812,12 @@ class AgenteSuporte(db.Model):
 class ChamadoAgente(db.Model):
     """Tabela para atribuição de chamados a agentes"""
     __tablename__ = 'chamado_agente'
+    __table_args__ = (
+        db.Index('ix_chamado_agente_chamado_ativo', 'chamado_id', 'ativo'),
+        db.Index('ix_chamado_agente_agente_ativo', 'agente_id', 'ativo'),
+        # Uma única atribuição ativa por chamado (NULL nas inativas, que não entram na unicidade)
+        db.Index('uq_chamado_agente_chamado_ativo', 'chamado_ativo_id', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     chamado_id = db.Column(db.Integer, db.ForeignKey('chamado.id'), nullable=False)
@@ -711,6 +827,7 @@ class ChamadoAgente(db.Model):
     ativo = db.Column(db.Boolean, default=True)
     observacoes = db.Column(db.Text, nullable=True)
     atribuido_por = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    chamado_ativo_id = db.Column(db.Integer, nullable=True)  # = chamado_id enquanto ativo (ver uq_chamado_agente_chamado_ativo)
 
     # Relacionamentos
     chamado = db.relationship('Chamado', backref='agente_atribuido')
@@ -724,6 +841,13 @@ class ChamadoAgente(db.Model):
     def __repr__(self):
         return f'<ChamadoAgente Chamado:{self.chamado_id} - Agente:{self.agente_id}>'
 
+@event.listens_for(ChamadoAgente, 'before_insert')
+@event.listens_for(ChamadoAgente, 'before_update')
+def _marcar_atribuicao_ativa(mapper, connection, atribuicao):
+    """Mantém chamado_ativo_id: uma segunda atribuição ativa do mesmo chamado viola o índice único"""
+    ativo = atribuicao.ativo is None or atribuicao.ativo
+    atribuicao.chamado_ativo_id = atribuicao.chamado_id if ativo else None
+
 class GrupoUsuarios(db.Model):
     """Tabela para grupos de usuários"""
     __tablename__ = 'grupos_usuarios'
@@ -736,6 +860,10 @@ class GrupoUsuarios(db.Model):
     data_atualizacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
     criado_por = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Contadores mantidos por setores.ti.contadores
+    membros_count = db.Column(db.Integer, default=0)
+    unidades_count = db.Column(db.Integer, default=0)
+
     # Relacionamentos
     criador = db.relationship('User', foreign_keys=[criado_por])
     membros = db.relationship('GrupoMembro', backref='grupo', lazy=True, cascade='all, delete-orphan')
@@ -744,11 +872,11 @@ class GrupoUsuarios(db.Model):
 
     def get_membros_count(self):
         """Retorna número de membros ativos no grupo"""
-        return GrupoMembro.query.filter_by(grupo_id=self.id, ativo=True).count()
+        return self.membros_count or 0
 
     def get_unidades_count(self):
         """Retorna número de unidades no grupo"""
-        return GrupoUnidade.query.filter_by(grupo_id=self.id).count()
+        return self.unidades_count or 0
 
     def __repr__(self):
         return f'<GrupoUsuarios {self.nome}>'
@@ -858,6 +986,35 @@ class EmailMassaDestinatario(db.Model):
     def __repr__(self):
         return f'<EmailMassaDestinatario {self.email_destinatario} - {self.status_envio}>'
 
+class EmailFila(db.Model):
+    """Caixa de saída de e-mails enviados em segundo plano pelo Microsoft Graph"""
+    __tablename__ = 'email_fila'
+    __table_args__ = (
+        db.Index('ix_email_fila_status_proxima', 'status', 'proxima_tentativa'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    assunto = db.Column(db.String(500), nullable=False)
+    corpo = db.Column(db.Text, nullable=False)
+    destinatarios = db.Column(db.Text, nullable=False)  # JSON com a lista de endereços
+    status = db.Column(db.String(20), default='pendente')  # pendente, enviando, enviado, falha
+    tentativas = db.Column(db.Integer, default=0)
+    proxima_tentativa = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    reserva = db.Column(db.String(32), nullable=True)  # token do trabalhador que reservou o envio
+    ultimo_erro = db.Column(db.Text, nullable=True)
+    data_criacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    data_envio = db.Column(db.DateTime, nullable=True)
+
+    def get_destinatarios(self):
+        """Retorna destinatários como lista"""
+        try:
+            return json.loads(self.destinatarios) if self.destinatarios else []
+        except:
+            return []
+
+    def __repr__(self):
+        return f'<EmailFila {self.id} - {self.status}>'
+
 class SessaoAtiva(db.Model):
     """Tabela para sessões ativas dos usuários"""
     __tablename__ = 'sessoes_ativas'
@@ -894,6 +1051,9 @@ class SessaoAtiva(db.Model):
 class NotificacaoAgente(db.Model):
     """Tabela para notificações de agentes"""
     __tablename__ = 'notificacoes_agentes'
+    __table_args__ = (
+        db.Index('ix_notificacoes_agentes_agente_lida', 'agente_id', 'lida', 'data_criacao'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     agente_id = db.Column(db.Integer, db.ForeignKey('agentes_suporte.id'), nullable=False)
@@ -1025,6 +1185,75 @@ class HistoricoSLA(db.Model):
     def __repr__(self):
         return f'<HistoricoSLA {self.id} - Chamado {self.chamado_id} - {self.acao}>'
 
+class SlaChamado(db.Model):
+    """Estado de SLA materializado por chamado, mantido nas escritas do chamado e pela varredura periódica"""
+    __tablename__ = 'sla_chamados'
+    __table_args__ = (
+        db.Index('ix_sla_chamados_status', 'status_chamado', 'sla_status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    chamado_id = db.Column(db.Integer, db.ForeignKey('chamado.id', ondelete='CASCADE'), unique=True, nullable=False)
+    prioridade = db.Column(db.String(20), nullable=True)
+    status_chamado = db.Column(db.String(20), nullable=True)
+    sla_status = db.Column(db.String(50), nullable=False)  # 'Dentro do Prazo', 'Em Risco', 'Violado', 'Cumprido', 'Indefinido'
+    sla_limite = db.Column(db.Float, nullable=True)  # em horas úteis
+    prazo_expiracao = db.Column(db.DateTime, nullable=True)
+    horas_decorridas = db.Column(db.Float, default=0)
+    horas_uteis_decorridas = db.Column(db.Float, default=0)
+    percentual_tempo_usado = db.Column(db.Float, default=0)
+    tempo_primeira_resposta_uteis = db.Column(db.Float, nullable=True)
+    tempo_resolucao_uteis = db.Column(db.Float, nullable=True)
+    violacao_primeira_resposta = db.Column(db.Boolean, default=False)
+    violacao_resolucao = db.Column(db.Boolean, default=False)
+    data_abertura = db.Column(db.DateTime, nullable=True, index=True)
+    data_calculo = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    desatualizado = db.Column(db.Boolean, default=False)  # configuração mudou; recalculado pela varredura
+
+    # Relacionamentos
+    chamado = db.relationship('Chamado', backref=db.backref('sla_snapshot', uselist=False, cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<SlaChamado Chamado {self.chamado_id} - {self.sla_status}>'
+
+class AlertaSLA(db.Model):
+    """Limiares de SLA já notificados; a chave única impede que dois workers alertem o mesmo limiar"""
+    __tablename__ = 'alertas_sla'
+    __table_args__ = (
+        db.UniqueConstraint('chamado_id', 'evento', 'limiar', name='uq_alertas_sla_limiar'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    chamado_id = db.Column(db.Integer, db.ForeignKey('chamado.id', ondelete='CASCADE'), nullable=False)
+    evento = db.Column(db.String(30), nullable=False)  # 'risco', 'primeira_resposta', 'resolucao'
+    limiar = db.Column(db.DateTime, nullable=False)  # instante do limiar, truncado ao minuto
+    data_criacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+
+    def __repr__(self):
+        return f'<AlertaSLA Chamado {self.chamado_id} - {self.evento} {self.limiar}>'
+
+class SequenciaIdentificador(db.Model):
+    """Contadores atômicos usados na geração de código e protocolo de chamados"""
+    __tablename__ = 'sequencias_identificadores'
+
+    nome = db.Column(db.String(50), primary_key=True)  # 'codigo_chamado', 'protocolo_YYYYMMDD'
+    valor = db.Column(db.BigInteger, nullable=False, default=0)  # último número reservado
+
+    def __repr__(self):
+        return f'<SequenciaIdentificador {self.nome} = {self.valor}>'
+
+class TravaProcesso(db.Model):
+    """Travas com prazo que elegem um único processo para tarefas de fundo (ver setores/ti/travas.py)"""
+    __tablename__ = 'travas_processos'
+
+    nome = db.Column(db.String(100), primary_key=True)  # 'varredura_sla', 'backup:42', ...
+    dono = db.Column(db.String(150), nullable=False)  # 'host:pid' do processo que detém a trava
+    expira_em = db.Column(db.DateTime, nullable=False)
+    atualizado_em = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<TravaProcesso {self.nome} - {self.dono}>'
+
 class Feriado(db.Model):
     """Tabela para feriados nacionais e locais"""
     __tablename__ = 'feriados'
@@ -1187,21 +1416,19 @@ class HorarioComercial(db.Model):
     def __repr__(self):
         return f'<HorarioComercial {self.nome} {self.hora_inicio}-{self.hora_fim}>'
 
-def obter_horario_comercial_ativo():
-    """Retorna a configuração de horário comercial ativa (padrão)"""
-    horario = HorarioComercial.query.filter_by(ativo=True, padrao=True).first()
-    if not horario:
-        # Se não há padrão, pegar o primeiro ativo
-        horario = HorarioComercial.query.filter_by(ativo=True).first()
-    return horario
+def obter_horario_comercial_ativo(sessao=None):
+    """Retorna a configuração de horário comercial ativa (padrão; sem padrão, a primeira ativa)"""
+    return (sessao or db.session).query(HorarioComercial).filter_by(ativo=True).order_by(
+        HorarioComercial.padrao.desc(), HorarioComercial.id
+    ).first()
 
 def obter_sla_por_prioridade(prioridade):
     """Retorna configuração SLA para uma prioridade específica"""
     return ConfiguracaoSLA.query.filter_by(prioridade=prioridade, ativo=True).first()
 
-def obter_todas_configuracoes_sla():
+def obter_todas_configuracoes_sla(sessao=None):
     """Retorna todas as configurações SLA ativas"""
-    return ConfiguracaoSLA.query.filter_by(ativo=True).all()
+    return (sessao or db.session).query(ConfiguracaoSLA).filter_by(ativo=True).all()
 
 def atualizar_horario_comercial(dados, usuario_id=None):
     """Atualiza configuração de horário comercial"""
@@ -1230,6 +1457,8 @@ def atualizar_horario_comercial(dados, usuario_id=None):
         horario.usuario_atualizacao = usuario_id
 
     db.session.commit()
+    from setores.ti.registro_configuracoes import invalidar_configuracoes
+    invalidar_configuracoes()
     return horario
 
 def atualizar_sla_prioridade(prioridade, tempo_resolucao, tempo_primeira_resposta=None, usuario_id=None):
@@ -1248,12 +1477,13 @@ def atualizar_sla_prioridade(prioridade, tempo_resolucao, tempo_primeira_respost
         sla.usuario_atualizacao = usuario_id
 
     db.session.commit()
+    from setores.ti.registro_configuracoes import invalidar_configuracoes
+    invalidar_configuracoes()
     return sla
 
-def obter_configuracoes_sla_dict():
+def obter_configuracoes_sla_dict(sessao=None):
     """Retorna configurações SLA em formato dict para compatibilidade"""
-    slas = obter_todas_configuracoes_sla()
-    horario = obter_horario_comercial_ativo()
+    slas = obter_todas_configuracoes_sla(sessao)
 
     config = {}
 
@@ -1271,9 +1501,9 @@ def obter_configuracoes_sla_dict():
 
     return config
 
-def obter_horario_comercial_dict():
+def obter_horario_comercial_dict(sessao=None):
     """Retorna configuração de horário comercial em formato dict para compatibilidade"""
-    horario = obter_horario_comercial_ativo()
+    horario = obter_horario_comercial_ativo(sessao)
     if not horario:
         return {
             'inicio': '08:00',
@@ -1292,31 +1522,10 @@ def obter_horario_comercial_dict():
         'emergencia_ativo': horario.emergencia_ativo,
         'emergencia_inicio': horario.emergencia_inicio,
         'emergencia_fim': horario.emergencia_fim,
-        'emergencia_dias': horario.emergencia_dias_lista
+        'emergencia_dias': horario.emergencia_dias_lista,
+        'considera_feriados': horario.considera_feriados
     }
 
-def registrar_log_acao(usuario_id, acao, categoria='sistema', detalhes='', ip_address='', user_agent='', recurso_afetado='', tipo_recurso=''):
-    """Registra uma ação do usuário no sistema"""
-    try:
-        log = LogAcao(
-            usuario_id=usuario_id,
-            acao=acao,
-            categoria=categoria,
-            detalhes=detalhes,
-            data_acao=get_brazil_time().replace(tzinfo=None),
-            ip_address=ip_address,
-            sucesso=True,
-            recurso_afetado=recurso_afetado,
-            tipo_recurso=tipo_recurso
-        )
-        db.session.add(log)
-        db.session.commit()
-        return log
-    except Exception as e:
-        print(f"Erro ao registrar log de ação: {str(e)}")
-        db.session.rollback()
-        return None
-
 def init_app(app):
     db.init_app(app)
     
@@ -1753,31 +1962,27 @@ def atualizar_lista_unidades(id_unidade, nome_unidade):
 
 # Funções auxiliares para logs e auditoria
 def registrar_log_acesso(usuario_id, ip_address=None, user_agent=None, session_id=None):
-    """Registra um novo log de acesso"""
+    """Registra um novo log de acesso (gravado em lote, fora da requisição)"""
     try:
-        # Extrair informações do user agent
-        navegador, sistema_operacional, dispositivo = extrair_info_user_agent(user_agent)
-        
-        log = LogAcesso(
-            usuario_id=usuario_id,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            session_id=session_id,
-            navegador=navegador,
-            sistema_operacional=sistema_operacional,
-            dispositivo=dispositivo
-        )
-        db.session.add(log)
-        db.session.commit()
-        return log
+        from setores.ti.logs_buffer import registrar_linha_log
+        registrar_linha_log(LogAcesso.__tablename__, {
+            'usuario_id': usuario_id,
+            'data_acesso': get_brazil_time().replace(tzinfo=None),
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'session_id': session_id,
+            'ativo': True
+        })
     except Exception as e:
         print(f"Erro ao registrar log de acesso: {str(e)}")
-        db.session.rollback()
-        return None
 
 def registrar_log_logout(usuario_id, session_id=None):
     """Registra logout do usuário"""
     try:
+        # O acesso pode ainda estar aguardando gravação
+        from setores.ti.logs_buffer import gravar_logs_pendentes
+        gravar_logs_pendentes()
+
         # Encontrar log de acesso ativo
         log_acesso = LogAcesso.query.filter_by(
             usuario_id=usuario_id,
@@ -1800,32 +2005,30 @@ def registrar_log_acao(usuario_id, acao, categoria=None, detalhes=None,
                       dados_anteriores=None, dados_novos=None, ip_address=None, 
                       user_agent=None, sucesso=True, erro_detalhes=None,
                       recurso_afetado=None, tipo_recurso=None):
-    """Registra uma ação do usuário"""
+    """Registra uma ação do usuário (gravada em lote, fora da requisição)"""
     try:
-        log = LogAcao(
-            usuario_id=usuario_id,
-            acao=acao,
-            categoria=categoria,
-            detalhes=detalhes,
-            dados_anteriores=json.dumps(dados_anteriores) if dados_anteriores else None,
-            dados_novos=json.dumps(dados_novos) if dados_novos else None,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            sucesso=sucesso,
-            erro_detalhes=erro_detalhes,
-            recurso_afetado=str(recurso_afetado) if recurso_afetado else None,
-            tipo_recurso=tipo_recurso
-        )
-        db.session.add(log)
-        db.session.commit()
-        return log
+        from setores.ti.logs_buffer import registrar_linha_log
+        registrar_linha_log(LogAcao.__tablename__, {
+            'usuario_id': usuario_id,
+            'acao': acao,
+            'categoria': categoria,
+            'detalhes': detalhes,
+            'dados_anteriores': json.dumps(dados_anteriores) if dados_anteriores else None,
+            'dados_novos': json.dumps(dados_novos) if dados_novos else None,
+            'data_acao': get_brazil_time().replace(tzinfo=None),
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'sucesso': sucesso,
+            'erro_detalhes': erro_detalhes,
+            'recurso_afetado': str(recurso_afetado) if recurso_afetado else None,
+            'tipo_recurso': tipo_recurso
+        })
     except Exception as e:
         print(f"Erro ao registrar log de ação: {str(e)}")
-        db.session.rollback()
-        return None
 
+@lru_cache(maxsize=1024)
 def extrair_info_user_agent(user_agent):
-    """Extrai informações básicas do user agent"""
+    """Extrai informações básicas do user agent (memorizado por string de user agent)"""
     if not user_agent:
         return None, None, None
     
@@ -0,0 +1,288 @@
+"""
+Migrações declarativas do banco: colunas adicionadas depois da criação das
+tabelas, chaves estrangeiras cuja regra ON DELETE mudou e os índices
+declarados nos modelos (__table_args__ / index=True)
+
+Na inicialização é calculada uma assinatura do esquema declarado (índices,
+colunas e chaves estrangeiras). Se for igual à última gravada em configuracoes, nada é inspecionado;
+caso contrário cada tabela é inspecionada uma vez, as colunas e os índices
+que faltam são criados, as chaves estrangeiras alteradas são recriadas e a
+nova assinatura é gravada.
+
+O autoteste roda EXPLAIN nas consultas mais frequentes e indica se o plano
+usa o índice esperado:
+
+    python -m migracoes --verificar --autoteste
+"""
+import argparse
+import hashlib
+import json
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import inspect, select, text
+
+from database import (
+    db, Chamado, ChamadoAgente, Configuracao, HistoricoChamado, LogAcao, LogAcesso,
+    NotificacaoAgente, get_brazil_time
+)
+
+logger = logging.getLogger(__name__)
+
+CHAVE_ASSINATURA = 'schema_assinatura'
+
+# Colunas adicionadas a tabelas já existentes: tabela -> [(coluna, tipo DDL)]
+COLUNAS_ADICIONADAS = {
+    'chamado': [
+        ('atribuido_por_id', 'INTEGER'),
+        ('fechado_por_id', 'INTEGER'),
+        ('observacoes', 'TEXT'),
+        ('qtd_reaberturas', 'INTEGER DEFAULT 0'),
+        ('chamado_origem_id', 'INTEGER'),
+    ],
+    'chamado_agente': [
+        ('chamado_ativo_id', 'INTEGER'),
+    ],
+    'grupos_usuarios': [
+        ('membros_count', 'INTEGER DEFAULT 0'),
+        ('unidades_count', 'INTEGER DEFAULT 0'),
+    ],
+    'agentes_suporte': [
+        ('chamados_ativos_count', 'INTEGER DEFAULT 0'),
+        ('notificacoes_nao_lidas_count', 'INTEGER DEFAULT 0'),
+    ],
+    'sla_chamados': [
+        ('desatualizado', 'BOOLEAN DEFAULT 0'),
+    ],
+    'email_fila': [
+        ('reserva', 'VARCHAR(32)'),
+    ],
+}
+
+# Chaves estrangeiras cuja regra ON DELETE mudou: tabela -> [(coluna, 'tabela.coluna' referida, ON DELETE)]
+CHAVES_ESTRANGEIRAS_ALTERADAS = {
+    'sla_chamados': [
+        ('chamado_id', 'chamado.id', 'CASCADE'),
+    ],
+}
+
+# ==================== ASSINATURA ====================
+
+def assinatura_esquema() -> str:
+    """Hash dos índices declarados, das colunas adicionadas e das chaves estrangeiras alteradas"""
+    itens = []
+    for tabela in db.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            itens.append([tabela.name, indice.name, [c.name for c in indice.columns], bool(indice.unique)])
+    itens.sort()
+    conteudo = json.dumps({
+        'indices': itens, 'colunas': COLUNAS_ADICIONADAS, 'chaves': CHAVES_ESTRANGEIRAS_ALTERADAS
+    }, sort_keys=True)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+def _assinatura_gravada() -> Optional[str]:
+    with db.engine.connect() as conn:
+        return conn.execute(
+            select(Configuracao.valor).where(Configuracao.chave == CHAVE_ASSINATURA)
+        ).scalar()
+
+def _gravar_assinatura(valor: str):
+    agora = get_brazil_time().replace(tzinfo=None)
+    registro = Configuracao.query.filter_by(chave=CHAVE_ASSINATURA).first()
+    if registro:
+        registro.valor = valor
+        registro.data_atualizacao = agora
+    else:
+        db.session.add(Configuracao(chave=CHAVE_ASSINATURA, valor=valor, data_atualizacao=agora))
+    db.session.commit()
+
+# ==================== COLUNAS E ÍNDICES ====================
+
+def adicionar_colunas_faltantes(inspector) -> List[str]:
+    adicionadas = []
+    for tabela, colunas in COLUNAS_ADICIONADAS.items():
+        existentes = {coluna['name'] for coluna in inspector.get_columns(tabela)}
+        for coluna, tipo in colunas:
+            if coluna in existentes:
+                continue
+            with db.engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}"))
+            adicionadas.append(f'{tabela}.{coluna}')
+    return adicionadas
+
+def ajustar_chaves_estrangeiras(inspector) -> List[str]:
+    """Recria as chaves estrangeiras cuja regra ON DELETE difere da declarada"""
+    dialeto = db.engine.dialect.name
+    if dialeto == 'sqlite':
+        # O SQLite não altera restrições de tabelas existentes
+        return []
+    ajustadas = []
+    for tabela, chaves in CHAVES_ESTRANGEIRAS_ALTERADAS.items():
+        existentes = inspector.get_foreign_keys(tabela)
+        for coluna, referida, regra in chaves:
+            tabela_referida, coluna_referida = referida.split('.')
+            atual = next((
+                chave for chave in existentes
+                if chave['constrained_columns'] == [coluna] and chave['referred_table'] == tabela_referida
+            ), None)
+            if atual and (atual.get('options') or {}).get('ondelete', '').upper() == regra:
+                continue
+            nome = (atual or {}).get('name') or f'fk_{tabela}_{coluna}'
+            with db.engine.begin() as conn:
+                if atual:
+                    remocao = 'DROP FOREIGN KEY' if dialeto == 'mysql' else 'DROP CONSTRAINT'
+                    conn.execute(text(f"ALTER TABLE {tabela} {remocao} {nome}"))
+                conn.execute(text(
+                    f"ALTER TABLE {tabela} ADD CONSTRAINT {nome} FOREIGN KEY ({coluna}) "
+                    f"REFERENCES {tabela_referida} ({coluna_referida}) ON DELETE {regra}"
+                ))
+            ajustadas.append(f'{tabela}.{coluna}')
+    return ajustadas
+
+def criar_indices_faltantes(tabelas=None, inspector=None) -> List[str]:
+    """Cria os índices declarados que não existem no banco; retorna os nomes criados"""
+    inspector = inspector or inspect(db.engine)
+    criados = []
+    for tabela in tabelas or db.metadata.sorted_tables:
+        if not tabela.indexes:
+            continue
+        existentes = {indice['name'] for indice in inspector.get_indexes(tabela.name)}
+        for indice in sorted(tabela.indexes, key=lambda i: i.name):
+            if indice.name in existentes:
+                continue
+            try:
+                indice.create(db.engine)
+                criados.append(indice.name)
+            except Exception as e:
+                # Outro processo pode ter criado o mesmo índice ao mesmo tempo
+                existentes = {i['name'] for i in inspect(db.engine).get_indexes(tabela.name)}
+                if indice.name not in existentes:
+                    raise
+                logger.debug(f"Índice {indice.name} criado por outro processo: {str(e)}")
+    return criados
+
+def aplicar_migracoes(forcar: bool = False) -> Dict:
+    """
+    Garante colunas, chaves estrangeiras e índices declarados
+
+    Returns:
+        {'verificado': bool, 'colunas': [...], 'chaves': [...], 'indices': [...]}; verificado=False
+        quando a assinatura não mudou e a inspeção foi dispensada
+    """
+    assinatura = assinatura_esquema()
+    if not forcar and _assinatura_gravada() == assinatura:
+        return {'verificado': False, 'colunas': [], 'chaves': [], 'indices': []}
+
+    inspector = inspect(db.engine)
+    colunas = adicionar_colunas_faltantes(inspector)
+    chaves = ajustar_chaves_estrangeiras(inspector)
+    indices = criar_indices_faltantes(inspector=inspector)
+    _gravar_assinatura(assinatura)
+    return {'verificado': True, 'colunas': colunas, 'chaves': chaves, 'indices': indices}
+
+# ==================== AUTOTESTE (EXPLAIN) ====================
+
+def consultas_chave():
+    """(descrição, consulta, índice esperado) das consultas mais frequentes"""
+    return [
+        ('Chamados por status, mais recentes',
+         select(Chamado.id).where(Chamado.status == 'Aberto').order_by(Chamado.data_abertura.desc()).limit(50),
+         'ix_chamado_status_abertura'),
+        ('Chamados do solicitante (e-mail)',
+         select(Chamado.id).where(Chamado.email == 'usuario@exemplo.com').order_by(Chamado.data_abertura.desc()),
+         'ix_chamado_email_abertura'),
+        ('Chamados do usuário',
+         select(Chamado.id).where(Chamado.usuario_id == 1).order_by(Chamado.data_abertura.desc()),
+         'ix_chamado_usuario_abertura'),
+        ('Chamados da unidade no período',
+         select(Chamado.id).where(Chamado.unidade == 'Unidade', Chamado.data_abertura >= '2025-01-01'),
+         'ix_chamado_unidade_abertura'),
+        ('Chamados concluídos no período',
+         select(Chamado.id).where(Chamado.data_conclusao >= '2025-01-01'),
+         'ix_chamado_data_conclusao'),
+        ('Atribuição ativa do chamado',
+         select(ChamadoAgente.id).where(ChamadoAgente.chamado_id == 1, ChamadoAgente.ativo == True),
+         'ix_chamado_agente_chamado_ativo'),
+        ('Notificações não lidas do agente',
+         select(NotificacaoAgente.id).where(NotificacaoAgente.agente_id == 1, NotificacaoAgente.lida == False)
+         .order_by(NotificacaoAgente.data_criacao.desc()),
+         'ix_notificacoes_agentes_agente_lida'),
+        ('Histórico do chamado',
+         select(HistoricoChamado.id).where(HistoricoChamado.chamado_id == 1).order_by(HistoricoChamado.data_acao),
+         'ix_historico_chamados_chamado_data'),
+        ('Ações do usuário, mais recentes',
+         select(LogAcao.id).where(LogAcao.usuario_id == 1).order_by(LogAcao.data_acao.desc()).limit(50),
+         'ix_logs_acoes_usuario_data'),
+        ('Acessos no período',
+         select(LogAcesso.id).where(LogAcesso.data_acesso >= '2025-01-01'),
+         'ix_logs_acesso_data_acesso'),
+    ]
+
+def autoteste_explain() -> List[Dict]:
+    """Roda EXPLAIN em cada consulta chave e indica se o índice esperado aparece no plano"""
+    dialeto = db.engine.dialect
+    prefixo = 'EXPLAIN QUERY PLAN ' if dialeto.name == 'sqlite' else 'EXPLAIN '
+    resultados = []
+    with db.engine.connect() as conn:
+        for descricao, consulta, indice in consultas_chave():
+            sql = str(consulta.compile(dialect=dialeto, compile_kwargs={'literal_binds': True}))
+            try:
+                linhas = conn.exec_driver_sql(prefixo + sql).mappings().all()
+                plano = [' | '.join(str(valor) for valor in linha.values() if valor is not None) for linha in linhas]
+                usa_indice = any(indice in passo for passo in plano)
+            except Exception as e:
+                plano = [f'erro: {str(e)}']
+                usa_indice = False
+            resultados.append({
+                'consulta': descricao,
+                'indice_esperado': indice,
+                'usa_indice': usa_indice,
+                'plano': plano,
+            })
+    return resultados
+
+def status_indices() -> List[Dict]:
+    """Índices declarados e se existem no banco"""
+    inspector = inspect(db.engine)
+    status = []
+    for tabela in db.metadata.sorted_tables:
+        if not tabela.indexes:
+            continue
+        existentes = {indice['name'] for indice in inspector.get_indexes(tabela.name)}
+        for indice in sorted(tabela.indexes, key=lambda i: i.name):
+            status.append({
+                'tabela': tabela.name,
+                'indice': indice.name,
+                'colunas': [c.name for c in indice.columns],
+                'existe': indice.name in existentes,
+            })
+    return status
+
+# ==================== LINHA DE COMANDO ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrações de colunas e índices do banco')
+    parser.add_argument('--verificar', action='store_true', help='Inspeciona o banco mesmo com a assinatura inalterada')
+    parser.add_argument('--autoteste', action='store_true', help='Roda EXPLAIN nas consultas chave')
+    args = parser.parse_args(argv)
+
+    from flask import Flask
+    from config import get_config
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    db.init_app(app)
+
+    with app.app_context():
+        resultado = aplicar_migracoes(forcar=args.verificar)
+        print(f"Colunas adicionadas: {', '.join(resultado['colunas']) or 'nenhuma'}")
+        print(f"Chaves estrangeiras recriadas: {', '.join(resultado['chaves']) or 'nenhuma'}")
+        print(f"Índices criados: {', '.join(resultado['indices']) or 'nenhum'}")
+        if args.autoteste:
+            for item in autoteste_explain():
+                marca = 'OK ' if item['usa_indice'] else 'SEM'
+                print(f"[{marca}] {item['consulta']} ({item['indice_esperado']})")
+                for passo in item['plano']:
+                    print(f"      {passo}")
+
+if __name__ == '__main__':
+    main()
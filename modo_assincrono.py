@@ -0,0 +1,309 @@
+"""
+Modo de execução do servidor: threading, gevent ou eventlet
+
+SOCKETIO_ASYNC_MODE escolhe o modo (padrão threading). Em threading cada
+cliente Socket.IO conectado (long-polling ou WebSocket) ocupa uma thread do
+sistema; em gevent/eventlet as conexões são corrotinas num único laço de
+eventos por worker.
+
+Nos modos com laço de eventos:
+  - preparar_modo_assincrono() precisa rodar antes dos demais imports (início
+    do app.py): aplica o monkey patching, que torna cooperativos socket, ssl,
+    DNS, time.sleep, threading e queue. PyMySQL, requests (Graph) e smtplib são
+    Python puro sobre socket e passam a liberar o laço enquanto esperam a rede.
+  - Trabalho de CPU em extensões C, que não libera o laço (hash de senha,
+    compressão dos backups), vai para o pool de threads nativas via
+    executar_bloqueante().
+  - validar_modo_assincrono() impede a inicialização com o pacote do modo
+    ausente ou sem o monkey patching aplicado.
+
+Produção (um laço por processo; com mais de um worker defina SOCKETIO_MESSAGE_QUEUE):
+    SOCKETIO_ASYNC_MODE=gevent gunicorn -w 1 \\
+        -k geventwebsocket.gunicorn.workers.GeventWebSocketWorker app:app
+
+Benchmark de conexões simultâneas por worker:
+    python modo_assincrono.py --benchmark --modo gevent --conexoes 2000
+    python modo_assincrono.py --benchmark --modo threading --conexoes 2000
+"""
+import os
+import sys
+
+MODOS_SUPORTADOS = ('threading', 'gevent', 'eventlet')
+MODO_PADRAO = 'threading'
+
+# Threads nativas para executar_bloqueante() nos modos com laço de eventos
+TAMANHO_POOL_THREADS = int(os.environ.get('SOCKETIO_POOL_THREADS', 20))
+
+_modo_ativo = MODO_PADRAO
+
+def modo_configurado() -> str:
+    return (os.environ.get('SOCKETIO_ASYNC_MODE') or MODO_PADRAO).strip().lower()
+
+def _monkey_patch_aplicado(modo: str) -> bool:
+    if modo == 'gevent':
+        from gevent import monkey
+        return all(monkey.is_module_patched(nome) for nome in ('socket', 'ssl', 'threading', 'time'))
+    if modo == 'eventlet':
+        from eventlet import patcher
+        return all(patcher.is_monkey_patched(nome) for nome in ('socket', 'thread', 'time'))
+    return True
+
+def _importar_pacote(modo: str):
+    import importlib
+    try:
+        return importlib.import_module(modo)
+    except ImportError:
+        raise RuntimeError(f"SOCKETIO_ASYNC_MODE={modo} exige o pacote {modo} instalado")
+
+def preparar_modo_assincrono() -> str:
+    """
+    Aplica o monkey patching do modo configurado
+
+    Deve ser chamada antes de importar Flask, SQLAlchemy, requests etc.
+    Workers que já aplicam o patching (gunicorn -k gevent/eventlet) são detectados.
+    """
+    global _modo_ativo
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    modo = modo_configurado()
+    if modo == 'gevent':
+        gevent = _importar_pacote(modo)
+        from gevent import monkey
+        if not monkey.is_module_patched('socket'):
+            monkey.patch_all()
+        gevent.get_hub().threadpool.maxsize = TAMANHO_POOL_THREADS
+    elif modo == 'eventlet':
+        eventlet = _importar_pacote(modo)
+        if not eventlet.patcher.is_monkey_patched('socket'):
+            eventlet.monkey_patch()
+        os.environ.setdefault('EVENTLET_THREADPOOL_SIZE', str(TAMANHO_POOL_THREADS))
+    _modo_ativo = modo
+    return modo
+
+def validar_modo_assincrono(modo: str) -> str:
+    """
+    Confere se o modo pode ser usado neste processo
+
+    Raises:
+        ValueError: modo desconhecido
+        RuntimeError: pacote ausente ou monkey patching não aplicado
+    """
+    import importlib
+    import logging
+    logger = logging.getLogger(__name__)
+
+    if modo not in MODOS_SUPORTADOS:
+        raise ValueError(f"SOCKETIO_ASYNC_MODE inválido: {modo} (use {', '.join(MODOS_SUPORTADOS)})")
+    if modo == 'threading':
+        return modo
+
+    _importar_pacote(modo)
+    if not _monkey_patch_aplicado(modo) or _modo_ativo != modo:
+        raise RuntimeError(
+            f"SOCKETIO_ASYNC_MODE={modo} sem monkey patching: chamadas de rede bloqueariam o laço de eventos. "
+            "Chame preparar_modo_assincrono() antes dos demais imports"
+        )
+    if modo == 'gevent':
+        try:
+            importlib.import_module('geventwebsocket')
+        except ImportError:
+            logger.warning("gevent-websocket não instalado: WebSocket via simple-websocket")
+    return modo
+
+def executar_bloqueante(funcao, *args, **kwargs):
+    """
+    Executa trabalho que não libera o laço de eventos (CPU, extensões C)
+
+    Nos modos gevent/eventlet roda no pool de threads nativas e a corrotina
+    atual espera sem travar as demais; em threading chama a função direto.
+    """
+    if _modo_ativo == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(funcao, args, kwargs)
+    if _modo_ativo == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(funcao, *args, **kwargs)
+    return funcao(*args, **kwargs)
+
+# ==================== BENCHMARK ====================
+
+def _elevar_limite_arquivos():
+    try:
+        import resource
+        _, maximo = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (maximo, maximo))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def _servir(porta: int):
+    """Sobe a aplicação completa no modo configurado (processo medido pelo benchmark)"""
+    _elevar_limite_arquivos()
+    import logging
+    logging.disable(logging.INFO)
+    from app import app, socketio
+    socketio.run(app, host='127.0.0.1', port=porta, debug=False, use_reloader=False,
+                 log_output=False, allow_unsafe_werkzeug=True)
+
+def _quadro_texto(texto: str) -> bytes:
+    """Quadro WebSocket de texto mascarado (obrigatório do cliente para o servidor)"""
+    import struct
+    dados = texto.encode('utf-8')
+    mascara = os.urandom(4)
+    if len(dados) < 126:
+        cabecalho = struct.pack('!BB', 0x81, 0x80 | len(dados))
+    else:
+        cabecalho = struct.pack('!BBH', 0x81, 0x80 | 126, len(dados))
+    return cabecalho + mascara + bytes(b ^ mascara[i % 4] for i, b in enumerate(dados))
+
+def _ler_exato(conexao, tamanho: int) -> bytes:
+    dados = b''
+    while len(dados) < tamanho:
+        parte = conexao.recv(tamanho - len(dados))
+        if not parte:
+            raise ConnectionError('conexão encerrada pelo servidor')
+        dados += parte
+    return dados
+
+def _ler_quadro(conexao) -> str:
+    import struct
+    _, tamanho = _ler_exato(conexao, 2)
+    tamanho &= 0x7F
+    if tamanho == 126:
+        tamanho = struct.unpack('!H', _ler_exato(conexao, 2))[0]
+    elif tamanho == 127:
+        tamanho = struct.unpack('!Q', _ler_exato(conexao, 8))[0]
+    return _ler_exato(conexao, tamanho).decode('utf-8', errors='replace')
+
+def _abrir_cliente(porta: int, timeout: float):
+    """Abre uma conexão WebSocket Engine.IO e entra no namespace padrão do Socket.IO"""
+    import base64
+    import socket
+    conexao = socket.create_connection(('127.0.0.1', porta), timeout=timeout)
+    chave = base64.b64encode(os.urandom(16)).decode()
+    conexao.sendall((
+        'GET /socket.io/?EIO=4&transport=websocket HTTP/1.1\r\n'
+        f'Host: 127.0.0.1:{porta}\r\n'
+        'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+        f'Sec-WebSocket-Key: {chave}\r\nSec-WebSocket-Version: 13\r\n\r\n'
+    ).encode())
+    resposta = b''
+    while b'\r\n\r\n' not in resposta:
+        resposta += _ler_exato(conexao, 1)
+    if b' 101 ' not in resposta.split(b'\r\n', 1)[0]:
+        raise ConnectionError(resposta.split(b'\r\n', 1)[0].decode(errors='replace'))
+    if not _ler_quadro(conexao).startswith('0'):
+        raise ConnectionError('handshake Engine.IO inválido')
+    conexao.sendall(_quadro_texto('40'))
+    while True:
+        pacote = _ler_quadro(conexao)
+        if pacote == '2':
+            conexao.sendall(_quadro_texto('3'))
+        elif pacote.startswith('40'):
+            return conexao
+        elif pacote.startswith('44'):
+            raise ConnectionError(f'conexão recusada: {pacote}')
+
+def _status_processo(pid: int) -> dict:
+    status = {}
+    try:
+        with open(f'/proc/{pid}/status') as arquivo:
+            for linha in arquivo:
+                nome, _, valor = linha.partition(':')
+                if nome in ('Threads', 'VmRSS'):
+                    status[nome] = int(valor.split()[0])
+    except OSError:
+        pass
+    return status
+
+def executar_benchmark(modo: str, conexoes: int, porta: int, espera: float, timeout: float) -> dict:
+    """
+    Mede quantas conexões Socket.IO simultâneas um worker sustenta no modo dado
+
+    O servidor roda em outro processo (a aplicação completa); o cliente abre as
+    conexões em corrotinas gevent e as mantém abertas durante `espera` segundos.
+    """
+    import subprocess
+    import time
+    from gevent import monkey
+    monkey.patch_all()
+    import gevent
+    import socket
+
+    _elevar_limite_arquivos()
+    ambiente = dict(os.environ, SOCKETIO_ASYNC_MODE=modo)
+    servidor = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--servir', '--porta', str(porta)],
+                                env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        limite = time.time() + 60
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', porta), timeout=1).close()
+                break
+            except OSError:
+                if servidor.poll() is not None or time.time() > limite:
+                    raise RuntimeError(f'servidor não subiu no modo {modo}')
+                time.sleep(0.5)
+
+        base = _status_processo(servidor.pid)
+        abertas, tempos, falhas = [], [], {}
+
+        def abrir():
+            inicio = time.perf_counter()
+            try:
+                abertas.append(_abrir_cliente(porta, timeout))
+                tempos.append(time.perf_counter() - inicio)
+            except Exception as e:
+                motivo = type(e).__name__
+                falhas[motivo] = falhas.get(motivo, 0) + 1
+
+        inicio = time.perf_counter()
+        gevent.joinall([gevent.spawn(abrir) for _ in range(conexoes)])
+        duracao = time.perf_counter() - inicio
+        gevent.sleep(espera)
+        carga = _status_processo(servidor.pid)
+
+        for conexao in abertas:
+            conexao.close()
+        tempos.sort()
+        rss_extra = carga.get('VmRSS', 0) - base.get('VmRSS', 0)
+        return {
+            'modo': modo,
+            'conexoes_pedidas': conexoes,
+            'conexoes_abertas': len(abertas),
+            'falhas': falhas,
+            'segundos_abertura': round(duracao, 2),
+            'handshake_ms_p50': round(tempos[len(tempos) // 2] * 1000, 1) if tempos else None,
+            'handshake_ms_p95': round(tempos[int(len(tempos) * 0.95)] * 1000, 1) if tempos else None,
+            'threads_servidor': carga.get('Threads'),
+            'rss_servidor_mb': round(carga.get('VmRSS', 0) / 1024, 1),
+            'kb_por_conexao': round(rss_extra / len(abertas), 1) if abertas else None,
+        }
+    finally:
+        servidor.terminate()
+        try:
+            servidor.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            servidor.kill()
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Modo assíncrono do servidor Socket.IO')
+    parser.add_argument('--benchmark', action='store_true', help='mede conexões simultâneas por worker')
+    parser.add_argument('--servir', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--modo', default=modo_configurado(), choices=MODOS_SUPORTADOS)
+    parser.add_argument('--conexoes', type=int, default=1000)
+    parser.add_argument('--porta', type=int, default=5099)
+    parser.add_argument('--espera', type=float, default=5.0, help='segundos com as conexões abertas antes de medir')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    if args.servir:
+        _servir(args.porta)
+    elif args.benchmark:
+        print(json.dumps(executar_benchmark(args.modo, args.conexoes, args.porta, args.espera, args.timeout),
+                         indent=2, ensure_ascii=False))
+    else:
+        parser.print_help()
@@ -3,6 +3,7 @@ Módulo de segurança para proteção contra ataques web
 """
 from .middleware import SecurityMiddleware
 from .rate_limiter import RateLimiter
+from .rate_limit_storage import MemoryBackend, SQLiteBackend, create_backend
 from .csrf_protection import CSRFProtection
 from .input_validator import InputValidator
 from .security_headers import SecurityHeaders
@@ -11,6 +12,9 @@ from .audit_logger import AuditLogger
 __all__ = [
     'SecurityMiddleware',
     'RateLimiter', 
+    'MemoryBackend',
+    'SQLiteBackend',
+    'create_backend',
     'CSRFProtection',
     'InputValidator',
     'SecurityHeaders',
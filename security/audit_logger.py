@@ -1,41 +1,39 @@
 """
 Sistema de auditoria e logging de segurança
 """
-import json
-import logging
 import os
 from datetime import datetime
 from flask import request, current_app, g
 from flask_login import current_user
 
+from .audit_writer import get_writer
+from .audit_query import query_audit_logs
+
 class AuditLogger:
-    def __init__(self, log_dir='logs', log_file='security.log'):
+    def __init__(self, log_dir='logs', log_file='security.log', **writer_options):
         # Configura caminhos absolutos para os logs
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.log_dir = os.path.join(self.base_dir, log_dir)
         self.log_file = os.path.join(self.log_dir, log_file)
         
-        # Cria o diretório se não existir
-        os.makedirs(self.log_dir, exist_ok=True)
-        
-        # Configura logger específico para segurança
-        self.security_logger = logging.getLogger('security')
-        self.security_logger.setLevel(logging.INFO)
-        
-        # Evita adicionar múltiplos handlers
-        if not self.security_logger.handlers:
-            handler = logging.FileHandler(self.log_file)
-            formatter = logging.Formatter(
-                '%(asctime)s - %(levelname)s - %(message)s'
-            )
-            handler.setFormatter(formatter)
-            self.security_logger.addHandler(handler)
+        # Os registros são gravados em segundo plano (JSON por linha, com rotação
+        # e compressão); um único gravador por arquivo, como o handler único anterior
+        self.writer = get_writer(self.log_file, **writer_options)
+    
+    def get_stats(self):
+        """Contadores do gravador (gravados, descartados, na fila, rotações, erros)"""
+        return self.writer.get_stats()
+    
+    def query(self, start=None, end=None, **filters):
+        """Consulta os registros do período nos arquivos ativo e rotacionados"""
+        return query_audit_logs(self.log_file, start, end, **filters)
     
     def log_security_event(self, event_type, message, ip_address=None, url=None, extra_data=None):
         """Registra um evento de segurança"""
         try:
             log_entry = {
                 'timestamp': datetime.utcnow().isoformat(),
+                'level': 'WARNING',
                 'event_type': event_type,
                 'message': message,
                 'ip_address': ip_address or getattr(g, 'client_ip', 'unknown'),
@@ -46,7 +44,7 @@ class AuditLogger:
                 'extra_data': extra_data or {}
             }
             
-            self.security_logger.warning(json.dumps(log_entry, ensure_ascii=False))
+            self.writer.submit(log_entry)
             
         except Exception as e:
             # Fallback para logging básico se houver erro
@@ -67,6 +65,7 @@ class AuditLogger:
             
             log_entry = {
                 'timestamp': datetime.utcnow().isoformat(),
+                'level': 'INFO',
                 'method': request.method,
                 'url': request.url,
                 'ip_address': getattr(g, 'client_ip', request.remote_addr),
@@ -86,7 +85,7 @@ class AuditLogger:
                 if any(critical in request.endpoint for critical in ['login', 'logout', 'delete', 'create']):
                     log_entry['critical_operation'] = True
             
-            self.security_logger.info(json.dumps(log_entry, ensure_ascii=False))
+            self.writer.submit(log_entry)
             
         except Exception as e:
             try:
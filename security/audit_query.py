@@ -0,0 +1,110 @@
+"""
+Consulta aos logs de auditoria (arquivo ativo e segmentos rotacionados .gz)
+
+Os segmentos cujo intervalo de tempo não cruza o período pedido nem são
+abertos; os demais são lidos linha a linha, sem carregar o arquivo inteiro.
+
+Uso:
+    python -m security.audit_query --start 2025-01-01T00:00 --end 2025-01-02T00:00 \\
+        [--event-type LOGIN_FAILED] [--ip 1.2.3.4] [--user-id 7] [--file logs/security.log]
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+
+from .audit_writer import SEGMENT_TIME_FORMAT, parse_line, segment_start
+
+# Registros são gravados quase em ordem; tolerância antes de encerrar a leitura de um arquivo
+ORDER_TOLERANCE = timedelta(seconds=30)
+
+DEFAULT_LOG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs', 'security.log')
+
+_SEGMENT_NAME = re.compile(r'\.(\d{8}T\d{6})(?:-\d+)?\.gz$')
+
+
+def list_segments(log_file):
+    """Segmentos em ordem cronológica: [(inicio, fim, caminho)] (fim None = até agora)"""
+    segments = []
+    for path in glob.glob(glob.escape(log_file) + '.*.gz'):
+        match = _SEGMENT_NAME.search(path)
+        if match:
+            segments.append((datetime.strptime(match.group(1), SEGMENT_TIME_FORMAT), path))
+    segments.sort()
+    if os.path.exists(log_file):
+        active_start = segment_start(log_file) or (segments[-1][0] if segments else datetime.min)
+        segments.append((active_start, log_file))
+
+    result = []
+    for index, (start, path) in enumerate(segments):
+        end = segments[index + 1][0] if index + 1 < len(segments) else None
+        result.append((start, end, path))
+    return result
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+
+def query_audit_logs(log_file=DEFAULT_LOG_FILE, start=None, end=None, event_type=None,
+                     ip_address=None, user_id=None):
+    """
+    Gera os registros de auditoria no período [start, end) que atendem aos filtros
+
+    Args:
+        start, end: datetime em UTC (None = sem limite)
+        event_type, ip_address, user_id: filtros opcionais por igualdade
+    """
+    start_iso = start.isoformat() if start else None
+    end_iso = end.isoformat() if end else None
+    stop_iso = (end + ORDER_TOLERANCE).isoformat() if end else None
+
+    for segment_begin, segment_end, path in list_segments(log_file):
+        if start and segment_end and segment_end + ORDER_TOLERANCE < start:
+            continue
+        if end and segment_begin > end + ORDER_TOLERANCE:
+            break
+
+        with _open(path) as f:
+            for line in f:
+                record = parse_line(line)
+                if not record:
+                    continue
+                timestamp = record.get('timestamp', '')
+                if stop_iso and timestamp > stop_iso:
+                    break
+                if start_iso and timestamp < start_iso:
+                    continue
+                if end_iso and timestamp >= end_iso:
+                    continue
+                if event_type and record.get('event_type') != event_type:
+                    continue
+                if ip_address and record.get('ip_address') != ip_address:
+                    continue
+                if user_id is not None and record.get('user_id') != user_id:
+                    continue
+                yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Consulta os logs de auditoria por período')
+    parser.add_argument('--file', default=DEFAULT_LOG_FILE, help='Arquivo de log ativo')
+    parser.add_argument('--start', type=datetime.fromisoformat, help='Início (ISO 8601, UTC)')
+    parser.add_argument('--end', type=datetime.fromisoformat, help='Fim exclusivo (ISO 8601, UTC)')
+    parser.add_argument('--event-type', help='Tipo de evento (ex.: LOGIN_FAILED)')
+    parser.add_argument('--ip', help='Endereço IP')
+    parser.add_argument('--user-id', type=int, help='ID do usuário')
+    args = parser.parse_args(argv)
+
+    for record in query_audit_logs(args.file, args.start, args.end, args.event_type, args.ip, args.user_id):
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+Gravação assíncrona dos registros de auditoria
+
+Os registros são colocados em uma fila limitada na thread da requisição e
+gravados em lote, como JSON por linha, por uma thread de fundo. O arquivo
+ativo é rotacionado por tamanho e por tempo; os segmentos rotacionados
+recebem no nome o instante (UTC) em que foram abertos e são comprimidos com
+gzip. Com a fila cheia o registro é descartado e contado (overflow='drop')
+ou a requisição espera até block_timeout segundos (overflow='block').
+
+Com vários workers, cada processo tem seu AuditWriter no mesmo arquivo. A
+gravação de cada lote e a rotação acontecem sob uma trava exclusiva (flock)
+no arquivo '<path>.lock'; antes de gravar, o processo reabre o arquivo ativo
+se outro processo já o rotacionou. Sem fcntl (Windows), não há trava entre
+processos.
+"""
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAX_QUEUE = 10000
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0  # segundos
+MAX_BYTES = 50 * 1024 * 1024
+ROTATE_INTERVAL = 24 * 3600  # segundos
+BACKUP_COUNT = 30
+BLOCK_TIMEOUT = 0.05  # segundos
+
+# Formato do instante de abertura no nome dos segmentos rotacionados
+SEGMENT_TIME_FORMAT = '%Y%m%dT%H%M%S'
+
+
+class AuditWriter:
+    """Fila limitada + thread que grava, rotaciona e comprime o log de auditoria"""
+
+    def __init__(self, path, max_queue=MAX_QUEUE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_bytes=MAX_BYTES, rotate_interval=ROTATE_INTERVAL, backup_count=BACKUP_COUNT,
+                 overflow='drop', block_timeout=BLOCK_TIMEOUT):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._lock_file = None
+        self._opened_at = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'written': 0, 'dropped': 0, 'rotations': 0, 'errors': 0}
+        self._stopping = threading.Event()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------------------------------------------------------------- produtor
+
+    def submit(self, record):
+        """Enfileira um registro (dict); retorna False se foi descartado"""
+        try:
+            if self.overflow == 'block':
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+    def flush(self, timeout=5.0):
+        """Aguarda a gravação dos registros enfileirados até agora"""
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self):
+        if self._stopping.is_set():
+            return
+        self.flush()
+        self._stopping.set()
+        self._thread.join(timeout=5.0)
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    # ---------------------------------------------------------------- gravação
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                try:
+                    with self._locked():
+                        self._maybe_rotate()
+                except Exception as e:
+                    self._count('errors')
+                    logger.error(f"Erro ao rotacionar log de auditoria: {str(e)}")
+                continue
+
+            batch, waiters = [], []
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @contextmanager
+    def _locked(self):
+        """Trava exclusiva entre processos para gravar e rotacionar o arquivo ativo"""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(self.path + '.lock', 'a')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(json.dumps(record, ensure_ascii=False, default=str))
+            except (TypeError, ValueError) as e:
+                self._count('errors')
+                logger.error(f"Registro de auditoria não serializável: {str(e)}")
+        if not lines:
+            return
+        try:
+            with self._locked():
+                self._maybe_rotate()
+                if self._file is None:
+                    self._open()
+                # O lote inteiro sob a trava: linhas de processos diferentes não se misturam
+                self._file.write('\n'.join(lines) + '\n')
+                self._file.flush()
+            self._count('written', len(lines))
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Erro ao gravar log de auditoria: {str(e)}")
+
+    def _open(self):
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._opened_at = segment_start(self.path) or datetime.utcnow()
+
+    def _is_current(self):
+        """O arquivo aberto ainda é o ativo (outro processo pode tê-lo rotacionado)"""
+        try:
+            return os.path.samestat(os.fstat(self._file.fileno()), os.stat(self.path))
+        except FileNotFoundError:
+            return False
+
+    def _maybe_rotate(self):
+        """Rotaciona o arquivo ativo se passou do tamanho ou da idade; chamado sob _locked"""
+        if self._file is not None and not self._is_current():
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            if not os.path.exists(self.path):
+                return
+            self._open()
+        # Tamanho do arquivo, não a posição deste processo: os outros também gravam nele
+        size = os.fstat(self._file.fileno()).st_size
+        age = (datetime.utcnow() - self._opened_at).total_seconds()
+        if size and (size >= self.max_bytes or age >= self.rotate_interval):
+            self._rotate()
+
+    def _rotate(self):
+        """Fecha o arquivo ativo, comprime como segmento e remove os mais antigos"""
+        self._file.close()
+        self._file = None
+
+        base = f"{self.path}.{self._opened_at.strftime(SEGMENT_TIME_FORMAT)}"
+        target = base
+        suffix = 1
+        while os.path.exists(target) or os.path.exists(target + '.gz'):
+            target = f"{base}-{suffix}"
+            suffix += 1
+        os.replace(self.path, target)
+        with open(target, 'rb') as source, gzip.open(target + '.gz', 'wb') as compressed:
+            shutil.copyfileobj(source, compressed)
+        os.remove(target)
+        self._count('rotations')
+
+        segments = sorted(glob.glob(glob.escape(self.path) + '.*.gz'))
+        for old in segments[:-self.backup_count] if self.backup_count else []:
+            os.remove(old)
+
+
+def segment_start(path):
+    """Instante do primeiro registro do arquivo ativo (None se vazio ou ilegível)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            record = parse_line(f.readline())
+        if record and record.get('timestamp'):
+            return datetime.fromisoformat(record['timestamp'])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def parse_line(line):
+    """Converte uma linha do log em dict (aceita também o formato antigo 'data - NÍVEL - {json}')"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        start = line.find('{')
+        if start < 0:
+            return None
+        try:
+            return json.loads(line[start:])
+        except ValueError:
+            return None
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path, **options):
+    """Um único AuditWriter por arquivo no processo"""
+    path = os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = AuditWriter(path, **options)
+            _writers[path] = writer
+        return writer
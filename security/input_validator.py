@@ -3,50 +3,96 @@ Validador de entrada para prevenir ataques de injeção
 """
 import re
 import html
-import json
 from urllib.parse import unquote
 from flask import current_app
 
+from .screening import ScreeningEngine
+
+# Padrões maliciosos conhecidos: (nome, regex, literais obrigatórios para o pré-filtro)
+MALICIOUS_RULES = [
+    # SQL Injection
+    ('sql_keyword', r"(\b(union|select|insert|update|delete|drop|create|alter|exec|execute)\b)",
+     ('union', 'select', 'insert', 'update', 'delete', 'drop', 'create', 'alter', 'exec')),
+    ('sql_tautology_numeric', r"(\b(or|and)\s+\d+\s*=\s*\d+)",
+     ('=',)),
+    ('sql_tautology', r"(\b(or|and)\s+['\"]?\w+['\"]?\s*=\s*['\"]?\w+['\"]?)",
+     ('=',)),
+    ('sql_comment', r"(--|#|/\*|\*/)",
+     ('--', '#', '/*', '*/')),
+    ('sql_xp_cmdshell', r"(\bxp_cmdshell\b)",
+     ('xp_cmdshell',)),
+    
+    # XSS
+    ('xss_script', r"(<script[^>]*>.*?</script>)",
+     ('<script',)),
+    ('xss_javascript_uri', r"(javascript\s*:)",
+     ('javascript',)),
+    ('xss_vbscript_uri', r"(vbscript\s*:)",
+     ('vbscript',)),
+    ('xss_event_handler', r"(on\w+\s*=)",
+     ('=',)),
+    ('xss_iframe', r"(<iframe[^>]*>)",
+     ('<iframe',)),
+    ('xss_object', r"(<object[^>]*>)",
+     ('<object',)),
+    ('xss_embed', r"(<embed[^>]*>)",
+     ('<embed',)),
+    ('xss_link', r"(<link[^>]*>)",
+     ('<link',)),
+    ('xss_meta', r"(<meta[^>]*>)",
+     ('<meta',)),
+    
+    # Command Injection
+    ('command_keyword', r"(\b(cmd|powershell|bash|sh|exec|system|eval)\b)",
+     ('cmd', 'powershell', 'bash', 'sh', 'exec', 'system', 'eval')),
+    ('command_operator', r"(\||&|;|\$\(|\`)",
+     ('|', '&', ';', '$(', '`')),
+    ('command_traversal', r"(\.\.\/|\.\.\\)",
+     ('../', '..\\')),
+    
+    # Path Traversal
+    ('path_traversal', r"(\.\.[\\/])",
+     ('../', '..\\')),
+    ('path_traversal_encoded', r"(%2e%2e[\\/])",
+     ('%2e%2e',)),
+    ('path_etc_passwd', r"(etc[\\/]passwd)",
+     ('passwd',)),
+    ('path_system32', r"(windows[\\/]system32)",
+     ('system32',)),
+    
+    # LDAP Injection
+    ('ldap_wildcard', r"(\*\)|\(\|)",
+     ('*)', '(|')),
+    ('ldap_filter', r"(\)\(|\&\()",
+     (')(', '&(')),
+]
+
+SUSPICIOUS_USER_AGENT_RULES = [
+    ('sqlmap', r'sqlmap', ('sqlmap',)),
+    ('nikto', r'nikto', ('nikto',)),
+    ('nmap', r'nmap', ('nmap',)),
+    ('masscan', r'masscan', ('masscan',)),
+    ('zap', r'zap', ('zap',)),
+    ('burp', r'burp', ('burp',)),
+    ('wget', r'wget', ('wget',)),
+    ('curl_bot', r'curl.*bot', ('curl',)),
+    ('python_requests', r'python-requests', ('python-requests',)),
+    ('scanner', r'scanner', ('scanner',)),
+    ('exploit', r'exploit', ('exploit',)),
+]
+
+CONTROL_CHARS = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+
 class InputValidator:
     def __init__(self):
-        # Padrões maliciosos conhecidos
-        self.malicious_patterns = [
-            # SQL Injection
-            r"(\b(union|select|insert|update|delete|drop|create|alter|exec|execute)\b)",
-            r"(\b(or|and)\s+\d+\s*=\s*\d+)",
-            r"(\b(or|and)\s+['\"]?\w+['\"]?\s*=\s*['\"]?\w+['\"]?)",
-            r"(--|#|/\*|\*/)",
-            r"(\bxp_cmdshell\b)",
-            
-            # XSS
-            r"(<script[^>]*>.*?</script>)",
-            r"(javascript\s*:)",
-            r"(vbscript\s*:)",
-            r"(on\w+\s*=)",
-            r"(<iframe[^>]*>)",
-            r"(<object[^>]*>)",
-            r"(<embed[^>]*>)",
-            r"(<link[^>]*>)",
-            r"(<meta[^>]*>)",
-            
-            # Command Injection
-            r"(\b(cmd|powershell|bash|sh|exec|system|eval)\b)",
-            r"(\||&|;|\$\(|\`)",
-            r"(\.\.\/|\.\.\\)",
-            
-            # Path Traversal
-            r"(\.\.[\\/])",
-            r"(%2e%2e[\\/])",
-            r"(etc[\\/]passwd)",
-            r"(windows[\\/]system32)",
-            
-            # LDAP Injection
-            r"(\*\)|\(\|)",
-            r"(\)\(|\&\()",
-        ]
+        # Padrões maliciosos conhecidos, compilados uma única vez
+        self.malicious_patterns = [rule[1] for rule in MALICIOUS_RULES]
+        self.screening = ScreeningEngine(MALICIOUS_RULES)
+        self.user_agent_screening = ScreeningEngine(SUSPICIOUS_USER_AGENT_RULES)
         
         # Caracteres perigosos
         self.dangerous_chars = ['<', '>', '"', "'", '&', '\x00', '\r', '\n']
+        self._dangerous_chars_regex = re.compile('[' + re.escape(''.join(self.dangerous_chars)) + ']')
         
         # Extensões de arquivo perigosas
         self.dangerous_extensions = [
@@ -95,16 +141,16 @@ class InputValidator:
         decoded_url = unquote(url)
         
         # Verifica padrões maliciosos
-        for pattern in self.malicious_patterns:
-            if re.search(pattern, decoded_url, re.IGNORECASE):
-                current_app.logger.warning(f"Padrão malicioso detectado na URL: {pattern}")
-                return False
+        rule = self.screening.check(decoded_url)
+        if rule:
+            current_app.logger.warning(f"Padrão malicioso detectado na URL: {rule}")
+            return False
         
         # Verifica caracteres perigosos
-        for char in self.dangerous_chars:
-            if char in decoded_url:
-                current_app.logger.warning(f"Caractere perigoso detectado na URL: {char}")
-                return False
+        match = self._dangerous_chars_regex.search(decoded_url)
+        if match:
+            current_app.logger.warning(f"Caractere perigoso detectado na URL: {match.group()!r}")
+            return False
         
         return True
     
@@ -127,27 +173,24 @@ class InputValidator:
     
     def validate_query_params(self, args):
         """Valida parâmetros de query string"""
-        for key, value in args.items():
-            if not self.is_safe_string(key) or not self.is_safe_string(value):
-                current_app.logger.warning(f"Parâmetro suspeito detectado: {key}={value}")
-                return False
+        rule = self.screening.check_values(args.items())
+        if rule:
+            current_app.logger.warning(f"Parâmetro suspeito detectado: {rule}")
+            return False
         return True
     
     def validate_form_data(self, form_data):
         """Valida dados de formulário"""
-        for key, value in form_data.items():
-            if not self.is_safe_string(key) or not self.is_safe_string(value):
-                current_app.logger.warning(f"Dados de formulário suspeitos: {key}")
-                return False
+        rule = self.screening.check_values(form_data.items())
+        if rule:
+            current_app.logger.warning(f"Dados de formulário suspeitos: {rule}")
+            return False
         return True
     
     def validate_json_data(self, json_data):
         """Valida dados JSON"""
-        try:
-            json_string = json.dumps(json_data)
-            return self.is_safe_string(json_string)
-        except Exception:
-            return False
+        # Percorre a estrutura decodificada, sem serializar novamente
+        return self.screening.scan(json_data) is None
     
     def validate_uploaded_files(self, files):
         """Valida arquivos enviados"""
@@ -166,15 +209,7 @@ class InputValidator:
     
     def is_safe_string(self, text):
         """Verifica se uma string é segura"""
-        if not isinstance(text, str):
-            text = str(text)
-        
-        # Verifica padrões maliciosos
-        for pattern in self.malicious_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                return False
-        
-        return True
+        return self.screening.check(text) is None
     
     def is_safe_filename(self, filename):
         """Verifica se um nome de arquivo é seguro"""
@@ -200,25 +235,7 @@ class InputValidator:
     
     def is_suspicious_user_agent(self, user_agent):
         """Verifica se o User-Agent é suspeito"""
-        suspicious_patterns = [
-            r'sqlmap',
-            r'nikto',
-            r'nmap',
-            r'masscan',
-            r'zap',
-            r'burp',
-            r'wget',
-            r'curl.*bot',
-            r'python-requests',
-            r'scanner',
-            r'exploit',
-        ]
-        
-        for pattern in suspicious_patterns:
-            if re.search(pattern, user_agent, re.IGNORECASE):
-                return True
-        
-        return False
+        return self.user_agent_screening.check(user_agent) is not None
     
     def sanitize_input(self, text):
         """Sanitiza entrada de dados"""
@@ -229,6 +246,6 @@ class InputValidator:
         text = html.escape(text)
         
         # Remove caracteres de controle
-        text = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', text)
+        text = CONTROL_CHARS.sub('', text)
         
         return text
\ No newline at end of file
@@ -1,19 +1,38 @@
 from flask import request, jsonify, session, g
 from datetime import datetime, timedelta
-import json
 import logging
 from functools import wraps
 import ipaddress
 import re
 
+from .rate_limiter import RateLimiter
+from .rate_limit_storage import create_backend
+from .screening import ScreeningEngine, MAX_DEPTH, MAX_NODES, MAX_CHARS
+
 logger = logging.getLogger(__name__)
 
+# Padrões suspeitos: (nome, regex, literais obrigatórios para o pré-filtro)
+SUSPICIOUS_RULES = [
+    ('xss_script', r'<script[^>]*>.*?</script>', ('<script',)),  # XSS
+    ('sql_union_select', r'union\s+select', ('union',)),  # SQL Injection
+    ('sql_drop_table', r'drop\s+table', ('drop',)),  # SQL Injection
+    ('command_exec', r'exec\s*\(', ('exec',)),  # Command Injection
+    ('xss_javascript_uri', r'javascript:', ('javascript:',)),  # XSS
+    ('xss_event_handler', r'on\w+\s*=', ('=',)),  # Event handlers
+]
+
+# Remoções feitas por sanitize_input
+SANITIZE_PATTERNS = [
+    re.compile(r'<script[^>]*>.*?</script>', re.IGNORECASE),
+    re.compile(r'javascript:', re.IGNORECASE),
+    re.compile(r'on\w+\s*=', re.IGNORECASE),
+]
+
 class SecurityMiddleware:
     def __init__(self, app=None):
         self.app = app
-        self.blocked_ips = {}
-        self.failed_attempts = {}
-        self.rate_limits = {}
+        self.rate_limiter = None
+        self.screening = None
         
         if app is not None:
             self.init_app(app)
@@ -30,6 +49,18 @@ class SecurityMiddleware:
         app.config.setdefault('SECURITY_RATE_LIMIT_REQUESTS', 5000)  # Aumentado para desenvolvimento
         app.config.setdefault('SECURITY_RATE_LIMIT_WINDOW', 3600)  # 1 hora
         
+        # Bloqueios, tentativas falhadas e contadores ficam no backend configurado
+        # (memory:// por processo ou sqlite:///arquivo compartilhado entre workers)
+        self.rate_limiter = RateLimiter(create_backend(app.config.get('RATE_LIMIT_STORAGE_URL')))
+        
+        # Regras de triagem compiladas uma única vez
+        self.screening = ScreeningEngine(
+            SUSPICIOUS_RULES,
+            max_depth=app.config.get('SECURITY_SCREEN_MAX_DEPTH', MAX_DEPTH),
+            max_nodes=app.config.get('SECURITY_SCREEN_MAX_NODES', MAX_NODES),
+            max_chars=app.config.get('SECURITY_SCREEN_MAX_CHARS', MAX_CHARS)
+        )
+        
         logger.info("SecurityMiddleware inicializado")
     
     def get_client_ip(self):
@@ -71,23 +102,19 @@ class SecurityMiddleware:
                     continue
         return False
     
+    @property
+    def storage(self):
+        return self.rate_limiter.backend
+    
     def record_failed_attempt(self, ip):
         """Registra uma tentativa de login falhada"""
-        current_time = datetime.now()
-        
-        if ip not in self.failed_attempts:
-            self.failed_attempts[ip] = {
-                'count': 0,
-                'first_attempt': current_time,
-                'last_attempt': current_time
-            }
-        
-        self.failed_attempts[ip]['count'] += 1
-        self.failed_attempts[ip]['last_attempt'] = current_time
+        # O contador expira após SECURITY_BLOCK_DURATION sem novas falhas
+        duration = self.app.config.get('SECURITY_BLOCK_DURATION', 3600)
+        count = self.storage.incr(f"failed:{ip}", duration)
         
         # Se excedeu o limite, bloqueia o IP
         max_attempts = self.app.config.get('SECURITY_MAX_FAILED_ATTEMPTS', 5)
-        if self.failed_attempts[ip]['count'] >= max_attempts:
+        if count >= max_attempts:
             self.block_ip(ip)
             logger.warning(f"IP {ip} bloqueado após {max_attempts} tentativas falhadas")
     
@@ -96,99 +123,58 @@ class SecurityMiddleware:
         if duration is None:
             duration = self.app.config.get('SECURITY_BLOCK_DURATION', 3600)
         
-        expires = datetime.now() + timedelta(seconds=duration)
-        self.blocked_ips[ip] = {
-            'blocked_at': datetime.now(),
-            'expires': expires,
+        now = datetime.now()
+        expires = now + timedelta(seconds=duration)
+        self.storage.set(f"blocked:{ip}", {
+            'blocked_at': now.timestamp(),
+            'expires': expires.timestamp(),
             'reason': 'Múltiplas tentativas falhadas'
-        }
+        }, ttl=duration)
         
         logger.warning(f"IP {ip} bloqueado até {expires}")
     
+    def get_block_info(self, ip):
+        """Retorna os dados do bloqueio ativo de um IP (None se não bloqueado)"""
+        block_info = self.storage.get(f"blocked:{ip}")
+        if not block_info:
+            return None
+        return {
+            'blocked_at': datetime.fromtimestamp(block_info['blocked_at']) if block_info.get('blocked_at') else None,
+            'expires': datetime.fromtimestamp(block_info['expires']) if block_info.get('expires') else None,
+            'reason': block_info.get('reason')
+        }
+    
     def is_ip_blocked(self, ip):
-        """Verifica se um IP está bloqueado"""
-        if ip not in self.blocked_ips:
-            return False
-        
-        block_info = self.blocked_ips[ip]
-        
-        # Verificar se existe o campo expires e se não é None
-        if 'expires' not in block_info or block_info['expires'] is None:
-            # Se não há expiração definida, remove o bloqueio
-            del self.blocked_ips[ip]
-            return False
-        
-        # Verificar se o bloqueio expirou
-        try:
-            if datetime.now() >= block_info['expires']:
-                # Bloqueio expirou, remover da lista
-                del self.blocked_ips[ip]
-                logger.info(f"Bloqueio do IP {ip} expirou e foi removido")
-                return False
-        except (TypeError, AttributeError) as e:
-            # Se houver erro na comparação, remover o bloqueio inválido
-            logger.error(f"Erro ao verificar expiração do bloqueio para IP {ip}: {e}")
-            del self.blocked_ips[ip]
-            return False
-        
-        return True
+        """Verifica se um IP está bloqueado (bloqueios expirados somem pelo TTL do backend)"""
+        return self.get_block_info(ip) is not None
     
     def unblock_ip(self, ip):
         """Remove o bloqueio de um IP"""
-        if ip in self.blocked_ips:
-            del self.blocked_ips[ip]
+        if self.is_ip_blocked(ip):
+            self.storage.delete(f"blocked:{ip}")
             logger.info(f"IP {ip} desbloqueado manualmente")
     
     def clear_failed_attempts(self, ip):
         """Limpa as tentativas falhadas de um IP"""
-        if ip in self.failed_attempts:
-            del self.failed_attempts[ip]
+        self.storage.delete(f"failed:{ip}")
     
     def check_rate_limit(self, ip):
-        """Verifica o rate limiting para um IP"""
-        current_time = datetime.now()
+        """Verifica o rate limiting global para um IP (janela deslizante, O(1) por requisição)"""
         window = self.app.config.get('SECURITY_RATE_LIMIT_WINDOW', 3600)
         max_requests = self.app.config.get('SECURITY_RATE_LIMIT_REQUESTS', 100)
         
-        if ip not in self.rate_limits:
-            self.rate_limits[ip] = {
-                'requests': [],
-                'window_start': current_time
-            }
-        
-        rate_info = self.rate_limits[ip]
-        
-        # Remove requisições antigas (fora da janela de tempo)
-        cutoff_time = current_time - timedelta(seconds=window)
-        rate_info['requests'] = [req_time for req_time in rate_info['requests'] if req_time > cutoff_time]
-        
-        # Adiciona a requisição atual
-        rate_info['requests'].append(current_time)
-        
-        # Verifica se excedeu o limite
-        if len(rate_info['requests']) > max_requests:
-            logger.warning(f"Rate limit excedido para IP {ip}: {len(rate_info['requests'])} requisições")
-            return False
-        
-        return True
+        allowed, count, _ = self.storage.hit(f"global:{ip}", max_requests, window)
+        if not allowed:
+            logger.warning(f"Rate limit excedido para IP {ip}: {int(count)} requisições")
+        return allowed
     
     def validate_input(self, data):
         """Valida entrada para prevenir ataques"""
         if isinstance(data, str):
-            # Padrões suspeitos
-            suspicious_patterns = [
-                r'<script[^>]*>.*?</script>',  # XSS
-                r'union\s+select',  # SQL Injection
-                r'drop\s+table',  # SQL Injection
-                r'exec\s*\(',  # Command Injection
-                r'javascript:',  # XSS
-                r'on\w+\s*=',  # Event handlers
-            ]
-            
-            for pattern in suspicious_patterns:
-                if re.search(pattern, data, re.IGNORECASE):
-                    logger.warning(f"Entrada suspeita detectada: {pattern}")
-                    return False
+            rule = self.screening.check(data)
+            if rule:
+                logger.warning(f"Entrada suspeita detectada: {rule}")
+                return False
         
         return True
     
@@ -196,9 +182,8 @@ class SecurityMiddleware:
         """Sanitiza entrada de dados"""
         if isinstance(data, str):
             # Remove tags HTML perigosas
-            data = re.sub(r'<script[^>]*>.*?</script>', '', data, flags=re.IGNORECASE)
-            data = re.sub(r'javascript:', '', data, flags=re.IGNORECASE)
-            data = re.sub(r'on\w+\s*=', '', data, flags=re.IGNORECASE)
+            for pattern in SANITIZE_PATTERNS:
+                data = pattern.sub('', data)
         
         return data
     
@@ -216,8 +201,8 @@ class SecurityMiddleware:
             return
         
         # Verifica se o IP está bloqueado
-        if self.is_ip_blocked(client_ip):
-            block_info = self.blocked_ips.get(client_ip, {})
+        block_info = self.get_block_info(client_ip)
+        if block_info:
             expires = block_info.get('expires')
             expires_str = expires.strftime('%Y-%m-%d %H:%M:%S') if expires else 'indefinido'
             
@@ -240,7 +225,9 @@ class SecurityMiddleware:
         if request.is_json and request.content_length and request.content_length > 0:
             try:
                 data = request.get_json(force=True, silent=True)
-                if data and not self.validate_input(json.dumps(data)):
+                rule = self.screening.scan(data) if data else None
+                if rule:
+                    logger.warning(f"Entrada suspeita detectada no JSON: {rule}")
                     return jsonify({'error': 'Dados inválidos'}), 400
             except Exception as e:
                 # Se há Content-Type JSON mas o body não é JSON válido, só logar sem bloquear
@@ -276,28 +263,22 @@ class SecurityMiddleware:
     
     def get_security_status(self):
         """Retorna status atual da segurança"""
+        blocked_ips = [key[len('blocked:'):] for key in self.storage.keys('blocked:')]
         return {
-            'blocked_ips_count': len(self.blocked_ips),
-            'failed_attempts_count': len(self.failed_attempts),
-            'rate_limited_ips': len(self.rate_limits),
-            'blocked_ips': list(self.blocked_ips.keys()),
+            'blocked_ips_count': len(blocked_ips),
+            'failed_attempts_count': len(self.storage.keys('failed:')),
+            'rate_limited_ips': self.storage.count_windows('global:'),
+            'blocked_ips': blocked_ips,
+            'screening_hits': self.screening.get_stats(),
             'security_active': True
         }
     
     def cleanup_expired_blocks(self):
-        """Remove bloqueios expirados (deve ser chamado periodicamente)"""
-        current_time = datetime.now()
-        expired_ips = []
-        
-        for ip, block_info in self.blocked_ips.items():
-            if 'expires' in block_info and block_info['expires'] and current_time >= block_info['expires']:
-                expired_ips.append(ip)
-        
-        for ip in expired_ips:
-            del self.blocked_ips[ip]
-            logger.info(f"Bloqueio expirado removido para IP {ip}")
-        
-        return len(expired_ips)
+        """Remove bloqueios e contadores expirados (o backend também faz isso periodicamente)"""
+        removed = self.storage.cleanup()
+        if removed:
+            logger.info(f"{removed} registros expirados de bloqueio/rate limiting removidos")
+        return removed
 
 # Decorador para endpoints que requerem validação extra
 def require_security_validation(f):
@@ -0,0 +1,296 @@
+"""
+Armazenamento do rate limiting e dos bloqueios de IP
+
+Os contadores usam janela deslizante aproximada (sliding window counter):
+cada chave guarda apenas a contagem da janela atual e da anterior, e a
+estimativa pondera a anterior pelo quanto dela ainda cabe na janela. O custo
+por requisição é O(1) e a memória é constante por chave.
+
+Backends:
+    memory://                 dicionário do processo, com limpeza periódica
+    sqlite:///caminho/arquivo compartilhado entre processos/workers do mesmo host
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# Intervalo mínimo entre limpezas de chaves expiradas
+EVICTION_INTERVAL = 60  # segundos
+SQLITE_TIMEOUT = 5  # segundos aguardando o lock do arquivo
+
+
+def _window_state(state, window, now):
+    """Avança (inicio, atual, anterior) até a janela que contém 'now'"""
+    start = math.floor(now / window) * window
+    if state is None:
+        return start, 0, 0
+    stored_start, current, previous = state
+    if stored_start == start:
+        return start, current, previous
+    if stored_start == start - window:
+        return start, 0, current
+    return start, 0, 0
+
+
+def _estimate(start, current, previous, window, now):
+    """Contagem estimada nos últimos 'window' segundos"""
+    weight = (window - (now - start)) / window
+    return previous * weight + current
+
+
+class MemoryBackend:
+    """Armazenamento em memória do processo (padrão; não compartilhado entre workers)"""
+
+    def __init__(self):
+        self._windows = {}  # chave -> (inicio, atual, anterior, expira)
+        self._values = {}  # chave -> (valor, expira)
+        self._lock = threading.Lock()
+        self._next_eviction = time.time() + EVICTION_INTERVAL
+
+    def _maybe_evict(self, now):
+        if now < self._next_eviction:
+            return
+        self._next_eviction = now + EVICTION_INTERVAL
+        self._evict(now)
+
+    def _evict(self, now):
+        removed = 0
+        for store in (self._windows, self._values):
+            expired = [key for key, item in store.items() if item[-1] is not None and item[-1] <= now]
+            for key in expired:
+                del store[key]
+            removed += len(expired)
+        return removed
+
+    def hit(self, key, limit, window, now=None):
+        """
+        Registra uma requisição se couber no limite
+
+        Returns:
+            (permitido, contagem_estimada, instante_de_reset)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._maybe_evict(now)
+            item = self._windows.get(key)
+            start, current, previous = _window_state(item[:3] if item else None, window, now)
+            count = _estimate(start, current, previous, window, now)
+            allowed = count < limit
+            if allowed:
+                current += 1
+                count += 1
+            self._windows[key] = (start, current, previous, start + 2 * window)
+        return allowed, count, start + window
+
+    def peek(self, key, window, now=None):
+        """Contagem estimada sem registrar requisição"""
+        now = time.time() if now is None else now
+        with self._lock:
+            item = self._windows.get(key)
+            if not item:
+                return 0.0, now
+            start, current, previous = _window_state(item[:3], window, now)
+            return _estimate(start, current, previous, window, now), start + window
+
+    def incr(self, key, ttl):
+        """Incrementa um contador simples; o prazo 'ttl' é renovado a cada incremento"""
+        now = time.time()
+        with self._lock:
+            self._maybe_evict(now)
+            value, expires = self._values.get(key, (0, None))
+            if expires is not None and expires <= now:
+                value = 0
+            value += 1
+            self._values[key] = (value, now + ttl)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    def get(self, key):
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires <= time.time():
+                del self._values[key]
+                return None
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+            self._windows.pop(key, None)
+
+    def keys(self, prefix):
+        now = time.time()
+        with self._lock:
+            return [
+                key for key, (_, expires) in self._values.items()
+                if key.startswith(prefix) and (expires is None or expires > now)
+            ]
+
+    def count_windows(self, prefix):
+        with self._lock:
+            return sum(1 for key in self._windows if key.startswith(prefix))
+
+    def cleanup(self):
+        """Remove imediatamente todas as chaves expiradas"""
+        with self._lock:
+            return self._evict(time.time())
+
+
+class SQLiteBackend:
+    """
+    Armazenamento em arquivo SQLite compartilhado pelos processos do host
+
+    Cada operação de escrita roda em BEGIN IMMEDIATE, o que a torna atômica
+    entre workers; o modo WAL mantém as leituras sem bloqueio.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._next_eviction = time.time() + EVICTION_INTERVAL
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_windows ("
+                " key TEXT PRIMARY KEY, start REAL NOT NULL, current INTEGER NOT NULL,"
+                " previous INTEGER NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_values ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        backend = self
+
+        class _Transaction:
+            def __enter__(self):
+                self.conn = backend._connection()
+                self.conn.execute("BEGIN IMMEDIATE")
+                return self.conn
+
+            def __exit__(self, exc_type, exc, tb):
+                self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+        return _Transaction()
+
+    def _maybe_evict(self, now):
+        if now < self._next_eviction:
+            return
+        self._next_eviction = now + EVICTION_INTERVAL
+        self.cleanup()
+
+    def hit(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        self._maybe_evict(now)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT start, current, previous FROM rate_windows WHERE key = ?", (key,)
+            ).fetchone()
+            start, current, previous = _window_state(row, window, now)
+            count = _estimate(start, current, previous, window, now)
+            allowed = count < limit
+            if allowed:
+                current += 1
+                count += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_windows (key, start, current, previous, expires)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, start, current, previous, start + 2 * window)
+            )
+        return allowed, count, start + window
+
+    def peek(self, key, window, now=None):
+        now = time.time() if now is None else now
+        row = self._connection().execute(
+            "SELECT start, current, previous FROM rate_windows WHERE key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return 0.0, now
+        start, current, previous = _window_state(row, window, now)
+        return _estimate(start, current, previous, window, now), start + window
+
+    def incr(self, key, ttl):
+        now = time.time()
+        self._maybe_evict(now)
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value, expires FROM rate_values WHERE key = ?", (key,)).fetchone()
+            value = 0
+            if row and (row[1] is None or row[1] > now):
+                value = json.loads(row[0])
+            value += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_values (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl)
+            )
+        return value
+
+    def set(self, key, value, ttl=None):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_values (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl if ttl else None)
+            )
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM rate_values WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, key):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM rate_values WHERE key = ?", (key,))
+            conn.execute("DELETE FROM rate_windows WHERE key = ?", (key,))
+
+    def keys(self, prefix):
+        rows = self._connection().execute(
+            "SELECT key FROM rate_values WHERE substr(key, 1, ?) = ? AND (expires IS NULL OR expires > ?)",
+            (len(prefix), prefix, time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def count_windows(self, prefix):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM rate_windows WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+        ).fetchone()[0]
+
+    def cleanup(self):
+        now = time.time()
+        with self._transaction() as conn:
+            removed = conn.execute("DELETE FROM rate_windows WHERE expires <= ?", (now,)).rowcount
+            removed += conn.execute(
+                "DELETE FROM rate_values WHERE expires IS NOT NULL AND expires <= ?", (now,)
+            ).rowcount
+        return removed
+
+
+def create_backend(url=None):
+    """Cria o backend a partir de uma URL (memory:// ou sqlite:///caminho)"""
+    url = url or 'memory://'
+    if url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    raise ValueError(f"Backend de rate limiting não suportado: {url}")
@@ -1,15 +1,15 @@
 """
 Sistema de Rate Limiting para prevenir ataques de força bruta e DDoS
 """
-from datetime import datetime, timedelta
-from collections import defaultdict
 import time
 
+from .rate_limit_storage import create_backend
+
 class RateLimiter:
-    def __init__(self):
-        # Armazena tentativas por IP
-        self.attempts = defaultdict(list)
-        
+    def __init__(self, backend=None):
+        # Armazenamento dos contadores (memória do processo ou compartilhado)
+        self.backend = backend or create_backend()
+
         # Configurações de rate limiting por endpoint
         self.limits = {
             'auth.login': {'requests': 15, 'window': 300},  # 15 tentativas em 5 minutos
@@ -18,100 +18,55 @@ class RateLimiter:
             'default': {'requests': 1000, 'window': 60},  # 1000 requests por minuto (padrão)
             'api_endpoints': {'requests': 800, 'window': 60},  # APIs bem liberais
         }
-    
+
+    def _key(self, ip, endpoint):
+        # Cria chave única para IP + endpoint
+        return f"rl:{ip}:{endpoint or 'unknown'}"
+
     def is_allowed(self, ip, endpoint):
         """Verifica se uma requisição é permitida baseada no rate limiting"""
-        current_time = time.time()
-        
-        # Determina o limite para o endpoint
         limit_config = self.get_limit_config(endpoint)
-        max_requests = limit_config['requests']
-        window_seconds = limit_config['window']
-        
-        # Cria chave única para IP + endpoint
-        key = f"{ip}:{endpoint or 'unknown'}"
-        
-        # Remove tentativas antigas
-        self.cleanup_old_attempts(key, current_time, window_seconds)
-        
-        # Verifica se excedeu o limite
-        if len(self.attempts[key]) >= max_requests:
-            return False
-        
-        # Adiciona a tentativa atual
-        self.attempts[key].append(current_time)
-        return True
-    
+        allowed, _, _ = self.backend.hit(
+            self._key(ip, endpoint), limit_config['requests'], limit_config['window']
+        )
+        return allowed
+
     def get_limit_config(self, endpoint):
         """Obtém configuração de limite para um endpoint específico"""
         if not endpoint:
             return self.limits['default']
-        
+
         # Verifica se é um endpoint de API
         if endpoint.startswith('api') or '/api/' in str(endpoint):
             return self.limits['api_endpoints']
-        
+
         # Verifica endpoints específicos
         if endpoint in self.limits:
             return self.limits[endpoint]
-        
+
         return self.limits['default']
-    
-    def cleanup_old_attempts(self, key, current_time, window_seconds):
-        """Remove tentativas antigas fora da janela de tempo"""
-        cutoff_time = current_time - window_seconds
-        self.attempts[key] = [
-            attempt_time for attempt_time in self.attempts[key]
-            if attempt_time > cutoff_time
-        ]
-    
+
+    def cleanup_old_attempts(self):
+        """Remove contadores de janelas já encerradas"""
+        return self.backend.cleanup()
+
     def get_remaining_attempts(self, ip, endpoint):
         """Retorna o número de tentativas restantes"""
-        current_time = time.time()
         limit_config = self.get_limit_config(endpoint)
-        max_requests = limit_config['requests']
-        window_seconds = limit_config['window']
-        
-        key = f"{ip}:{endpoint or 'unknown'}"
-        self.cleanup_old_attempts(key, current_time, window_seconds)
-        
-        return max(0, max_requests - len(self.attempts[key]))
-    
+        count, _ = self.backend.peek(self._key(ip, endpoint), limit_config['window'])
+        return max(0, int(limit_config['requests'] - count))
+
     def get_reset_time(self, ip, endpoint):
         """Retorna quando o rate limit será resetado"""
-        current_time = time.time()
         limit_config = self.get_limit_config(endpoint)
-        window_seconds = limit_config['window']
-        
-        key = f"{ip}:{endpoint or 'unknown'}"
-        
-        if not self.attempts[key]:
-            return current_time
-        
-        oldest_attempt = min(self.attempts[key])
-        return oldest_attempt + window_seconds
-    
+        count, reset_time = self.backend.peek(self._key(ip, endpoint), limit_config['window'])
+        return reset_time if count else time.time()
+
     def block_ip_temporarily(self, ip, duration_minutes=15):
         """Bloqueia um IP temporariamente"""
-        current_time = time.time()
-        block_until = current_time + (duration_minutes * 60)
-        
-        # Adiciona muitas tentativas falsas para bloquear
-        key = f"{ip}:blocked"
-        self.attempts[key] = [block_until] * 1000  # Número alto para garantir bloqueio
-    
+        block_until = time.time() + (duration_minutes * 60)
+        self.backend.set(f"blocked:{ip}", {'expires': block_until}, ttl=duration_minutes * 60)
+
     def is_ip_blocked(self, ip):
         """Verifica se um IP está bloqueado"""
-        current_time = time.time()
-        key = f"{ip}:blocked"
-        
-        if key in self.attempts:
-            # Se ainda há tentativas "falsas" no futuro, está bloqueado
-            future_attempts = [t for t in self.attempts[key] if t > current_time]
-            if future_attempts:
-                return True
-            else:
-                # Remove o bloqueio expirado
-                del self.attempts[key]
-        
-        return False
+        return self.backend.get(f"blocked:{ip}") is not None
@@ -0,0 +1,139 @@
+"""
+Triagem de entrada com regras pré-compiladas
+
+Cada regra é compilada uma única vez e pode declarar literais obrigatórios:
+substrings (em minúsculas) sem as quais o padrão não tem como casar. O texto
+é convertido para minúsculas uma vez e a regex só roda para as regras cujo
+literal aparece nele (pré-filtro por substring, confirmação por regex).
+
+Estruturas JSON já decodificadas são percorridas no lugar, com limites de
+profundidade, quantidade de itens e total de caracteres. Cada chave e cada
+string é verificada separadamente na forma escapada de JSON, como na
+verificação antiga sobre json.dumps da estrutura: quebras de linha viram
+"\\n" (um payload em várias linhas continua casando) e strings vizinhas nunca
+se juntam em um acerto. Os acertos são contados por regra.
+"""
+import json
+import re
+import threading
+from collections import Counter
+
+# Limites padrão para estruturas JSON
+MAX_DEPTH = 64
+MAX_NODES = 100000
+MAX_CHARS = 4 * 1024 * 1024
+
+# Nomes usados nos contadores quando um limite é excedido
+RULE_MAX_DEPTH = 'limite_profundidade'
+RULE_MAX_NODES = 'limite_itens'
+RULE_MAX_CHARS = 'limite_tamanho'
+
+# Caracteres não ASCII que re.IGNORECASE considera iguais a letras ASCII
+# (İ, ı, ſ e o sinal de Kelvin); convertidos antes do pré-filtro para que ele
+# nunca descarte um texto que a regex casaria
+ASCII_CASE_FOLD = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
+
+def _fold(text):
+    if text.isascii():
+        return text.lower()
+    return text.translate(ASCII_CASE_FOLD).lower()
+
+
+class ScreeningEngine:
+    """
+    Conjunto de regras de triagem
+
+    Cada regra é (nome, padrão) ou (nome, padrão, literais). Regras sem
+    literais são sempre avaliadas.
+    """
+
+    def __init__(self, rules, flags=re.IGNORECASE, max_depth=MAX_DEPTH,
+                 max_nodes=MAX_NODES, max_chars=MAX_CHARS):
+        self.rules = [
+            (rule[0], re.compile(rule[1], flags), tuple(rule[2]) if len(rule) > 2 and rule[2] else ())
+            for rule in rules
+        ]
+        self._uses_literals = any(literals for _, _, literals in self.rules)
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_chars = max_chars
+        self._hits = Counter()
+        self._lock = threading.Lock()
+
+    def _record(self, rule):
+        with self._lock:
+            self._hits[rule] += 1
+        return rule
+
+    def match_text(self, text):
+        """Nome da primeira regra que casa com o texto (None se seguro); não conta acertos"""
+        if not isinstance(text, str):
+            text = str(text)
+        lowered = _fold(text) if self._uses_literals else text
+        for name, regex, literals in self.rules:
+            if literals and not any(literal in lowered for literal in literals):
+                continue
+            if regex.search(text):
+                return name
+        return None
+
+    def check(self, text):
+        """Como match_text, registrando o acerto nos contadores"""
+        rule = self.match_text(text)
+        return self._record(rule) if rule else None
+
+    def check_values(self, items):
+        """Verifica pares chave/valor (query string, formulário), cada chave e valor separadamente"""
+        for key, value in items:
+            rule = self.match_text(key) or self.match_text(value)
+            if rule:
+                return self._record(rule)
+        return None
+
+    def scan(self, data):
+        """
+        Verifica chaves e strings de uma estrutura JSON decodificada
+
+        Returns:
+            Nome da regra (ou do limite) violado, ou None
+        """
+        nodes = 0
+        chars = 0
+        stack = [(data, 0)]
+        while stack:
+            value, depth = stack.pop()
+            nodes += 1
+            if nodes > self.max_nodes:
+                return self._record(RULE_MAX_NODES)
+            if depth > self.max_depth:
+                return self._record(RULE_MAX_DEPTH)
+
+            if isinstance(value, str):
+                texts = (value,)
+            elif isinstance(value, dict):
+                texts = [key for key in value if isinstance(key, str)]
+                stack.extend((item, depth + 1) for item in value.values())
+            else:
+                texts = ()
+                if isinstance(value, (list, tuple)):
+                    stack.extend((item, depth + 1) for item in value)
+
+            for text in texts:
+                chars += len(text)
+                if chars > self.max_chars:
+                    return self._record(RULE_MAX_CHARS)
+                rule = self.match_text(json.dumps(text))
+                if rule:
+                    return self._record(rule)
+
+        return None
+
+    def get_stats(self):
+        """Contadores de acertos por regra"""
+        with self._lock:
+            return dict(self._hits)
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits.clear()
@@ -8,7 +8,8 @@ class SecurityConfig:
     """Configurações de segurança centralizadas"""
     
     # Rate Limiting
-    RATE_LIMIT_STORAGE_URL = "memory://"
+    # memory:// (por processo) ou sqlite:///instance/rate_limit.db (compartilhado entre workers do host)
+    RATE_LIMIT_STORAGE_URL = os.environ.get('RATE_LIMIT_STORAGE_URL', 'memory://')
     RATELIMIT_HEADERS_ENABLED = True
     
     # Configurações de sessão
@@ -2,6 +2,10 @@ from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from database import db, Chamado, AgenteSuporte, ChamadoAgente, User, get_brazil_time, NotificacaoAgente, HistoricoAtendimento
 from sqlalchemy import func
+from setores.ti.sla_utils import registrar_snapshot_sla
+from setores.ti.atribuicao_agentes import ChamadoJaAtribuido, reivindicar_chamado
+from setores.ti.contadores import recalcular_contadores
+from setores.ti.tempo_real import SALA_ADMIN, SALA_TI, emitir, sala_agente
 import logging
 import traceback
 import pytz
@@ -185,6 +189,7 @@ def atualizar_chamado_agente(chamado_id):
                     chamado_agente.finalizar_atribuicao()
 
         db.session.commit()
+        registrar_snapshot_sla(chamado.id)
 
         # Enviar e-mail de notificação
         try:
@@ -401,7 +406,7 @@ Sistema de Suporte TI - Evoque Fitness
         try:
             from flask import current_app
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_transferido', {
+                emitir('chamado_transferido', {
                     'chamado_id': chamado.id,
                     'codigo': chamado.codigo,
                     'protocolo': chamado.protocolo,
@@ -417,10 +422,10 @@ Sistema de Suporte TI - Evoque Fitness
                     'transferido_por': f"{current_user.nome} {current_user.sobrenome}",
                     'observacoes': observacoes,
                     'timestamp': get_brazil_time().isoformat()
-                }, room=f'agente_{agente_destino.id}')
+                }, [sala_agente(agente_destino.id)])
                 
                 # Emitir também para administradores
-                current_app.socketio.emit('chamado_transferido_admin', {
+                emitir('chamado_transferido_admin', {
                     'chamado_id': chamado.id,
                     'codigo': chamado.codigo,
                     'protocolo': chamado.protocolo,
@@ -432,7 +437,7 @@ Sistema de Suporte TI - Evoque Fitness
                     'transferido_por': f"{current_user.nome} {current_user.sobrenome}",
                     'observacoes': observacoes,
                     'timestamp': get_brazil_time().isoformat()
-                }, room='admin')
+                }, [SALA_ADMIN])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -460,7 +465,7 @@ def listar_agentes_ativos():
 
         agentes_list = []
         for agente, usuario in agentes:
-            chamados_ativos = agente.get_chamados_ativos()
+            chamados_ativos = agente.get_carga()
             
             agentes_list.append({
                 'id': agente.id,
@@ -587,7 +592,8 @@ def estatisticas_agente():
             'chamados_ativos': chamados_ativos,
             'concluidos_hoje': concluidos_hoje,
             'disponiveis': chamados_disponiveis,
-            'limite_max': agente.max_chamados_simultaneos
+            'limite_max': agente.max_chamados_simultaneos,
+            'notificacoes_nao_lidas': agente.get_notificacoes_nao_lidas()
         }
 
         return json_response(estatisticas)
@@ -724,15 +730,6 @@ def atribuir_chamado_para_mim(chamado_id):
         if not chamado:
             return error_response('Chamado não encontrado', 404)
 
-        # Verificar se o chamado já está atribuído
-        atribuicao_existente = ChamadoAgente.query.filter_by(
-            chamado_id=chamado_id,
-            ativo=True
-        ).first()
-
-        if atribuicao_existente:
-            return error_response('Chamado já está atribuído a outro agente', 400)
-
         # Verificar se o agente pode receber mais chamados
         if not agente.pode_receber_chamado():
             return error_response('Você já atingiu o limite máximo de chamados simultâneos', 400)
@@ -741,19 +738,16 @@ def atribuir_chamado_para_mim(chamado_id):
         if chamado.status not in ['Aberto', 'Aguardando']:
             return error_response('Chamado não está disponível para atribuição', 400)
 
-        # Criar nova atribuição
-        nova_atribuicao = ChamadoAgente(
-            chamado_id=chamado_id,
-            agente_id=agente.id,
-            atribuido_por=current_user.id,
-            observacoes=f'Auto-atribuição pelo agente'
-        )
+        # Criar nova atribuição (o índice único recusa se outro agente já reivindicou)
+        try:
+            reivindicar_chamado(chamado_id, agente.id, current_user.id, 'Auto-atribuição pelo agente')
+        except ChamadoJaAtribuido:
+            return error_response('Chamado já está atribuído a outro agente', 400)
 
         # Se o chamado estava "Aberto", muda para "Aguardando"
         if chamado.status == 'Aberto':
             chamado.status = 'Aguardando'
 
-        db.session.add(nova_atribuicao)
         db.session.commit()
 
         # Criar notificação para o agente
@@ -824,7 +818,7 @@ Equipe de Suporte TI - Evoque Fitness
         try:
             from flask import current_app
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_atribuido', {
+                emitir('chamado_atribuido', {
                     'chamado_id': chamado.id,
                     'codigo': chamado.codigo,
                     'protocolo': chamado.protocolo,
@@ -835,7 +829,7 @@ Equipe de Suporte TI - Evoque Fitness
                     'agente_nome': f"{current_user.nome} {current_user.sobrenome}",
                     'agente_email': current_user.email,
                     'timestamp': get_brazil_time().isoformat()
-                })
+                }, [SALA_TI])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -909,6 +903,21 @@ def listar_notificacoes():
         logger.error(f"Erro ao listar notificações: {str(e)}")
         return error_response('Erro interno no servidor')
 
+@agente_api_bp.route('/api/agente/notificacoes/nao-lidas', methods=['GET'])
+@api_login_required
+def contar_notificacoes_nao_lidas():
+    """Retorna o número de notificações não lidas do agente logado"""
+    try:
+        agente = AgenteSuporte.query.filter_by(usuario_id=current_user.id, ativo=True).first()
+        if not agente:
+            return error_response('Usuário não é um agente de suporte', 403)
+
+        return json_response({'nao_lidas': agente.get_notificacoes_nao_lidas()})
+
+    except Exception as e:
+        logger.error(f"Erro ao contar notificações não lidas: {str(e)}")
+        return error_response('Erro interno no servidor')
+
 @agente_api_bp.route('/api/agente/notificacoes/<int:notificacao_id>/marcar-lida', methods=['POST'])
 @api_login_required
 def marcar_notificacao_lida(notificacao_id):
@@ -954,6 +963,7 @@ def marcar_todas_notificacoes_lidas():
             'lida': True,
             'data_leitura': get_brazil_time().replace(tzinfo=None)
         })
+        recalcular_contadores(grupos=(), agentes=[agente.id])
 
         db.session.commit()
 
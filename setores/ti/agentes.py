@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from database import db, User, AgenteSuporte, ChamadoAgente, Chamado
 from auth.auth_helpers import setor_required
+from setores.ti.atribuicao_agentes import ChamadoJaAtribuido, atribuir_automaticamente, motor_atribuicao
 import json
 import logging
 
@@ -36,7 +37,7 @@ def listar_agentes():
                 'especialidades': agente.especialidades_list,
                 'nivel_experiencia': agente.nivel_experiencia,
                 'max_chamados_simultaneos': agente.max_chamados_simultaneos,
-                'chamados_ativos': agente.get_chamados_ativos(),
+                'chamados_ativos': agente.get_carga(),
                 'pode_receber_chamado': agente.pode_receber_chamado(),
                 'data_criacao': agente.data_criacao.strftime('%d/%m/%Y %H:%M') if agente.data_criacao else None
             })
@@ -163,6 +164,7 @@ def excluir_agente(agente_id):
         # Finalizar todas as atribuições antigas
         ChamadoAgente.query.filter_by(agente_id=agente_id, ativo=True).update({
             'ativo': False,
+            'chamado_ativo_id': None,
             'data_conclusao': db.func.now()
         })
         
@@ -287,6 +289,42 @@ def atribuir_chamado(chamado_id):
         logger.error(f"Erro ao atribuir chamado: {str(e)}")
         return error_response('Erro interno no servidor')
 
+@agentes_bp.route('/api/chamados/<int:chamado_id>/atribuir-automatico', methods=['POST'])
+@login_required
+@setor_required('Administrador')
+def atribuir_chamado_automaticamente(chamado_id):
+    """Atribui o chamado ao agente disponível de menor ocupação"""
+    try:
+        chamado = Chamado.query.get(chamado_id)
+        if not chamado:
+            return error_response('Chamado não encontrado', 404)
+
+        if chamado.status not in ['Aberto', 'Aguardando']:
+            return error_response('Chamado não está disponível para atribuição')
+
+        try:
+            atribuicao = atribuir_automaticamente(chamado, current_user.id)
+        except ChamadoJaAtribuido:
+            return error_response('Chamado já possui agente atribuído')
+
+        if not atribuicao:
+            return error_response('Nenhum agente disponível no momento', 409)
+
+        db.session.commit()
+
+        agente = AgenteSuporte.query.get(atribuicao.agente_id)
+        logger.info(f"Chamado {chamado.codigo} atribuído automaticamente ao agente {agente.usuario.nome} por {current_user.nome}")
+
+        return json_response({
+            'message': f'Chamado {chamado.codigo} atribuído ao agente {agente.usuario.nome}',
+            'agente_id': agente.id
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro na atribuição automática: {str(e)}")
+        return error_response('Erro interno no servidor')
+
 @agentes_bp.route('/api/usuarios-disponiveis', methods=['GET'])
 @login_required
 @setor_required('Administrador')
@@ -331,11 +369,7 @@ def obter_estatisticas_agentes():
         chamados_atribuidos = ChamadoAgente.query.filter_by(ativo=True).count()
 
         # Agentes disponíveis (ativos que podem receber mais chamados)
-        agentes = AgenteSuporte.query.filter_by(ativo=True).all()
-        agentes_disponiveis = 0
-        for agente in agentes:
-            if agente.pode_receber_chamado():
-                agentes_disponiveis += 1
+        agentes_disponiveis = motor_atribuicao.contar_disponiveis()
 
         estatisticas = {
             'total_agentes': total_agentes,
@@ -0,0 +1,364 @@
+"""
+Motor de atribuição de chamados aos agentes de suporte
+
+Mantém em memória a carga de cada agente (atribuições ativas em chamados
+Aberto/Aguardando, lida do contador agentes_suporte.chamados_ativos_count),
+reconstruída do banco na inicialização e atualizada a cada commit que toca
+ChamadoAgente, Chamado.status ou AgenteSuporte. Só os agentes
+afetados são recontados; uma ressincronização completa a cada
+INTERVALO_RESSINCRONIZACAO_AGENTES segundos absorve as alterações feitas por
+outros workers ou fora do ORM.
+
+A escolha automática usa um heap por especialidade (e um geral, '*') ordenado
+por ocupação (carga / máximo), nível de experiência e carga, com invalidação
+preguiçosa das entradas antigas: O(log n) por escolha e por atualização.
+
+A exclusividade da atribuição é garantida pelo banco: ChamadoAgente.chamado_ativo_id
+repete o chamado_id enquanto a atribuição está ativa e tem índice único, então
+dois agentes reivindicando o mesmo chamado ao mesmo tempo resultam em um
+sucesso e um ChamadoJaAtribuido.
+"""
+import heapq
+import json
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import and_, event, func, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import db, AgenteSuporte, Chamado, ChamadoAgente, get_brazil_time
+from setores.ti.contadores import recalcular_contadores
+
+logger = logging.getLogger(__name__)
+
+NIVEIS_EXPERIENCIA = {'senior': 0, 'pleno': 1, 'junior': 2}  # menor = preferido no desempate
+INTERVALO_RESSINCRONIZACAO_AGENTES = 60  # segundos
+HEAP_GERAL = '*'
+
+class ChamadoJaAtribuido(Exception):
+    """O chamado já tem uma atribuição ativa"""
+
+def _normalizar(especialidade) -> str:
+    return str(especialidade or '').strip().lower()
+
+def _especialidades(valor: Optional[str]) -> Set[str]:
+    try:
+        lista = json.loads(valor) if valor else []
+    except (TypeError, json.JSONDecodeError):
+        return set()
+    return {_normalizar(e) for e in lista if _normalizar(e)} if isinstance(lista, list) else set()
+
+class _EstadoAgente:
+    __slots__ = ('carga', 'maximo', 'ativo', 'especialidades', 'nivel', 'versao')
+
+    def __init__(self, carga: int, maximo: int, ativo: bool, especialidades: Set[str], nivel: int, versao: int):
+        self.carga = carga
+        self.maximo = maximo
+        self.ativo = ativo
+        self.especialidades = especialidades
+        self.nivel = nivel
+        self.versao = versao
+
+    def chave(self, agente_id: int):
+        ocupacao = self.carga / self.maximo if self.maximo > 0 else 1.0
+        return (ocupacao, self.nivel, self.carga, agente_id, self.versao)
+
+class MotorAtribuicao:
+    """Contadores de carga por agente e fila de prioridade para a escolha automática"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._agentes: Dict[int, _EstadoAgente] = {}
+        self._heaps: Dict[str, List] = {}
+        self._versao = 0
+        self.pronto = False
+
+    # ---------- carga do banco ----------
+
+    @staticmethod
+    def _consultar(conn, ids_agentes: Optional[Iterable[int]] = None) -> Dict[int, _EstadoAgente]:
+        agentes = select(
+            AgenteSuporte.id, AgenteSuporte.ativo, AgenteSuporte.especialidades,
+            AgenteSuporte.nivel_experiencia, AgenteSuporte.max_chamados_simultaneos,
+            AgenteSuporte.chamados_ativos_count
+        )
+        if ids_agentes is not None:
+            agentes = agentes.where(AgenteSuporte.id.in_(list(ids_agentes)))
+
+        estados = {}
+        for agente_id, ativo, especialidades, nivel, maximo, carga in conn.execute(agentes):
+            estados[agente_id] = _EstadoAgente(
+                carga=carga or 0,
+                maximo=maximo if maximo is not None else 10,
+                ativo=ativo is None or bool(ativo),
+                especialidades=_especialidades(especialidades),
+                nivel=NIVEIS_EXPERIENCIA.get(_normalizar(nivel), len(NIVEIS_EXPERIENCIA)),
+                versao=0,
+            )
+        return estados
+
+    def _publicar(self, agente_id: int, estado: Optional[_EstadoAgente]):
+        """Substitui o estado do agente e empilha a nova chave (chamar com o lock)"""
+        if estado is None:
+            self._agentes.pop(agente_id, None)
+            return
+        self._versao += 1
+        estado.versao = self._versao
+        self._agentes[agente_id] = estado
+        if not estado.ativo:
+            return
+        chave = estado.chave(agente_id)
+        for nome in estado.especialidades | {HEAP_GERAL}:
+            heap = self._heaps.setdefault(nome, [])
+            heapq.heappush(heap, chave)
+            if len(heap) > 2 * len(self._agentes) + 64:
+                self._compactar(nome)
+
+    def _compactar(self, nome: str):
+        heap = [chave for chave in self._heaps[nome] if self._valida(chave)]
+        heapq.heapify(heap)
+        self._heaps[nome] = heap
+
+    def _valida(self, chave) -> bool:
+        estado = self._agentes.get(chave[3])
+        return estado is not None and estado.versao == chave[4] and estado.ativo
+
+    def reconstruir(self):
+        """Recarrega todos os agentes e cargas (inicialização e ressincronização)"""
+        with db.engine.connect() as conn:
+            estados = self._consultar(conn)
+        with self._lock:
+            self._agentes = {}
+            self._heaps = {}
+            for agente_id, estado in estados.items():
+                self._publicar(agente_id, estado)
+            self.pronto = True
+        logger.debug(f"Motor de atribuição reconstruído: {len(estados)} agentes")
+
+    def atualizar(self, ids_agentes: Iterable[int] = (), ids_chamados: Iterable[int] = ()):
+        """Reconta os agentes informados e os que têm atribuição ativa nos chamados informados"""
+        ids_agentes = {i for i in ids_agentes if i is not None}
+        ids_chamados = [i for i in ids_chamados if i is not None]
+        if not self.pronto:
+            return
+        with db.engine.connect() as conn:
+            if ids_chamados:
+                ids_agentes.update(conn.execute(
+                    select(ChamadoAgente.agente_id).where(
+                        ChamadoAgente.chamado_id.in_(ids_chamados), ChamadoAgente.ativo == True
+                    )
+                ).scalars())
+            if not ids_agentes:
+                return
+            estados = self._consultar(conn, ids_agentes)
+        with self._lock:
+            for agente_id in ids_agentes:
+                self._publicar(agente_id, estados.get(agente_id))
+
+    def _garantir_pronto(self):
+        if not self.pronto:
+            self.reconstruir()
+
+    # ---------- consultas ----------
+
+    def carga(self, agente_id: int) -> int:
+        """Chamados ativos atribuídos ao agente"""
+        self._garantir_pronto()
+        estado = self._agentes.get(agente_id)
+        return estado.carga if estado else 0
+
+    def contar_disponiveis(self) -> int:
+        """Agentes ativos abaixo do limite de chamados simultâneos"""
+        self._garantir_pronto()
+        with self._lock:
+            return sum(1 for e in self._agentes.values() if e.ativo and e.carga < e.maximo)
+
+    def _topo(self, nome: str, excluir: Set[int]) -> Optional[int]:
+        heap = self._heaps.get(nome)
+        if not heap:
+            return None
+        retiradas = []
+        escolhido = None
+        while heap:
+            chave = heap[0]
+            if not self._valida(chave):
+                heapq.heappop(heap)
+                continue
+            if chave[0] >= 1:
+                break  # o de menor ocupação está cheio: todos estão
+            if chave[3] in excluir:
+                retiradas.append(heapq.heappop(heap))
+                continue
+            escolhido = chave[3]
+            break
+        for chave in retiradas:
+            heapq.heappush(heap, chave)
+        return escolhido
+
+    def escolher(self, especialidade: Optional[str] = None, excluir: Iterable[int] = ()) -> Optional[int]:
+        """
+        Agente com capacidade livre e menor ocupação
+
+        Prefere quem tem a especialidade; sem especialista disponível, usa todos.
+        """
+        self._garantir_pronto()
+        excluir = set(excluir)
+        with self._lock:
+            nome = _normalizar(especialidade)
+            agente_id = self._topo(nome, excluir) if nome else None
+            if agente_id is None:
+                agente_id = self._topo(HEAP_GERAL, excluir)
+            return agente_id
+
+motor_atribuicao = MotorAtribuicao()
+
+# ==================== ATRIBUIÇÃO ====================
+
+def reivindicar_chamado(chamado_id: int, agente_id: int, atribuido_por: Optional[int] = None,
+                        observacoes: Optional[str] = None) -> ChamadoAgente:
+    """
+    Grava a atribuição ativa do chamado ao agente (o commit fica com quem chama)
+
+    Raises:
+        ChamadoJaAtribuido: outra atribuição ativa já existe; a sessão é revertida
+    """
+    atribuicao = ChamadoAgente(
+        chamado_id=chamado_id,
+        agente_id=agente_id,
+        atribuido_por=atribuido_por,
+        observacoes=observacoes
+    )
+    db.session.add(atribuicao)
+    try:
+        db.session.flush()
+    except IntegrityError as e:
+        db.session.rollback()
+        logger.info(f"Chamado {chamado_id} já atribuído; reivindicação do agente {agente_id} recusada: {str(e.orig)}")
+        raise ChamadoJaAtribuido(chamado_id)
+    return atribuicao
+
+def atribuir_automaticamente(chamado: Chamado, atribuido_por: Optional[int] = None,
+                             observacoes: str = 'Atribuição automática') -> Optional[ChamadoAgente]:
+    """
+    Atribui o chamado ao agente disponível de menor ocupação (preferindo a especialidade do problema)
+
+    Returns:
+        A atribuição criada, ou None se nenhum agente tem capacidade livre
+
+    Raises:
+        ChamadoJaAtribuido: o chamado já tem agente
+    """
+    agente_id = motor_atribuicao.escolher(chamado.problema)
+    if agente_id is None:
+        return None
+    return reivindicar_chamado(chamado.id, agente_id, atribuido_por, observacoes)
+
+# ==================== EVENTOS DA SESSÃO ====================
+
+def _pendentes(session) -> Dict[str, Set[int]]:
+    return session.info.setdefault('atribuicao_pendente', {'agentes': set(), 'chamados': set()})
+
+def _apos_flush(session, flush_context):
+    agentes, chamados = set(), set()
+    for obj in session.new:
+        if isinstance(obj, ChamadoAgente):
+            agentes.add(obj.agente_id)
+        elif isinstance(obj, AgenteSuporte):
+            agentes.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, ChamadoAgente):
+            agentes.add(obj.agente_id)
+            agentes.update(inspect(obj).attrs.agente_id.history.deleted)
+        elif isinstance(obj, Chamado):
+            if inspect(obj).attrs.status.history.has_changes():
+                chamados.add(obj.id)
+        elif isinstance(obj, AgenteSuporte):
+            agentes.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, ChamadoAgente):
+            agentes.add(obj.agente_id)
+        elif isinstance(obj, AgenteSuporte):
+            agentes.add(obj.id)
+        elif isinstance(obj, Chamado):
+            chamados.add(obj.id)
+    if agentes or chamados:
+        pendentes = _pendentes(session)
+        pendentes['agentes'].update(agentes)
+        pendentes['chamados'].update(chamados)
+
+def _apos_commit(session):
+    pendentes = session.info.pop('atribuicao_pendente', None)
+    if not pendentes:
+        return
+    try:
+        motor_atribuicao.atualizar(pendentes['agentes'], pendentes['chamados'])
+    except Exception as e:
+        logger.error(f"Erro ao atualizar a carga dos agentes: {str(e)}")
+
+def _apos_rollback(session):
+    session.info.pop('atribuicao_pendente', None)
+
+def registrar_eventos():
+    if event.contains(Session, 'after_flush', _apos_flush):
+        return
+    event.listen(Session, 'after_flush', _apos_flush)
+    event.listen(Session, 'after_commit', _apos_commit)
+    event.listen(Session, 'after_rollback', _apos_rollback)
+
+registrar_eventos()
+
+# ==================== INICIALIZAÇÃO ====================
+
+def corrigir_atribuicoes_ativas() -> int:
+    """
+    Preenche chamado_ativo_id nas atribuições gravadas antes do índice único
+
+    Se um chamado tem mais de uma atribuição ativa, mantém a mais recente e
+    finaliza as demais. Retorna quantas foram finalizadas.
+    """
+    tabela = ChamadoAgente.__table__
+    agora = get_brazil_time().replace(tzinfo=None)
+    with db.engine.begin() as conn:
+        conn.execute(update(tabela).where(
+            tabela.c.ativo == False, tabela.c.chamado_ativo_id.isnot(None)
+        ).values(chamado_ativo_id=None))
+
+        sem_marca = and_(tabela.c.ativo == True, tabela.c.chamado_ativo_id.is_(None))
+        duplicados = conn.execute(
+            select(tabela.c.chamado_id, func.max(tabela.c.id)).where(
+                tabela.c.ativo == True,
+                tabela.c.chamado_id.in_(select(tabela.c.chamado_id).where(sem_marca))
+            ).group_by(tabela.c.chamado_id).having(func.count(tabela.c.id) > 1)
+        ).all()
+        for chamado_id, manter_id in duplicados:
+            conn.execute(update(tabela).where(
+                tabela.c.chamado_id == chamado_id, tabela.c.ativo == True, tabela.c.id != manter_id
+            ).values(ativo=False, chamado_ativo_id=None, data_conclusao=agora))
+        if duplicados:
+            logger.warning(f"Atribuições ativas duplicadas finalizadas em {len(duplicados)} chamado(s)")
+
+        conn.execute(update(tabela).where(sem_marca).values(chamado_ativo_id=tabela.c.chamado_id))
+    return len(duplicados)
+
+def executar_ressincronizacao(app, socketio):
+    while True:
+        socketio.sleep(INTERVALO_RESSINCRONIZACAO_AGENTES)
+        try:
+            with app.app_context():
+                motor_atribuicao.reconstruir()
+        except Exception as e:
+            logger.error(f"Erro ao ressincronizar a carga dos agentes: {str(e)}")
+
+def iniciar_atribuicao(app, socketio):
+    """Corrige as atribuições antigas, carrega as cargas e agenda a ressincronização"""
+    try:
+        with app.app_context():
+            if corrigir_atribuicoes_ativas():
+                recalcular_contadores(grupos=())
+                db.session.commit()
+            motor_atribuicao.reconstruir()
+    except Exception as e:
+        logger.error(f"Erro ao carregar a carga dos agentes: {str(e)}")
+    socketio.start_background_task(executar_ressincronizacao, app, socketio)
@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from database import db, LogAcesso, LogAcao, SessaoAtiva, User, get_brazil_time
 from auth.auth_helpers import setor_required
 from setores.ti.painel import json_response, error_response
+from setores.ti.paginacao import CursorInvalido, paginar
 import logging
 from datetime import datetime, timedelta
 import pytz
@@ -22,8 +23,6 @@ def listar_logs_acesso():
         dias = request.args.get('dias', 7, type=int)
         usuario_id = request.args.get('usuario_id', type=int)
         ip_address = request.args.get('ip')
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 5, type=int)
 
         # Data limite
         data_limite = get_brazil_time().replace(tzinfo=None) - timedelta(days=dias)
@@ -36,15 +35,17 @@ def listar_logs_acesso():
         if usuario_id:
             query = query.filter(LogAcesso.usuario_id == usuario_id)
         if ip_address:
-            query = query.filter(LogAcesso.ip_address.like(f'%{ip_address}%'))
+            query = query.filter(LogAcesso.ip_address.like(f'{ip_address}%'))
 
-        # Ordenar por data mais recente e paginar
-        logs_paginated = query.order_by(LogAcesso.data_acesso.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Mais recentes primeiro (keyset com limit/cursor, page/per_page no formato legado)
+        try:
+            linhas, paginacao = paginar(query, LogAcesso.data_acesso, LogAcesso.id,
+                                        limite_padrao=5, registro=lambda linha: linha[0])
+        except CursorInvalido:
+            return error_response('Cursor inválido', 400)
 
         logs_data = []
-        for log, usuario in logs_paginated.items:
+        for log, usuario in linhas:
             # Calcular duração da sessão se ainda ativa
             duracao = log.duracao_sessao
             if log.ativo and not log.data_logout and log.data_acesso:
@@ -75,14 +76,7 @@ def listar_logs_acesso():
 
         return json_response({
             'logs': logs_data,
-            'pagination': {
-                'page': logs_paginated.page,
-                'pages': logs_paginated.pages,
-                'per_page': logs_paginated.per_page,
-                'total': logs_paginated.total,
-                'has_next': logs_paginated.has_next,
-                'has_prev': logs_paginated.has_prev
-            }
+            'pagination': paginacao
         })
 
     except Exception as e:
@@ -0,0 +1,509 @@
+"""
+Backup e restauração do banco em arquivo JSON por linha comprimido
+
+Cada tabela do escopo é lida em lotes pela chave primária (id > último id),
+com cursor do lado do servidor (stream_results), e as linhas são gravadas à
+medida que chegam em um arquivo gzip ou zstd; o SHA-256 é calculado sobre os
+bytes comprimidos enquanto o arquivo é escrito. O backup roda em segundo
+plano e o progresso (tabelas concluídas e registros) fica no próprio
+BackupHistorico, visível de qualquer processo. Enquanto gera o arquivo, o
+processo mantém a trava 'backup:<id>' (ver setores/ti/travas.py); um backup
+'em_progresso' só é dado como interrompido quando essa trava vence.
+
+Formato (uma linha JSON por registro):
+    {"tipo": "cabecalho", "versao": 1, "escopo": ..., "incremental_desde": ...}
+    {"tipo": "tabela", "nome": ..., "colunas": [...], "incremental": bool}
+    [valor, valor, ...]                       (uma linha por registro)
+    {"tipo": "fim_tabela", "nome": ..., "registros": n}
+    {"tipo": "rodape", "registros_total": n}
+
+O backup incremental inclui as linhas com data_atualizacao (ou data_acao,
+data_acesso, data_criacao) posterior ao início do último backup concluído do
+mesmo tipo; tabelas sem essas colunas vão completas. Exclusões não são
+registradas no incremental.
+
+Restauração (linha de comando):
+    python -m setores.ti.backup --restaurar backups/backup_completo_20250101_020000_1.jsonl.gz [--substituir]
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.types import Date, DateTime, LargeBinary, Numeric, Time
+
+from database import db, BackupHistorico, get_brazil_time
+from modo_assincrono import executar_bloqueante
+from setores.ti.tempo_real import SALA_ADMIN, emitir
+from setores.ti.travas import adquirir_trava, liberar_trava, manter_trava
+
+try:
+    import zstandard
+except ImportError:  # zstd é opcional; sem o pacote só gzip fica disponível
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+VERSAO_FORMATO = 1
+TAMANHO_LOTE_BACKUP = 2000
+NIVEL_GZIP = 6
+NIVEL_ZSTD = 3
+DIRETORIO_BACKUP_PADRAO = 'backups/'
+TEMPO_TRAVA_BACKUP = 120  # segundos sem renovação até o backup ser considerado interrompido
+INTERVALO_VERIFICACAO_BACKUPS = 300  # segundos entre verificações de backups interrompidos
+
+EXTENSOES = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+# Colunas usadas pelo backup incremental, em ordem de preferência
+COLUNAS_INCREMENTAIS = ('data_atualizacao', 'data_acao', 'data_acesso', 'data_criacao')
+
+TABELAS_CONFIGURACOES = ('configuracoes', 'configuracoes_avancadas', 'configuracoes_sla', 'horario_comercial', 'feriados')
+# Os resumos diários dos logs acompanham os logs, para restaurarem juntos
+TABELAS_LOGS = ('logs_acesso', 'logs_acoes', 'resumo_diario_acessos', 'resumo_diario_acoes')
+# O próprio histórico de backups não entra no backup
+TABELAS_EXCLUIDAS = ('backup_historico',)
+
+TIPOS_BACKUP = ('completo', 'dados', 'configuracoes', 'logs')
+
+
+def compressoes_disponiveis() -> List[str]:
+    return ['gzip', 'zstd'] if zstandard else ['gzip']
+
+def tabelas_do_escopo(tipo: str) -> List:
+    """Tabelas do escopo em ordem de dependência (pais antes dos filhos)"""
+    tabelas = [t for t in db.metadata.sorted_tables if t.name not in TABELAS_EXCLUIDAS]
+    if tipo == 'configuracoes':
+        return [t for t in tabelas if t.name in TABELAS_CONFIGURACOES]
+    if tipo == 'logs':
+        return [t for t in tabelas if t.name in TABELAS_LOGS]
+    if tipo == 'dados':
+        return [t for t in tabelas if t.name not in TABELAS_CONFIGURACOES + TABELAS_LOGS]
+    return tabelas
+
+def coluna_incremental(tabela):
+    for nome in COLUNAS_INCREMENTAIS:
+        if nome in tabela.c:
+            return tabela.c[nome]
+    return None
+
+# ==================== SERIALIZAÇÃO ====================
+
+def _serializar(valor):
+    if isinstance(valor, (datetime, date, dt_time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(valor)).decode('ascii')
+    return valor
+
+def _conversor(coluna):
+    """Função que converte o valor gravado de volta ao tipo da coluna"""
+    tipo = coluna.type
+    if isinstance(tipo, DateTime):
+        return datetime.fromisoformat
+    if isinstance(tipo, Date):
+        return date.fromisoformat
+    if isinstance(tipo, Time):
+        return dt_time.fromisoformat
+    if isinstance(tipo, Numeric) and getattr(tipo, 'asdecimal', False):
+        return Decimal
+    if isinstance(tipo, LargeBinary):
+        return base64.b64decode
+    return None
+
+class _EscritorComHash:
+    """Arquivo de saída que atualiza o SHA-256 com os bytes (já comprimidos) escritos"""
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.sha256 = hashlib.sha256()
+        self.tamanho = 0
+
+    def write(self, dados):
+        self.sha256.update(dados)
+        self.tamanho += len(dados)
+        return self.arquivo.write(dados)
+
+    def flush(self):
+        self.arquivo.flush()
+
+    def close(self):
+        self.arquivo.close()
+
+    @property
+    def closed(self):
+        return self.arquivo.closed
+
+    def writable(self):
+        return True
+
+def _abrir_saida(caminho: str, compressao: str):
+    escritor = _EscritorComHash(open(caminho, 'wb'))
+    if compressao == 'zstd':
+        saida = zstandard.ZstdCompressor(level=NIVEL_ZSTD).stream_writer(escritor)
+    else:
+        saida = gzip.GzipFile(fileobj=escritor, mode='wb', compresslevel=NIVEL_GZIP)
+    return saida, escritor
+
+def _fechar(saida, escritor):
+    saida.close()
+    # GzipFile não fecha o arquivo recebido em fileobj
+    if not escritor.closed:
+        escritor.close()
+
+def _abrir_entrada(caminho: str):
+    if caminho.endswith('.zst'):
+        if not zstandard:
+            raise RuntimeError('Pacote zstandard não instalado')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(caminho, 'rb'), closefd=True), encoding='utf-8')
+    return gzip.open(caminho, 'rt', encoding='utf-8')
+
+def hash_arquivo(caminho: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            sha256.update(bloco)
+    return sha256.hexdigest()
+
+# ==================== GERAÇÃO ====================
+
+def _linhas_tabela(conn, tabela, desde: Optional[datetime], tamanho_lote: int):
+    """Gera as linhas da tabela em lotes pela chave primária, com cursor do lado do servidor"""
+    chave = list(tabela.primary_key.columns)
+    base = select(tabela)
+    coluna_data = coluna_incremental(tabela) if desde else None
+    if coluna_data is not None:
+        base = base.where(coluna_data > desde)
+
+    if len(chave) != 1:
+        # Sem chave simples: uma única leitura ordenada, ainda em streaming
+        resultado = conn.execution_options(stream_results=True, yield_per=tamanho_lote).execute(base.order_by(*chave))
+        for linha in resultado:
+            yield linha
+        return
+
+    pk = chave[0]
+    ultimo = None
+    while True:
+        consulta = base.order_by(pk).limit(tamanho_lote)
+        if ultimo is not None:
+            consulta = consulta.where(pk > ultimo)
+        resultado = conn.execution_options(stream_results=True, yield_per=tamanho_lote).execute(consulta)
+        quantidade = 0
+        for linha in resultado:
+            quantidade += 1
+            ultimo = linha._mapping[pk.name]
+            yield linha
+        if quantidade < tamanho_lote:
+            return
+
+def gerar_backup(caminho: str, tipo: str, compressao: str = 'gzip', desde: Optional[datetime] = None,
+                 tamanho_lote: int = TAMANHO_LOTE_BACKUP, ao_concluir_tabela=None) -> Dict:
+    """
+    Grava o backup do escopo em caminho
+
+    Args:
+        desde: se informado, backup incremental a partir deste instante
+        ao_concluir_tabela: callback(nome_tabela, registros_tabela, registros_total)
+
+    Returns:
+        {'hash': sha256, 'tamanho_bytes': n, 'tabelas': [...], 'registros_total': n}
+    """
+    tabelas = tabelas_do_escopo(tipo)
+    parcial = caminho + '.parcial'
+    saida, escritor = _abrir_saida(parcial, compressao)
+    total = 0
+    try:
+        def gravar(linhas: List):
+            # compressão e SHA-256 fora do laço de eventos (modo gevent/eventlet)
+            executar_bloqueante(saida.write, ''.join(linhas).encode('utf-8'))
+
+        gravar([json.dumps({
+            'tipo': 'cabecalho', 'versao': VERSAO_FORMATO, 'escopo': tipo, 'compressao': compressao,
+            'incremental_desde': desde.isoformat() if desde else None,
+            'gerado_em': get_brazil_time().replace(tzinfo=None).isoformat(),
+            'dialeto': db.engine.dialect.name,
+        }) + '\n'])
+
+        with db.engine.connect() as conn:
+            for tabela in tabelas:
+                colunas = [c.name for c in tabela.columns]
+                incremental = bool(desde) and coluna_incremental(tabela) is not None
+                gravar([json.dumps({'tipo': 'tabela', 'nome': tabela.name, 'colunas': colunas,
+                                    'incremental': incremental}) + '\n'])
+                registros = 0
+                lote = []
+                for linha in _linhas_tabela(conn, tabela, desde, tamanho_lote):
+                    lote.append(json.dumps([_serializar(valor) for valor in linha], ensure_ascii=False) + '\n')
+                    if len(lote) >= tamanho_lote:
+                        gravar(lote)
+                        registros += len(lote)
+                        lote = []
+                if lote:
+                    gravar(lote)
+                    registros += len(lote)
+                gravar([json.dumps({'tipo': 'fim_tabela', 'nome': tabela.name, 'registros': registros}) + '\n'])
+                total += registros
+                if ao_concluir_tabela:
+                    ao_concluir_tabela(tabela.name, registros, total)
+
+        gravar([json.dumps({'tipo': 'rodape', 'registros_total': total}) + '\n'])
+    except Exception:
+        _fechar(saida, escritor)
+        os.remove(parcial)
+        raise
+    _fechar(saida, escritor)
+
+    os.replace(parcial, caminho)
+    return {
+        'hash': escritor.sha256.hexdigest(),
+        'tamanho_bytes': escritor.tamanho,
+        'tabelas': [t.name for t in tabelas],
+        'registros_total': total,
+    }
+
+# ==================== RESTAURAÇÃO ====================
+
+def restaurar_backup(caminho: str, substituir: bool = False, hash_esperado: Optional[str] = None,
+                     tamanho_lote: int = TAMANHO_LOTE_BACKUP) -> Dict:
+    """
+    Lê o backup em streaming e grava as linhas de volta, um lote por transação
+
+    As linhas de cada lote substituem as de mesma chave primária (apaga e
+    insere). Com substituir=True, em backups completos (não incrementais), a
+    tabela é esvaziada antes. No MySQL as FKs ficam desligadas durante a carga.
+
+    Returns:
+        {tabela: registros restaurados}
+    """
+    if hash_esperado and hash_arquivo(caminho) != hash_esperado:
+        raise ValueError('SHA-256 do arquivo não confere com o registrado no backup')
+
+    tabelas = {t.name: t for t in db.metadata.sorted_tables}
+    restaurados = {}
+    mysql = db.engine.dialect.name == 'mysql'
+
+    with db.engine.connect() as conn, _abrir_entrada(caminho) as entrada:
+        if mysql:
+            conn.execute(text('SET FOREIGN_KEY_CHECKS=0'))
+            conn.commit()
+        try:
+            cabecalho = json.loads(entrada.readline())
+            if cabecalho.get('tipo') != 'cabecalho' or cabecalho.get('versao') != VERSAO_FORMATO:
+                raise ValueError('Arquivo de backup em formato desconhecido')
+
+            tabela = colunas = conversores = None
+            lote = []
+
+            def carregar():
+                chave = list(tabela.primary_key.columns)
+                with conn.begin():
+                    if len(chave) == 1:
+                        valores = [linha[chave[0].name] for linha in lote]
+                        conn.execute(delete(tabela).where(chave[0].in_(valores)))
+                    conn.execute(insert(tabela), lote)
+                restaurados[tabela.name] = restaurados.get(tabela.name, 0) + len(lote)
+                lote.clear()
+
+            for linha_arquivo in entrada:
+                registro = json.loads(linha_arquivo)
+                if isinstance(registro, list):
+                    if tabela is None:
+                        continue
+                    lote.append({
+                        coluna: (conversor(valor) if conversor and valor is not None else valor)
+                        for coluna, conversor, valor in zip(colunas, conversores, registro)
+                        if coluna in tabela.c
+                    })
+                    if len(lote) >= tamanho_lote:
+                        carregar()
+                elif registro.get('tipo') == 'tabela':
+                    tabela = tabelas.get(registro['nome'])
+                    if tabela is None:
+                        logger.warning(f"Tabela {registro['nome']} do backup não existe mais; ignorada")
+                        continue
+                    colunas = registro['colunas']
+                    conversores = [_conversor(tabela.c[c]) if c in tabela.c else None for c in colunas]
+                    restaurados.setdefault(tabela.name, 0)
+                    if substituir and not registro.get('incremental'):
+                        with conn.begin():
+                            conn.execute(delete(tabela))
+                elif registro.get('tipo') == 'fim_tabela':
+                    if tabela is not None and lote:
+                        carregar()
+                    tabela = None
+        finally:
+            if mysql:
+                conn.rollback()
+                conn.execute(text('SET FOREIGN_KEY_CHECKS=1'))
+                conn.commit()
+    return restaurados
+
+# ==================== EXECUÇÃO EM SEGUNDO PLANO ====================
+
+def diretorio_backup(app) -> str:
+    diretorio = app.config.get('BACKUP_PATH') or DIRETORIO_BACKUP_PADRAO
+    if not os.path.isabs(diretorio):
+        diretorio = os.path.join(app.root_path, diretorio)
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
+
+def inicio_ultimo_backup(tipo: str) -> Optional[datetime]:
+    """Início do último backup concluído do tipo (base do incremental)"""
+    ultimo = BackupHistorico.query.filter_by(tipo=tipo, status='concluido') \
+        .order_by(BackupHistorico.data_inicio.desc()).first()
+    return ultimo.data_inicio if ultimo else None
+
+def _nome_trava(backup_id: int) -> str:
+    return f'backup:{backup_id}'
+
+def _executar_backup(app, socketio, backup_id: int, compressao: str, desde: Optional[datetime]):
+    with app.app_context(), manter_trava(app, _nome_trava(backup_id), TEMPO_TRAVA_BACKUP) as concessao:
+        if concessao is None:
+            logger.error(f"Backup {backup_id} não executado: trava pertence a outro processo")
+            return
+        backup = BackupHistorico.query.get(backup_id)
+        if not backup or backup.status != 'em_progresso':
+            return
+        caminho = backup.caminho_arquivo
+        concluidas = []
+
+        def ao_concluir_tabela(nome, registros, total):
+            if not concessao.valida:
+                raise RuntimeError('Trava do backup perdida para outro processo')
+            concluidas.append(nome)
+            db.session.execute(
+                BackupHistorico.__table__.update().where(BackupHistorico.__table__.c.id == backup_id)
+                .values(tabelas_incluidas=json.dumps(concluidas), registros_total=total)
+            )
+            db.session.commit()
+            emitir('backup_progresso', progresso_backup(backup_id, len(concluidas), total), [SALA_ADMIN], socketio=socketio)
+
+        try:
+            resultado = gerar_backup(caminho, backup.tipo, compressao, desde, ao_concluir_tabela=ao_concluir_tabela)
+            backup = BackupHistorico.query.get(backup_id)
+            backup.status = 'concluido'
+            backup.hash_arquivo = resultado['hash']
+            backup.tamanho_mb = round(resultado['tamanho_bytes'] / (1024 * 1024), 3)
+            backup.tabelas_incluidas = json.dumps(resultado['tabelas'])
+            backup.registros_total = resultado['registros_total']
+        except Exception as e:
+            logger.error(f"Erro durante execução do backup {backup_id}: {str(e)}")
+            db.session.rollback()
+            backup = BackupHistorico.query.get(backup_id)
+            backup.status = 'erro'
+            backup.erro_detalhes = str(e)
+        backup.data_fim = get_brazil_time().replace(tzinfo=None)
+        backup.tempo_execucao = backup.calcular_duracao()
+        db.session.commit()
+        emitir('backup_concluido', {'id': backup.id, 'status': backup.status, 'tamanho_mb': backup.tamanho_mb}, [SALA_ADMIN], socketio=socketio)
+
+def agendar_backup(app, socketio, backup: BackupHistorico, compressao: str, incremental: bool = False) -> Optional[datetime]:
+    """Define o arquivo do backup e inicia a geração em segundo plano; retorna a base do incremental"""
+    desde = inicio_ultimo_backup(backup.tipo) if incremental else None
+    sufixo = '_incremental' if desde else ''
+    backup.nome_arquivo = (f"backup_{backup.tipo}{sufixo}_{backup.data_inicio.strftime('%Y%m%d_%H%M%S')}"
+                           f"_{backup.id}{EXTENSOES[compressao]}")
+    backup.caminho_arquivo = os.path.join(diretorio_backup(app), backup.nome_arquivo)
+    backup.compressao = compressao
+    db.session.commit()
+    # Trava adquirida já na requisição: a verificação de interrompidos de outro
+    # worker nunca vê o backup sem dono antes de a tarefa começar
+    adquirir_trava(_nome_trava(backup.id), TEMPO_TRAVA_BACKUP)
+    socketio.start_background_task(_executar_backup, app, socketio, backup.id, compressao, desde)
+    return desde
+
+def progresso_backup(backup_id: int, tabelas_concluidas: Optional[int] = None, registros: Optional[int] = None) -> Dict:
+    backup = BackupHistorico.query.get(backup_id)
+    if tabelas_concluidas is None:
+        tabelas_concluidas = len(json.loads(backup.tabelas_incluidas or '[]'))
+        registros = backup.registros_total or 0
+    total_tabelas = len(tabelas_do_escopo(backup.tipo))
+    return {
+        'id': backup.id,
+        'status': backup.status,
+        'tabelas_concluidas': tabelas_concluidas,
+        'total_tabelas': total_tabelas,
+        'registros': registros,
+        'percentual': round(100.0 * tabelas_concluidas / total_tabelas, 1) if total_tabelas else 100.0,
+        'tamanho_mb': backup.tamanho_mb,
+        'hash_arquivo': backup.hash_arquivo,
+        'erro_detalhes': backup.erro_detalhes,
+    }
+
+def falhar_backups_interrompidos() -> List[int]:
+    """
+    Marca como erro os backups 'em_progresso' cuja trava venceu (processo encerrado)
+
+    A trava do backup é adquirida antes de mexer no registro e no arquivo
+    parcial, então um backup ainda em geração por outro processo nunca é tocado.
+    """
+    interrompidos = []
+    for (backup_id,) in db.session.query(BackupHistorico.id).filter_by(status='em_progresso').all():
+        if not adquirir_trava(_nome_trava(backup_id), TEMPO_TRAVA_BACKUP, apenas_vencida=True):
+            continue
+        try:
+            backup = BackupHistorico.query.get(backup_id)
+            if backup.status != 'em_progresso':
+                continue
+            backup.status = 'erro'
+            backup.erro_detalhes = 'Backup interrompido: o processo que o gerava foi encerrado'
+            backup.data_fim = get_brazil_time().replace(tzinfo=None)
+            db.session.commit()
+            if backup.caminho_arquivo and os.path.exists(backup.caminho_arquivo + '.parcial'):
+                os.remove(backup.caminho_arquivo + '.parcial')
+            interrompidos.append(backup_id)
+        finally:
+            liberar_trava(_nome_trava(backup_id))
+    db.session.commit()
+    return interrompidos
+
+def iniciar_backups(app, socketio):
+    """Inicia a verificação periódica de backups interrompidos"""
+    def _loop():
+        while True:
+            with app.app_context():
+                try:
+                    for backup_id in falhar_backups_interrompidos():
+                        logger.warning(f"Backup {backup_id} interrompido marcado como erro")
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Erro ao verificar backups interrompidos: {str(e)}")
+                finally:
+                    db.session.remove()
+            socketio.sleep(INTERVALO_VERIFICACAO_BACKUPS)
+
+    socketio.start_background_task(_loop)
+
+# ==================== LINHA DE COMANDO ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Restauração de backups do banco')
+    parser.add_argument('--restaurar', required=True, help='Arquivo de backup (.jsonl.gz ou .jsonl.zst)')
+    parser.add_argument('--substituir', action='store_true', help='Esvazia as tabelas de backups completos antes de carregar')
+    args = parser.parse_args(argv)
+
+    from flask import Flask
+    from config import get_config
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    db.init_app(app)
+
+    with app.app_context():
+        registro = BackupHistorico.query.filter_by(nome_arquivo=os.path.basename(args.restaurar)).first()
+        restaurados = restaurar_backup(args.restaurar, substituir=args.substituir,
+                                       hash_esperado=registro.hash_arquivo if registro else None)
+        for tabela, quantidade in restaurados.items():
+            print(f"{tabela}: {quantidade} registros")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+"""
+Busca textual em chamados, usuários e logs de ação por índice invertido
+
+A tabela termos_busca guarda, para cada registro indexado, os termos dos seus
+campos de texto (minúsculos, sem acentos, com pelo menos TAMANHO_MINIMO_TERMO
+caracteres) com o maior peso dos campos em que aparecem e os bits desses
+campos. Cada palavra buscada vira uma faixa da chave primária
+(entidade, termo, registro_id): o termo buscado é prefixo dos termos
+encontrados, e a consulta não percorre a tabela de origem como o LIKE '%x%'.
+Todas as palavras precisam aparecer; a pontuação soma os pesos, em dobro
+quando o termo é exato.
+
+Manutenção incremental:
+  - chamados e usuários: o evento after_flush da sessão troca os termos dos
+    registros incluídos, alterados ou removidos, na mesma transação;
+  - logs de ação (gravados em lote pelo logs_buffer): indexados em segundo
+    plano a cada INTERVALO_INDEXACAO_LOGS segundos a partir do último id
+    indexado, e antes de cada busca em logs.
+
+A primeira construção roda em um só worker (trava TRAVA_CONSTRUCAO); até
+ela terminar, as buscas usam o LIKE nas colunas de origem. Para reconstruir (alterações fora do ORM, restauração manual):
+
+    python -m setores.ti.busca --reconstruir
+"""
+import argparse
+import logging
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, event, exists, func, insert, inspect, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import db, Chamado, Configuracao, LogAcao, TermoBusca, User, get_brazil_time
+from setores.ti.travas import manter_trava
+
+logger = logging.getLogger(__name__)
+
+VERSAO_INDICE = '1'  # alterar força a reconstrução na próxima inicialização
+CHAVE_VERSAO = 'busca_indice_versao'
+CHAVE_MARCA_LOGS = 'busca_logs_indexados_ate'
+
+TAMANHO_MINIMO_TERMO = 2
+TAMANHO_MAXIMO_TERMO = 40  # termos_busca.termo
+MAXIMO_TERMOS_REGISTRO = 300
+MAXIMO_PALAVRAS_BUSCA = 8
+TAMANHO_LOTE_INDEXACAO = 1000
+INTERVALO_INDEXACAO_LOGS = 30  # segundos
+TRAVA_CONSTRUCAO = 'busca:construcao'
+TEMPO_TRAVA_CONSTRUCAO = 120  # segundos; renovada enquanto a reconstrução roda
+JANELA_REVISAO_LOGS = 1000  # ids abaixo da marca revistos (inserções concluídas fora de ordem)
+
+PALAVRAS_IGNORADAS = {
+    'da', 'das', 'de', 'do', 'dos', 'em', 'na', 'nas', 'no', 'nos', 'um', 'uma',
+    'para', 'por', 'com', 'que', 'se', 'ao', 'aos', 'as', 'os',
+}
+
+# entidade -> (modelo, {campo: peso}); a ordem dos campos define os bits
+INDICES = {
+    'chamado': (Chamado, {'codigo': 10, 'protocolo': 10, 'solicitante': 5, 'email': 5, 'problema': 3, 'descricao': 1}),
+    'usuario': (User, {'nome': 5, 'sobrenome': 5, 'usuario': 5, 'email': 4, 'nivel_acesso': 1, '_setores': 1}),
+    'log_acao': (LogAcao, {'acao': 2, 'detalhes': 1}),
+}
+ENTIDADE_POR_MODELO = {modelo: entidade for entidade, (modelo, _) in INDICES.items()}
+INDEXADOS_NA_SESSAO = (Chamado, User)  # logs: indexação por marca (inseridos em lote fora do ORM)
+
+_estado = {'pronto': False}
+_lock_logs = threading.Lock()
+
+# ==================== TERMOS ====================
+
+def normalizar(texto) -> str:
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+def _palavras(texto) -> List[str]:
+    return [
+        palavra[:TAMANHO_MAXIMO_TERMO] for palavra in re.findall(r'[a-z0-9]+', normalizar(texto))
+        if len(palavra) >= TAMANHO_MINIMO_TERMO and palavra not in PALAVRAS_IGNORADAS
+    ]
+
+def termos_consulta(texto) -> List[str]:
+    """Palavras buscáveis do texto digitado (sem repetição)"""
+    return list(dict.fromkeys(_palavras(texto)))[:MAXIMO_PALAVRAS_BUSCA]
+
+def _bits(entidade: str, campos: Optional[Iterable[str]]) -> int:
+    nomes = list(INDICES[entidade][1])
+    if not campos:
+        return 0
+    return sum(1 << nomes.index(campo) for campo in campos)
+
+def termos_registro(entidade: str, valores: Dict) -> Dict[str, Tuple[int, int]]:
+    """termo -> (peso, bits dos campos) de um registro"""
+    termos: Dict[str, Tuple[int, int]] = {}
+    for posicao, (campo, peso) in enumerate(INDICES[entidade][1].items()):
+        for palavra in _palavras(valores.get(campo)):
+            anterior_peso, anterior_bits = termos.get(palavra, (0, 0))
+            if palavra not in termos and len(termos) >= MAXIMO_TERMOS_REGISTRO:
+                continue
+            termos[palavra] = (max(anterior_peso, peso), anterior_bits | (1 << posicao))
+    return termos
+
+def _linhas(entidade: str, registro_id: int, valores: Dict) -> List[Dict]:
+    return [
+        {'entidade': entidade, 'termo': termo, 'registro_id': registro_id, 'peso': peso, 'campos': bits}
+        for termo, (peso, bits) in termos_registro(entidade, valores).items()
+    ]
+
+# ==================== GRAVAÇÃO ====================
+
+def _substituir(conn, entidade: str, registros: Dict[int, Optional[Dict]]):
+    """Troca os termos dos registros (valores None = registro removido)"""
+    tabela = TermoBusca.__table__
+    ids = list(registros)
+    for inicio in range(0, len(ids), TAMANHO_LOTE_INDEXACAO):
+        conn.execute(delete(tabela).where(
+            tabela.c.entidade == entidade, tabela.c.registro_id.in_(ids[inicio:inicio + TAMANHO_LOTE_INDEXACAO])
+        ))
+    linhas = [
+        linha for registro_id, valores in registros.items() if valores is not None
+        for linha in _linhas(entidade, registro_id, valores)
+    ]
+    for inicio in range(0, len(linhas), TAMANHO_LOTE_INDEXACAO):
+        conn.execute(insert(tabela), linhas[inicio:inicio + TAMANHO_LOTE_INDEXACAO])
+
+def _valores(objeto, entidade: str) -> Dict:
+    return {campo: getattr(objeto, campo) for campo in INDICES[entidade][1]}
+
+def _apos_flush(session, flush_context):
+    """Reindexa chamados e usuários incluídos, alterados ou removidos, na transação do flush"""
+    por_entidade: Dict[str, Dict[int, Optional[Dict]]] = {}
+    for objeto in list(session.new) + list(session.dirty):
+        if not isinstance(objeto, INDEXADOS_NA_SESSAO) or objeto in session.deleted:
+            continue
+        entidade = ENTIDADE_POR_MODELO[type(objeto)]
+        if objeto in session.dirty:
+            estado = inspect(objeto)
+            if not any(estado.attrs[campo].history.has_changes() for campo in INDICES[entidade][1]):
+                continue
+        por_entidade.setdefault(entidade, {})[objeto.id] = _valores(objeto, entidade)
+    for objeto in session.deleted:
+        if isinstance(objeto, INDEXADOS_NA_SESSAO):
+            por_entidade.setdefault(ENTIDADE_POR_MODELO[type(objeto)], {})[objeto.id] = None
+    if por_entidade:
+        conn = session.connection()
+        for entidade, registros in por_entidade.items():
+            _substituir(conn, entidade, registros)
+
+def registrar_eventos():
+    if event.contains(Session, 'after_flush', _apos_flush):
+        return
+    event.listen(Session, 'after_flush', _apos_flush)
+
+registrar_eventos()
+
+# ==================== LOGS DE AÇÃO ====================
+
+def _ler_marca(conn) -> int:
+    valor = conn.execute(select(Configuracao.valor).where(Configuracao.chave == CHAVE_MARCA_LOGS)).scalar()
+    try:
+        return int(valor or 0)
+    except ValueError:
+        return 0
+
+def _gravar_marca(conn, marca: int):
+    tabela = Configuracao.__table__
+    agora = get_brazil_time().replace(tzinfo=None)
+    if not conn.execute(update(tabela).where(tabela.c.chave == CHAVE_MARCA_LOGS).values(
+        valor=str(marca), data_atualizacao=agora
+    )).rowcount:
+        conn.execute(insert(tabela).values(chave=CHAVE_MARCA_LOGS, valor=str(marca), data_atualizacao=agora))
+
+def indexar_logs_pendentes() -> int:
+    """Indexa os logs de ação gravados desde a última execução; retorna quantos receberam termos"""
+    logs = LogAcao.__table__
+    termos = TermoBusca.__table__
+    indexados = 0
+    ultimo_id = None
+    with _lock_logs:
+        while True:
+            try:
+                with db.engine.begin() as conn:
+                    marca = _ler_marca(conn)
+                    if ultimo_id is None:
+                        ultimo_id = marca - JANELA_REVISAO_LOGS
+                    sem_termos = ~exists().where(
+                        termos.c.entidade == 'log_acao', termos.c.registro_id == logs.c.id
+                    )
+                    linhas = conn.execute(
+                        select(logs.c.id, logs.c.acao, logs.c.detalhes).where(
+                            logs.c.id > ultimo_id, sem_termos
+                        ).order_by(logs.c.id).limit(TAMANHO_LOTE_INDEXACAO)
+                    ).all()
+                    novas = [
+                        termo for linha in linhas
+                        for termo in _linhas('log_acao', linha.id, {'acao': linha.acao, 'detalhes': linha.detalhes})
+                    ]
+                    for inicio in range(0, len(novas), TAMANHO_LOTE_INDEXACAO):
+                        conn.execute(insert(termos), novas[inicio:inicio + TAMANHO_LOTE_INDEXACAO])
+                    if linhas and linhas[-1].id > marca:
+                        _gravar_marca(conn, linhas[-1].id)
+            except IntegrityError:
+                # Outro worker indexou os mesmos logs ao mesmo tempo
+                logger.debug("Logs de ação já indexados por outro processo")
+                break
+            indexados += len({termo['registro_id'] for termo in novas})
+            if linhas:
+                ultimo_id = linhas[-1].id
+            if len(linhas) < TAMANHO_LOTE_INDEXACAO:
+                break
+    return indexados
+
+def remover_termos_logs_expirados() -> int:
+    """Apaga os termos dos logs removidos pela retenção (ids abaixo do menor existente)"""
+    termos = TermoBusca.__table__
+    with db.engine.begin() as conn:
+        menor = conn.execute(select(func.min(LogAcao.__table__.c.id))).scalar()
+        limite = termos.c.registro_id < menor if menor is not None else termos.c.registro_id.isnot(None)
+        return conn.execute(delete(termos).where(termos.c.entidade == 'log_acao', limite)).rowcount
+
+# ==================== CONSULTA ====================
+
+def indice_pronto() -> bool:
+    """True depois que a primeira construção do índice terminou"""
+    if not _estado['pronto']:
+        with db.engine.connect() as conn:
+            versao = conn.execute(select(Configuracao.valor).where(Configuracao.chave == CHAVE_VERSAO)).scalar()
+        _estado['pronto'] = versao == VERSAO_INDICE
+    return _estado['pronto']
+
+def _sucessor(prefixo: str) -> Optional[str]:
+    """Menor texto (em [a-z0-9]) maior que todos os que começam com o prefixo"""
+    prefixo = prefixo.rstrip('z')
+    if not prefixo:
+        return None
+    ultimo = prefixo[-1]
+    return prefixo[:-1] + ('a' if ultimo == '9' else chr(ord(ultimo) + 1))
+
+def _faixa(termo: str):
+    coluna = TermoBusca.__table__.c.termo
+    limite = _sucessor(termo)
+    if limite is None:
+        return coluna >= termo
+    return and_(coluna >= termo, coluna < limite)
+
+def consulta_ranqueada(entidade: str, palavras: List[str], campos: Optional[Iterable[str]] = None):
+    """SELECT registro_id, pontuacao dos registros que contêm todas as palavras (como prefixo)"""
+    tabela = TermoBusca.__table__
+    faixas = [_faixa(palavra) for palavra in palavras]
+    pontuacao = sum(
+        func.sum(case((tabela.c.termo == palavra, tabela.c.peso * 2), (faixa, tabela.c.peso), else_=0))
+        for palavra, faixa in zip(palavras, faixas)
+    )
+    consulta = select(tabela.c.registro_id, pontuacao.label('pontuacao')).where(
+        tabela.c.entidade == entidade, or_(*faixas)
+    )
+    bits = _bits(entidade, campos)
+    if bits:
+        consulta = consulta.where(tabela.c.campos.op('&')(bits) != 0)
+    return consulta.group_by(tabela.c.registro_id).having(
+        and_(*[func.max(case((faixa, 1), else_=0)) == 1 for faixa in faixas])
+    )
+
+def filtro_busca(entidade: str, texto: str, campos: Optional[Iterable[str]] = None):
+    """
+    Condição para filtrar uma consulta do modelo da entidade pelo texto buscado
+
+    Args:
+        campos: restringe a esses campos indexados (padrão: todos)
+
+    Sem índice pronto, ou sem palavra buscável no texto (ex.: uma letra), usa
+    o LIKE nos campos.
+    """
+    modelo, pesos = INDICES[entidade]
+    palavras = termos_consulta(texto)
+    if palavras and indice_pronto():
+        if entidade == 'log_acao':
+            indexar_logs_pendentes()
+        return modelo.id.in_(consulta_ranqueada(entidade, palavras, campos).with_only_columns(
+            TermoBusca.__table__.c.registro_id
+        ))
+    termo = f'%{texto.strip()}%'
+    return or_(*[getattr(modelo, campo).ilike(termo) for campo in (campos or pesos)])
+
+def buscar(entidade: str, texto: str, pagina: int = 1, por_pagina: int = 20) -> Dict:
+    """
+    Registros da entidade ordenados por relevância
+
+    Returns:
+        {'itens': [(registro, pontuacao)], 'total', 'pagina', 'por_pagina', 'paginas'}
+    """
+    modelo = INDICES[entidade][0]
+    pagina = max(pagina, 1)
+    palavras = termos_consulta(texto)
+    resultado = {'itens': [], 'total': 0, 'pagina': pagina, 'por_pagina': por_pagina, 'paginas': 0}
+    if not palavras:
+        return resultado
+
+    if not indice_pronto():
+        consulta = modelo.query.filter(filtro_busca(entidade, texto)).order_by(modelo.id.desc())
+        total = consulta.count()
+        pares = [(registro, 0) for registro in consulta.offset((pagina - 1) * por_pagina).limit(por_pagina)]
+    else:
+        if entidade == 'log_acao':
+            indexar_logs_pendentes()
+        ranqueada = consulta_ranqueada(entidade, palavras).subquery()
+        total = db.session.execute(select(func.count()).select_from(ranqueada)).scalar() or 0
+        linhas = db.session.execute(
+            select(ranqueada.c.registro_id, ranqueada.c.pontuacao).order_by(
+                ranqueada.c.pontuacao.desc(), ranqueada.c.registro_id.desc()
+            ).offset((pagina - 1) * por_pagina).limit(por_pagina)
+        ).all()
+        registros = {r.id: r for r in modelo.query.filter(modelo.id.in_([l.registro_id for l in linhas]))}
+        # Termos de registros apagados fora do ORM são ignorados até a próxima reconstrução
+        pares = [(registros[l.registro_id], l.pontuacao) for l in linhas if l.registro_id in registros]
+
+    resultado.update(itens=pares, total=total, paginas=(total + por_pagina - 1) // por_pagina)
+    return resultado
+
+# ==================== RECONSTRUÇÃO ====================
+
+def reconstruir(entidades: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """
+    Reindexa as entidades a partir das tabelas de origem, em lotes de ids
+
+    Returns:
+        {entidade: registros indexados}
+    """
+    termos = TermoBusca.__table__
+    resultado = {}
+    for entidade in entidades or INDICES:
+        modelo, pesos = INDICES[entidade]
+        tabela = modelo.__table__
+        colunas = [tabela.c.id] + [modelo.__mapper__.attrs[campo].columns[0] for campo in pesos]
+        ultimo_id, total = 0, 0
+        while True:
+            with db.engine.begin() as conn:
+                linhas = conn.execute(
+                    select(*colunas).where(tabela.c.id > ultimo_id).order_by(tabela.c.id).limit(TAMANHO_LOTE_INDEXACAO)
+                ).all()
+                if not linhas:
+                    conn.execute(delete(termos).where(termos.c.entidade == entidade, termos.c.registro_id > ultimo_id))
+                    break
+                conn.execute(delete(termos).where(
+                    termos.c.entidade == entidade, termos.c.registro_id > ultimo_id,
+                    termos.c.registro_id <= linhas[-1][0]
+                ))
+                novas = [
+                    termo for linha in linhas
+                    for termo in _linhas(entidade, linha[0], dict(zip(pesos, linha[1:])))
+                ]
+                for inicio in range(0, len(novas), TAMANHO_LOTE_INDEXACAO):
+                    conn.execute(insert(termos), novas[inicio:inicio + TAMANHO_LOTE_INDEXACAO])
+                if entidade == 'log_acao':
+                    _gravar_marca(conn, linhas[-1][0])
+            ultimo_id = linhas[-1][0]
+            total += len(linhas)
+        resultado[entidade] = total
+    return resultado
+
+def _versao_atual() -> bool:
+    registro = Configuracao.query.filter_by(chave=CHAVE_VERSAO).first()
+    return bool(registro and registro.valor == VERSAO_INDICE)
+
+def _gravar_versao():
+    agora = get_brazil_time().replace(tzinfo=None)
+    registro = Configuracao.query.filter_by(chave=CHAVE_VERSAO).first()
+    if registro:
+        registro.valor = VERSAO_INDICE
+        registro.data_atualizacao = agora
+    else:
+        db.session.add(Configuracao(chave=CHAVE_VERSAO, valor=VERSAO_INDICE, data_atualizacao=agora))
+    db.session.commit()
+
+def _indexacao_periodica(app, socketio, construir: bool):
+    with app.app_context():
+        if construir:
+            try:
+                # Só um worker constrói; os demais seguem para a indexação dos logs
+                with manter_trava(app, TRAVA_CONSTRUCAO, TEMPO_TRAVA_CONSTRUCAO) as concessao:
+                    if concessao and not _versao_atual():
+                        resultado = reconstruir()
+                        _gravar_versao()
+                        logger.info(f"Índice de busca construído: {resultado}")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro ao construir o índice de busca: {str(e)}")
+            finally:
+                db.session.remove()
+    while True:
+        socketio.sleep(INTERVALO_INDEXACAO_LOGS)
+        try:
+            with app.app_context():
+                indexar_logs_pendentes()
+                remover_termos_logs_expirados()
+        except Exception as e:
+            logger.error(f"Erro ao indexar logs de ação: {str(e)}")
+
+def iniciar_busca(app, socketio):
+    """Constrói o índice na primeira inicialização (ou ao mudar VERSAO_INDICE) e indexa os logs novos"""
+    with app.app_context():
+        construir = not _versao_atual()
+    socketio.start_background_task(_indexacao_periodica, app, socketio, construir)
+    return construir
+
+# ==================== LINHA DE COMANDO ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Índice de busca textual')
+    parser.add_argument('--reconstruir', action='store_true', help='Reindexa chamados, usuários e logs de ação')
+    parser.add_argument('--entidade', choices=list(INDICES), action='append', help='Reindexa só esta entidade')
+    args = parser.parse_args(argv)
+
+    from flask import Flask
+    from config import get_config
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    db.init_app(app)
+
+    with app.app_context():
+        if args.reconstruir:
+            with manter_trava(app, TRAVA_CONSTRUCAO, TEMPO_TRAVA_CONSTRUCAO) as concessao:
+                if not concessao:
+                    print("Reconstrução já em andamento em outro processo")
+                    return
+                resultado = reconstruir(args.entidade)
+                _gravar_versao()
+            for entidade, registros in resultado.items():
+                print(f"{entidade}: {registros} registros")
+
+if __name__ == '__main__':
+    main()
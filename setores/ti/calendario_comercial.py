@@ -0,0 +1,380 @@
+"""
+Calendário comercial pré-calculado para o motor de SLA
+
+Os intervalos de expediente (dias úteis, almoço, plantão e feriados) são
+expandidos uma única vez em uma lista ordenada com somas acumuladas, de modo
+que "segundos úteis entre A e B" e "A + N horas úteis" são respondidos com
+busca binária em vez de iterar dia a dia.
+
+As somas acumuladas são ancoradas em uma origem fixa (o início da cobertura
+inicial): estender a cobertura para trás gera posições negativas e nunca
+desloca as posições já calculadas.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime, date, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import logging
+import pytz
+
+logger = logging.getLogger(__name__)
+
+BRAZIL_TZ = pytz.timezone('America/Sao_Paulo')
+
+SEGUNDOS_DIA = 86400
+
+# Anos cobertos ao redor do ano atual na primeira construção do calendário;
+# consultas fora dessa faixa estendem a cobertura sob demanda.
+ANOS_COBERTURA = 5
+
+# Tempo máximo (segundos) em que a lista de feriados fica em cache antes de
+# ser relida do banco; garante que alterações feitas por outros workers
+# sejam percebidas mesmo sem invalidação explícita.
+FERIADOS_TTL = 300
+
+def _para_time(valor, padrao: time) -> time:
+    """Converte time, 'HH:MM' ou 'HH:MM:SS' para objeto time"""
+    if valor is None or valor == '':
+        return padrao
+    if isinstance(valor, time):
+        return valor
+    try:
+        return time.fromisoformat(str(valor))
+    except ValueError:
+        return padrao
+
+def _segundos(t: time) -> int:
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+def _subtrair_janela(janelas: List[Tuple[int, int]], inicio: int, fim: int) -> List[Tuple[int, int]]:
+    """Remove o trecho [inicio, fim) das janelas informadas"""
+    resultado = []
+    for a, b in janelas:
+        if fim <= a or inicio >= b:
+            resultado.append((a, b))
+            continue
+        if a < inicio:
+            resultado.append((a, inicio))
+        if fim < b:
+            resultado.append((fim, b))
+    return resultado
+
+def _unir_janelas(janelas: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Ordena e funde janelas sobrepostas"""
+    resultado = []
+    for a, b in sorted(janelas):
+        if a >= b:
+            continue
+        if resultado and a <= resultado[-1][1]:
+            resultado[-1] = (resultado[-1][0], max(resultado[-1][1], b))
+        else:
+            resultado.append((a, b))
+    return resultado
+
+def chave_configuracao(config_horario: Dict) -> tuple:
+    """Retorna uma chave imutável com os campos que afetam o calendário"""
+    inicio = _para_time(config_horario.get('inicio'), time(8, 0))
+    fim = _para_time(config_horario.get('fim'), time(18, 0))
+    almoco = None
+    if config_horario.get('considera_almoco'):
+        almoco = (
+            _para_time(config_horario.get('almoco_inicio'), time(12, 0)),
+            _para_time(config_horario.get('almoco_fim'), time(13, 0))
+        )
+    emergencia = None
+    if config_horario.get('emergencia_ativo'):
+        emergencia = (
+            _para_time(config_horario.get('emergencia_inicio'), time(18, 0)),
+            _para_time(config_horario.get('emergencia_fim'), time(22, 0)),
+            tuple(sorted(config_horario.get('emergencia_dias') or []))
+        )
+    return (
+        inicio,
+        fim,
+        tuple(sorted(config_horario.get('dias_semana') or [])),
+        almoco,
+        emergencia,
+        bool(config_horario.get('considera_feriados', True))
+    )
+
+class CalendarioComercial:
+    """
+    Calendário de expediente com somas de prefixo sobre intervalos úteis
+
+    Os instantes são tratados como horário de parede de São Paulo; datetimes
+    sem timezone são considerados já no horário local.
+    """
+
+    def __init__(self, config_horario: Dict, feriados: Iterable[date] = (), feriados_recorrentes: Iterable[Tuple[int, int]] = ()):
+        self.chave = chave_configuracao(config_horario)
+        inicio, fim, dias_semana, almoco, emergencia, considera_feriados = self.chave
+
+        janelas_semana = {}
+        for dia in range(7):
+            janelas = []
+            if dia in dias_semana:
+                janelas = [(_segundos(inicio), _segundos(fim))]
+                if almoco:
+                    janelas = _subtrair_janela(janelas, _segundos(almoco[0]), _segundos(almoco[1]))
+                if emergencia and dia in emergencia[2]:
+                    janelas.append((_segundos(emergencia[0]), _segundos(emergencia[1])))
+            janelas_semana[dia] = _unir_janelas(janelas)
+        self._janelas_semana = janelas_semana
+
+        if considera_feriados:
+            self._feriados = frozenset(feriados)
+            self._feriados_recorrentes = frozenset(feriados_recorrentes)
+        else:
+            self._feriados = frozenset()
+            self._feriados_recorrentes = frozenset()
+
+        self._lock = threading.Lock()
+        ano_atual = date.today().year
+        self._origem = date(ano_atual - ANOS_COBERTURA, 1, 1).toordinal()
+        self._construir(ano_atual - ANOS_COBERTURA, ano_atual + ANOS_COBERTURA)
+
+    # ---------------------------------------------------------------- construção
+
+    def _eh_feriado(self, dia: date) -> bool:
+        return dia in self._feriados or (dia.month, dia.day) in self._feriados_recorrentes
+
+    def _construir(self, ano_inicio: int, ano_fim: int):
+        """Expande os intervalos úteis de ano_inicio até ano_fim (inclusive)"""
+        inicios = []
+        fins = []
+        acumulado = []
+        acumulado_fim = []
+        total = 0.0
+        deslocamento = 0.0
+
+        ordinal_inicio = date(ano_inicio, 1, 1).toordinal()
+        ordinal_fim = date(ano_fim, 12, 31).toordinal()
+        for ordinal in range(ordinal_inicio, ordinal_fim + 1):
+            if ordinal == self._origem:
+                deslocamento = total
+            janelas = self._janelas_semana[(ordinal - 1) % 7]
+            if not janelas:
+                continue
+            if self._feriados or self._feriados_recorrentes:
+                if self._eh_feriado(date.fromordinal(ordinal)):
+                    continue
+            base = ordinal * SEGUNDOS_DIA
+            for a, b in janelas:
+                inicios.append(base + a)
+                fins.append(base + b)
+                acumulado.append(total)
+                total += b - a
+                acumulado_fim.append(total)
+
+        # Posição zero na origem, qualquer que seja o início da cobertura
+        if deslocamento:
+            acumulado = [valor - deslocamento for valor in acumulado]
+            acumulado_fim = [valor - deslocamento for valor in acumulado_fim]
+
+        # Atribuição única para que leitores concorrentes nunca vejam listas
+        # de tamanhos diferentes
+        self._dados = (ano_inicio, ano_fim, inicios, fins, acumulado, acumulado_fim)
+
+    def _garantir_cobertura(self, *segundos: float):
+        """Estende a cobertura até incluir todos os instantes (segundos absolutos) informados"""
+        anos = [date.fromordinal(max(1, int(valor / SEGUNDOS_DIA))).year for valor in segundos]
+        menor, maior = min(anos), max(anos)
+        ano_inicio, ano_fim = self._dados[0], self._dados[1]
+        if ano_inicio <= menor and maior <= ano_fim:
+            return
+        with self._lock:
+            ano_inicio, ano_fim = self._dados[0], self._dados[1]
+            if menor < ano_inicio or maior > ano_fim:
+                self._construir(min(ano_inicio, menor - 1),
+                                ano_fim if maior <= ano_fim else maior + ANOS_COBERTURA)
+
+    @property
+    def intervalos(self):
+        """Tupla (inicios, fins, acumulado, acumulado_fim) em segundos absolutos"""
+        return self._dados[2:]
+
+    def intervalos_numpy(self, segundos_min: float = None, segundos_max: float = None):
+        """
+        Retorna os intervalos como arrays NumPy (inicios, fins, acumulado, acumulado_fim),
+        garantindo antes a cobertura dos instantes informados
+        """
+        import numpy as np
+
+        instantes = [segundos for segundos in (segundos_min, segundos_max) if segundos is not None]
+        if instantes:
+            self._garantir_cobertura(*instantes)
+        dados = self._dados
+        cache = getattr(self, '_cache_numpy', None)
+        if cache is None or cache[0] is not dados:
+            arrays = tuple(np.asarray(lista, dtype=np.float64) for lista in dados[2:])
+            cache = (dados, arrays)
+            self._cache_numpy = cache
+        return cache[1]
+
+    def estender_ate_posicao(self, posicao: float):
+        """Estende a cobertura até que a posição útil informada esteja dentro dela"""
+        if not self.possui_expediente:
+            return
+        while not self._dados[5] or self._dados[5][-1] < posicao:
+            with self._lock:
+                ano_inicio, ano_fim = self._dados[0], self._dados[1]
+                self._construir(ano_inicio, ano_fim + ANOS_COBERTURA)
+
+    @property
+    def possui_expediente(self) -> bool:
+        return any(self._janelas_semana.values())
+
+    # ---------------------------------------------------------------- conversão
+
+    @staticmethod
+    def para_local(dt: datetime) -> datetime:
+        """Retorna o horário de parede de São Paulo (sem tzinfo)"""
+        if dt.tzinfo is not None:
+            return dt.astimezone(BRAZIL_TZ).replace(tzinfo=None)
+        return dt
+
+    @staticmethod
+    def para_segundos(dt: datetime) -> float:
+        """Converte um horário local sem tzinfo para segundos absolutos"""
+        return (dt.toordinal() * SEGUNDOS_DIA + dt.hour * 3600 + dt.minute * 60
+                + dt.second + dt.microsecond / 1_000_000)
+
+    @staticmethod
+    def de_segundos(segundos: float) -> datetime:
+        """Converte segundos absolutos para datetime no timezone do Brasil"""
+        ordinal, resto = divmod(segundos, SEGUNDOS_DIA)
+        local = datetime.combine(date.fromordinal(int(ordinal)), time()) + timedelta(seconds=resto)
+        return BRAZIL_TZ.localize(local)
+
+    # ---------------------------------------------------------------- consultas
+
+    @staticmethod
+    def _posicao(dados, segundos: float) -> float:
+        _, _, inicios, fins, acumulado, _ = dados
+        i = bisect_right(inicios, segundos) - 1
+        if i < 0:
+            return acumulado[0] if acumulado else 0.0
+        return acumulado[i] + min(segundos, fins[i]) - inicios[i]
+
+    def posicao(self, segundos: float) -> float:
+        """Segundos úteis acumulados desde a origem do calendário até o instante"""
+        self._garantir_cobertura(segundos)
+        return self._posicao(self._dados, segundos)
+
+    def instante_da_posicao(self, posicao: float) -> Optional[float]:
+        """Primeiro instante (segundos absolutos) em que a posição útil é atingida"""
+        _, _, inicios, _, acumulado, acumulado_fim = self._dados
+        i = bisect_left(acumulado_fim, posicao)
+        if i >= len(inicios):
+            return None
+        return inicios[i] + max(0.0, posicao - acumulado[i])
+
+    def segundos_uteis(self, inicio: datetime, fim: datetime) -> float:
+        """Segundos úteis entre dois instantes"""
+        a = self.para_segundos(self.para_local(inicio))
+        b = self.para_segundos(self.para_local(fim))
+        if a >= b:
+            return 0.0
+        # Cobertura dos dois instantes antes de ler as somas, ambas do mesmo snapshot
+        self._garantir_cobertura(a, b)
+        dados = self._dados
+        return self._posicao(dados, b) - self._posicao(dados, a)
+
+    def horas_uteis(self, inicio: datetime, fim: datetime) -> float:
+        """Horas úteis entre dois instantes"""
+        return self.segundos_uteis(inicio, fim) / 3600
+
+    def eh_horario_comercial(self, dt: datetime) -> bool:
+        """Verifica se o instante está dentro de um intervalo útil"""
+        segundos = self.para_segundos(self.para_local(dt))
+        self._garantir_cobertura(segundos)
+        _, _, inicios, fins, _, _ = self._dados
+        i = bisect_right(inicios, segundos) - 1
+        return i >= 0 and segundos < fins[i]
+
+    def proximo_horario_comercial(self, dt: datetime) -> datetime:
+        """Retorna o próprio instante se útil, senão o início do próximo intervalo útil"""
+        local = self.para_local(dt)
+        if not self.possui_expediente:
+            return BRAZIL_TZ.localize(local)
+        segundos = self.para_segundos(local)
+        while True:
+            self._garantir_cobertura(segundos)
+            ano_fim, inicios, fins = self._dados[1], self._dados[2], self._dados[3]
+            i = bisect_right(inicios, segundos) - 1
+            if i >= 0 and segundos < fins[i]:
+                return BRAZIL_TZ.localize(local)
+            if i + 1 < len(inicios):
+                return self.de_segundos(inicios[i + 1])
+            # Sem intervalos restantes na cobertura atual: estender e tentar de novo
+            segundos = date(ano_fim + 1, 1, 1).toordinal() * SEGUNDOS_DIA
+
+    def adicionar_horas_uteis(self, inicio: datetime, horas: float) -> datetime:
+        """Calcula o instante em que se completam N horas úteis a partir de inicio"""
+        if horas <= 0 or not self.possui_expediente:
+            return self.proximo_horario_comercial(inicio)
+        alvo = self.posicao(self.para_segundos(self.para_local(inicio))) + horas * 3600
+        self.estender_ate_posicao(alvo)
+        return self.de_segundos(self.instante_da_posicao(alvo))
+
+# ==================== CACHE DO CALENDÁRIO ====================
+
+_cache_lock = threading.Lock()
+_calendarios: Dict[tuple, CalendarioComercial] = {}
+_feriados_cache = {'carregado_em': None, 'datas': frozenset(), 'recorrentes': frozenset(), 'versao': 0}
+
+def _carregar_feriados():
+    """Lê os feriados ativos do banco, respeitando o TTL do cache"""
+    agora = datetime.now().timestamp()
+    carregado_em = _feriados_cache['carregado_em']
+    if carregado_em is not None and agora - carregado_em < FERIADOS_TTL:
+        return _feriados_cache
+
+    datas = frozenset()
+    recorrentes = frozenset()
+    try:
+        from database import Feriado, db
+        linhas = db.session.query(Feriado.data, Feriado.recorrente).filter(Feriado.ativo == True).all()
+        datas = frozenset(data for data, recorrente in linhas if data and not recorrente)
+        recorrentes = frozenset((data.month, data.day) for data, recorrente in linhas if data and recorrente)
+    except Exception as e:
+        logger.warning(f"Não foi possível carregar feriados para o calendário comercial: {str(e)}")
+
+    with _cache_lock:
+        if datas != _feriados_cache['datas'] or recorrentes != _feriados_cache['recorrentes']:
+            _feriados_cache['versao'] += 1
+            _calendarios.clear()
+        _feriados_cache['datas'] = datas
+        _feriados_cache['recorrentes'] = recorrentes
+        _feriados_cache['carregado_em'] = agora
+    return _feriados_cache
+
+def obter_calendario_comercial(config_horario: Dict = None) -> CalendarioComercial:
+    """
+    Retorna o calendário comercial em cache para a configuração informada
+
+    O cache é indexado pelos campos relevantes da configuração e pela versão
+    dos feriados, então uma alteração de horário gera um calendário novo
+    automaticamente.
+    """
+    if config_horario is None:
+        from setores.ti.sla_utils import carregar_configuracoes_horario_comercial
+        config_horario = carregar_configuracoes_horario_comercial()
+
+    feriados = _carregar_feriados()
+    chave = (chave_configuracao(config_horario), feriados['versao'])
+
+    calendario = _calendarios.get(chave)
+    if calendario is None:
+        calendario = CalendarioComercial(config_horario, feriados['datas'], feriados['recorrentes'])
+        with _cache_lock:
+            if len(_calendarios) >= 8:
+                _calendarios.clear()
+            _calendarios[chave] = calendario
+    return calendario
+
+def invalidar_calendario_comercial():
+    """Descarta calendários e feriados em cache (chamar após alterar feriados ou horário)"""
+    with _cache_lock:
+        _calendarios.clear()
+        _feriados_cache['carregado_em'] = None
@@ -0,0 +1,300 @@
+"""
+Contadores denormalizados de grupos e agentes
+
+Colunas mantidas na mesma transação das alterações que as afetam, para que
+as listagens não façam um COUNT por linha:
+
+    grupos_usuarios.membros_count                  membros ativos do grupo
+    grupos_usuarios.unidades_count                 unidades do grupo
+    agentes_suporte.notificacoes_nao_lidas_count   notificações não lidas do agente
+    agentes_suporte.chamados_ativos_count          atribuições ativas em chamados Aberto/Aguardando
+
+O evento after_flush da sessão verifica, para cada linha incluída, alterada ou
+removida, se ela contava antes e se conta depois, e aplica a diferença com
+UPDATE ... SET contador = contador + n: o incremento é atômico no banco e não
+perde alterações de transações concorrentes. A mudança de status de um
+chamado também move a contagem do agente da atribuição ativa.
+
+Alterações fora do ORM (query.update/delete em lote, SQL manual) não passam
+pelo evento: quem as faz chama recalcular_contadores() para os registros
+afetados. Para recalcular tudo (restauração manual, divergência):
+
+    python -m setores.ti.contadores --recalcular
+"""
+import argparse
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, func, inspect, or_, select, true, update
+from sqlalchemy.orm import Session
+
+from database import (db, AgenteSuporte, Chamado, ChamadoAgente, Configuracao, GrupoMembro,
+                      GrupoUnidade, GrupoUsuarios, NotificacaoAgente, get_brazil_time)
+
+logger = logging.getLogger(__name__)
+
+VERSAO_CONTADORES = '1'  # alterar força o recálculo na próxima inicialização
+CHAVE_VERSAO = 'contadores_versao'
+STATUS_ATIVOS = ('Aberto', 'Aguardando')
+
+class Contador(NamedTuple):
+    modelo: type                      # linhas contadas
+    chave: str                        # atributo com o id do registro pai
+    coluna: object                    # coluna do contador na tabela pai
+    campos: Tuple[str, ...]           # atributos lidos por conta
+    conta: Callable[[Dict], bool]     # a linha entra no contador?
+    filtro: object                    # a mesma condição em SQL (recálculo)
+
+CONTADORES = (
+    Contador(GrupoMembro, 'grupo_id', GrupoUsuarios.__table__.c.membros_count,
+             ('ativo',), lambda v: bool(v['ativo']), GrupoMembro.ativo == True),
+    Contador(GrupoUnidade, 'grupo_id', GrupoUsuarios.__table__.c.unidades_count,
+             (), lambda v: True, true()),
+    Contador(NotificacaoAgente, 'agente_id', AgenteSuporte.__table__.c.notificacoes_nao_lidas_count,
+             ('lida',), lambda v: not v['lida'], or_(NotificacaoAgente.lida == False, NotificacaoAgente.lida.is_(None))),
+)
+CONTADOR_CHAMADOS_ATIVOS = AgenteSuporte.__table__.c.chamados_ativos_count
+CAMPOS_ATRIBUICAO = ('agente_id', 'chamado_id', 'ativo')
+MODELOS_PAI = {GrupoUsuarios.__table__: GrupoUsuarios, AgenteSuporte.__table__: AgenteSuporte}
+
+# ==================== EVENTOS DA SESSÃO ====================
+
+def _campos_lidos():
+    """(modelo, atributos) cujo valor anterior o evento precisa conhecer"""
+    for contador in CONTADORES:
+        yield contador.modelo, (contador.chave,) + contador.campos
+    yield ChamadoAgente, CAMPOS_ATRIBUICAO
+    yield Chamado, ('status',)
+
+def _valores(obj, campos) -> Tuple[Dict, Dict]:
+    """(antes, depois) dos campos de uma linha alterada"""
+    estado = inspect(obj)
+    antes, depois = {}, {}
+    for campo in campos:
+        historico = estado.attrs[campo].history
+        depois[campo] = getattr(obj, campo)
+        antes[campo] = historico.deleted[0] if historico.deleted else depois[campo]
+    return antes, depois
+
+def _linhas_alteradas(session, modelo, campos):
+    """(antes, depois) de cada linha do modelo no flush; None onde a linha não existe"""
+    for obj in session.new:
+        if isinstance(obj, modelo):
+            yield obj, None, {campo: getattr(obj, campo) for campo in campos}
+    for obj in session.dirty:
+        if isinstance(obj, modelo) and session.is_modified(obj):
+            antes, depois = _valores(obj, campos)
+            yield obj, antes, depois
+    for obj in session.deleted:
+        if isinstance(obj, modelo):
+            yield obj, _valores(obj, campos)[0], None
+
+def _deltas_chamados_ativos(session, deltas):
+    # Status dos chamados alterados neste flush (antes, depois)
+    status_chamados = {}
+    for obj, antes, depois in _linhas_alteradas(session, Chamado, ('status',)):
+        if antes is not None and (depois is None or antes['status'] != depois['status']):
+            status_chamados[obj.id] = (antes['status'], depois['status'] if depois else None)
+
+    atribuicoes = []
+    alteradas = set()
+    for obj, antes, depois in _linhas_alteradas(session, ChamadoAgente, CAMPOS_ATRIBUICAO):
+        atribuicoes.append((antes, depois))
+        alteradas.add(obj.id)
+    if not atribuicoes and not status_chamados:
+        return
+
+    conn = session.connection()
+    if status_chamados:
+        # Atribuições ativas (não alteradas) dos chamados que mudaram de status
+        for atribuicao_id, agente_id, chamado_id in conn.execute(
+            select(ChamadoAgente.id, ChamadoAgente.agente_id, ChamadoAgente.chamado_id)
+            .where(ChamadoAgente.chamado_ativo_id.in_(list(status_chamados)))
+        ):
+            if atribuicao_id not in alteradas:
+                valores = {'agente_id': agente_id, 'chamado_id': chamado_id, 'ativo': True}
+                atribuicoes.append((valores, valores))
+
+    outros = {
+        valores['chamado_id'] for par in atribuicoes for valores in par
+        if valores is not None and valores['chamado_id'] not in status_chamados
+    }
+    status_atual = dict(conn.execute(
+        select(Chamado.id, Chamado.status).where(Chamado.id.in_(list(outros)))
+    ).all()) if outros else {}
+
+    def conta(valores, momento: int) -> bool:
+        if valores is None or not valores['ativo']:
+            return False
+        chamado_id = valores['chamado_id']
+        status = status_chamados[chamado_id][momento] if chamado_id in status_chamados else status_atual.get(chamado_id)
+        return status in STATUS_ATIVOS
+
+    for antes, depois in atribuicoes:
+        if conta(antes, 0):
+            deltas[(CONTADOR_CHAMADOS_ATIVOS, antes['agente_id'])] -= 1
+        if conta(depois, 1):
+            deltas[(CONTADOR_CHAMADOS_ATIVOS, depois['agente_id'])] += 1
+
+def _aplicar(session, deltas):
+    por_incremento = defaultdict(list)
+    for (coluna, pai_id), delta in deltas.items():
+        if delta and pai_id is not None:
+            por_incremento[(coluna, delta)].append(pai_id)
+    if not por_incremento:
+        return
+
+    conn = session.connection()
+    expirar = session.info.setdefault('contadores_expirar', set())
+    # Ordem fixa de tabela e id: transações concorrentes travam as linhas na mesma sequência
+    for (coluna, delta) in sorted(por_incremento, key=lambda c: (c[0].table.name, c[0].name, c[1])):
+        ids = sorted(por_incremento[(coluna, delta)])
+        tabela = coluna.table
+        conn.execute(update(tabela).where(tabela.c.id.in_(ids)).values({coluna.name: func.coalesce(coluna, 0) + delta}))
+        expirar.update((MODELOS_PAI[tabela], pai_id, coluna.name) for pai_id in ids)
+
+def _antes_flush(session, flush_context, instances):
+    # Carrega os campos das linhas removidas enquanto elas ainda existem no banco
+    for obj in session.deleted:
+        for modelo, campos in _campos_lidos():
+            if isinstance(obj, modelo):
+                for campo in campos:
+                    getattr(obj, campo)
+
+def _apos_flush(session, flush_context):
+    deltas = defaultdict(int)
+    for contador in CONTADORES:
+        campos = (contador.chave,) + contador.campos
+        for _, antes, depois in _linhas_alteradas(session, contador.modelo, campos):
+            if antes is not None and contador.conta(antes):
+                deltas[(contador.coluna, antes[contador.chave])] -= 1
+            if depois is not None and contador.conta(depois):
+                deltas[(contador.coluna, depois[contador.chave])] += 1
+    _deltas_chamados_ativos(session, deltas)
+    _aplicar(session, deltas)
+
+def _apos_flush_postexec(session, flush_context):
+    # Objetos carregados na sessão passam a reler o contador atualizado por SQL
+    for modelo, pai_id, coluna in session.info.pop('contadores_expirar', ()):
+        obj = session.identity_map.get(Session.identity_key(modelo, pai_id))
+        if obj is not None:
+            session.expire(obj, [coluna])
+
+def _sem_efeito(alvo, valor, anterior, iniciador):
+    return valor
+
+def registrar_eventos():
+    if event.contains(Session, 'after_flush', _apos_flush):
+        return
+    # active_history: o valor anterior é carregado mesmo que o atributo estivesse expirado
+    for modelo, campos in _campos_lidos():
+        for campo in campos:
+            event.listen(getattr(modelo, campo), 'set', _sem_efeito, active_history=True, retval=True)
+    event.listen(Session, 'before_flush', _antes_flush)
+    event.listen(Session, 'after_flush', _apos_flush)
+    event.listen(Session, 'after_flush_postexec', _apos_flush_postexec)
+
+registrar_eventos()
+
+# ==================== RECÁLCULO ====================
+
+def _contagens():
+    """(coluna do contador, subconsulta correlacionada com o valor correto)"""
+    for contador in CONTADORES:
+        pai = contador.coluna.table
+        yield contador.coluna, select(func.count()).select_from(contador.modelo.__table__).where(
+            getattr(contador.modelo, contador.chave) == pai.c.id, contador.filtro
+        ).scalar_subquery()
+    pai = CONTADOR_CHAMADOS_ATIVOS.table
+    yield CONTADOR_CHAMADOS_ATIVOS, select(func.count()).select_from(ChamadoAgente.__table__).join(
+        Chamado.__table__, Chamado.id == ChamadoAgente.chamado_id
+    ).where(
+        ChamadoAgente.agente_id == pai.c.id, ChamadoAgente.ativo == True, Chamado.status.in_(STATUS_ATIVOS)
+    ).scalar_subquery()
+
+def recalcular_contadores(grupos: Optional[Iterable[int]] = None,
+                          agentes: Optional[Iterable[int]] = None) -> Dict[str, int]:
+    """
+    Reconta os contadores a partir das tabelas de origem, na transação da sessão
+
+    grupos e agentes: ids a recontar; None reconta todos, vazio nenhum.
+    Retorna, por contador, quantos registros estavam divergentes. O commit
+    fica com quem chama.
+    """
+    filtros = {
+        GrupoUsuarios.__table__: None if grupos is None else list(grupos),
+        AgenteSuporte.__table__: None if agentes is None else list(agentes),
+    }
+
+    corrigidos = {}
+    for coluna, contagem in _contagens():
+        tabela = coluna.table
+        ids = filtros[tabela]
+        if ids is not None and not ids:
+            continue
+        consulta = update(tabela).where(or_(coluna.is_(None), coluna != contagem)).values({coluna.name: contagem})
+        if ids is not None:
+            consulta = consulta.where(tabela.c.id.in_(ids))
+        resultado = db.session.execute(consulta)
+        corrigidos[f'{tabela.name}.{coluna.name}'] = resultado.rowcount
+
+    colunas = defaultdict(list)
+    for coluna, _ in _contagens():
+        colunas[MODELOS_PAI[coluna.table]].append(coluna.name)
+    for obj in list(db.session.identity_map.values()):
+        if type(obj) in colunas:
+            db.session.expire(obj, colunas[type(obj)])
+    return corrigidos
+
+# ==================== INICIALIZAÇÃO ====================
+
+def _gravar_versao():
+    agora = get_brazil_time().replace(tzinfo=None)
+    registro = Configuracao.query.filter_by(chave=CHAVE_VERSAO).first()
+    if registro:
+        registro.valor = VERSAO_CONTADORES
+        registro.data_atualizacao = agora
+    else:
+        db.session.add(Configuracao(chave=CHAVE_VERSAO, valor=VERSAO_CONTADORES, data_atualizacao=agora))
+    db.session.commit()
+
+def iniciar_contadores(app) -> bool:
+    """Recalcula todos os contadores na primeira inicialização (ou ao mudar VERSAO_CONTADORES)"""
+    try:
+        with app.app_context():
+            registro = Configuracao.query.filter_by(chave=CHAVE_VERSAO).first()
+            if registro and registro.valor == VERSAO_CONTADORES:
+                return False
+            corrigidos = recalcular_contadores()
+            _gravar_versao()
+            logger.info(f"Contadores recalculados: {corrigidos}")
+            return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao recalcular os contadores: {str(e)}")
+        return False
+
+# ==================== LINHA DE COMANDO ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Contadores denormalizados de grupos e agentes')
+    parser.add_argument('--recalcular', action='store_true', help='Reconta todos os contadores')
+    args = parser.parse_args(argv)
+
+    from flask import Flask
+    from config import get_config
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    db.init_app(app)
+
+    with app.app_context():
+        if args.recalcular:
+            corrigidos = recalcular_contadores()
+            db.session.commit()
+            _gravar_versao()
+            for contador, registros in corrigidos.items():
+                print(f"{contador}: {registros} corrigido(s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""
+Fila de saída de e-mails (tabela email_fila)
+
+Os e-mails são gravados na fila dentro da requisição e enviados por
+trabalhadores em segundo plano, com reutilização do token do Microsoft Graph,
+sessão HTTP persistente e novas tentativas com backoff exponencial.
+Cada e-mail é reservado (com um token) só ao começar o seu envio, e o
+resultado só é gravado enquanto a reserva ainda pertencer ao trabalhador.
+O transporte pode ser trocado por TransporteFalso (EMAIL_TRANSPORTE=falso).
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import timedelta
+from typing import List, Optional
+
+import requests
+from msal import ConfidentialClientApplication
+from requests.adapters import HTTPAdapter
+
+from database import db, EmailFila, get_brazil_time
+
+logger = logging.getLogger(__name__)
+
+CLIENT_ID = os.getenv('CLIENT_ID')
+CLIENT_SECRET = os.getenv('CLIENT_SECRET')
+TENANT_ID = os.getenv('TENANT_ID')
+USER_ID = os.getenv('USER_ID')
+
+MAX_TENTATIVAS = 5
+BACKOFF_BASE = 30  # segundos; dobra a cada tentativa
+BACKOFF_MAXIMO = 3600
+TEMPO_RESERVA = 600  # segundos até um e-mail "enviando" voltar a ficar disponível
+ESPERA_OCIOSA = 30  # segundos entre consultas à fila sem novos e-mails
+TAMANHO_LOTE = 20  # candidatos lidos por consulta; cada um é reservado só ao começar o envio
+TIMEOUT_GRAPH = (5, 30)  # conexão, leitura
+
+class ErroEnvioEmail(Exception):
+    """Falha no envio; temporaria=True indica que vale tentar de novo"""
+
+    def __init__(self, mensagem: str, temporaria: bool = True, espera: Optional[int] = None):
+        super().__init__(mensagem)
+        self.temporaria = temporaria
+        self.espera = espera
+
+# ==================== TRANSPORTES ====================
+
+class TransporteGraph:
+    """Envio pelo Microsoft Graph com cliente MSAL (e seu cache de token) e sessão HTTP reutilizados"""
+
+    def __init__(self):
+        self.habilitado = all([CLIENT_ID, CLIENT_SECRET, TENANT_ID, USER_ID])
+        self.endpoint = f"https://graph.microsoft.com/v1.0/users/{USER_ID}/sendMail" if self.habilitado else None
+        self._cliente = None
+        self._sessao = None
+        self._lock = threading.Lock()
+
+    def _obter_cliente(self) -> ConfidentialClientApplication:
+        with self._lock:
+            if self._cliente is None:
+                self._cliente = ConfidentialClientApplication(
+                    client_id=CLIENT_ID,
+                    client_credential=CLIENT_SECRET,
+                    authority=f"https://login.microsoftonline.com/{TENANT_ID}"
+                )
+            return self._cliente
+
+    def _obter_sessao(self) -> requests.Session:
+        with self._lock:
+            if self._sessao is None:
+                sessao = requests.Session()
+                sessao.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+                self._sessao = sessao
+            return self._sessao
+
+    def obter_token(self) -> Optional[str]:
+        """Token de aplicação; o MSAL devolve o token em cache até perto de expirar"""
+        if not self.habilitado:
+            return None
+        resultado = self._obter_cliente().acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
+        if "access_token" in resultado:
+            return resultado["access_token"]
+        logger.error(f"Erro ao obter token do Graph: {resultado.get('error', 'N/A')} - {resultado.get('error_description', 'N/A')}")
+        return None
+
+    def descartar_token(self):
+        """Força a obtenção de um novo token no próximo envio"""
+        with self._lock:
+            self._cliente = None
+
+    def enviar(self, assunto: str, corpo: str, destinatarios: List[str]):
+        if not self.habilitado:
+            raise ErroEnvioEmail('E-mail desabilitado: variáveis do Microsoft Graph não configuradas', temporaria=False)
+
+        token = self.obter_token()
+        if not token:
+            raise ErroEnvioEmail('Token do Microsoft Graph não obtido')
+
+        email_data = {
+            "message": {
+                "subject": assunto,
+                "body": {
+                    "contentType": "Text",
+                    "content": corpo
+                },
+                "toRecipients": [
+                    {"emailAddress": {"address": addr}} for addr in destinatarios
+                ]
+            },
+            "saveToSentItems": "false"
+        }
+
+        try:
+            response = self._obter_sessao().post(
+                self.endpoint,
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+                json=email_data,
+                timeout=TIMEOUT_GRAPH
+            )
+        except requests.RequestException as e:
+            raise ErroEnvioEmail(f'Erro na requisição ao Graph: {str(e)}')
+
+        if response.status_code == 202:
+            return
+        if response.status_code == 401:
+            self.descartar_token()
+            raise ErroEnvioEmail('Token rejeitado pelo Graph (401)')
+        if response.status_code == 429 or response.status_code >= 500:
+            espera = response.headers.get('Retry-After')
+            raise ErroEnvioEmail(f'Graph indisponível ({response.status_code})',
+                                 espera=int(espera) if espera and espera.isdigit() else None)
+        raise ErroEnvioEmail(f'Graph recusou o e-mail ({response.status_code}): {response.text[:500]}', temporaria=False)
+
+class TransporteFalso:
+    """Transporte local para desenvolvimento e testes: guarda as mensagens em memória"""
+
+    def __init__(self):
+        self.enviados = []
+        self.erro: Optional[ErroEnvioEmail] = None  # se definido, é levantado em todo envio
+
+    def enviar(self, assunto: str, corpo: str, destinatarios: List[str]):
+        if self.erro:
+            raise self.erro
+        self.enviados.append({'assunto': assunto, 'corpo': corpo, 'destinatarios': list(destinatarios)})
+
+TRANSPORTE_GRAPH = TransporteGraph()
+_transporte = TransporteFalso() if os.getenv('EMAIL_TRANSPORTE', 'graph').lower() == 'falso' else TRANSPORTE_GRAPH
+
+def obter_transporte():
+    return _transporte
+
+def definir_transporte(transporte):
+    """Substitui o transporte usado pelos trabalhadores (ex.: TransporteFalso em testes)"""
+    global _transporte
+    _transporte = transporte
+
+# ==================== FILA ====================
+
+_novos_emails = threading.Event()
+
+def enfileirar_email(assunto: str, corpo: str, destinatarios: List[str]) -> EmailFila:
+    """Grava o e-mail na fila e acorda os trabalhadores"""
+    email = EmailFila(
+        assunto=assunto,
+        corpo=corpo,
+        destinatarios=json.dumps(list(destinatarios))
+    )
+    db.session.add(email)
+    db.session.commit()
+    _novos_emails.set()
+    return email
+
+def enviar_email_agora(assunto: str, corpo: str, destinatarios: List[str]) -> bool:
+    """Envia imediatamente, sem passar pela fila (usado no teste de configuração)"""
+    try:
+        obter_transporte().enviar(assunto, corpo, destinatarios)
+        return True
+    except ErroEnvioEmail as e:
+        logger.error(f"Falha ao enviar e-mail: {str(e)}")
+        return False
+
+def _disponivel(agora):
+    return db.and_(
+        EmailFila.status.in_(['pendente', 'enviando']),
+        EmailFila.proxima_tentativa <= agora
+    )
+
+def _candidatos(limite: int = TAMANHO_LOTE) -> List[int]:
+    """E-mails disponíveis, na ordem da próxima tentativa"""
+    agora = get_brazil_time().replace(tzinfo=None)
+    return [
+        email_id for (email_id,) in db.session.query(EmailFila.id).filter(_disponivel(agora))
+        .order_by(EmailFila.proxima_tentativa).limit(limite).all()
+    ]
+
+def _reservar(email_id: int) -> Optional[str]:
+    """
+    Reserva o e-mail para este trabalhador, imediatamente antes do envio
+
+    A reserva é um UPDATE condicional: só um trabalhador consegue mudar a linha
+    para 'enviando' e gravar o seu token. E-mails presos em 'enviando'
+    (trabalhador interrompido) voltam a ficar disponíveis quando a reserva
+    expira; a partir daí o token antigo não finaliza mais o e-mail.
+
+    Returns:
+        token da reserva, ou None se outro trabalhador a obteve
+    """
+    agora = get_brazil_time().replace(tzinfo=None)
+    token = uuid.uuid4().hex
+    atualizados = EmailFila.query.filter(EmailFila.id == email_id, _disponivel(agora)).update({
+        'status': 'enviando',
+        'reserva': token,
+        'proxima_tentativa': agora + timedelta(seconds=TEMPO_RESERVA)
+    }, synchronize_session=False)
+    db.session.commit()
+    return token if atualizados else None
+
+def _finalizar(email_id: int, token: str, valores: dict) -> bool:
+    """Grava o resultado só se a reserva ainda for deste trabalhador"""
+    atualizados = EmailFila.query.filter(EmailFila.id == email_id, EmailFila.reserva == token).update(
+        dict(valores, reserva=None), synchronize_session=False
+    )
+    db.session.commit()
+    if not atualizados:
+        logger.warning(f"E-mail {email_id}: reserva expirada antes do fim do envio, resultado descartado")
+    return bool(atualizados)
+
+def _processar(email_id: int, token: str):
+    """Envia um e-mail reservado e registra o resultado"""
+    email = EmailFila.query.filter_by(id=email_id, reserva=token).first()
+    if not email:
+        return
+    agora = get_brazil_time().replace(tzinfo=None)
+    try:
+        obter_transporte().enviar(email.assunto, email.corpo, email.get_destinatarios())
+        valores = {'status': 'enviado', 'data_envio': agora, 'ultimo_erro': None}
+    except Exception as e:
+        tentativas = (email.tentativas or 0) + 1
+        valores = {'tentativas': tentativas, 'ultimo_erro': str(e)}
+        temporaria = getattr(e, 'temporaria', True)
+        if temporaria and tentativas < MAX_TENTATIVAS:
+            espera = getattr(e, 'espera', None) or min(BACKOFF_BASE * 2 ** (tentativas - 1), BACKOFF_MAXIMO)
+            valores.update(status='pendente', proxima_tentativa=agora + timedelta(seconds=espera))
+            logger.warning(f"E-mail {email.id}: tentativa {tentativas} falhou, nova tentativa em {espera}s: {str(e)}")
+        else:
+            valores['status'] = 'falha'
+            logger.error(f"E-mail {email.id} descartado após {tentativas} tentativa(s): {str(e)}")
+    _finalizar(email_id, token, valores)
+
+def _proxima_espera() -> float:
+    """Segundos até o próximo e-mail da fila ficar disponível (limitado a ESPERA_OCIOSA)"""
+    proxima = db.session.query(db.func.min(EmailFila.proxima_tentativa)).filter(
+        EmailFila.status.in_(['pendente', 'enviando'])
+    ).scalar()
+    if proxima is None:
+        return ESPERA_OCIOSA
+    restante = (proxima - get_brazil_time().replace(tzinfo=None)).total_seconds()
+    return min(max(restante, 0.5), ESPERA_OCIOSA)
+
+def _trabalhador(app):
+    while True:
+        espera = 0
+        with app.app_context():
+            try:
+                processados = 0
+                for email_id in _candidatos():
+                    token = _reservar(email_id)
+                    if token:
+                        _processar(email_id, token)
+                        processados += 1
+                if not processados:
+                    espera = _proxima_espera()
+            except Exception as e:
+                db.session.rollback()
+                espera = ESPERA_OCIOSA
+                logger.error(f"Erro no trabalhador de e-mail: {str(e)}")
+            finally:
+                db.session.remove()
+        if espera:
+            _novos_emails.wait(espera)
+            _novos_emails.clear()
+
+def iniciar_trabalhadores_email(app, socketio, quantidade: int = 2):
+    """Inicia os trabalhadores que esvaziam a fila de e-mails"""
+    for _ in range(quantidade):
+        socketio.start_background_task(_trabalhador, app)
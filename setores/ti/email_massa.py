@@ -0,0 +1,320 @@
+"""
+Envio de e-mails em massa para grupos (tabelas emails_massa e email_massa_destinatarios)
+
+A requisição apenas grava o EmailMassa e um destinatário 'pendente' por
+membro; o envio roda em segundo plano com um conjunto limitado de conexões
+SMTP persistentes. Cada destinatário é reservado com um UPDATE condicional e
+o resultado é gravado (junto com enviados_count/falhas_count) logo após o
+envio, de modo que um envio interrompido é retomado a partir dos
+destinatários ainda pendentes.
+
+Cada envio roda sob a trava 'email_massa:<id>' (ver setores/ti/travas.py),
+renovada enquanto o envio está ativo. Com vários workers, só um processo
+envia cada EmailMassa; um envio só é considerado interrompido, e retomado por
+outro processo, quando sua trava vence.
+"""
+import logging
+import queue
+import threading
+from typing import Optional
+
+from jinja2 import Template
+
+from database import db, EmailMassa, EmailMassaDestinatario, get_brazil_time
+from setores.ti.email_service import email_service
+from setores.ti.tempo_real import SALA_ADMIN, emitir
+from setores.ti.travas import manter_trava, trava_ativa
+
+logger = logging.getLogger(__name__)
+
+CONEXOES_SMTP = 4  # conexões simultâneas por envio em massa
+TAMANHO_LOTE_DESTINATARIOS = 200
+TEMPO_TRAVA_ENVIO = 120  # segundos sem renovação até o envio ser considerado interrompido
+INTERVALO_RETOMADA = 60  # segundos entre verificações de envios interrompidos
+
+TEMPLATE_EMAIL_GRUPO = Template("""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <style>
+                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+                .header { background-color: #007bff; color: white; padding: 20px; text-align: center; }
+                .content { background-color: #f8f9fa; padding: 20px; }
+                .message { background-color: white; padding: 20px; margin: 15px 0; }
+                .footer { text-align: center; margin-top: 20px; font-size: 12px; color: #666; }
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1>{{ assunto }}</h1>
+                </div>
+
+                <div class="content">
+                    <p>Olá <strong>{{ nome_destinatario }}</strong>,</p>
+
+                    <div class="message">
+                        {{ mensagem|safe }}
+                    </div>
+
+                    <p><em>Esta mensagem foi enviada para o grupo: <strong>{{ nome_grupo }}</strong></em></p>
+                </div>
+
+                <div class="footer">
+                    <p>Enviado por: {{ remetente }} em {{ data_envio }}</p>
+                    <p>Sistema ERP Evoque Fitness</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """)
+
+_app = None
+_socketio = None
+_em_execucao = set()
+_em_execucao_lock = threading.Lock()
+
+def _agora():
+    return get_brazil_time().replace(tzinfo=None)
+
+def _nome_trava(email_massa_id: int) -> str:
+    return f'email_massa:{email_massa_id}'
+
+def _contexto_envio(email_massa: EmailMassa) -> dict:
+    """Campos do template comuns a todos os destinatários"""
+    data_envio = email_massa.data_envio or _agora()
+    return {
+        'assunto': email_massa.assunto,
+        'mensagem': email_massa.conteudo,
+        'nome_grupo': email_massa.grupo.nome if email_massa.grupo else '',
+        'remetente': f"{email_massa.criador.nome} {email_massa.criador.sobrenome}" if email_massa.criador else '',
+        'data_envio': data_envio.strftime('%d/%m/%Y às %H:%M')
+    }
+
+def _reservar_destinatario(destinatario_id: int) -> bool:
+    """Marca o destinatário como 'enviando'; só uma tarefa consegue reservá-lo"""
+    atualizados = EmailMassaDestinatario.query.filter(
+        EmailMassaDestinatario.id == destinatario_id,
+        EmailMassaDestinatario.status_envio == 'pendente'
+    ).update({'status_envio': 'enviando'}, synchronize_session=False)
+    db.session.commit()
+    return bool(atualizados)
+
+def _registrar_resultado(email_massa_id: int, destinatario_id: int, erro: Optional[str]):
+    """Grava o resultado do destinatário e o contador do envio na mesma transação"""
+    agora = _agora()
+    if erro is None:
+        valores = {'status_envio': 'enviado', 'data_envio': agora, 'erro_envio': None}
+        contador = {'enviados_count': db.func.coalesce(EmailMassa.enviados_count, 0) + 1}
+    else:
+        valores = {'status_envio': 'falha', 'erro_envio': erro[:1000]}
+        contador = {'falhas_count': db.func.coalesce(EmailMassa.falhas_count, 0) + 1}
+    EmailMassaDestinatario.query.filter_by(id=destinatario_id).update(valores, synchronize_session=False)
+    EmailMassa.query.filter_by(id=email_massa_id).update(contador, synchronize_session=False)
+    db.session.commit()
+
+def _conexao_smtp(app, email_massa_id: int, contexto: dict, fila: queue.Queue, concessao):
+    """Consome destinatários da fila enviando por uma única sessão SMTP"""
+    with app.app_context():
+        try:
+            with email_service.abrir_sessao() as sessao:
+                while True:
+                    item = fila.get()
+                    if item is None:
+                        return
+                    destinatario_id, email, nome = item
+                    try:
+                        # Trava perdida: outro processo assumiu o envio
+                        if not concessao.valida or not _reservar_destinatario(destinatario_id):
+                            continue
+                        erro = None
+                        try:
+                            corpo_html = TEMPLATE_EMAIL_GRUPO.render(nome_destinatario=nome, **contexto)
+                            sessao.enviar(email, contexto['assunto'], corpo_html)
+                        except Exception as e:
+                            erro = str(e) or e.__class__.__name__
+                            logger.warning(f"Falha no envio em massa {email_massa_id} para {email}: {erro}")
+                        _registrar_resultado(email_massa_id, destinatario_id, erro)
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f"Erro ao registrar envio em massa {email_massa_id} para {email}: {str(e)}")
+        finally:
+            db.session.remove()
+
+def _finalizar(email_massa_id: int):
+    """Conclui o envio quando não restam destinatários pendentes"""
+    restantes = EmailMassaDestinatario.query.filter(
+        EmailMassaDestinatario.email_massa_id == email_massa_id,
+        EmailMassaDestinatario.status_envio.in_(['pendente', 'enviando'])
+    ).count()
+    if restantes:
+        return
+    email_massa = EmailMassa.query.get(email_massa_id)
+    email_massa.status = 'concluido' if not email_massa.falhas_count else 'erro'
+    email_massa.data_conclusao = _agora()
+    db.session.commit()
+    logger.info(f"Envio em massa {email_massa_id} concluído: {email_massa.enviados_count} enviados, "
+                f"{email_massa.falhas_count} falhas")
+    if _socketio is not None:
+        try:
+            emitir('email_massa_concluido', progresso_envio_massa(email_massa), [SALA_ADMIN], socketio=_socketio)
+        except Exception as socket_error:
+            logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
+
+def _executar_envio(app, email_massa_id: int):
+    """Distribui os destinatários pendentes entre as conexões SMTP, em lotes"""
+    with app.app_context():
+        try:
+            with manter_trava(app, _nome_trava(email_massa_id), TEMPO_TRAVA_ENVIO) as concessao:
+                if concessao is None:
+                    logger.info(f"Envio em massa {email_massa_id} já está em execução em outro processo")
+                    return
+                _enviar_pendentes(app, email_massa_id, concessao)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro no envio em massa {email_massa_id}: {str(e)}")
+            try:
+                EmailMassa.query.filter_by(id=email_massa_id).update(
+                    {'erro_detalhes': str(e)[:1000]}, synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+        finally:
+            db.session.remove()
+            with _em_execucao_lock:
+                _em_execucao.discard(email_massa_id)
+
+def _enviar_pendentes(app, email_massa_id: int, concessao):
+    """Executa o envio com a trava do EmailMassa já adquirida"""
+    email_massa = EmailMassa.query.get(email_massa_id)
+    if not email_massa or email_massa.status in ('concluido', 'erro'):
+        return
+    if email_massa.status != 'enviando':
+        email_massa.status = 'enviando'
+        email_massa.data_envio = email_massa.data_envio or _agora()
+
+    # Com a trava em mãos, destinatários em 'enviando' só podem ter sido
+    # reservados por um processo cuja trava venceu (há mais de TEMPO_TRAVA_ENVIO
+    # sem renovação); voltam a 'pendente'. O destinatário em curso no momento da
+    # queda pode, portanto, receber a mensagem duas vezes, mas nenhum fica sem envio.
+    EmailMassaDestinatario.query.filter(
+        EmailMassaDestinatario.email_massa_id == email_massa_id,
+        EmailMassaDestinatario.status_envio == 'enviando'
+    ).update({'status_envio': 'pendente'}, synchronize_session=False)
+    db.session.commit()
+    contexto = _contexto_envio(email_massa)
+
+    # As conexões ficam abertas durante todo o envio; a fila limitada
+    # mantém em memória apenas alguns lotes de destinatários
+    fila = queue.Queue(maxsize=2 * TAMANHO_LOTE_DESTINATARIOS)
+    conexoes = [
+        _socketio.start_background_task(_conexao_smtp, app, email_massa_id, contexto, fila, concessao)
+        for _ in range(CONEXOES_SMTP)
+    ]
+    try:
+        ultimo_id = 0
+        while concessao.valida:
+            lote = db.session.query(
+                EmailMassaDestinatario.id,
+                EmailMassaDestinatario.email_destinatario,
+                EmailMassaDestinatario.nome_destinatario
+            ).filter(
+                EmailMassaDestinatario.email_massa_id == email_massa_id,
+                EmailMassaDestinatario.status_envio == 'pendente',
+                EmailMassaDestinatario.id > ultimo_id
+            ).order_by(EmailMassaDestinatario.id).limit(TAMANHO_LOTE_DESTINATARIOS).all()
+            db.session.commit()
+            if not lote:
+                break
+            ultimo_id = lote[-1][0]
+            for item in lote:
+                fila.put(tuple(item))
+    finally:
+        for _ in conexoes:
+            fila.put(None)
+        for conexao in conexoes:
+            conexao.join()
+
+    if concessao.valida:
+        _finalizar(email_massa_id)
+
+def agendar_envio_massa(email_massa_id: int) -> bool:
+    """Inicia o envio em segundo plano (ignorado se já estiver em execução neste processo)"""
+    if _app is None:
+        logger.error("Envio em massa não inicializado (iniciar_envios_massa não foi chamado)")
+        return False
+    with _em_execucao_lock:
+        if email_massa_id in _em_execucao:
+            return False
+        _em_execucao.add(email_massa_id)
+    _socketio.start_background_task(_executar_envio, _app, email_massa_id)
+    return True
+
+def progresso_envio_massa(email_massa: EmailMassa) -> dict:
+    """Resumo do andamento a partir dos contadores do EmailMassa"""
+    total = email_massa.destinatarios_count or 0
+    enviados = email_massa.enviados_count or 0
+    falhas = email_massa.falhas_count or 0
+    processados = enviados + falhas
+    return {
+        'id': email_massa.id,
+        'status': email_massa.status,
+        'destinatarios_count': total,
+        'enviados_count': enviados,
+        'falhas_count': falhas,
+        'pendentes': max(total - processados, 0),
+        'percentual': round(processados * 100 / total, 1) if total else 100.0,
+        'data_envio': email_massa.data_envio.strftime('%d/%m/%Y %H:%M') if email_massa.data_envio else None,
+        'data_conclusao': email_massa.data_conclusao.strftime('%d/%m/%Y %H:%M') if email_massa.data_conclusao else None
+    }
+
+def retomar_envios_interrompidos() -> list:
+    """
+    Agenda os envios ativos cuja trava venceu (processo encerrado durante o envio)
+
+    O envio só começa se este processo conseguir a trava, então dois workers
+    nunca retomam o mesmo EmailMassa.
+    """
+    ativos = [
+        email_massa_id for (email_massa_id,) in db.session.query(EmailMassa.id).filter(
+            EmailMassa.status.in_(['preparando', 'enviando'])
+        ).all()
+    ]
+    db.session.commit()
+    retomados = []
+    for email_massa_id in ativos:
+        with _em_execucao_lock:
+            if email_massa_id in _em_execucao:
+                continue
+        if trava_ativa(_nome_trava(email_massa_id)):
+            continue
+        if agendar_envio_massa(email_massa_id):
+            retomados.append(email_massa_id)
+    return retomados
+
+def _retomada_periodica(app):
+    while True:
+        with app.app_context():
+            try:
+                for email_massa_id in retomar_envios_interrompidos():
+                    logger.info(f"Retomando envio em massa {email_massa_id}")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro ao verificar envios em massa interrompidos: {str(e)}")
+            finally:
+                db.session.remove()
+        _socketio.sleep(INTERVALO_RETOMADA)
+
+def iniciar_envios_massa(app, socketio):
+    """
+    Registra a aplicação e inicia a verificação periódica de envios interrompidos
+
+    A verificação roda em todos os workers; cada envio interrompido é retomado
+    por quem adquirir sua trava primeiro.
+    """
+    global _app, _socketio
+    _app = app
+    _socketio = socketio
+    socketio.start_background_task(_retomada_periodica, app)
@@ -8,6 +8,67 @@ from jinja2 import Template
 
 logger = logging.getLogger(__name__)
 
+SMTP_TIMEOUT = 30  # segundos
+MENSAGENS_POR_SESSAO = 100  # reconecta após esse número de envios (limite do servidor por conexão)
+
+class SessaoSMTP:
+    """Conexão SMTP reutilizada entre envios, reaberta quando cai ou atinge MENSAGENS_POR_SESSAO"""
+
+    def __init__(self, servico):
+        self.servico = servico
+        self._conexao = None
+        self._enviadas = 0
+
+    def _conectar(self):
+        self.fechar()
+        conexao = smtplib.SMTP(self.servico.smtp_server, self.servico.smtp_port, timeout=SMTP_TIMEOUT)
+        try:
+            conexao.starttls()
+            conexao.login(self.servico.email_username, self.servico.email_password)
+        except Exception:
+            conexao.close()
+            raise
+        self._conexao = conexao
+        self._enviadas = 0
+
+    def enviar(self, destinatario, assunto, corpo_html, corpo_texto=None):
+        """
+        Envia uma mensagem pela conexão aberta
+
+        Uma queda da conexão é tratada com uma reconexão e nova tentativa;
+        os demais erros SMTP são propagados ao chamador.
+        """
+        if not self.servico.credenciais_configuradas():
+            raise smtplib.SMTPException("Credenciais de email não configuradas")
+
+        msg = self.servico.montar_mensagem(destinatario, assunto, corpo_html, corpo_texto)
+        if self._conexao is None or self._enviadas >= MENSAGENS_POR_SESSAO:
+            self._conectar()
+        try:
+            self._conexao.send_message(msg)
+        except OSError as e:
+            # smtplib.SMTPException também é OSError: só quedas de conexão justificam reconectar
+            if isinstance(e, smtplib.SMTPException) and not isinstance(e, smtplib.SMTPServerDisconnected):
+                raise
+            logger.warning(f"Conexão SMTP perdida, reconectando: {str(e)}")
+            self._conectar()
+            self._conexao.send_message(msg)
+        self._enviadas += 1
+
+    def fechar(self):
+        if self._conexao is not None:
+            try:
+                self._conexao.quit()
+            except Exception:
+                self._conexao.close()
+            self._conexao = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
 class EmailService:
     def __init__(self):
         self.smtp_server = os.getenv('MICROSOFT_GRAPH_SMTP_SERVER', 'smtp-mail.outlook.com')
@@ -16,30 +77,41 @@ class EmailService:
         self.email_password = os.getenv('MICROSOFT_GRAPH_PASSWORD')
         self.from_email = os.getenv('MICROSOFT_GRAPH_USERNAME')
         
+    def credenciais_configuradas(self):
+        return all([self.email_username, self.email_password])
+
+    def montar_mensagem(self, destinatario, assunto, corpo_html, corpo_texto=None):
+        """Monta a mensagem MIME (texto opcional + HTML)"""
+        msg = MIMEMultipart('alternative')
+        msg['From'] = self.from_email
+        msg['To'] = destinatario
+        msg['Subject'] = assunto
+
+        # Adicionar versão texto se fornecida
+        if corpo_texto:
+            parte_texto = MIMEText(corpo_texto, 'plain', 'utf-8')
+            msg.attach(parte_texto)
+
+        # Adicionar versão HTML
+        parte_html = MIMEText(corpo_html, 'html', 'utf-8')
+        msg.attach(parte_html)
+        return msg
+
+    def abrir_sessao(self):
+        """Sessão SMTP persistente para enviar várias mensagens com um único login"""
+        return SessaoSMTP(self)
+
     def enviar_email(self, destinatario, assunto, corpo_html, corpo_texto=None):
         """Envia um email usando as configurações do Microsoft Graph"""
         try:
-            if not all([self.email_username, self.email_password]):
+            if not self.credenciais_configuradas():
                 logger.error("Credenciais de email não configuradas")
                 return False
                 
-            # Criar mensagem
-            msg = MIMEMultipart('alternative')
-            msg['From'] = self.from_email
-            msg['To'] = destinatario
-            msg['Subject'] = assunto
-            
-            # Adicionar versão texto se fornecida
-            if corpo_texto:
-                parte_texto = MIMEText(corpo_texto, 'plain', 'utf-8')
-                msg.attach(parte_texto)
-            
-            # Adicionar versão HTML
-            parte_html = MIMEText(corpo_html, 'html', 'utf-8')
-            msg.attach(parte_html)
+            msg = self.montar_mensagem(destinatario, assunto, corpo_html, corpo_texto)
             
             # Conectar e enviar
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+            with smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=SMTP_TIMEOUT) as server:
                 server.starttls()
                 server.login(self.email_username, self.email_password)
                 server.send_message(msg)
@@ -0,0 +1,284 @@
+"""
+Gravação adiada dos logs de ação e de acesso (tabelas logs_acoes e logs_acesso)
+
+As linhas são acumuladas em memória em cada processo e gravadas por uma
+thread de fundo com um INSERT de várias linhas a cada TAMANHO_LOTE_LOGS
+registros ou INTERVALO_GRAVACAO_LOGS_MS milissegundos, o que ocorrer primeiro.
+Se o banco estiver inacessível, o lote é anexado a um arquivo de contingência
+(JSON por linha) em logs/ e reenviado na próxima gravação bem-sucedida. Se o
+banco recusar o lote (linha inválida ou grande demais), as linhas são
+gravadas uma a uma e só as recusadas são descartadas, com registro no log.
+Os pendentes são gravados também no encerramento do processo.
+
+Sem a thread iniciada (scripts que usam só o database), cada log é gravado
+na hora, como antes.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from database import db, LogAcao, LogAcesso, extrair_info_user_agent
+from setores.ti.resumos_diarios import somar_logs_inseridos
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE_LOGS = 200  # linhas que disparam uma gravação imediata
+INTERVALO_GRAVACAO_LOGS_MS = 500  # milissegundos máximos entre gravações
+IDADE_CONTINGENCIA_ORFA = 300  # segundos sem alteração para adotar o arquivo de outro processo
+
+DIRETORIO_CONTINGENCIA = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'logs')
+PREFIXO_CONTINGENCIA = 'logs_pendentes-'
+
+TABELAS = {
+    LogAcao.__tablename__: LogAcao.__table__,
+    LogAcesso.__tablename__: LogAcesso.__table__,
+}
+
+# Colunas DateTime convertidas para texto no arquivo de contingência
+COLUNAS_DATA = ('data_acao', 'data_acesso')
+
+
+def _completar(tabela: str, linha: Dict) -> Dict:
+    """Preenche os campos derivados fora da requisição (navegador, sistema, dispositivo)"""
+    if tabela == LogAcesso.__tablename__ and 'navegador' not in linha:
+        navegador, sistema_operacional, dispositivo = extrair_info_user_agent(linha.get('user_agent'))
+        linha['navegador'] = navegador
+        linha['sistema_operacional'] = sistema_operacional
+        linha['dispositivo'] = dispositivo
+    return linha
+
+
+def _falha_de_conexao(erro: Exception) -> bool:
+    """Banco inacessível (vale a contingência), e não uma linha recusada"""
+    return isinstance(erro, OperationalError) or (
+        isinstance(erro, DBAPIError) and erro.connection_invalidated
+    )
+
+
+class BufferLogs:
+    """Acumula linhas de log por tabela e grava em lote"""
+
+    def __init__(self, tamanho_lote: int = TAMANHO_LOTE_LOGS, intervalo_ms: int = INTERVALO_GRAVACAO_LOGS_MS,
+                 diretorio: str = DIRETORIO_CONTINGENCIA):
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo_ms / 1000.0
+        self.diretorio = diretorio
+        self.ativo = False
+        self._lock = threading.Lock()
+        self._lock_gravacao = threading.Lock()
+        self._pendentes: List = []  # [(tabela, linha)]
+        self._acordar = threading.Event()
+        self._stats = {'gravados': 0, 'contingencia': 0, 'reenviados': 0, 'descartados': 0, 'erros': 0}
+
+    @property
+    def arquivo_contingencia(self) -> str:
+        return os.path.join(self.diretorio, f'{PREFIXO_CONTINGENCIA}{os.getpid()}.jsonl')
+
+    def adicionar(self, tabela: str, linha: Dict):
+        """Enfileira uma linha; sem a thread de gravação ativa, grava na hora"""
+        if not self.ativo:
+            self._inserir([(tabela, _completar(tabela, linha))])
+            return
+        with self._lock:
+            self._pendentes.append((tabela, linha))
+            cheio = len(self._pendentes) >= self.tamanho_lote
+        if cheio:
+            self._acordar.set()
+
+    def pendentes(self) -> int:
+        with self._lock:
+            return len(self._pendentes)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pendentes'] = len(self._pendentes)
+        return stats
+
+    def _contar(self, chave: str, quantidade: int = 1):
+        with self._lock:
+            self._stats[chave] += quantidade
+
+    # ---------------------------------------------------------------- gravação
+
+    def gravar(self) -> int:
+        """Grava os pendentes (e o conteúdo da contingência); retorna as linhas gravadas"""
+        with self._lock_gravacao:
+            with self._lock:
+                lote, self._pendentes = self._pendentes, []
+            lote = [(tabela, _completar(tabela, linha)) for tabela, linha in lote]
+
+            gravadas = 0
+            if lote:
+                gravadas, restante = self._gravar_lote(lote)
+                self._contar('gravados', gravadas)
+                if restante:
+                    self._salvar_contingencia(restante)
+                    return gravadas
+
+            gravadas += self._reenviar_contingencia()
+            return gravadas
+
+    def _gravar_lote(self, lote: List) -> Tuple[int, List]:
+        """
+        Grava o lote; se o banco o recusar, grava linha a linha e descarta as recusadas
+
+        Returns:
+            (linhas gravadas, linhas não gravadas por falha de conexão)
+        """
+        try:
+            self._inserir(lote)
+            return len(lote), []
+        except Exception as e:
+            if _falha_de_conexao(e):
+                self._contar('erros')
+                logger.error(f"Banco indisponível para gravar logs, usando contingência: {str(e)}")
+                return 0, lote
+            logger.warning(f"Lote de {len(lote)} logs recusado pelo banco, gravando linha a linha: {str(e)}")
+
+        gravadas = 0
+        for posicao, item in enumerate(lote):
+            try:
+                self._inserir([item])
+                gravadas += 1
+            except Exception as e:
+                if _falha_de_conexao(e):
+                    self._contar('erros')
+                    logger.error(f"Banco indisponível para gravar logs, usando contingência: {str(e)}")
+                    return gravadas, lote[posicao:]
+                self._contar('descartados')
+                logger.error(f"Log descartado ({item[0]}), recusado pelo banco: {str(e)} - {item[1]!r:.500}")
+        return gravadas, []
+
+    def _inserir(self, lote: List):
+        """Um INSERT de várias linhas por tabela, na mesma transação"""
+        por_tabela: Dict[str, List[Dict]] = {}
+        for tabela, linha in lote:
+            por_tabela.setdefault(tabela, []).append(linha)
+        with db.engine.begin() as conn:
+            for tabela, linhas in por_tabela.items():
+                # executemany exige as mesmas chaves em todas as linhas
+                colunas = set().union(*linhas)
+                linhas = [{coluna: linha.get(coluna) for coluna in colunas} for linha in linhas]
+                for inicio in range(0, len(linhas), self.tamanho_lote):
+                    conn.execute(insert(TABELAS[tabela]), linhas[inicio:inicio + self.tamanho_lote])
+                # Resumos diários dos painéis, na mesma transação
+                somar_logs_inseridos(conn, tabela, linhas)
+
+    # ---------------------------------------------------------------- contingência
+
+    def _salvar_contingencia(self, lote: List, novos: bool = True) -> bool:
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            conteudo = ''.join(
+                json.dumps({'tabela': tabela, 'linha': {
+                    chave: valor.isoformat() if isinstance(valor, datetime) else valor
+                    for chave, valor in linha.items()
+                }}, ensure_ascii=False) + '\n'
+                for tabela, linha in lote
+            )
+            with open(self.arquivo_contingencia, 'a', encoding='utf-8') as arquivo:
+                arquivo.write(conteudo)
+            if novos:
+                self._contar('contingencia', len(lote))
+            return True
+        except Exception as e:
+            self._contar('erros')
+            logger.error(f"Erro ao salvar logs em contingência ({len(lote)} perdidos): {str(e)}")
+            return False
+
+    def _arquivos_contingencia(self) -> List[str]:
+        """Arquivo deste processo e os de processos encerrados (sem alteração recente)"""
+        proprio = self.arquivo_contingencia
+        limite = time.time() - IDADE_CONTINGENCIA_ORFA
+        arquivos = []
+        for caminho in glob.glob(os.path.join(glob.escape(self.diretorio), f'{PREFIXO_CONTINGENCIA}*.jsonl')):
+            try:
+                if caminho == proprio or os.path.getmtime(caminho) < limite:
+                    arquivos.append(caminho)
+            except OSError:
+                continue
+        return arquivos
+
+    def _reenviar_contingencia(self) -> int:
+        reenviadas = 0
+        for caminho in self._arquivos_contingencia():
+            # Renomear reserva o arquivo: outro processo não o reenvia ao mesmo tempo
+            reservado = f'{caminho}.{os.getpid()}.reenvio'
+            try:
+                os.replace(caminho, reservado)
+            except OSError:
+                continue
+
+            lote = []
+            with open(reservado, 'r', encoding='utf-8') as arquivo:
+                for linha_arquivo in arquivo:
+                    try:
+                        registro = json.loads(linha_arquivo)
+                    except ValueError:
+                        continue
+                    linha = registro['linha']
+                    for coluna in COLUNAS_DATA:
+                        if linha.get(coluna):
+                            linha[coluna] = datetime.fromisoformat(linha[coluna])
+                    lote.append((registro['tabela'], linha))
+
+            gravadas, restante = self._gravar_lote(lote) if lote else (0, [])
+            reenviadas += gravadas
+            self._contar('reenviados', gravadas)
+            if restante:
+                if self._salvar_contingencia(restante, novos=False):
+                    os.remove(reservado)
+                break
+            os.remove(reservado)
+            logger.info(f"{gravadas} logs reenviados da contingência {os.path.basename(caminho)}")
+        return reenviadas
+
+    # ---------------------------------------------------------------- thread
+
+    def executar(self, app):
+        while True:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            with app.app_context():
+                try:
+                    self.gravar()
+                except Exception as e:
+                    logger.error(f"Erro na gravação de logs: {str(e)}")
+
+
+buffer_logs = BufferLogs()
+
+
+def registrar_linha_log(tabela: str, linha: Dict):
+    """Enfileira uma linha para logs_acoes ou logs_acesso"""
+    buffer_logs.adicionar(tabela, linha)
+
+
+def gravar_logs_pendentes() -> int:
+    """Grava imediatamente os logs pendentes deste processo"""
+    return buffer_logs.gravar()
+
+
+def iniciar_gravacao_logs(app, socketio):
+    """Inicia a gravação em lote dos logs e a gravação final ao encerrar"""
+    buffer_logs.ativo = True
+    socketio.start_background_task(buffer_logs.executar, app)
+
+    def _gravar_ao_encerrar():
+        try:
+            with app.app_context():
+                buffer_logs.gravar()
+        except Exception as e:
+            logger.error(f"Erro ao gravar logs no encerramento: {str(e)}")
+
+    atexit.register(_gravar_ao_encerrar)
@@ -0,0 +1,158 @@
+"""
+Paginação por keyset (cursor) das listagens da API
+
+As listagens ordenam por (coluna, id) e cada página continua a partir da
+posição do último item da página anterior, codificada em um cursor opaco.
+Não há COUNT nem OFFSET: o custo de uma página independe da profundidade.
+
+Modos (decididos pelos parâmetros da requisição):
+    - 'limit' e/ou 'cursor' presentes: keyset. A resposta traz 'proximo_cursor'
+      e, se pedido com total=exato ou total=estimado, a contagem.
+    - caso contrário: page/per_page (formato legado, com COUNT e OFFSET),
+      mantido para clientes que ainda navegam por número de página.
+
+NULL é tratado como o menor valor da coluna, como no MySQL e no SQLite:
+no fim da lista em ordem decrescente e no início em ordem crescente.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from flask import request
+from sqlalchemy import and_, func, or_, select
+
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 200
+LIMITE_CONTAGEM = 10000  # teto da contagem estimada (total=estimado)
+
+
+class CursorInvalido(ValueError):
+    """Cursor malformado ou gerado para outra ordenação"""
+
+
+def _chave_coluna(coluna) -> str:
+    return str(coluna)
+
+def _serializar(valor):
+    if isinstance(valor, datetime):
+        return {'dt': valor.isoformat()}
+    if isinstance(valor, date):
+        return {'d': valor.isoformat()}
+    return valor
+
+def _desserializar(valor):
+    if isinstance(valor, dict):
+        if 'dt' in valor:
+            return datetime.fromisoformat(valor['dt'])
+        if 'd' in valor:
+            return date.fromisoformat(valor['d'])
+        raise ValueError('Valor de cursor desconhecido')
+    return valor
+
+def codificar_cursor(coluna, valor, registro_id) -> str:
+    """Codifica a posição (valor da coluna, id) de um registro como cursor opaco"""
+    conteudo = json.dumps({'c': _chave_coluna(coluna), 'v': _serializar(valor), 'id': registro_id},
+                          separators=(',', ':'))
+    return base64.urlsafe_b64encode(conteudo.encode()).decode()
+
+def decodificar_cursor(cursor, coluna):
+    """Decodifica um cursor gerado por codificar_cursor para a mesma coluna; None se vazio"""
+    if not cursor:
+        return None
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if dados['c'] != _chave_coluna(coluna):
+            raise ValueError('Cursor de outra ordenação')
+        return _desserializar(dados['v']), int(dados['id'])
+    except Exception:
+        raise CursorInvalido('Cursor inválido')
+
+def _aceita_nulo(coluna) -> bool:
+    return getattr(getattr(coluna, 'expression', coluna), 'nullable', True)
+
+def ordenacao(coluna, coluna_id, descendente=True):
+    """Cláusulas de ORDER BY coerentes com condicao_apos"""
+    if descendente:
+        return coluna.desc(), coluna_id.desc()
+    return coluna.asc(), coluna_id.asc()
+
+def condicao_apos(coluna, coluna_id, valor, registro_id, descendente=True):
+    """Filtro dos registros que vêm depois de (valor, registro_id) na ordenação"""
+    nulo = _aceita_nulo(coluna)
+    if descendente:
+        if valor is None:
+            return and_(coluna.is_(None), coluna_id < registro_id)
+        condicoes = [coluna < valor, and_(coluna == valor, coluna_id < registro_id)]
+        if nulo:
+            condicoes.append(coluna.is_(None))
+        return or_(*condicoes)
+
+    if valor is None:
+        return or_(and_(coluna.is_(None), coluna_id > registro_id), coluna.isnot(None))
+    return or_(coluna > valor, and_(coluna == valor, coluna_id > registro_id))
+
+def usa_cursor() -> bool:
+    """A requisição pediu paginação por keyset?"""
+    return 'cursor' in request.args or 'limit' in request.args
+
+def contar(query, coluna_id, teto=None) -> int:
+    """COUNT da consulta sem ordenação; com teto, para de contar em teto + 1 linhas"""
+    query = query.order_by(None).with_entities(coluna_id)
+    if teto is None:
+        return query.count()
+    subconsulta = query.limit(teto + 1).subquery()
+    return query.session.scalar(select(func.count()).select_from(subconsulta))
+
+def paginar(query, coluna, coluna_id, descendente=True, limite_padrao=LIMITE_PADRAO, registro=None):
+    """
+    Pagina a consulta por (coluna, coluna_id) conforme os parâmetros da requisição
+
+    registro extrai da linha o objeto que tem a coluna e o id (para consultas
+    que retornam tuplas). Retorna (itens, paginacao). Levanta CursorInvalido.
+    """
+    registro = registro or (lambda linha: linha)
+    query_ordenada = query.order_by(None).order_by(*ordenacao(coluna, coluna_id, descendente))
+
+    if not usa_cursor():
+        page = max(request.args.get('page', 1, type=int) or 1, 1)
+        per_page = max(request.args.get('per_page', limite_padrao, type=int) or limite_padrao, 1)
+        paginados = query_ordenada.paginate(page=page, per_page=per_page, error_out=False)
+        return paginados.items, {
+            'page': paginados.page,
+            'pages': paginados.pages,
+            'per_page': paginados.per_page,
+            'total': paginados.total,
+            'has_next': paginados.has_next,
+            'has_prev': paginados.has_prev
+        }
+
+    limite = min(max(request.args.get('limit', limite_padrao, type=int) or limite_padrao, 1), LIMITE_MAXIMO)
+    cursor = decodificar_cursor(request.args.get('cursor'), coluna)
+    query_pagina = query_ordenada
+    if cursor:
+        query_pagina = query_pagina.filter(condicao_apos(coluna, coluna_id, cursor[0], cursor[1], descendente))
+
+    linhas = query_pagina.limit(limite + 1).all()
+    proximo_cursor = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        ultimo = registro(linhas[-1])
+        proximo_cursor = codificar_cursor(coluna, getattr(ultimo, coluna.key), getattr(ultimo, coluna_id.key))
+
+    paginacao = {
+        'per_page': limite,
+        'has_next': proximo_cursor is not None,
+        'has_prev': bool(cursor),
+        'proximo_cursor': proximo_cursor
+    }
+
+    # Contagem só quando pedida: exata (COUNT completo) ou estimada (limitada)
+    modo_total = request.args.get('total')
+    if modo_total == 'exato':
+        paginacao['total'] = contar(query, coluna_id)
+    elif modo_total == 'estimado':
+        total = contar(query, coluna_id, LIMITE_CONTAGEM)
+        paginacao['total_estimado'] = min(total, LIMITE_CONTAGEM)
+        paginacao['total_limitado'] = total > LIMITE_CONTAGEM
+
+    return linhas, paginacao
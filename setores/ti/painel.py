@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, jsonify, abort, redirect, url_for, flash, Response
+from flask import Blueprint, render_template, request, jsonify, abort, redirect, url_for, flash, Response, stream_with_context
 from database import Chamado, Unidade, User, db, ProblemaReportado, get_brazil_time, utc_to_brazil
 from database import HistoricoTicket, Configuracao, AgenteSuporte, ChamadoAgente, HistoricoSLA
 from sqlalchemy.exc import IntegrityError
@@ -7,12 +7,14 @@ import random
 import string
 from flask_login import LoginManager, login_required, current_user, logout_user
 from auth.auth_helpers import setor_required
+from auth.cache_usuarios import invalidar_cache_usuario
 import os
 from setores.ti.routes import enviar_email
 from setores.ti.rotas import get_client_info
 from datetime import datetime, timedelta
 from flask import current_app
 from sqlalchemy import func, case, extract
+import copy
 import json
 import pytz
 import traceback
@@ -24,11 +26,30 @@ from setores.ti.sla_utils import (
     carregar_configuracoes_sla,
     salvar_configuracoes_sla,
     carregar_configuracoes_horario_comercial,
-    obter_metricas_sla_consolidadas
+    obter_metricas_sla_consolidadas,
+    avaliar_sla_lote,
+    sla_lote_item,
+    registrar_snapshot_sla,
+    invalidar_snapshot_sla
+)
+from setores.ti.atribuicao_agentes import ChamadoJaAtribuido, reivindicar_chamado
+from setores.ti.busca import buscar, filtro_busca
+from setores.ti.calendario_comercial import invalidar_calendario_comercial
+from setores.ti.paginacao import CursorInvalido, codificar_cursor, condicao_apos, decodificar_cursor, ordenacao, paginar
+from setores.ti.registro_configuracoes import invalidar_configuracoes, obter_configuracoes
+from setores.ti.tempo_real import SALA_ADMIN, SALA_TI, emitir, sala_setor
+from setores.ti.resumos_diarios import (
+    descontar_chamados, somar_acessos, somar_acoes, somar_chamados, tempo_medio_horas
 )
 
 painel_bp = Blueprint('painel', __name__, template_folder='templates')
 
+# Colunas de Chamado na ordem esperada por avaliar_sla_lote
+COLUNAS_SLA_CHAMADO = (
+    Chamado.id, Chamado.prioridade, Chamado.status, Chamado.data_abertura,
+    Chamado.data_primeira_resposta, Chamado.data_conclusao
+)
+
 # Configurar logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -365,7 +386,9 @@ def setup_database_endpoint():
         from setores.ti.routes import gerar_codigo_chamado, gerar_protocolo
 
         # Limpar chamados de teste existentes
-        Chamado.query.filter_by(solicitante='Usuário de Demonstração').delete()
+        chamados_demonstracao = Chamado.query.filter_by(solicitante='Usuário de Demonstração')
+        descontar_chamados(chamados_demonstracao)
+        chamados_demonstracao.delete()
 
         # Criar chamado aberto ontem às 16:00 (dentro do horário comercial)
         ontem_16h = agora.replace(hour=16, minute=0, second=0, microsecond=0) - timedelta(days=1)
@@ -492,40 +515,21 @@ def setup_demo_page():
     '''
 
 def carregar_configuracoes():
-    """Carrega configurações do banco de dados ou retorna padr����es"""
+    """Configurações padrão mescladas com as do banco (servidas pelo registro em memória)"""
     try:
-        config_final = CONFIGURACOES_PADRAO.copy()
-
-        # Verificar se a tabela de configurações existe
-        try:
-            # Tentar buscar todas as configurações do banco
-            configs_db = Configuracao.query.all()
-
-            for config in configs_db:
-                try:
-                    valor = json.loads(config.valor)
-                    # Atualizar apenas seções existentes
-                    if config.chave in config_final and isinstance(valor, dict):
-                        config_final[config.chave].update(valor)
-                    else:
-                        config_final[config.chave] = valor
-                except json.JSONDecodeError:
-                    # Para valores que não são JSON (strings simples), tratar como strings
-                    if config.chave in ['versao_database', 'data_criacao', 'sistema_inicializado']:
-                        config_final[config.chave] = config.valor
-                    else:
-                        logger.error(f"Erro ao decodificar configuraç����o {config.chave}")
-                    continue
-
-        except Exception as db_error:
-            logger.warning(f"Tabela de configurações não disponível ou vazia: {str(db_error)}")
-            # Retorna configurações padrão se a tabela não existir
-
+        config_final = copy.deepcopy(CONFIGURACOES_PADRAO)
+        for chave, valor in obter_configuracoes().gerais.items():
+            valor = copy.deepcopy(valor)
+            # Atualizar apenas seções existentes
+            if isinstance(config_final.get(chave), dict) and isinstance(valor, dict):
+                config_final[chave].update(valor)
+            else:
+                config_final[chave] = valor
         return config_final
 
     except Exception as e:
         logger.error(f"Erro geral ao carregar configurações: {str(e)}")
-        return CONFIGURACOES_PADRAO.copy()
+        return copy.deepcopy(CONFIGURACOES_PADRAO)
 
 def salvar_configuracoes_db(config):
     """Salva configurações no banco de dados"""
@@ -560,6 +564,7 @@ def salvar_configuracoes_db(config):
                 db.session.add(nova_config)
         
         db.session.commit()
+        invalidar_configuracoes()
         logger.info("Configurações salvas com sucesso no banco de dados")
         
         return True
@@ -648,11 +653,11 @@ def salvar_configuracoes_api():
         # Emitir evento Socket.IO para notificar outros usuários sobre mudança de configurações
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('configuracoes_atualizadas', {
+                emitir('configuracoes_atualizadas', {
                     'usuario': current_user.nome,
                     'secoes': list(data.keys()),
                     'timestamp': get_brazil_time().isoformat()
-                })
+                }, [SALA_ADMIN])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
         
@@ -704,11 +709,11 @@ def salvar_configuracoes_notificacoes():
         # Emitir evento Socket.IO
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('notificacoes_configuradas', {
+                emitir('notificacoes_configuradas', {
                     'usuario': current_user.nome,
                     'configuracoes': data,
                     'timestamp': get_brazil_time().isoformat()
-                })
+                }, [SALA_ADMIN])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
         
@@ -1055,25 +1060,12 @@ def atribuir_chamado_para_mim(chamado_id):
             logger.warning(f"Chamado {chamado_id} não está disponível (status: {chamado.status})")
             return error_response('Chamado não está disponível para atribuição')
 
-        # Verificar se já tem agente atribuído
-        atribuicao_existente = ChamadoAgente.query.filter_by(
-            chamado_id=chamado_id,
-            ativo=True
-        ).first()
-
-        if atribuicao_existente:
+        # Criar nova atribuição (o índice único recusa se outro agente já reivindicou)
+        try:
+            reivindicar_chamado(chamado_id, agente.id, current_user.id, 'Auto-atribuição pelo agente')
+        except ChamadoJaAtribuido:
             logger.warning(f"Chamado {chamado_id} já possui agente atribuído")
             return error_response('Chamado já possui agente atribuído')
-
-        # Criar nova atribuição
-        nova_atribuicao = ChamadoAgente(
-            chamado_id=chamado_id,
-            agente_id=agente.id,
-            atribuido_por=current_user.id,
-            observacoes='Auto-atribuição pelo agente'
-        )
-
-        db.session.add(nova_atribuicao)
         db.session.commit()
 
         logger.info(f"Chamado {chamado_id} atribuído com sucesso ao agente {agente.id}")
@@ -1105,7 +1097,7 @@ Equipe de Suporte TI - Evoque Fitness
         # Emitir evento Socket.IO para notificação em tempo real
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_atribuido', {
+                emitir('chamado_atribuido', {
                     'chamado_id': chamado.id,
                     'codigo': chamado.codigo,
                     'protocolo': chamado.protocolo,
@@ -1116,7 +1108,7 @@ Equipe de Suporte TI - Evoque Fitness
                     'agente_nome': f"{current_user.nome} {current_user.sobrenome}",
                     'agente_email': current_user.email,
                     'timestamp': get_brazil_time().isoformat()
-                })
+                }, [SALA_TI])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -1197,6 +1189,7 @@ def atualizar_chamado_agente(chamado_id):
                 logger.warning(f"Erro ao criar histórico: {str(hist_error)}")
 
         db.session.commit()
+        registrar_snapshot_sla(chamado.id)
 
         # Registrar log da ação
         registrar_log_acao(
@@ -1211,13 +1204,13 @@ def atualizar_chamado_agente(chamado_id):
         # Emitir evento Socket.IO
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_atualizado', {
+                emitir('chamado_atualizado', {
                     'chamado_id': chamado.id,
                     'codigo': chamado.codigo,
                     'status': chamado.status,
                     'agente': f"{current_user.nome} {current_user.sobrenome}",
                     'timestamp': get_brazil_time().isoformat()
-                })
+                }, [SALA_TI])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -1306,7 +1299,7 @@ def transferir_chamado_agente(chamado_id):
         # Emitir evento Socket.IO
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_transferido', {
+                emitir('chamado_transferido', {
                     'chamado_id': chamado.id,
                     'codigo': chamado.codigo,
                     'agente_origem_nome': f"{current_user.nome} {current_user.sobrenome}",
@@ -1314,7 +1307,7 @@ def transferir_chamado_agente(chamado_id):
                     'agente_destino_nome': f"{agente_destino.usuario.nome} {agente_destino.usuario.sobrenome}",
                     'agente_destino_email': agente_destino.usuario.email,
                     'timestamp': get_brazil_time().isoformat()
-                })
+                }, [SALA_TI])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -1539,6 +1532,7 @@ def salvar_configuracoes_sla_api():
                 from database import atualizar_horario_comercial, registrar_log_acao
 
                 horario_atualizado = atualizar_horario_comercial(horario_config, usuario_id=current_user.id)
+                invalidar_snapshot_sla()
 
                 # Registrar log da alteração
                 registrar_log_acao(
@@ -1653,6 +1647,7 @@ def salvar_horario_comercial_api():
             dados_atualizacao['dias_semana'] = data['dias_semana']
 
         horario_atualizado = atualizar_horario_comercial(dados_atualizacao, usuario_id=current_user.id)
+        invalidar_snapshot_sla()
 
         # Registrar log da alteração
         registrar_log_acao(
@@ -1779,6 +1774,8 @@ def migrar_tabelas_sla():
             resultados['horarios_criados'] = 1
 
         db.session.commit()
+        if resultados['slas_criadas'] or resultados['horarios_criados']:
+            invalidar_configuracoes()
 
         # Registrar log da migração
         registrar_log_acao(
@@ -1848,8 +1845,11 @@ def obter_chamados_com_sla():
         limit = request.args.get('limit', 50, type=int)
         offset = request.args.get('offset', 0, type=int)
 
-        # Construir query
-        query = Chamado.query
+        # Construir query apenas com as colunas exibidas e usadas no SLA
+        query = db.session.query(
+            *COLUNAS_SLA_CHAMADO,
+            Chamado.codigo, Chamado.protocolo, Chamado.solicitante, Chamado.problema
+        )
 
         if status_filtro:
             query = query.filter(Chamado.status == status_filtro)
@@ -1867,28 +1867,28 @@ def obter_chamados_com_sla():
         config_sla = carregar_configuracoes_sla()
         config_horario = carregar_configuracoes_horario_comercial()
 
-        chamados_list = []
-        for chamado in chamados:
-            sla_info = calcular_sla_chamado_correto(chamado, config_sla, config_horario)
+        lote = avaliar_sla_lote(chamados, config_sla, config_horario)
 
+        chamados_list = []
+        for indice, chamado in enumerate(chamados):
             # Filtrar por status SLA se especificado
-            if sla_status_filtro and sla_info['sla_status'] != sla_status_filtro:
+            if sla_status_filtro and lote['sla_status'][indice] != sla_status_filtro:
                 continue
 
-            data_abertura_brazil = chamado.get_data_abertura_brazil()
-            data_conclusao_brazil = chamado.get_data_conclusao_brazil()
+            data_abertura_brazil = lote['data_abertura_brazil'][indice]
+            data_conclusao_brazil = lote['data_conclusao_brazil'][indice]
 
             chamado_data = {
                 'id': chamado.id,
                 'codigo': chamado.codigo,
-                'protocolo': getattr(chamado, 'protocolo', None),
+                'protocolo': chamado.protocolo,
                 'solicitante': chamado.solicitante,
                 'problema': chamado.problema,
                 'status': chamado.status,
                 'prioridade': chamado.prioridade,
                 'data_abertura': data_abertura_brazil.strftime('%d/%m/%Y %H:%M:%S') if data_abertura_brazil else None,
                 'data_conclusao': data_conclusao_brazil.strftime('%d/%m/%Y %H:%M:%S') if data_conclusao_brazil else None,
-                'sla': sla_info
+                'sla': sla_lote_item(lote, indice)
             }
 
             chamados_list.append(chamado_data)
@@ -1925,26 +1925,28 @@ def obter_dashboard_sla():
         if 'fim' in config_horario and hasattr(config_horario['fim'], 'strftime'):
             config_horario['fim'] = config_horario['fim'].strftime('%H:%M')
 
-        # Obter chamados abertos em risco
-        chamados_abertos = Chamado.query.filter(
-            Chamado.status.in_(['Aberto', 'Aguardando'])
+        # Obter chamados abertos em risco a partir do snapshot de SLA
+        from database import SlaChamado
+        chamados_em_risco = db.session.query(Chamado, SlaChamado).join(
+            SlaChamado, SlaChamado.chamado_id == Chamado.id
+        ).filter(
+            SlaChamado.status_chamado.in_(['Aberto', 'Aguardando']),
+            SlaChamado.sla_status.in_(['Em Risco', 'Violado'])
         ).order_by(Chamado.data_abertura.asc()).all()
 
         chamados_risco = []
-        for chamado in chamados_abertos:
-            sla_info = calcular_sla_chamado_correto(chamado, config_sla, config_horario)
-            if sla_info['sla_status'] in ['Em Risco', 'Violado']:
-                data_abertura_brazil = chamado.get_data_abertura_brazil()
-                chamados_risco.append({
-                    'id': chamado.id,
-                    'codigo': chamado.codigo,
-                    'solicitante': chamado.solicitante,
-                    'problema': chamado.problema,
-                    'prioridade': chamado.prioridade,
-                    'data_abertura': data_abertura_brazil.strftime('%d/%m/%Y %H:%M') if data_abertura_brazil else None,
-                    'sla_status': sla_info['sla_status'],
-                    'percentual_tempo_usado': sla_info['percentual_tempo_usado']
-                })
+        for chamado, snapshot in chamados_em_risco:
+            data_abertura_brazil = chamado.get_data_abertura_brazil()
+            chamados_risco.append({
+                'id': chamado.id,
+                'codigo': chamado.codigo,
+                'solicitante': chamado.solicitante,
+                'problema': chamado.problema,
+                'prioridade': chamado.prioridade,
+                'data_abertura': data_abertura_brazil.strftime('%d/%m/%Y %H:%M') if data_abertura_brazil else None,
+                'sla_status': snapshot.sla_status,
+                'percentual_tempo_usado': snapshot.percentual_tempo_usado
+            })
 
         # Estatísticas por status
         stats_status = db.session.query(
@@ -2013,15 +2015,6 @@ def auto_atribuir_chamado(chamado_id):
         if chamado.status not in ['Aberto']:
             return error_response('Chamado não está dispon��vel para atribuição')
 
-        # Verificar se já tem agente atribuído
-        atribuicao_existente = ChamadoAgente.query.filter_by(
-            chamado_id=chamado_id,
-            ativo=True
-        ).first()
-
-        if atribuicao_existente:
-            return error_response('Chamado já possui agente atribuído')
-
         # Buscar ou criar agente
         agente = AgenteSuporte.query.filter_by(usuario_id=current_user.id, ativo=True).first()
         if not agente:
@@ -2039,15 +2032,14 @@ def auto_atribuir_chamado(chamado_id):
             else:
                 return error_response('Usuário não tem permissão para ser agente', 403)
 
-        # Criar atribuição
-        nova_atribuicao = ChamadoAgente(
-            chamado_id=chamado_id,
-            agente_id=agente.id,
-            atribuido_por=current_user.id,
-            observacoes='Auto-atribuição pelo agente'
-        )
+        if not agente.pode_receber_chamado():
+            return error_response('Você já atingiu o limite máximo de chamados simultâneos', 400)
 
-        db.session.add(nova_atribuicao)
+        # Criar atribuição (o índice único recusa se outro agente já reivindicou)
+        try:
+            reivindicar_chamado(chamado_id, agente.id, current_user.id, 'Auto-atribuição pelo agente')
+        except ChamadoJaAtribuido:
+            return error_response('Chamado já possui agente atribuído')
         db.session.commit()
 
         # Enviar email
@@ -2459,139 +2451,247 @@ def obter_historico_acoes_chamados():
         logger.error(f"Erro ao obter histórico: {str(e)}")
         return error_response('Erro interno ao obter histórico')
 
+# ==================== LISTAGEM DE CHAMADOS ====================
+
+LIMITE_PADRAO_CHAMADOS = 50
+LIMITE_MAXIMO_CHAMADOS = 500
+TAMANHO_LOTE_STREAMING = 500
+
+def _formatar_chamado_lista(c) -> dict:
+    """Monta o item de /api/chamados a partir de uma linha da projeção"""
+    data_abertura_brazil = utc_to_brazil(c.data_abertura) if c.data_abertura else None
+
+    agente_info = None
+    if c.agente_id:
+        agente_info = {
+            'id': c.agente_id,
+            'nome': f"{c.agente_nome} {c.agente_sobrenome}",
+            'usuario': c.agente_usuario,
+            'nivel_experiencia': c.agente_nivel_experiencia
+        }
+
+    return {
+        'id': c.id,
+        'codigo': c.codigo,
+        'protocolo': c.protocolo,
+        'solicitante': c.solicitante,
+        'email': c.email,
+        'cargo': c.cargo,
+        'telefone': c.telefone,
+        'unidade': c.unidade,
+        'problema': c.problema,
+        'descricao': c.descricao,
+        'internet_item': c.internet_item,
+        'data_visita': c.data_visita.strftime('%d/%m/%Y') if c.data_visita else None,
+        'data_abertura': data_abertura_brazil.strftime('%d/%m/%Y %H:%M:%S') if data_abertura_brazil else None,
+        'status': c.status or 'Aberto',
+        'prioridade': c.prioridade or 'Normal',
+        'visita_tecnica': c.visita_tecnica if c.visita_tecnica is not None else False,
+        'observacoes': c.observacoes,
+        'fechado_por': f"{c.fechado_por_nome} {c.fechado_por_sobrenome}" if c.fechado_por_nome else None,
+        'atribuido_por': f"{c.atribuido_por_nome} {c.atribuido_por_sobrenome}" if c.atribuido_por_nome else None,
+        'qtd_reaberturas': c.qtd_reaberturas or 0,
+        'agente': agente_info,
+        'agente_id': agente_info['id'] if agente_info else None
+    }
+
+def _stream_lista_json(linhas):
+    """Gera um array JSON item a item, sem montar a lista inteira em memória"""
+    yield '['
+    primeiro = True
+    for linha in linhas:
+        try:
+            item = json.dumps(_formatar_chamado_lista(linha))
+        except Exception as e:
+            logger.error(f"Erro ao formatar chamado {linha.id}: {str(e)}")
+            continue
+        yield item if primeiro else ',' + item
+        primeiro = False
+    yield ']'
+
 @painel_bp.route('/api/chamados', methods=['GET'])
 @login_required
 @setor_required('TI')
 def listar_chamados():
+    """
+    Lista chamados com agente atribuído, em uma única consulta
+
+    Sem parâmetros de paginação, retorna a lista completa (formato legado).
+    Com 'limit' e/ou 'cursor', retorna uma página com 'proximo_cursor' para
+    paginação por keyset (data de abertura e id, do mais recente ao mais antigo).
+    Filtros opcionais: status, prioridade, unidade, agente_id e busca.
+    """
     try:
-        print("🔍 DEBUG: Iniciando listar_chamados()")
-        logger.debug("Iniciando consulta de chamados...")
         from database import ChamadoAgente, AgenteSuporte, User
+        from sqlalchemy.orm import aliased
 
-        # Fazer join com agentes se existir
-        chamados = db.session.query(Chamado).outerjoin(
-            ChamadoAgente, (Chamado.id == ChamadoAgente.chamado_id) & (ChamadoAgente.ativo == True)
+        paginado = 'limit' in request.args or 'cursor' in request.args
+        limit = min(max(request.args.get('limit', LIMITE_PADRAO_CHAMADOS, type=int), 1), LIMITE_MAXIMO_CHAMADOS)
+        try:
+            cursor = decodificar_cursor(request.args.get('cursor'), Chamado.data_abertura)
+        except CursorInvalido:
+            return error_response('Cursor inválido', 400)
+
+        UsuarioAgente = aliased(User)
+        UsuarioFechou = aliased(User)
+        UsuarioAtribuiu = aliased(User)
+
+        # Uma atribuição ativa por chamado (a mais recente)
+        atribuicao_ativa = db.session.query(
+            ChamadoAgente.chamado_id,
+            func.max(ChamadoAgente.id).label('atribuicao_id')
+        ).filter(ChamadoAgente.ativo == True).group_by(ChamadoAgente.chamado_id).subquery()
+
+        query = db.session.query(
+            Chamado.id, Chamado.codigo, Chamado.protocolo, Chamado.solicitante, Chamado.email,
+            Chamado.cargo, Chamado.telefone, Chamado.unidade, Chamado.problema, Chamado.descricao,
+            Chamado.internet_item, Chamado.data_visita, Chamado.data_abertura, Chamado.status,
+            Chamado.prioridade, Chamado.visita_tecnica, Chamado.observacoes, Chamado.qtd_reaberturas,
+            AgenteSuporte.id.label('agente_id'),
+            AgenteSuporte.nivel_experiencia.label('agente_nivel_experiencia'),
+            UsuarioAgente.nome.label('agente_nome'),
+            UsuarioAgente.sobrenome.label('agente_sobrenome'),
+            UsuarioAgente.usuario.label('agente_usuario'),
+            UsuarioFechou.nome.label('fechado_por_nome'),
+            UsuarioFechou.sobrenome.label('fechado_por_sobrenome'),
+            UsuarioAtribuiu.nome.label('atribuido_por_nome'),
+            UsuarioAtribuiu.sobrenome.label('atribuido_por_sobrenome')
+        ).outerjoin(
+            atribuicao_ativa, atribuicao_ativa.c.chamado_id == Chamado.id
+        ).outerjoin(
+            ChamadoAgente, ChamadoAgente.id == atribuicao_ativa.c.atribuicao_id
         ).outerjoin(
             AgenteSuporte, ChamadoAgente.agente_id == AgenteSuporte.id
         ).outerjoin(
-            User, AgenteSuporte.usuario_id == User.id
-        ).order_by(Chamado.data_abertura.desc()).all()
+            UsuarioAgente, AgenteSuporte.usuario_id == UsuarioAgente.id
+        ).outerjoin(
+            UsuarioFechou, Chamado.fechado_por_id == UsuarioFechou.id
+        ).outerjoin(
+            UsuarioAtribuiu, Chamado.atribuido_por_id == UsuarioAtribuiu.id
+        )
 
-        logger.debug(f"Total de chamados encontrados: {len(chamados)}")
+        # Filtros
+        status_filtro = request.args.get('status', '').strip()
+        if status_filtro:
+            query = query.filter(Chamado.status == status_filtro)
+        prioridade_filtro = request.args.get('prioridade', '').strip()
+        if prioridade_filtro:
+            query = query.filter(Chamado.prioridade == prioridade_filtro)
+        unidade_filtro = request.args.get('unidade', '').strip()
+        if unidade_filtro:
+            query = query.filter(Chamado.unidade == unidade_filtro)
+        agente_filtro = request.args.get('agente_id', type=int)
+        if agente_filtro:
+            query = query.filter(AgenteSuporte.id == agente_filtro)
+        busca = request.args.get('busca', '').strip()
+        if busca:
+            query = query.filter(filtro_busca('chamado', busca))
 
-        chamados_list = []
-        for c in chamados:
-            try:
-                # Converter data de abertura para timezone do Brasil
-                data_abertura_brazil = c.get_data_abertura_brazil()
-                data_abertura_str = data_abertura_brazil.strftime('%d/%m/%Y %H:%M:%S') if data_abertura_brazil else None
-
-                # Converter data de visita se existir
-                data_visita_str = c.data_visita.strftime('%d/%m/%Y') if c.data_visita else None
-
-                # Buscar agente atribuído
-                agente_info = None
-                chamado_agente = ChamadoAgente.query.filter_by(
-                    chamado_id=c.id,
-                    ativo=True
-                ).first()
-
-                if chamado_agente and chamado_agente.agente:
-                    agente_info = {
-                        'id': chamado_agente.agente.id,
-                        'nome': f"{chamado_agente.agente.usuario.nome} {chamado_agente.agente.usuario.sobrenome}",
-                        'usuario': chamado_agente.agente.usuario.usuario,
-                        'nivel_experiencia': chamado_agente.agente.nivel_experiencia
-                    }
+        # Keyset: continuar após (data_abertura, id) do último item da página anterior
+        if cursor:
+            query = query.filter(condicao_apos(Chamado.data_abertura, Chamado.id, *cursor))
 
-                # Buscar informações de quem fechou o chamado
-                fechado_por_info = None
-                if hasattr(c, 'fechado_por_id') and c.fechado_por_id:
-                    try:
-                        fechado_por = User.query.get(c.fechado_por_id)
-                        if fechado_por:
-                            fechado_por_info = f"{fechado_por.nome} {fechado_por.sobrenome}"
-                    except:
-                        pass
+        query = query.order_by(*ordenacao(Chamado.data_abertura, Chamado.id))
 
-                # Buscar informações de quem atribuiu o chamado
-                atribuido_por_info = None
-                if hasattr(c, 'atribuido_por_id') and c.atribuido_por_id:
-                    try:
-                        atribuido_por = User.query.get(c.atribuido_por_id)
-                        if atribuido_por:
-                            atribuido_por_info = f"{atribuido_por.nome} {atribuido_por.sobrenome}"
-                    except:
-                        pass
+        if not paginado:
+            linhas = query.yield_per(TAMANHO_LOTE_STREAMING)
+            return Response(stream_with_context(_stream_lista_json(linhas)), mimetype='application/json')
 
-                chamado_data = {
-                    'id': c.id,
-                    'codigo': c.codigo if hasattr(c, 'codigo') else None,
-                    'protocolo': c.protocolo if hasattr(c, 'protocolo') else None,
-                    'solicitante': c.solicitante if hasattr(c, 'solicitante') else None,
-                    'email': c.email if hasattr(c, 'email') else None,
-                    'cargo': c.cargo if hasattr(c, 'cargo') else None,
-                    'telefone': c.telefone if hasattr(c, 'telefone') else None,
-                    'unidade': c.unidade if hasattr(c, 'unidade') else None,
-                    'problema': c.problema if hasattr(c, 'problema') else None,
-                    'descricao': c.descricao if hasattr(c, 'descricao') else None,
-                    'internet_item': c.internet_item if hasattr(c, 'internet_item') else None,
-                    'data_visita': data_visita_str,
-                    'data_abertura': data_abertura_str,
-                    'status': c.status if hasattr(c, 'status') else 'Aberto',
-                    'prioridade': c.prioridade if hasattr(c, 'prioridade') else 'Normal',
-                    'visita_tecnica': c.visita_tecnica if hasattr(c, 'visita_tecnica') else False,
-                    'observacoes': c.observacoes if hasattr(c, 'observacoes') else None,
-                    'fechado_por': fechado_por_info,
-                    'atribuido_por': atribuido_por_info,
-                    'qtd_reaberturas': c.qtd_reaberturas if hasattr(c, 'qtd_reaberturas') else 0,
-                    'agente': agente_info,
-                    'agente_id': agente_info['id'] if agente_info else None
-                }
-                chamados_list.append(chamado_data)
-                logger.debug(f"Chamado {c.id} formatado com sucesso")
-            except Exception as e:
-                logger.error(f"Erro ao formatar chamado {c.id}: {str(e)}")
-                continue
+        linhas = query.limit(limit + 1).all()
+        proximo_cursor = None
+        if len(linhas) > limit:
+            linhas = linhas[:limit]
+            proximo_cursor = codificar_cursor(Chamado.data_abertura, linhas[-1].data_abertura, linhas[-1].id)
 
-        logger.debug("Retornando lista de chamados")
-        return json_response(chamados_list)
+        def gerar():
+            yield '{"chamados": '
+            yield from _stream_lista_json(linhas)
+            yield f', "proximo_cursor": {json.dumps(proximo_cursor)}, "limit": {limit}}}'
+
+        return Response(stream_with_context(gerar()), mimetype='application/json')
     except Exception as e:
         logger.error(f"Erro ao listar chamados: {str(e)}")
         logger.error(traceback.format_exc())
-        return error_response('Erro interno ao listar chamados', details=str(e))
+        return error_response('Erro interno ao listar chamados', 500)
 
-@painel_bp.route('/api/chamados/estatisticas', methods=['GET'])
+@painel_bp.route('/api/busca', methods=['GET'])
 @login_required
 @setor_required('TI')
-def obter_estatisticas_chamados():
-    """Retorna estatísticas dos chamados por status"""
+def buscar_texto():
+    """Busca textual ranqueada em chamados, usuários ou logs de ação (parâmetros q, tipo, page, per_page)"""
     try:
-        logger.info("Iniciando consulta de estatísticas de chamados...")
-
-        # Primeiro, verificar se existem chamados no banco
-        total_chamados = Chamado.query.count()
-        logger.info(f"Total de chamados no banco: {total_chamados}")
-
-        if total_chamados == 0:
-            logger.warning("Nenhum chamado encontrado no banco de dados")
+        texto = request.args.get('q', '').strip()
+        tipo = request.args.get('tipo', 'chamados')
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
 
-        # Contar chamados por status
-        estatisticas = db.session.query(
-            Chamado.status,
-            func.count(Chamado.id).label('quantidade')
-        ).group_by(Chamado.status).all()
+        if tipo == 'chamados':
+            resultado = buscar('chamado', texto, page, per_page)
+            itens = [{
+                'id': c.id,
+                'codigo': c.codigo,
+                'protocolo': c.protocolo,
+                'solicitante': c.solicitante,
+                'problema': c.problema,
+                'status': c.status,
+                'data_abertura': c.data_abertura.strftime('%d/%m/%Y %H:%M') if c.data_abertura else None,
+                'pontuacao': pontuacao
+            } for c, pontuacao in resultado['itens']]
+        elif tipo == 'usuarios':
+            if not current_user.tem_permissao_gerenciar_usuarios():
+                return error_response('Acesso negado', 403)
+            resultado = buscar('usuario', texto, page, per_page)
+            itens = [{
+                'id': u.id,
+                'nome': u.nome,
+                'sobrenome': u.sobrenome,
+                'usuario': u.usuario,
+                'email': u.email,
+                'nivel_acesso': u.nivel_acesso,
+                'pontuacao': pontuacao
+            } for u, pontuacao in resultado['itens']]
+        elif tipo == 'logs':
+            if current_user.nivel_acesso != 'Administrador':
+                return error_response('Acesso negado', 403)
+            resultado = buscar('log_acao', texto, page, per_page)
+            itens = [{
+                'id': log.id,
+                'usuario_id': log.usuario_id,
+                'acao': log.acao,
+                'categoria': log.categoria,
+                'detalhes': log.detalhes,
+                'data_acao': log.data_acao.strftime('%d/%m/%Y %H:%M:%S') if log.data_acao else None,
+                'pontuacao': pontuacao
+            } for log, pontuacao in resultado['itens']]
+        else:
+            return error_response('Tipo de busca inválido')
 
-        logger.info(f"Estatísticas brutas do banco: {estatisticas}")
+        return json_response({
+            'resultados': itens,
+            'total': resultado['total'],
+            'pages': resultado['paginas'],
+            'current_page': resultado['pagina'],
+            'per_page': resultado['por_pagina']
+        })
+    except Exception as e:
+        logger.error(f"Erro na busca textual: {str(e)}")
+        return error_response('Erro interno na busca', 500)
 
-        # Converter para dicionário
+@painel_bp.route('/api/chamados/estatisticas', methods=['GET'])
+@login_required
+@setor_required('TI')
+def obter_estatisticas_chamados():
+    """Retorna estatísticas dos chamados por status"""
+    try:
+        # Contagem por status a partir dos resumos diários
         stats_dict = {}
         total = 0
 
-        for status, quantidade in estatisticas:
-            stats_dict[status] = quantidade
-            total += quantidade
-            logger.info(f"Status {status}: {quantidade} chamados")
+        for linha in somar_chamados(('status',)):
+            if not linha['quantidade']:
+                continue
+            stats_dict[linha['status']] = linha['quantidade']
+            total += linha['quantidade']
 
         # Adicionar status que podem não ter chamados
         status_possiveis = ['Aberto', 'Aguardando', 'Concluido', 'Cancelado']
@@ -2601,7 +2701,6 @@ def obter_estatisticas_chamados():
 
         stats_dict['total'] = total
 
-        logger.info(f"Estatísticas finais: {stats_dict}")
         return json_response(stats_dict)
 
     except Exception as e:
@@ -2765,6 +2864,7 @@ def atualizar_status_chamado(id):
         db.session.add(historico)
 
         db.session.commit()
+        registrar_snapshot_sla(chamado.id)
         
         # Buscar informações do agente para incluir na resposta
         agente_info = None
@@ -2789,7 +2889,7 @@ def atualizar_status_chamado(id):
         # Emitir evento Socket.IO apenas se a conexão estiver disponível
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('status_atualizado', {
+                emitir('status_atualizado', {
                     'chamado_id': chamado.id,
                     'codigo': chamado.codigo,
                     'status_anterior': status_anterior,
@@ -2797,7 +2897,7 @@ def atualizar_status_chamado(id):
                     'solicitante': chamado.solicitante,
                     'agente': agente_info,
                     'timestamp': agora_brazil.isoformat()
-                })
+                }, [SALA_TI])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -2836,11 +2936,11 @@ def deletar_chamado(id):
         # Emitir evento Socket.IO apenas se a conexão estiver disponível
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_deletado', {
+                emitir('chamado_deletado', {
                     'id': id,
                     'codigo': codigo_chamado,
                     'timestamp': get_brazil_time().isoformat()
-                })
+                }, [SALA_TI])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -2866,29 +2966,21 @@ def listar_usuarios():
         if not current_user.tem_permissao_gerenciar_usuarios():
             return error_response('Acesso negado. Permissão de administrador ou agente de suporte necessária.', 403)
         busca = request.args.get('busca', '').strip()
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 5, type=int)
 
         query = User.query
 
         # Aplicar filtros de busca
         if busca:
-            query = query.filter(
-                db.or_(
-                    User.nome.ilike(f'%{busca}%'),
-                    User.sobrenome.ilike(f'%{busca}%'),
-                    User.email.ilike(f'%{busca}%'),
-                    User.usuario.ilike(f'%{busca}%')
-                )
-            )
+            query = query.filter(filtro_busca('usuario', busca, ('nome', 'sobrenome', 'email', 'usuario')))
 
-        # Paginação
-        usuarios_pag = query.order_by(User.nome).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Paginação por nome (keyset com limit/cursor, page/per_page no formato legado)
+        try:
+            usuarios, paginacao = paginar(query, User.nome, User.id, descendente=False, limite_padrao=5)
+        except CursorInvalido:
+            return error_response('Cursor inválido', 400)
 
         usuarios_list = []
-        for user in usuarios_pag.items:
+        for user in usuarios:
             usuarios_list.append({
                 'id': user.id,
                 'nome': user.nome,
@@ -2902,15 +2994,10 @@ def listar_usuarios():
                 'data_cadastro': user.data_criacao.strftime('%d/%m/%Y') if user.data_criacao else None
             })
 
-        return json_response({
-            'usuarios': usuarios_list,
-            'total': usuarios_pag.total,
-            'pages': usuarios_pag.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': usuarios_pag.has_next,
-            'has_prev': usuarios_pag.has_prev
-        })
+        resposta = dict(paginacao, usuarios=usuarios_list)
+        if 'page' in resposta:
+            resposta['current_page'] = resposta.pop('page')
+        return json_response(resposta)
 
     except Exception as e:
         logger.error(f"Erro ao listar usuários: {str(e)}")
@@ -2983,14 +3070,14 @@ def criar_usuario():
         # Emitir evento Socket.IO apenas se a conex��o estiver disponível
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('usuario_criado', {
+                emitir('usuario_criado', {
                     'id': novo_usuario.id,
                     'nome': novo_usuario.nome,
                     'sobrenome': novo_usuario.sobrenome,
                     'usuario': novo_usuario.usuario,
                     'nivel_acesso': novo_usuario.nivel_acesso,
                     'timestamp': get_brazil_time().isoformat()
-                })
+                }, [SALA_ADMIN])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
         
@@ -3017,30 +3104,22 @@ def criar_usuario():
 def buscar_usuarios_backup():
     try:
         busca = request.args.get('busca', '').strip()
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 50, type=int)
 
         # Buscar usuários no banco de dados
         query = User.query
 
         # Aplicar filtros de busca se fornecido
         if busca:
-            query = query.filter(
-                db.or_(
-                    User.nome.ilike(f'%{busca}%'),
-                    User.sobrenome.ilike(f'%{busca}%'),
-                    User.email.ilike(f'%{busca}%'),
-                    User.usuario.ilike(f'%{busca}%')
-                )
-            )
+            query = query.filter(filtro_busca('usuario', busca, ('nome', 'sobrenome', 'email', 'usuario')))
 
-        # Paginação
-        usuarios_pag = query.order_by(User.nome).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Paginação por nome (keyset com limit/cursor, page/per_page no formato legado)
+        try:
+            usuarios, paginacao = paginar(query, User.nome, User.id, descendente=False, limite_padrao=50)
+        except CursorInvalido:
+            return error_response('Cursor inválido', 400)
 
         usuarios_list = []
-        for user in usuarios_pag.items:
+        for user in usuarios:
             usuarios_list.append({
                 'id': user.id,
                 'nome': user.nome,
@@ -3054,15 +3133,10 @@ def buscar_usuarios_backup():
                 'data_cadastro': user.data_criacao.strftime('%d/%m/%Y') if hasattr(user, 'data_criacao') and user.data_criacao else None
             })
 
-        return json_response({
-            'usuarios': usuarios_list,
-            'total': usuarios_pag.total,
-            'pages': usuarios_pag.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': usuarios_pag.has_next,
-            'has_prev': usuarios_pag.has_prev
-        })
+        resposta = dict(paginacao, usuarios=usuarios_list)
+        if 'page' in resposta:
+            resposta['current_page'] = resposta.pop('page')
+        return json_response(resposta)
 
     except Exception as e:
         logger.error(f"Erro ao buscar usuários: {str(e)}")
@@ -3127,18 +3201,7 @@ def buscar_usuarios_backup():
 
         # Aplicar filtro de busca se fornecido
         if busca:
-            like_term = f'%{busca}%'
-            query = query.filter(
-                db.or_(
-                    User.nome.ilike(like_term),
-                    User.sobrenome.ilike(like_term),
-                    db.func.concat(User.nome, ' ', User.sobrenome).ilike(like_term),
-                    User.usuario.ilike(like_term),
-                    User.email.ilike(like_term),
-                    User.nivel_acesso.ilike(like_term),
-                    User._setores.ilike(like_term)
-                )
-            )
+            query = query.filter(filtro_busca('usuario', busca))
 
         # Aplicar ordenação e paginação
         query = query.order_by(User.data_criacao.desc())
@@ -3238,17 +3301,18 @@ def toggle_bloqueio_usuario(user_id):
         status_anterior = usuario.bloqueado
         usuario.bloqueado = not usuario.bloqueado
         db.session.commit()
+        invalidar_cache_usuario(usuario.id)
         
         # Emitir evento Socket.IO apenas se a conexão estiver disponível
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('usuario_bloqueio_alterado', {
+                emitir('usuario_bloqueio_alterado', {
                     'usuario_id': usuario.id,
                     'nome': usuario.nome,
                     'status_anterior': status_anterior,
                     'novo_status': usuario.bloqueado,
                     'timestamp': get_brazil_time().isoformat()
-                })
+                }, [SALA_ADMIN])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
         
@@ -3288,6 +3352,7 @@ def gerar_nova_senha(user_id):
         usuario.alterar_senha_primeiro_acesso = True
         
         db.session.commit()
+        invalidar_cache_usuario(usuario.id)
         
         return json_response({
             'message': 'Nova senha gerada com sucesso',
@@ -3344,6 +3409,7 @@ def atualizar_usuario(user_id):
             usuario.bloqueado = data['bloqueado']
         
         db.session.commit()
+        invalidar_cache_usuario(usuario.id)
         
         return json_response({
             'message': 'Usuário atualizado com sucesso',
@@ -3395,15 +3461,16 @@ def deletar_usuario(user_id):
         nome_usuario = usuario.usuario
         db.session.delete(usuario)
         db.session.commit()
+        invalidar_cache_usuario(user_id)
         
         # Emitir evento Socket.IO apenas se a conexão estiver disponível
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('usuario_deletado', {
+                emitir('usuario_deletado', {
                     'id': user_id,
                     'usuario': nome_usuario,
                     'timestamp': get_brazil_time().isoformat()
-                })
+                }, [SALA_ADMIN])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
         
@@ -3580,13 +3647,13 @@ Equipe de Suporte TI - Evoque Fitness
             # Emitir evento Socket.IO apenas se a conexão estiver disponível
             try:
                 if hasattr(current_app, 'socketio'):
-                    current_app.socketio.emit('ticket_enviado', {
+                    emitir('ticket_enviado', {
                         'chamado_id': chamado.id,
                         'codigo': chamado.codigo,
                         'assunto': assunto,
                         'destinatarios': destinatarios,
                         'timestamp': get_brazil_time().isoformat()
-                    })
+                    }, [SALA_TI])
             except Exception as socket_error:
                 logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
             
@@ -3645,42 +3712,23 @@ def obter_grafico_semanal():
         hoje = get_brazil_time().date()
         inicio_periodo = hoje - timedelta(days=27)  # 4 semanas = 28 dias
         
-        # Buscar chamados por dia
-        chamados_por_dia = db.session.query(
-            func.date(Chamado.data_abertura).label('data'),
-            func.count(Chamado.id).label('quantidade')
-        ).filter(
-            Chamado.data_abertura >= inicio_periodo
-        ).group_by(
-            func.date(Chamado.data_abertura)
-        ).all()
+        # Chamados por dia e por status (resumos diários)
+        por_dia = {}
+        por_status = {}
+        for linha in somar_chamados(('dia', 'status'), desde=inicio_periodo):
+            por_dia[linha['dia']] = por_dia.get(linha['dia'], 0) + linha['quantidade']
+            por_status[linha['status']] = por_status.get(linha['status'], 0) + linha['quantidade']
         
         # Criar lista com todos os dias do período
         dados_grafico = []
         for i in range(28):
             data_atual = inicio_periodo + timedelta(days=i)
-            quantidade = 0
-            
-            # Procurar quantidade para esta data
-            for registro in chamados_por_dia:
-                if registro.data == data_atual:
-                    quantidade = registro.quantidade
-                    break
-            
             dados_grafico.append({
                 'data': data_atual.strftime('%Y-%m-%d'),
-                'quantidade': quantidade
+                'quantidade': por_dia.get(data_atual, 0)
             })
         
-        # Distribuição por status (últimas 4 semanas)
-        status_counts = db.session.query(
-            Chamado.status,
-            func.count(Chamado.id).label('quantidade')
-        ).filter(
-            Chamado.data_abertura >= inicio_periodo
-        ).group_by(Chamado.status).all()
-        
-        dados_status = [{'status': s.status, 'quantidade': s.quantidade} for s in status_counts]
+        dados_status = [{'status': status, 'quantidade': quantidade} for status, quantidade in por_status.items() if quantidade]
         
         return json_response({
             'grafico_semanal': dados_grafico,
@@ -3701,17 +3749,19 @@ def obter_chamados_detalhados_sla():
         sla_config = carregar_configuracoes_sla()
         horario_config = carregar_configuracoes_horario_comercial()
 
-        chamados = Chamado.query.order_by(Chamado.data_abertura.desc()).all()
+        chamados = db.session.query(
+            *COLUNAS_SLA_CHAMADO,
+            Chamado.codigo, Chamado.solicitante, Chamado.problema
+        ).filter(
+            Chamado.data_abertura.isnot(None)
+        ).order_by(Chamado.data_abertura.desc()).all()
 
-        chamados_detalhados = []
-        for chamado in chamados:
-            if not chamado.data_abertura:
-                continue
+        lote = avaliar_sla_lote(chamados, sla_config, horario_config)
 
-            sla_info = calcular_sla_chamado_correto(chamado, sla_config, horario_config)
-            
+        chamados_detalhados = []
+        for indice, chamado in enumerate(chamados):
             # Converter data de abertura para timezone do Brasil
-            data_abertura_brazil = chamado.get_data_abertura_brazil()
+            data_abertura_brazil = lote['data_abertura_brazil'][indice]
             data_abertura_str = data_abertura_brazil.strftime('%d/%m/%Y %H:%M') if data_abertura_brazil else 'N/A'
             
             chamados_detalhados.append({
@@ -3721,14 +3771,14 @@ def obter_chamados_detalhados_sla():
                 'problema': chamado.problema,
                 'status': chamado.status,
                 'data_abertura': data_abertura_str,
-                'horas_decorridas': sla_info['horas_decorridas'],
-                'sla_limite': sla_info['sla_limite'],
-                'sla_status': sla_info['sla_status'],
-                'prioridade': sla_info.get('prioridade', chamado.prioridade),
-                'tempo_primeira_resposta': sla_info['tempo_primeira_resposta'],
-                'tempo_resolucao': sla_info['tempo_resolucao'],
-                'violacao_primeira_resposta': sla_info['violacao_primeira_resposta'],
-                'violacao_resolucao': sla_info['violacao_resolucao']
+                'horas_decorridas': lote['horas_decorridas'][indice],
+                'sla_limite': lote['sla_limite'][indice],
+                'sla_status': lote['sla_status'][indice],
+                'prioridade': lote['prioridade'][indice],
+                'tempo_primeira_resposta': lote['tempo_primeira_resposta'][indice],
+                'tempo_resolucao': lote['tempo_resolucao'][indice],
+                'violacao_primeira_resposta': lote['violacao_primeira_resposta'][indice],
+                'violacao_resolucao': lote['violacao_resolucao'][indice]
             })
         
         return json_response(chamados_detalhados)
@@ -4055,6 +4105,7 @@ def sincronizar_sla_database():
         # 3. Adicionar feriados brasileiros se solicitado
         if incluir_feriados:
             from datetime import date
+            from database import Feriado
             ano_atual = date.today().year
 
             feriados_brasileiros = [
@@ -4107,6 +4158,13 @@ def sincronizar_sla_database():
         # Commit das alterações
         db.session.commit()
 
+        if configuracoes_corrigidas:
+            invalidar_configuracoes()
+        if feriados_adicionados:
+            invalidar_calendario_comercial()
+        if feriados_adicionados or chamados_corrigidos or configuracoes_corrigidas:
+            invalidar_snapshot_sla()
+
         # Registrar ação de auditoria
         client_info = get_client_info(request)
         registrar_log_acao(
@@ -4153,7 +4211,9 @@ def corrigir_dados_teste():
         agora_brazil = get_brazil_time()
 
         # Limpar dados de teste antigos
-        Chamado.query.filter(Chamado.solicitante.in_(['Ronaldo', 'Maria Silva', 'João Santos', 'Usuário de Demonstração'])).delete()
+        chamados_teste = Chamado.query.filter(Chamado.solicitante.in_(['Ronaldo', 'Maria Silva', 'João Santos', 'Usuário de Demonstração']))
+        descontar_chamados(chamados_teste)
+        chamados_teste.delete()
 
         # 1. Chamado crítico aberto ontem às 16:00 (só deve contar 2h úteis até hoje)
         ontem_16h = agora_brazil.replace(hour=16, minute=0, second=0, microsecond=0) - timedelta(days=1)
@@ -4461,7 +4521,7 @@ def atualizar_status_setor_usuario():
         # Emitir evento Socket.IO apenas se a conexão estiver disponível
         try:
             if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('status_atualizado_setor', {
+                emitir('status_atualizado_setor', {
                     'chamado_id': chamado.id,
                     'codigo': chamado.codigo,
                     'status_anterior': status_anterior,
@@ -4470,7 +4530,7 @@ def atualizar_status_setor_usuario():
                     'usuario_alteracao': current_user.nome,
                     'setor_usuario': current_user.setores,
                     'timestamp': agora_brazil.isoformat()
-                })
+                }, [SALA_TI] + [sala_setor(setor) for setor in current_user.setores])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
         
@@ -4576,7 +4636,7 @@ def listar_agentes():
                 'especialidades': agente.especialidades_list,
                 'nivel_experiencia': agente.nivel_experiencia,
                 'max_chamados_simultaneos': agente.max_chamados_simultaneos,
-                'chamados_ativos': agente.get_chamados_ativos(),
+                'chamados_ativos': agente.get_carga(),
                 'pode_receber_chamado': agente.pode_receber_chamado(),
                 'data_criacao': agente.data_criacao.strftime('%d/%m/%Y %H:%M') if agente.data_criacao else None
             })
@@ -4715,6 +4775,7 @@ def excluir_agente(agente_id):
         # Finalizar todas as atribuiç��es antigas
         ChamadoAgente.query.filter_by(agente_id=agente_id, ativo=True).update({
             'ativo': False,
+            'chamado_ativo_id': None,
             'data_conclusao': get_brazil_time().replace(tzinfo=None)
         })
 
@@ -4744,8 +4805,6 @@ def obter_historico_chamados():
         data_inicio = request.args.get('data_inicio', '')
         data_fim = request.args.get('data_fim', '')
         periodo = request.args.get('periodo', '30')  # dias
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
 
         logger.debug(f"Filtros do histórico: status={status}, unidade={unidade}, solicitante={solicitante}")
 
@@ -4760,7 +4819,7 @@ def obter_historico_chamados():
             query = query.filter(Chamado.unidade == unidade)
 
         if solicitante:
-            query = query.filter(Chamado.solicitante.ilike(f'%{solicitante}%'))
+            query = query.filter(filtro_busca('chamado', solicitante, ('solicitante',)))
 
         # Filtro de data
         if data_inicio and data_fim:
@@ -4781,15 +4840,11 @@ def obter_historico_chamados():
             except ValueError:
                 pass
 
-        # Ordenar por data de abertura mais recente
-        query = query.order_by(Chamado.data_abertura.desc())
-
-        # Paginação
-        chamados_paginados = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        # Mais recentes primeiro (keyset com limit/cursor, page/per_page no formato legado)
+        try:
+            chamados, paginacao = paginar(query, Chamado.data_abertura, Chamado.id)
+        except CursorInvalido:
+            return error_response('Cursor inválido', 400)
 
         # Preparar dados para resposta
         chamados_list = []
@@ -4797,7 +4852,7 @@ def obter_historico_chamados():
         total_cancelados = 0
         tempos_resolucao = []
 
-        for c in chamados_paginados.items:
+        for c in chamados:
             try:
                 # Converter datas
                 data_abertura_brazil = c.get_data_abertura_brazil()
@@ -4862,16 +4917,9 @@ def obter_historico_chamados():
                 'total_concluidos': total_concluidos,
                 'total_cancelados': total_cancelados,
                 'tempo_medio_resolucao': round(tempo_medio, 1),
-                'total_filtrados': chamados_paginados.total
+                'total_filtrados': paginacao.get('total', paginacao.get('total_estimado'))
             },
-            'paginacao': {
-                'page': chamados_paginados.page,
-                'pages': chamados_paginados.pages,
-                'per_page': chamados_paginados.per_page,
-                'total': chamados_paginados.total,
-                'has_next': chamados_paginados.has_next,
-                'has_prev': chamados_paginados.has_prev
-            }
+            'paginacao': paginacao
         }
 
         return json_response(resposta)
@@ -4970,17 +5018,18 @@ def listar_logs_acoes():
     try:
         from database import LogAcao
 
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 20))
         categoria = request.args.get('categoria')
         usuario_id = request.args.get('usuario_id')
         data_inicio = request.args.get('data_inicio')
         data_fim = request.args.get('data_fim')
+        busca = request.args.get('busca', '').strip()
 
         # Construir query base
         query = LogAcao.query
 
         # Aplicar filtros
+        if busca:
+            query = query.filter(filtro_busca('log_acao', busca))
         if categoria:
             query = query.filter(LogAcao.categoria == categoria)
         if usuario_id:
@@ -4998,18 +5047,14 @@ def listar_logs_acoes():
             except ValueError:
                 pass
 
-        # Ordenar por data mais recente
-        query = query.order_by(LogAcao.data_acao.desc())
-
-        # Paginar
-        logs_paginados = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        # Mais recentes primeiro (keyset com limit/cursor, page/per_page no formato legado)
+        try:
+            logs, paginacao = paginar(query, LogAcao.data_acao, LogAcao.id)
+        except CursorInvalido:
+            return error_response('Cursor inválido', 400)
 
         logs_list = []
-        for log in logs_paginados.items:
+        for log in logs:
             data_acao_brazil = log.get_data_acao_brazil()
 
             logs_list.append({
@@ -5029,14 +5074,7 @@ def listar_logs_acoes():
 
         return json_response({
             'logs': logs_list,
-            'pagination': {
-                'page': logs_paginados.page,
-                'pages': logs_paginados.pages,
-                'per_page': logs_paginados.per_page,
-                'total': logs_paginados.total,
-                'has_next': logs_paginados.has_next,
-                'has_prev': logs_paginados.has_prev
-            }
+            'pagination': paginacao
         })
 
     except Exception as e:
@@ -5070,40 +5108,42 @@ def listar_categorias_logs_acoes():
 def estatisticas_logs_acoes():
     """Retorna estatísticas dos logs de ações"""
     try:
-        from database import LogAcao
-
-        # Estat��sticas gerais
-        total_acoes = LogAcao.query.count()
-        acoes_sucesso = LogAcao.query.filter_by(sucesso=True).count()
-        acoes_erro = LogAcao.query.filter_by(sucesso=False).count()
+        # Estatísticas gerais (resumos diários)
+        total_acoes = 0
+        acoes_sucesso = 0
+        for linha in somar_acoes(('sucesso',)):
+            total_acoes += linha['quantidade']
+            if linha['sucesso']:
+                acoes_sucesso += linha['quantidade']
+        acoes_erro = total_acoes - acoes_sucesso
 
         # Ações por categoria (últimos 30 dias)
-        trinta_dias_atras = get_brazil_time() - timedelta(days=30)
-        acoes_por_categoria = db.session.query(
-            LogAcao.categoria,
-            func.count(LogAcao.id).label('quantidade')
-        ).filter(
-            LogAcao.data_acao >= trinta_dias_atras.replace(tzinfo=None)
-        ).group_by(LogAcao.categoria).all()
-
-        # Usuários mais ativos (últimos 30 dias)
-        usuarios_ativos = db.session.query(
-            LogAcao.usuario_id,
-            User.nome,
-            func.count(LogAcao.id).label('quantidade')
-        ).join(User).filter(
-            LogAcao.data_acao >= trinta_dias_atras.replace(tzinfo=None)
-        ).group_by(LogAcao.usuario_id, User.nome).order_by(
-            func.count(LogAcao.id).desc()
-        ).limit(10).all()
+        trinta_dias_atras = get_brazil_time().date() - timedelta(days=30)
+        acoes_por_categoria = somar_acoes(('categoria',), desde=trinta_dias_atras)
+
+        # Usuários mais ativos (últimos 30 dias); usuario_id 0 são ações do sistema
+        mais_ativos = [
+            linha for linha in somar_acoes(('usuario_id',), desde=trinta_dias_atras, ordenar='quantidade')
+            if linha['usuario_id'] and linha['quantidade']
+        ]
+        nomes = dict(db.session.query(User.id, User.nome).filter(
+            User.id.in_([linha['usuario_id'] for linha in mais_ativos])
+        ).all()) if mais_ativos else {}
+        usuarios_ativos = [linha for linha in mais_ativos if linha['usuario_id'] in nomes][:10]
 
         return json_response({
             'total_acoes': total_acoes,
             'acoes_sucesso': acoes_sucesso,
             'acoes_erro': acoes_erro,
             'taxa_sucesso': round((acoes_sucesso / total_acoes * 100) if total_acoes > 0 else 0, 2),
-            'por_categoria': [{'categoria': cat[0], 'quantidade': cat[1]} for cat in acoes_por_categoria],
-            'usuarios_ativos': [{'usuario_id': u[0], 'nome': u[1], 'quantidade': u[2]} for u in usuarios_ativos]
+            'por_categoria': [
+                {'categoria': linha['categoria'] or None, 'quantidade': linha['quantidade']}
+                for linha in acoes_por_categoria if linha['quantidade']
+            ],
+            'usuarios_ativos': [
+                {'usuario_id': linha['usuario_id'], 'nome': nomes[linha['usuario_id']], 'quantidade': linha['quantidade']}
+                for linha in usuarios_ativos
+            ]
         })
 
     except Exception as e:
@@ -5118,8 +5158,6 @@ def listar_logs_acesso():
     try:
         from database import LogAcesso
 
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 20))
         usuario_id = request.args.get('usuario_id')
         data_inicio = request.args.get('data_inicio')
         data_fim = request.args.get('data_fim')
@@ -5148,18 +5186,14 @@ def listar_logs_acesso():
         elif ativo == 'false':
             query = query.filter(LogAcesso.ativo == False)
 
-        # Ordenar por data mais recente
-        query = query.order_by(LogAcesso.data_acesso.desc())
-
-        # Paginar
-        logs_paginados = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        # Mais recentes primeiro (keyset com limit/cursor, page/per_page no formato legado)
+        try:
+            logs, paginacao = paginar(query, LogAcesso.data_acesso, LogAcesso.id)
+        except CursorInvalido:
+            return error_response('Cursor inválido', 400)
 
         logs_list = []
-        for log in logs_paginados.items:
+        for log in logs:
             data_acesso_brazil = log.get_data_acesso_brazil()
             data_logout_brazil = log.get_data_logout_brazil()
 
@@ -5179,14 +5213,7 @@ def listar_logs_acesso():
 
         return json_response({
             'logs': logs_list,
-            'pagination': {
-                'page': logs_paginados.page,
-                'pages': logs_paginados.pages,
-                'per_page': logs_paginados.per_page,
-                'total': logs_paginados.total,
-                'has_next': logs_paginados.has_next,
-                'has_prev': logs_paginados.has_prev
-            }
+            'pagination': paginacao
         })
 
     except Exception as e:
@@ -5200,43 +5227,24 @@ def listar_logs_acesso():
 def estatisticas_logs_acesso():
     """Retorna estatísticas dos logs de acesso"""
     try:
-        from database import LogAcesso
-
-        # Estatísticas gerais
-        total_acessos = LogAcesso.query.count()
+        # Estatísticas gerais (resumos diários); sessões ativas são o estado atual
+        total_acessos = somar_acessos()[0]['quantidade']
         sessoes_ativas = LogAcesso.query.filter_by(ativo=True).count()
 
         # Acessos por dia (últimos 30 dias)
-        trinta_dias_atras = get_brazil_time() - timedelta(days=30)
-        acessos_por_dia = db.session.query(
-            func.date(LogAcesso.data_acesso).label('data'),
-            func.count(LogAcesso.id).label('quantidade')
-        ).filter(
-            LogAcesso.data_acesso >= trinta_dias_atras.replace(tzinfo=None)
-        ).group_by(func.date(LogAcesso.data_acesso)).all()
+        trinta_dias_atras = get_brazil_time().date() - timedelta(days=30)
+        acessos_por_dia = sorted(somar_acessos(('dia',), desde=trinta_dias_atras), key=lambda linha: linha['dia'])
 
-        # Dispositivos mais utilizados
-        dispositivos = db.session.query(
-            LogAcesso.dispositivo,
-            func.count(LogAcesso.id).label('quantidade')
-        ).filter(
-            LogAcesso.dispositivo.isnot(None)
-        ).group_by(LogAcesso.dispositivo).all()
-
-        # Navegadores mais utilizados
-        navegadores = db.session.query(
-            LogAcesso.navegador,
-            func.count(LogAcesso.id).label('quantidade')
-        ).filter(
-            LogAcesso.navegador.isnot(None)
-        ).group_by(LogAcesso.navegador).all()
+        # Dispositivos e navegadores mais utilizados
+        dispositivos = [linha for linha in somar_acessos(('dispositivo',)) if linha['dispositivo'] and linha['quantidade']]
+        navegadores = [linha for linha in somar_acessos(('navegador',)) if linha['navegador'] and linha['quantidade']]
 
         return json_response({
             'total_acessos': total_acessos,
             'sessoes_ativas': sessoes_ativas,
-            'por_dia': [{'data': str(d[0]), 'quantidade': d[1]} for d in acessos_por_dia],
-            'dispositivos': [{'dispositivo': d[0], 'quantidade': d[1]} for d in dispositivos],
-            'navegadores': [{'navegador': n[0], 'quantidade': n[1]} for n in navegadores]
+            'por_dia': [{'data': str(d['dia']), 'quantidade': d['quantidade']} for d in acessos_por_dia if d['quantidade']],
+            'dispositivos': [{'dispositivo': d['dispositivo'], 'quantidade': d['quantidade']} for d in dispositivos],
+            'navegadores': [{'navegador': n['navegador'], 'quantidade': n['quantidade']} for n in navegadores]
         })
 
     except Exception as e:
@@ -5249,77 +5257,68 @@ def estatisticas_logs_acesso():
 def analise_problemas():
     """Análise estatística de problemas reportados"""
     try:
-        # Problemas mais frequentes (últimos 3 meses)
-        tres_meses_atras = get_brazil_time() - timedelta(days=90)
-        problemas_frequentes = db.session.query(
-            Chamado.problema,
-            func.count(Chamado.id).label('quantidade'),
-            func.avg(func.extract('epoch', Chamado.data_conclusao - Chamado.data_abertura)/3600).label('tempo_medio_resolucao')
-        ).filter(
-            Chamado.data_abertura >= tres_meses_atras.replace(tzinfo=None)
-        ).group_by(Chamado.problema).order_by(
-            func.count(Chamado.id).desc()
-        ).limit(10).all()
+        # Últimos 3 meses, a partir dos resumos diários
+        tres_meses_atras = get_brazil_time().date() - timedelta(days=90)
+
+        # Problemas mais frequentes
+        problemas_frequentes = somar_chamados(('problema',), desde=tres_meses_atras, ordenar='quantidade', limite=10)
 
         # Unidades com mais problemas
-        unidades_problemas = db.session.query(
-            Chamado.unidade,
-            func.count(Chamado.id).label('quantidade'),
-            func.sum(case([(Chamado.status == 'Aberto', 1)], else_=0)).label('abertos'),
-            func.sum(case([(Chamado.status == 'Concluido', 1)], else_=0)).label('concluidos')
-        ).filter(
-            Chamado.data_abertura >= tres_meses_atras.replace(tzinfo=None)
-        ).group_by(Chamado.unidade).order_by(
-            func.count(Chamado.id).desc()
-        ).limit(15).all()
-
-        # Tendências temporais (por semana nos últimos 3 meses)
-        tendencias = db.session.query(
-            func.extract('week', Chamado.data_abertura).label('semana'),
-            func.extract('year', Chamado.data_abertura).label('ano'),
-            func.count(Chamado.id).label('quantidade')
-        ).filter(
-            Chamado.data_abertura >= tres_meses_atras.replace(tzinfo=None)
-        ).group_by(
-            func.extract('week', Chamado.data_abertura),
-            func.extract('year', Chamado.data_abertura)
-        ).order_by('ano', 'semana').all()
+        unidades = {}
+        for linha in somar_chamados(('unidade', 'status'), desde=tres_meses_atras):
+            unidade = unidades.setdefault(linha['unidade'], {'unidade': linha['unidade'], 'total': 0, 'abertos': 0, 'concluidos': 0})
+            unidade['total'] += linha['quantidade']
+            if linha['status'] == 'Aberto':
+                unidade['abertos'] += linha['quantidade']
+            elif linha['status'] == 'Concluido':
+                unidade['concluidos'] += linha['quantidade']
+        unidades_problemas = sorted(
+            (u for u in unidades.values() if u['total']), key=lambda u: u['total'], reverse=True
+        )[:15]
+
+        # Tendências temporais (por semana ISO nos últimos 3 meses)
+        semanas = {}
+        for linha in somar_chamados(('dia',), desde=tres_meses_atras):
+            ano, semana, _ = linha['dia'].isocalendar()
+            semanas[(ano, semana)] = semanas.get((ano, semana), 0) + linha['quantidade']
 
         # Análise de resolução por prioridade
-        resolucao_prioridade = db.session.query(
-            Chamado.prioridade,
-            func.count(Chamado.id).label('total'),
-            func.sum(case([(Chamado.status == 'Concluido', 1)], else_=0)).label('resolvidos'),
-            func.avg(func.extract('epoch', Chamado.data_conclusao - Chamado.data_abertura)/3600).label('tempo_medio')
-        ).filter(
-            Chamado.data_abertura >= tres_meses_atras.replace(tzinfo=None)
-        ).group_by(Chamado.prioridade).all()
+        prioridades = {}
+        for linha in somar_chamados(('prioridade', 'status'), desde=tres_meses_atras):
+            item = prioridades.setdefault(linha['prioridade'], {
+                'total': 0, 'resolvidos': 0, 'com_conclusao': 0, 'segundos_resolucao': 0
+            })
+            item['total'] += linha['quantidade']
+            item['com_conclusao'] += linha['com_conclusao']
+            item['segundos_resolucao'] += linha['segundos_resolucao']
+            if linha['status'] == 'Concluido':
+                item['resolvidos'] += linha['quantidade']
 
         return json_response({
             'problemas_frequentes': [{
-                'problema': p[0],
-                'quantidade': p[1],
-                'tempo_medio_resolucao': round(p[2], 2) if p[2] else None
-            } for p in problemas_frequentes],
+                'problema': p['problema'],
+                'quantidade': p['quantidade'],
+                'tempo_medio_resolucao': round(tempo_medio_horas(p), 2) if p['com_conclusao'] else None
+            } for p in problemas_frequentes if p['quantidade']],
             'unidades_problemas': [{
-                'unidade': u[0],
-                'total': u[1],
-                'abertos': u[2],
-                'concluidos': u[3],
-                'taxa_resolucao': round((u[3] / u[1] * 100) if u[1] > 0 else 0, 2)
+                'unidade': u['unidade'],
+                'total': u['total'],
+                'abertos': u['abertos'],
+                'concluidos': u['concluidos'],
+                'taxa_resolucao': round((u['concluidos'] / u['total'] * 100) if u['total'] > 0 else 0, 2)
             } for u in unidades_problemas],
             'tendencias_semanais': [{
-                'semana': t[0],
-                'ano': t[1],
-                'quantidade': t[2]
-            } for t in tendencias],
+                'semana': semana,
+                'ano': ano,
+                'quantidade': quantidade
+            } for (ano, semana), quantidade in sorted(semanas.items()) if quantidade],
             'resolucao_por_prioridade': [{
-                'prioridade': r[0],
-                'total': r[1],
-                'resolvidos': r[2],
-                'taxa_resolucao': round((r[2] / r[1] * 100) if r[1] > 0 else 0, 2),
-                'tempo_medio': round(r[3], 2) if r[3] else None
-            } for r in resolucao_prioridade]
+                'prioridade': prioridade,
+                'total': r['total'],
+                'resolvidos': r['resolvidos'],
+                'taxa_resolucao': round((r['resolvidos'] / r['total'] * 100) if r['total'] > 0 else 0, 2),
+                'tempo_medio': round(tempo_medio_horas(r), 2) if r['com_conclusao'] else None
+            } for prioridade, r in prioridades.items() if r['total']]
         })
 
     except Exception as e:
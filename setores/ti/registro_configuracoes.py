@@ -0,0 +1,145 @@
+"""
+Registro em memória das configurações do sistema
+
+Configuracao, ConfiguracaoAvancada, ConfiguracaoSLA e HorarioComercial são lidas
+juntas, uma vez, e servidas da memória até mudarem. Toda gravação nessas tabelas
+chama invalidar_configuracoes(), que incrementa a versão guardada em
+configuracoes (chave CHAVE_VERSAO):
+
+  - no processo que gravou, a próxima leitura já recarrega;
+  - nos demais workers a versão do banco é conferida no máximo a cada
+    INTERVALO_VERIFICACAO_VERSAO segundos (uma consulta pela chave única) e,
+    se mudou, tudo é recarregado.
+
+A versão e os valores são lidos numa sessão própria, na mesma transação e com
+a versão primeiro: os valores guardados nunca são mais antigos que a versão
+sob a qual ficam em memória (nem incluem alterações ainda não confirmadas da
+requisição atual).
+"""
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Integer, String, cast, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import db, Configuracao, ConfiguracaoAvancada, get_brazil_time
+
+logger = logging.getLogger(__name__)
+
+CHAVE_VERSAO = 'configuracoes_versao'
+INTERVALO_VERIFICACAO_VERSAO = 5  # segundos
+
+# Chaves de configuracoes gravadas como texto simples (não JSON)
+CHAVES_TEXTO = ('versao_database', 'data_criacao', 'sistema_inicializado')
+
+class ConfiguracoesSistema:
+    """Fotografia das configurações em uma versão (não alterar: compartilhada entre requisições)"""
+
+    def __init__(self, versao: Optional[int], gerais: Dict[str, Any], avancadas: Dict[str, Any],
+                 sla: Dict[str, float], horario_comercial: Dict[str, Any]):
+        self.versao = versao
+        self.gerais = gerais  # configuracoes: chave -> valor decodificado
+        self.avancadas = avancadas  # configuracoes_avancadas: chave -> valor tipado
+        self.sla = sla  # formato de obter_configuracoes_sla_dict()
+        self.horario_comercial = horario_comercial  # formato de obter_horario_comercial_dict()
+
+_lock = threading.Lock()
+_estado = {'configuracoes': None, 'verificado_em': 0.0}
+
+# ==================== VERSÃO ====================
+
+def ler_versao(sessao: Optional[Session] = None) -> int:
+    """Versão atual das configurações; com sessao, lida na transação dela"""
+    consulta = select(Configuracao.valor).where(Configuracao.chave == CHAVE_VERSAO)
+    if sessao is not None:
+        valor = sessao.execute(consulta).scalar()
+    else:
+        with db.engine.connect() as conn:
+            valor = conn.execute(consulta).scalar()
+    try:
+        return int(valor or 0)
+    except ValueError:
+        return 0
+
+def _incrementar_versao():
+    tabela = Configuracao.__table__
+    agora = get_brazil_time().replace(tzinfo=None)
+    incremento = update(tabela).where(tabela.c.chave == CHAVE_VERSAO).values(
+        valor=cast(cast(tabela.c.valor, Integer) + 1, String), data_atualizacao=agora
+    )
+    with db.engine.begin() as conn:
+        if conn.execute(incremento).rowcount:
+            return
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(insert(tabela).values(chave=CHAVE_VERSAO, valor='1', data_atualizacao=agora))
+    except IntegrityError:
+        # Outro processo criou o registro ao mesmo tempo
+        with db.engine.begin() as conn:
+            conn.execute(incremento)
+
+def invalidar_configuracoes():
+    """Descarta as configurações em memória neste processo e nos demais (chamar após o commit)"""
+    try:
+        _incrementar_versao()
+    except Exception as e:
+        logger.error(f"Erro ao incrementar versão das configurações: {str(e)}")
+    with _lock:
+        _estado['configuracoes'] = None
+
+# ==================== CARGA ====================
+
+def _carregar_gerais(sessao: Session) -> Dict[str, Any]:
+    gerais = {}
+    for chave, valor in sessao.query(Configuracao.chave, Configuracao.valor).filter(Configuracao.chave != CHAVE_VERSAO):
+        try:
+            gerais[chave] = json.loads(valor)
+        except (TypeError, json.JSONDecodeError):
+            if chave in CHAVES_TEXTO:
+                gerais[chave] = valor
+    return gerais
+
+def _carregar(sessao: Session, versao: Optional[int]) -> ConfiguracoesSistema:
+    """Valores na transação de sessao, em que a versão já foi lida"""
+    from database import obter_configuracoes_sla_dict, obter_horario_comercial_dict
+
+    gerais = _carregar_gerais(sessao)
+    avancadas = {config.chave: config.get_valor_tipado() for config in sessao.query(ConfiguracaoAvancada)}
+    configuracoes = ConfiguracoesSistema(
+        versao, gerais, avancadas, obter_configuracoes_sla_dict(sessao), obter_horario_comercial_dict(sessao)
+    )
+    logger.debug(f"Configurações carregadas (versão {versao})")
+    return configuracoes
+
+def obter_configuracoes() -> ConfiguracoesSistema:
+    """Configurações atuais, recarregadas só quando a versão no banco muda"""
+    configuracoes = _estado['configuracoes']
+    agora = time.monotonic()
+    if configuracoes is not None and agora - _estado['verificado_em'] < INTERVALO_VERIFICACAO_VERSAO:
+        return configuracoes
+
+    with _lock:
+        configuracoes = _estado['configuracoes']
+        if configuracoes is not None and agora - _estado['verificado_em'] < INTERVALO_VERIFICACAO_VERSAO:
+            return configuracoes
+        try:
+            # Sessão própria: não usa o snapshot (nem as alterações pendentes) da requisição
+            with Session(db.engine) as sessao:
+                versao = ler_versao(sessao)
+                if configuracoes is None or configuracoes.versao != versao:
+                    configuracoes = _carregar(sessao, versao)
+            _estado['configuracoes'] = configuracoes
+            _estado['verificado_em'] = agora
+        except Exception as e:
+            logger.warning(f"Configurações indisponíveis no banco, usando padrões: {str(e)}")
+            if configuracoes is None:
+                configuracoes = ConfiguracoesSistema(None, {}, {}, {}, {})
+    return configuracoes
+
+def valor_avancado(chave: str, padrao: Any = None) -> Any:
+    """Valor tipado de uma ConfiguracaoAvancada"""
+    return obter_configuracoes().avancadas.get(chave, padrao)
@@ -0,0 +1,511 @@
+"""
+Exportação de relatórios (chamados e usuários) em JSON, CSV e PDF por streaming
+
+As linhas vêm de um cursor com yield_per e passam uma única vez pelo gerador
+do formato; o resumo (totais, taxa de resolução, tempo médio) é acumulado
+nessa mesma passagem e sai ao final do arquivo. Nenhum formato mantém o
+resultado inteiro em memória.
+
+Exportações acima de LIMITE_EXPORTACAO_DIRETA registros (ou pedidas com
+assincrono=1) são gravadas em disco por uma tarefa em segundo plano, com
+um RelatorioGerado acompanhando o andamento. O arquivo leva o id do
+RelatorioGerado no nome, e o processo que o grava mantém a trava
+'relatorio:<id>' (ver setores/ti/travas.py); um relatório em 'gerando' cuja
+trava venceu é marcado como erro.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import pytz
+from sqlalchemy import func
+
+from database import db, Chamado, LogAcesso, RelatorioGerado, User, get_brazil_time
+from setores.ti.tempo_real import SALA_ADMIN, emitir, sala_usuario
+from setores.ti.travas import adquirir_trava, liberar_trava, manter_trava
+
+logger = logging.getLogger(__name__)
+
+BRAZIL_TZ = pytz.timezone('America/Sao_Paulo')
+
+TAMANHO_LOTE_RELATORIO = 1000  # linhas lidas do banco por vez
+LINHAS_POR_BLOCO = 500  # linhas por bloco enviado na resposta
+LIMITE_EXPORTACAO_DIRETA = 20000  # acima disso a exportação vai para segundo plano
+DIRETORIO_RELATORIOS = 'relatorios/'
+TEMPO_TRAVA_EXPORTACAO = 120  # segundos sem renovação até a exportação ser considerada interrompida
+INTERVALO_VERIFICACAO_EXPORTACOES = 300  # segundos entre verificações de exportações interrompidas
+
+FORMATOS = {
+    'json': ('application/json; charset=utf-8', '.json'),
+    'csv': ('text/csv; charset=utf-8', '.csv'),
+    'pdf': ('application/pdf', '.pdf'),
+}
+
+def _formatar(data: Optional[datetime], formato: str = '%d/%m/%Y %H:%M:%S') -> Optional[str]:
+    """Formata uma data gravada sem fuso como os métodos get_*_brazil dos modelos"""
+    if not data:
+        return None
+    if data.tzinfo is None:
+        data = pytz.utc.localize(data)
+    return data.astimezone(BRAZIL_TZ).strftime(formato)
+
+def _periodo(filtros: Dict) -> Dict:
+    return {
+        'inicio': filtros.get('data_inicio') or 'Início dos registros',
+        'fim': filtros.get('data_fim') or 'Hoje'
+    }
+
+def _filtro_data(query, coluna, filtros: Dict):
+    if filtros.get('data_inicio'):
+        try:
+            query = query.filter(coluna >= datetime.strptime(filtros['data_inicio'], '%Y-%m-%d'))
+        except ValueError:
+            pass
+    if filtros.get('data_fim'):
+        try:
+            query = query.filter(coluna < datetime.strptime(filtros['data_fim'], '%Y-%m-%d') + timedelta(days=1))
+        except ValueError:
+            pass
+    return query
+
+# ==================== CHAMADOS ====================
+
+def consulta_chamados(filtros: Dict):
+    query = _filtro_data(Chamado.query, Chamado.data_abertura, filtros)
+    if filtros.get('status'):
+        query = query.filter(Chamado.status == filtros['status'])
+    if filtros.get('prioridade'):
+        query = query.filter(Chamado.prioridade == filtros['prioridade'])
+    if filtros.get('unidade'):
+        query = query.filter(Chamado.unidade.ilike(f"%{filtros['unidade']}%"))
+    return query
+
+def linhas_chamados(filtros: Dict) -> Iterator[Dict]:
+    query = consulta_chamados(filtros).order_by(Chamado.data_abertura.desc())
+    for chamado in query.yield_per(TAMANHO_LOTE_RELATORIO):
+        tempo_resolucao = None
+        if chamado.data_conclusao and chamado.data_abertura:
+            delta = chamado.data_conclusao - chamado.data_abertura
+            tempo_resolucao = round(delta.total_seconds() / 3600, 2)  # em horas
+
+        yield {
+            'codigo': chamado.codigo,
+            'protocolo': chamado.protocolo,
+            'solicitante': chamado.solicitante,
+            'email': chamado.email,
+            'cargo': chamado.cargo,
+            'telefone': chamado.telefone,
+            'unidade': chamado.unidade,
+            'problema': chamado.problema,
+            'descricao': chamado.descricao or '',
+            'status': chamado.status,
+            'prioridade': chamado.prioridade,
+            'data_abertura': _formatar(chamado.data_abertura),
+            'data_conclusao': _formatar(chamado.data_conclusao),
+            'tempo_resolucao_horas': tempo_resolucao,
+            'data_visita': chamado.data_visita.strftime('%d/%m/%Y') if chamado.data_visita else None
+        }
+
+class ResumoChamados:
+    """Totais do relatório de chamados acumulados linha a linha"""
+
+    def __init__(self, filtros: Dict):
+        self.filtros = filtros
+        self.total = 0
+        self.concluidos = 0
+        self.abertos = 0
+        self.soma_resolucao = 0.0
+        self.com_resolucao = 0
+
+    def adicionar(self, linha: Dict):
+        self.total += 1
+        if linha['status'] == 'Concluido':
+            self.concluidos += 1
+        elif linha['status'] == 'Aberto':
+            self.abertos += 1
+        if linha['tempo_resolucao_horas']:
+            self.soma_resolucao += linha['tempo_resolucao_horas']
+            self.com_resolucao += 1
+
+    def resultado(self) -> Dict:
+        return {
+            'total_chamados': self.total,
+            'chamados_concluidos': self.concluidos,
+            'chamados_abertos': self.abertos,
+            'taxa_resolucao': round((self.concluidos / self.total * 100), 2) if self.total > 0 else 0,
+            'tempo_medio_resolucao_horas': round(self.soma_resolucao / self.com_resolucao, 2) if self.com_resolucao else 0,
+            'periodo': _periodo(self.filtros)
+        }
+
+# ==================== USUÁRIOS ====================
+
+def consulta_usuarios(filtros: Dict):
+    return _filtro_data(User.query, User.data_criacao, filtros)
+
+def linhas_usuarios(filtros: Dict) -> Iterator[Dict]:
+    """Usuários com último acesso e totais em uma única consulta (agregados por subconsulta)"""
+    acessos = db.session.query(
+        LogAcesso.usuario_id.label('usuario_id'),
+        func.count(LogAcesso.id).label('total'),
+        func.max(LogAcesso.data_acesso).label('ultimo')
+    ).group_by(LogAcesso.usuario_id).subquery()
+    chamados = db.session.query(
+        Chamado.usuario_id.label('usuario_id'),
+        func.count(Chamado.id).label('total')
+    ).group_by(Chamado.usuario_id).subquery()
+
+    usuarios_filtrados = consulta_usuarios(filtros).with_entities(User.id).subquery()
+    query = db.session.query(User, acessos.c.total, acessos.c.ultimo, chamados.c.total) \
+        .filter(User.id.in_(db.session.query(usuarios_filtrados.c.id))) \
+        .outerjoin(acessos, acessos.c.usuario_id == User.id) \
+        .outerjoin(chamados, chamados.c.usuario_id == User.id) \
+        .order_by(User.data_criacao.desc())
+
+    for usuario, total_acessos, ultimo_acesso, total_chamados in query.yield_per(TAMANHO_LOTE_RELATORIO):
+        yield {
+            'id': usuario.id,
+            'nome_completo': f"{usuario.nome} {usuario.sobrenome}",
+            'usuario': usuario.usuario,
+            'email': usuario.email,
+            'nivel_acesso': usuario.nivel_acesso,
+            'setores': usuario.setores,
+            'bloqueado': usuario.bloqueado,
+            'data_criacao': _formatar(usuario.data_criacao),
+            'ultimo_acesso': _formatar(ultimo_acesso) or 'Nunca',
+            'total_acessos': total_acessos or 0,
+            'total_chamados': total_chamados or 0
+        }
+
+class ResumoUsuarios:
+    """Totais do relatório de usuários acumulados linha a linha"""
+
+    def __init__(self, filtros: Dict):
+        self.filtros = filtros
+        self.total = 0
+        self.bloqueados = 0
+
+    def adicionar(self, linha: Dict):
+        self.total += 1
+        if linha['bloqueado']:
+            self.bloqueados += 1
+
+    def resultado(self) -> Dict:
+        return {
+            'total_usuarios': self.total,
+            'usuarios_ativos': self.total - self.bloqueados,
+            'usuarios_bloqueados': self.bloqueados,
+            'periodo': _periodo(self.filtros)
+        }
+
+# ==================== DEFINIÇÃO DOS RELATÓRIOS ====================
+
+def _sim_nao(valor):
+    return 'Sim' if valor else 'Não'
+
+def _lista(valor):
+    return ', '.join(valor) if isinstance(valor, list) else valor
+
+# (título, chave, largura no PDF em pontos, formatador)
+COLUNAS_CHAMADOS = [
+    ('Código', 'codigo', 55, None), ('Protocolo', 'protocolo', 0, None), ('Solicitante', 'solicitante', 95, None),
+    ('Email', 'email', 0, None), ('Cargo', 'cargo', 0, None), ('Telefone', 'telefone', 0, None),
+    ('Unidade', 'unidade', 95, None), ('Problema', 'problema', 95, None), ('Descrição', 'descricao', 0, None),
+    ('Status', 'status', 60, None), ('Prioridade', 'prioridade', 55, None), ('Data Abertura', 'data_abertura', 85, None),
+    ('Data Conclusão', 'data_conclusao', 85, None), ('Tempo Resolução (h)', 'tempo_resolucao_horas', 70, None),
+    ('Data Visita', 'data_visita', 0, None),
+]
+
+COLUNAS_USUARIOS = [
+    ('ID', 'id', 30, None), ('Nome Completo', 'nome_completo', 130, None), ('Usuário', 'usuario', 80, None),
+    ('Email', 'email', 150, None), ('Nível de Acesso', 'nivel_acesso', 75, None), ('Setores', 'setores', 0, _lista),
+    ('Bloqueado', 'bloqueado', 50, _sim_nao), ('Data Criação', 'data_criacao', 0, None),
+    ('Último Acesso', 'ultimo_acesso', 85, None), ('Total Acessos', 'total_acessos', 55, None),
+    ('Total Chamados', 'total_chamados', 55, None),
+]
+
+RELATORIOS = {
+    'chamados': {
+        'titulo': 'Relatório de Chamados', 'consulta': consulta_chamados, 'linhas': linhas_chamados,
+        'resumo': ResumoChamados, 'colunas': COLUNAS_CHAMADOS,
+    },
+    'usuarios': {
+        'titulo': 'Relatório de Usuários', 'consulta': consulta_usuarios, 'linhas': linhas_usuarios,
+        'resumo': ResumoUsuarios, 'colunas': COLUNAS_USUARIOS,
+    },
+}
+
+def contar_registros(tipo: str, filtros: Dict) -> int:
+    return RELATORIOS[tipo]['consulta'](filtros).order_by(None).count()
+
+# ==================== FORMATOS ====================
+
+def _valor(linha: Dict, chave: str, formatador) -> object:
+    valor = linha[chave]
+    return formatador(valor) if formatador else valor
+
+def _gerar_csv(colunas, linhas: Iterable[Dict]) -> Iterator[bytes]:
+    saida = io.StringIO()
+    writer = csv.writer(saida)
+    writer.writerow([titulo for titulo, _, _, _ in colunas])
+    pendentes = 0
+    primeiro = True
+    for linha in linhas:
+        writer.writerow([_valor(linha, chave, formatador) for _, chave, _, formatador in colunas])
+        pendentes += 1
+        if pendentes >= LINHAS_POR_BLOCO:
+            yield saida.getvalue().encode('utf-8-sig' if primeiro else 'utf-8')
+            primeiro = False
+            saida.seek(0)
+            saida.truncate()
+            pendentes = 0
+    yield saida.getvalue().encode('utf-8-sig' if primeiro else 'utf-8')
+
+def _gerar_json(linhas: Iterable[Dict], resumo) -> Iterator[bytes]:
+    bloco = ['{"relatorio": [']
+    separador = ''
+    for linha in linhas:
+        bloco.append(separador + json.dumps(linha, ensure_ascii=False))
+        separador = ', '
+        if len(bloco) >= LINHAS_POR_BLOCO:
+            yield ''.join(bloco).encode('utf-8')
+            bloco = []
+    bloco.append('], "resumo": ' + json.dumps(resumo.resultado(), ensure_ascii=False) + '}')
+    yield ''.join(bloco).encode('utf-8')
+
+class _PdfStream:
+    """
+    PDF mínimo (texto em Helvetica, A4 paisagem) gerado página a página
+
+    Os deslocamentos de cada objeto são contados à medida que os bytes saem,
+    e a tabela xref é escrita no fim; o documento nunca fica inteiro em memória.
+    """
+    LARGURA, ALTURA = 842, 595
+    MARGEM = 30
+    FONTE = 7
+    ENTRELINHA = 10
+
+    def __init__(self):
+        self.posicao = 0
+        self.deslocamentos = {}
+        self.paginas = []
+        self.proximo_id = 4  # 1 catálogo, 2 páginas, 3 fonte
+
+    def _objeto(self, numero: int, conteudo: bytes) -> bytes:
+        self.deslocamentos[numero] = self.posicao
+        dados = f'{numero} 0 obj\n'.encode('latin-1') + conteudo + b'\nendobj\n'
+        self.posicao += len(dados)
+        return dados
+
+    def inicio(self) -> bytes:
+        dados = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.posicao += len(dados)
+        return dados + self._objeto(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+
+    @staticmethod
+    def _texto(valor) -> bytes:
+        texto = '' if valor is None else str(valor)
+        texto = texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').replace('\r', ' ').replace('\n', ' ')
+        return texto.encode('cp1252', errors='replace')
+
+    def pagina(self, linhas: List[List]) -> bytes:
+        """linhas: lista de células [(x, texto)] por linha da página, de cima para baixo"""
+        comandos = [b'BT', f'/F1 {self.FONTE} Tf'.encode('latin-1')]
+        y = self.ALTURA - self.MARGEM
+        for celulas in linhas:
+            for x, texto in celulas:
+                comandos.append(f'1 0 0 1 {x} {y} Tm ('.encode('latin-1') + self._texto(texto) + b') Tj')
+            y -= self.ENTRELINHA
+        comandos.append(b'ET')
+        conteudo = b'\n'.join(comandos)
+
+        id_conteudo, id_pagina = self.proximo_id, self.proximo_id + 1
+        self.proximo_id += 2
+        self.paginas.append(id_pagina)
+        return self._objeto(id_conteudo, f'<< /Length {len(conteudo)} >>\nstream\n'.encode('latin-1') + conteudo + b'\nendstream') + \
+            self._objeto(id_pagina, (
+                f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.LARGURA} {self.ALTURA}] '
+                f'/Resources << /Font << /F1 3 0 R >> >> /Contents {id_conteudo} 0 R >>'
+            ).encode('latin-1'))
+
+    def fim(self) -> bytes:
+        kids = ' '.join(f'{numero} 0 R' for numero in self.paginas)
+        dados = self._objeto(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.paginas)} >>'.encode('latin-1'))
+        dados += self._objeto(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        total = self.proximo_id
+        xref = [f'xref\n0 {total}\n', '0000000000 65535 f \n']
+        for numero in range(1, total):
+            xref.append(f'{self.deslocamentos.get(numero, 0):010d} 00000 n \n')
+        xref.append(f'trailer\n<< /Size {total} /Root 1 0 R >>\nstartxref\n{self.posicao}\n%%EOF\n')
+        return dados + ''.join(xref).encode('latin-1')
+
+def _gerar_pdf(titulo: str, colunas, linhas: Iterable[Dict], resumo) -> Iterator[bytes]:
+    pdf = _PdfStream()
+    visiveis = [(t, c, largura, f) for t, c, largura, f in colunas if largura]
+    posicoes = []
+    x = pdf.MARGEM
+    for _, _, largura, _ in visiveis:
+        posicoes.append(x)
+        x += largura
+    limites = [max(1, int(largura / (pdf.FONTE * 0.5))) for _, _, largura, _ in visiveis]
+    cabecalho = list(zip(posicoes, [t for t, _, _, _ in visiveis]))
+    por_pagina = (pdf.ALTURA - 2 * pdf.MARGEM) // pdf.ENTRELINHA - 3
+
+    def nova_pagina():
+        return [[(pdf.MARGEM, titulo)], [], cabecalho]
+
+    yield pdf.inicio()
+    pagina = nova_pagina()
+    for linha in linhas:
+        pagina.append([
+            (x, ('' if linha[chave] is None else str(_valor(linha, chave, formatador)))[:limite])
+            for x, limite, (_, chave, _, formatador) in zip(posicoes, limites, visiveis)
+        ])
+        if len(pagina) - 3 >= por_pagina:
+            yield pdf.pagina(pagina)
+            pagina = nova_pagina()
+
+    # Resumo ao final, calculado na mesma passagem
+    pagina += [[], [(pdf.MARGEM, 'Resumo')]]
+    for chave, valor in resumo.resultado().items():
+        if isinstance(valor, dict):
+            valor = ' - '.join(str(v) for v in valor.values())
+        pagina.append([(pdf.MARGEM, f"{chave.replace('_', ' ').capitalize()}: {valor}")])
+    yield pdf.pagina(pagina)
+    yield pdf.fim()
+
+def gerar_relatorio(tipo: str, formato: str, filtros: Dict, contador: Optional[List[int]] = None) -> Iterator[bytes]:
+    """
+    Gera o relatório em blocos de bytes no formato pedido
+
+    Args:
+        contador: lista de um item incrementada a cada linha (registros processados)
+    """
+    definicao = RELATORIOS[tipo]
+    resumo = definicao['resumo'](filtros)
+
+    def linhas():
+        for linha in definicao['linhas'](filtros):
+            resumo.adicionar(linha)
+            if contador is not None:
+                contador[0] += 1
+            yield linha
+
+    if formato == 'csv':
+        return _gerar_csv(definicao['colunas'], linhas())
+    if formato == 'pdf':
+        return _gerar_pdf(definicao['titulo'], definicao['colunas'], linhas(), resumo)
+    return _gerar_json(linhas(), resumo)
+
+def nome_arquivo(tipo: str, formato: str, relatorio_id: Optional[int] = None) -> str:
+    """Nome do arquivo; exportações gravadas em disco levam o id do RelatorioGerado"""
+    sufixo = f'_{relatorio_id}' if relatorio_id is not None else ''
+    return f"relatorio_{tipo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{sufixo}{FORMATOS[formato][1]}"
+
+# ==================== EXPORTAÇÃO EM SEGUNDO PLANO ====================
+
+def diretorio_relatorios(app) -> str:
+    diretorio = os.path.join(app.root_path, DIRETORIO_RELATORIOS)
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
+
+def _nome_trava(relatorio_id: int) -> str:
+    return f'relatorio:{relatorio_id}'
+
+def _executar_exportacao(app, socketio, relatorio_id: int, tipo: str, formato: str, filtros: Dict):
+    with app.app_context(), manter_trava(app, _nome_trava(relatorio_id), TEMPO_TRAVA_EXPORTACAO) as concessao:
+        if concessao is None:
+            logger.error(f"Exportação {relatorio_id} não executada: trava pertence a outro processo")
+            return
+        relatorio = RelatorioGerado.query.get(relatorio_id)
+        if not relatorio or relatorio.status != 'gerando':
+            return
+        inicio = time.time()
+        contador = [0]
+        parcial = relatorio.caminho_arquivo + '.parcial'
+        try:
+            with open(parcial, 'wb') as arquivo:
+                for bloco in gerar_relatorio(tipo, formato, filtros, contador):
+                    if not concessao.valida:
+                        raise RuntimeError('Trava da exportação perdida para outro processo')
+                    arquivo.write(bloco)
+            os.replace(parcial, relatorio.caminho_arquivo)
+            relatorio.status = 'concluido'
+            relatorio.tamanho_kb = round(os.path.getsize(relatorio.caminho_arquivo) / 1024, 2)
+        except Exception as e:
+            logger.error(f"Erro ao exportar relatório {relatorio_id}: {str(e)}")
+            db.session.rollback()
+            relatorio = RelatorioGerado.query.get(relatorio_id)
+            relatorio.status = 'erro'
+            relatorio.erro_detalhes = str(e)
+            if os.path.exists(parcial):
+                os.remove(parcial)
+        relatorio.registros_processados = contador[0]
+        relatorio.tempo_execucao = int(time.time() - inicio)
+        relatorio.data_conclusao = get_brazil_time().replace(tzinfo=None)
+        db.session.commit()
+        emitir('relatorio_concluido', {'id': relatorio.id, 'status': relatorio.status}, [sala_usuario(relatorio.usuario_id), SALA_ADMIN], socketio=socketio)
+
+def agendar_exportacao(app, socketio, tipo: str, formato: str, filtros: Dict, usuario_id: int) -> RelatorioGerado:
+    """Registra o RelatorioGerado e grava o arquivo em segundo plano"""
+    relatorio = RelatorioGerado(
+        nome_relatorio=RELATORIOS[tipo]['titulo'],
+        tipo_relatorio=tipo,
+        formato=formato,
+        parametros=json.dumps(filtros),
+        nome_arquivo=nome_arquivo(tipo, formato),
+        status='gerando',
+        usuario_id=usuario_id
+    )
+    db.session.add(relatorio)
+    db.session.flush()
+    # O id no nome separa exportações iguais iniciadas no mesmo segundo
+    relatorio.nome_arquivo = nome_arquivo(tipo, formato, relatorio.id)
+    relatorio.caminho_arquivo = os.path.join(diretorio_relatorios(app), relatorio.nome_arquivo)
+    db.session.commit()
+    adquirir_trava(_nome_trava(relatorio.id), TEMPO_TRAVA_EXPORTACAO)
+    socketio.start_background_task(_executar_exportacao, app, socketio, relatorio.id, tipo, formato, filtros)
+    return relatorio
+
+def falhar_exportacoes_interrompidas() -> List[int]:
+    """Marca como erro as exportações em 'gerando' cuja trava venceu (processo encerrado)"""
+    interrompidas = []
+    for (relatorio_id,) in db.session.query(RelatorioGerado.id).filter_by(status='gerando').all():
+        if not adquirir_trava(_nome_trava(relatorio_id), TEMPO_TRAVA_EXPORTACAO, apenas_vencida=True):
+            continue
+        try:
+            relatorio = RelatorioGerado.query.get(relatorio_id)
+            if relatorio.status != 'gerando':
+                continue
+            relatorio.status = 'erro'
+            relatorio.erro_detalhes = 'Exportação interrompida: o processo que a gerava foi encerrado'
+            relatorio.data_conclusao = get_brazil_time().replace(tzinfo=None)
+            db.session.commit()
+            if relatorio.caminho_arquivo and os.path.exists(relatorio.caminho_arquivo + '.parcial'):
+                os.remove(relatorio.caminho_arquivo + '.parcial')
+            interrompidas.append(relatorio_id)
+        finally:
+            liberar_trava(_nome_trava(relatorio_id))
+    db.session.commit()
+    return interrompidas
+
+def iniciar_exportacoes(app, socketio):
+    """Inicia a verificação periódica de exportações interrompidas"""
+    def _loop():
+        while True:
+            with app.app_context():
+                try:
+                    for relatorio_id in falhar_exportacoes_interrompidas():
+                        logger.warning(f"Exportação {relatorio_id} interrompida marcada como erro")
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Erro ao verificar exportações interrompidas: {str(e)}")
+                finally:
+                    db.session.remove()
+            socketio.sleep(INTERVALO_VERIFICACAO_EXPORTACOES)
+
+    socketio.start_background_task(_loop)
@@ -0,0 +1,520 @@
+"""
+Resumos diários pré-agregados para os painéis (chamados, acessos e ações)
+
+Cada tabela resumo_diario_* guarda contadores por dia e dimensão:
+chamados por dia de abertura × unidade × problema × prioridade × status (com
+soma do tempo de resolução e histograma em faixas), acessos por dia × usuário
+× dispositivo × navegador e ações por dia × usuário × categoria × resultado.
+Os painéis somam essas linhas, e o custo da consulta depende do período
+pedido, não do volume de chamados e logs.
+
+Manutenção incremental:
+  - gravações pelo ORM (Chamado, LogAcesso, LogAcao): o before_flush lê e
+    trava (SELECT ... FOR UPDATE) os valores gravados dos registros alterados,
+    e o after_flush desconta essa contribuição e soma a nova, na mesma
+    transação; duas transações que alteram o mesmo chamado se serializam;
+  - logs gravados em lote (logs_buffer): somar_logs_inseridos na transação do INSERT.
+
+Uma reconciliação periódica (um worker por vez) compara os resumos com as
+tabelas de origem e aplica só as diferenças, como incrementos. Alterações
+feitas fora do ORM (UPDATE/DELETE em massa, restauração manual) são
+corrigidas por ela, ou na hora pela linha de comando:
+
+    python -m setores.ti.resumos_diarios --reconciliar [--desde AAAA-MM-DD]
+    python -m setores.ti.resumos_diarios --reconstruir [--desde AAAA-MM-DD]
+
+A reconstrução apaga e regrava as linhas: incrementos gravados durante ela
+se perdem, por isso deve rodar fora do horário de pico.
+
+Os resumos de logs preservam os dias já expirados pela retenção: a
+reconstrução desses resumos começa no registro mais antigo ainda existente.
+"""
+import argparse
+import logging
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, distinct, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from database import (
+    db, Chamado, Configuracao, LogAcao, LogAcesso, ResumoDiarioAcao, ResumoDiarioAcesso,
+    ResumoDiarioChamado, get_brazil_time
+)
+from setores.ti.travas import adquirir_trava, manter_trava, trava_ativa
+
+logger = logging.getLogger(__name__)
+
+VERSAO_RESUMOS = '1'  # alterar força a reconstrução na próxima inicialização
+CHAVE_VERSAO = 'resumos_diarios_versao'
+TAMANHO_LOTE_RECONSTRUCAO = 5000
+TRAVA_CONSTRUCAO = 'resumos_diarios:construcao'
+TEMPO_TRAVA_CONSTRUCAO = 120  # segundos; renovada enquanto a reconstrução roda
+TRAVA_RECONCILIACAO = 'resumos_diarios:reconciliacao'
+INTERVALO_RECONCILIACAO = 12 * 3600  # segundos
+
+# (limite em horas, coluna); a última faixa não tem limite
+FAIXAS_RESOLUCAO = [
+    (4, 'faixa_ate_4h'),
+    (8, 'faixa_ate_8h'),
+    (24, 'faixa_ate_24h'),
+    (72, 'faixa_ate_72h'),
+    (None, 'faixa_acima_72h'),
+]
+
+# ==================== CONTRIBUIÇÃO DE CADA REGISTRO ====================
+
+def _texto(valor, tamanho: int) -> str:
+    return (valor or '')[:tamanho]
+
+def _dia(valor) -> Optional[date]:
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, str) and valor:
+        return datetime.fromisoformat(valor).date()
+    return valor or None
+
+def _contribuicao_chamado(v: Dict) -> Optional[Tuple[Tuple, Dict]]:
+    dia = _dia(v['data_abertura'])
+    if not dia:
+        return None
+    chave = (dia, _texto(v['unidade'], 100), _texto(v['problema'], 100),
+             _texto(v['prioridade'], 20), _texto(v['status'], 20))
+    valores = {'quantidade': 1}
+    if v['data_conclusao'] and v['data_abertura']:
+        segundos = (v['data_conclusao'] - v['data_abertura']).total_seconds()
+        valores['com_conclusao'] = 1
+        valores['segundos_resolucao'] = int(segundos)
+        for limite, coluna in FAIXAS_RESOLUCAO:
+            if limite is None or segundos <= limite * 3600:
+                valores[coluna] = 1
+                break
+    return chave, valores
+
+def _contribuicao_acesso(v: Dict) -> Optional[Tuple[Tuple, Dict]]:
+    dia = _dia(v['data_acesso'])
+    if not dia:
+        return None
+    chave = (dia, v['usuario_id'] or 0, _texto(v['dispositivo'], 50), _texto(v['navegador'], 100))
+    valores = {'quantidade': 1}
+    if v['duracao_sessao'] is not None:
+        valores['sessoes_com_duracao'] = 1
+        valores['minutos_sessao'] = v['duracao_sessao']
+    return chave, valores
+
+def _contribuicao_acao(v: Dict) -> Optional[Tuple[Tuple, Dict]]:
+    dia = _dia(v['data_acao'])
+    if not dia:
+        return None
+    sucesso = True if v['sucesso'] is None else bool(v['sucesso'])
+    return (dia, v['usuario_id'] or 0, _texto(v['categoria'], 100), sucesso), {'quantidade': 1}
+
+# modelo de origem -> (resumo, colunas-chave, campos lidos, contribuição, coluna de data, preserva histórico)
+RESUMOS = {
+    Chamado: (ResumoDiarioChamado, ('dia', 'unidade', 'problema', 'prioridade', 'status'),
+              ('data_abertura', 'data_conclusao', 'unidade', 'problema', 'prioridade', 'status'),
+              _contribuicao_chamado, 'data_abertura', False),
+    LogAcesso: (ResumoDiarioAcesso, ('dia', 'usuario_id', 'dispositivo', 'navegador'),
+                ('data_acesso', 'usuario_id', 'dispositivo', 'navegador', 'duracao_sessao'),
+                _contribuicao_acesso, 'data_acesso', True),
+    LogAcao: (ResumoDiarioAcao, ('dia', 'usuario_id', 'categoria', 'sucesso'),
+              ('data_acao', 'usuario_id', 'categoria', 'sucesso'),
+              _contribuicao_acao, 'data_acao', True),
+}
+
+def _acumular(deltas: Dict, modelo, valores: Dict, sinal: int):
+    contribuicao = RESUMOS[modelo][3](valores)
+    if not contribuicao:
+        return
+    chave, incrementos = contribuicao
+    destino = deltas.setdefault(modelo, {}).setdefault(chave, {})
+    for coluna, valor in incrementos.items():
+        destino[coluna] = destino.get(coluna, 0) + sinal * valor
+
+# ==================== GRAVAÇÃO DOS CONTADORES ====================
+
+def _somar(conn, modelo, deltas: Dict[Tuple, Dict]):
+    """Soma os incrementos nas linhas do resumo (cria a linha quando não existe)"""
+    resumo, colunas_chave = RESUMOS[modelo][0], RESUMOS[modelo][1]
+    tabela = resumo.__table__
+    dialeto = conn.dialect.name
+    for chave, incrementos in deltas.items():
+        incrementos = {coluna: valor for coluna, valor in incrementos.items() if valor}
+        if not incrementos:
+            continue
+        valores = dict(zip(colunas_chave, chave), **incrementos)
+        if dialeto == 'mysql':
+            from sqlalchemy.dialects.mysql import insert as insert_mysql
+            comando = insert_mysql(tabela).values(**valores)
+            comando = comando.on_duplicate_key_update(
+                {coluna: tabela.c[coluna] + comando.inserted[coluna] for coluna in incrementos}
+            )
+            conn.execute(comando)
+        elif dialeto in ('sqlite', 'postgresql'):
+            if dialeto == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+            else:
+                from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+            comando = insert_dialeto(tabela).values(**valores)
+            comando = comando.on_conflict_do_update(
+                index_elements=list(colunas_chave),
+                set_={coluna: tabela.c[coluna] + comando.excluded[coluna] for coluna in incrementos}
+            )
+            conn.execute(comando)
+        else:
+            filtro = [tabela.c[coluna] == valor for coluna, valor in zip(colunas_chave, chave)]
+            resultado = conn.execute(update(tabela).where(*filtro).values(
+                {coluna: tabela.c[coluna] + valor for coluna, valor in incrementos.items()}
+            ))
+            if not resultado.rowcount:
+                conn.execute(insert(tabela).values(**valores))
+
+def _aplicar(conn, deltas: Dict):
+    for modelo, por_chave in deltas.items():
+        _somar(conn, modelo, por_chave)
+
+def somar_logs_inseridos(conn, tabela: str, linhas: Iterable[Dict]):
+    """Atualiza os resumos com logs inseridos fora do ORM (mesma conexão/transação do INSERT)"""
+    modelo = {LogAcao.__tablename__: LogAcao, LogAcesso.__tablename__: LogAcesso}.get(tabela)
+    if not modelo:
+        return
+    campos = RESUMOS[modelo][2]
+    deltas = {}
+    for linha in linhas:
+        _acumular(deltas, modelo, {campo: linha.get(campo) for campo in campos}, 1)
+    _aplicar(conn, deltas)
+
+def descontar_chamados(consulta):
+    """Desconta dos resumos os chamados de uma consulta antes de um DELETE em massa"""
+    campos = RESUMOS[Chamado][2]
+    deltas = {}
+    for linha in consulta.with_entities(*[getattr(Chamado, campo) for campo in campos]):
+        _acumular(deltas, Chamado, dict(zip(campos, linha)), -1)
+    _aplicar(db.session.connection(), deltas)
+
+# ==================== EVENTOS DA SESSÃO ====================
+
+def _campos_alterados(objeto, campos) -> bool:
+    estado = inspect(objeto)
+    return any(estado.attrs[campo].history.has_changes() for campo in campos)
+
+def _valores_gravados(session, modelo, ids) -> Dict:
+    """Lê os valores gravados dos registros, travando as linhas até o fim da transação"""
+    campos = RESUMOS[modelo][2]
+    consulta = (
+        select(modelo.id, *[getattr(modelo, campo) for campo in campos])
+        .where(modelo.id.in_(ids))
+        .order_by(modelo.id)
+        .with_for_update()
+    )
+    return {linha[0]: dict(zip(campos, linha[1:])) for linha in session.connection().execute(consulta)}
+
+def _antes_flush(session, flush_context, instances):
+    """
+    Guarda a contribuição atual dos registros alterados ou removidos
+
+    Os valores vêm do banco (SELECT ... FOR UPDATE), não da sessão: outra
+    transação que altere o mesmo registro espera o commit desta e desconta
+    os valores já atualizados.
+    """
+    ids_por_modelo = {}
+    for objeto in list(session.dirty) + list(session.deleted):
+        modelo = type(objeto)
+        if modelo not in RESUMOS or inspect(objeto).pending:
+            continue
+        if objeto not in session.deleted and not _campos_alterados(objeto, RESUMOS[modelo][2]):
+            continue
+        ids_por_modelo.setdefault(modelo, set()).add(inspect(objeto).identity[0])
+    anteriores = []
+    for modelo, ids in ids_por_modelo.items():
+        # Registro já removido por outra transação: a contribuição já foi descontada
+        anteriores.extend((modelo, valores) for valores in _valores_gravados(session, modelo, ids).values())
+    if anteriores:
+        session.info.setdefault('resumos_anteriores', []).extend(anteriores)
+
+def _apos_flush(session, flush_context):
+    """Desconta as contribuições antigas e soma as novas, na transação do flush"""
+    deltas = {}
+    for modelo, valores in session.info.pop('resumos_anteriores', []):
+        _acumular(deltas, modelo, valores, -1)
+    for objeto in list(session.new) + list(session.dirty):
+        modelo = type(objeto)
+        if modelo not in RESUMOS or objeto in session.deleted:
+            continue
+        if objeto in session.dirty and not _campos_alterados(objeto, RESUMOS[modelo][2]):
+            continue
+        _acumular(deltas, modelo, {campo: getattr(objeto, campo) for campo in RESUMOS[modelo][2]}, 1)
+    if deltas:
+        _aplicar(session.connection(), deltas)
+
+def _apos_rollback(session, transacao):
+    session.info.pop('resumos_anteriores', None)
+
+def registrar_eventos():
+    if event.contains(Session, 'after_flush', _apos_flush):
+        return
+    event.listen(Session, 'before_flush', _antes_flush)
+    event.listen(Session, 'after_flush', _apos_flush)
+    event.listen(Session, 'after_soft_rollback', _apos_rollback)
+
+registrar_eventos()
+
+# ==================== CONSULTAS ====================
+
+def _somas(resumo, agrupar: Iterable[str], desde: Optional[date], ate: Optional[date], filtros: Dict,
+           metricas: Iterable[str], ordenar: Optional[str] = None, limite: Optional[int] = None) -> List[Dict]:
+    agrupar = list(agrupar)
+    colunas = [getattr(resumo, coluna) for coluna in agrupar]
+    consulta = db.session.query(
+        *colunas, *[func.coalesce(func.sum(getattr(resumo, m)), 0).label(m) for m in metricas]
+    )
+    if desde:
+        consulta = consulta.filter(resumo.dia >= desde)
+    if ate:
+        consulta = consulta.filter(resumo.dia <= ate)
+    for coluna, valor in filtros.items():
+        if isinstance(valor, (list, tuple, set)):
+            consulta = consulta.filter(getattr(resumo, coluna).in_(list(valor)))
+        else:
+            consulta = consulta.filter(getattr(resumo, coluna) == valor)
+    if agrupar:
+        consulta = consulta.group_by(*colunas)
+    if ordenar:
+        consulta = consulta.order_by(func.sum(getattr(resumo, ordenar)).desc())
+    if limite:
+        consulta = consulta.limit(limite)
+    return [dict(linha._mapping) for linha in consulta.all()]
+
+def somar_chamados(agrupar: Iterable[str] = (), desde: Optional[date] = None, ate: Optional[date] = None,
+                   ordenar: Optional[str] = None, limite: Optional[int] = None, **filtros) -> List[Dict]:
+    """
+    Soma os contadores de chamados abertos no período, agrupados pelas colunas pedidas
+
+    Cada item traz as colunas de agrupamento, quantidade, com_conclusao,
+    segundos_resolucao e as faixas de resolução
+    """
+    metricas = ['quantidade', 'com_conclusao', 'segundos_resolucao'] + [coluna for _, coluna in FAIXAS_RESOLUCAO]
+    return _somas(ResumoDiarioChamado, agrupar, desde, ate, filtros, metricas, ordenar, limite)
+
+def somar_acessos(agrupar: Iterable[str] = (), desde: Optional[date] = None, ate: Optional[date] = None,
+                  ordenar: Optional[str] = None, limite: Optional[int] = None, **filtros) -> List[Dict]:
+    metricas = ['quantidade', 'sessoes_com_duracao', 'minutos_sessao']
+    return _somas(ResumoDiarioAcesso, agrupar, desde, ate, filtros, metricas, ordenar, limite)
+
+def somar_acoes(agrupar: Iterable[str] = (), desde: Optional[date] = None, ate: Optional[date] = None,
+                ordenar: Optional[str] = None, limite: Optional[int] = None, **filtros) -> List[Dict]:
+    return _somas(ResumoDiarioAcao, agrupar, desde, ate, filtros, ['quantidade'], ordenar, limite)
+
+def usuarios_com_acesso(desde: Optional[date] = None) -> int:
+    """Usuários distintos com acesso a partir do dia informado"""
+    consulta = db.session.query(func.count(distinct(ResumoDiarioAcesso.usuario_id))).filter(
+        ResumoDiarioAcesso.quantidade > 0
+    )
+    if desde:
+        consulta = consulta.filter(ResumoDiarioAcesso.dia >= desde)
+    return consulta.scalar() or 0
+
+def tempo_medio_horas(linha: Dict) -> float:
+    """Tempo médio de resolução (horas) de uma linha de somar_chamados"""
+    if not linha['com_conclusao']:
+        return 0
+    return linha['segundos_resolucao'] / linha['com_conclusao'] / 3600
+
+def acima_de_24h(linha: Dict) -> int:
+    return linha['faixa_ate_72h'] + linha['faixa_acima_72h']
+
+# ==================== RECONSTRUÇÃO ====================
+
+def _recalcular(executor, modelo, desde: Optional[date]) -> Optional[Tuple[Optional[date], Dict]]:
+    """
+    Contribuições recalculadas a partir da tabela de origem
+
+    Returns:
+        (primeiro dia recalculado, {chave: valores}), ou None se o modelo
+        preserva histórico e não há registros (os dias expirados ficam como estão)
+    """
+    campos, coluna_data, preserva_historico = RESUMOS[modelo][2], RESUMOS[modelo][4], RESUMOS[modelo][5]
+    coluna = getattr(modelo, coluna_data)
+    inicio = desde
+    if preserva_historico:
+        mais_antigo = _dia(executor.execute(select(func.min(coluna))).scalar())
+        if not mais_antigo:
+            return None
+        inicio = max(inicio, mais_antigo) if inicio else mais_antigo
+
+    consulta = select(*[getattr(modelo, campo) for campo in campos])
+    if inicio:
+        consulta = consulta.where(coluna >= datetime.combine(inicio, datetime.min.time()))
+    deltas = {}
+    for linha in executor.execute(consulta.execution_options(yield_per=TAMANHO_LOTE_RECONSTRUCAO)):
+        _acumular(deltas, modelo, dict(zip(campos, linha)), 1)
+    return inicio, deltas.get(modelo, {})
+
+def reconstruir(desde: Optional[date] = None) -> Dict[str, int]:
+    """
+    Recalcula os resumos a partir das tabelas de origem
+
+    Args:
+        desde: primeiro dia recalculado; None recalcula tudo (nos logs, a partir
+               do registro mais antigo ainda existente)
+
+    Returns:
+        {tabela de resumo: linhas gravadas}
+    """
+    resultado = {}
+    for modelo, (resumo, colunas_chave, *_) in RESUMOS.items():
+        recalculo = _recalcular(db.session, modelo, desde)
+        if recalculo is None:
+            resultado[resumo.__tablename__] = 0
+            continue
+        inicio, por_chave = recalculo
+
+        linhas = [dict(zip(colunas_chave, chave), **valores) for chave, valores in por_chave.items()]
+        with db.engine.begin() as conn:
+            remocao = delete(resumo.__table__)
+            if inicio:
+                remocao = remocao.where(resumo.__table__.c.dia >= inicio)
+            conn.execute(remocao)
+            for posicao in range(0, len(linhas), TAMANHO_LOTE_RECONSTRUCAO):
+                lote = linhas[posicao:posicao + TAMANHO_LOTE_RECONSTRUCAO]
+                # executemany exige as mesmas colunas em todas as linhas
+                colunas = set().union(*lote)
+                conn.execute(insert(resumo.__table__), [{c: linha.get(c, 0) for c in colunas} for linha in lote])
+        resultado[resumo.__tablename__] = len(linhas)
+    db.session.commit()
+    return resultado
+
+def reconciliar(desde: Optional[date] = None) -> Dict[str, int]:
+    """
+    Corrige as linhas dos resumos que divergem das tabelas de origem
+
+    Origem e resumo são lidos na mesma transação (mesmo snapshot) e só a
+    diferença é aplicada, como incremento: ao contrário da reconstrução,
+    incrementos gravados por outras transações enquanto ela roda são mantidos.
+
+    Returns:
+        {tabela de resumo: linhas corrigidas}
+    """
+    resultado = {}
+    for modelo, (resumo, colunas_chave, *_) in RESUMOS.items():
+        tabela = resumo.__table__
+        metricas = [coluna.name for coluna in tabela.c if coluna.name != 'id' and coluna.name not in colunas_chave]
+        diferencas = {}
+        with db.engine.begin() as conn:
+            recalculo = _recalcular(conn, modelo, desde)
+            if recalculo is None:
+                resultado[tabela.name] = 0
+                continue
+            inicio, corretos = recalculo
+
+            consulta = select(*[tabela.c[coluna] for coluna in list(colunas_chave) + metricas])
+            if inicio:
+                consulta = consulta.where(tabela.c.dia >= inicio)
+            atuais = {}
+            for linha in conn.execute(consulta.execution_options(yield_per=TAMANHO_LOTE_RECONSTRUCAO)):
+                atuais[tuple(linha[:len(colunas_chave)])] = dict(zip(metricas, linha[len(colunas_chave):]))
+
+            for chave in set(corretos) | set(atuais):
+                correto, atual = corretos.get(chave, {}), atuais.get(chave, {})
+                ajuste = {metrica: correto.get(metrica, 0) - atual.get(metrica, 0) for metrica in metricas}
+                if any(ajuste.values()):
+                    diferencas[chave] = ajuste
+            _somar(conn, modelo, diferencas)
+        resultado[tabela.name] = len(diferencas)
+    return resultado
+
+def _versao_atual() -> bool:
+    registro = Configuracao.query.filter_by(chave=CHAVE_VERSAO).first()
+    return bool(registro and registro.valor == VERSAO_RESUMOS)
+
+def _gravar_versao():
+    agora = get_brazil_time().replace(tzinfo=None)
+    registro = Configuracao.query.filter_by(chave=CHAVE_VERSAO).first()
+    if registro:
+        registro.valor = VERSAO_RESUMOS
+        registro.data_atualizacao = agora
+    else:
+        db.session.add(Configuracao(chave=CHAVE_VERSAO, valor=VERSAO_RESUMOS, data_atualizacao=agora))
+    db.session.commit()
+
+def _construir_inicial(app):
+    with app.app_context():
+        try:
+            with manter_trava(app, TRAVA_CONSTRUCAO, TEMPO_TRAVA_CONSTRUCAO) as concessao:
+                # Outro worker está construindo, ou já terminou
+                if not concessao or _versao_atual():
+                    return
+                resultado = reconstruir()
+                _gravar_versao()
+                logger.info(f"Resumos diários construídos: {resultado}")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao construir os resumos diários: {str(e)}")
+        finally:
+            db.session.remove()
+
+def _reconciliacao_periodica(app, socketio, intervalo: int):
+    """Só o worker que detém a trava de reconciliação (renovada a cada ciclo) executa"""
+    while True:
+        socketio.sleep(intervalo)
+        with app.app_context():
+            try:
+                if not trava_ativa(TRAVA_CONSTRUCAO) and adquirir_trava(TRAVA_RECONCILIACAO, 2 * intervalo):
+                    corrigidas = reconciliar()
+                    if any(corrigidas.values()):
+                        logger.warning(f"Resumos diários divergentes corrigidos: {corrigidas}")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro na reconciliação dos resumos diários: {str(e)}")
+            finally:
+                db.session.remove()
+
+def iniciar_resumos_diarios(app, socketio, intervalo: int = INTERVALO_RECONCILIACAO):
+    """
+    Inicia a reconciliação periódica dos resumos e, na primeira inicialização
+    (ou ao mudar VERSAO_RESUMOS), a construção em segundo plano
+
+    Todos os workers chamam; a construção roda em um só, sob TRAVA_CONSTRUCAO.
+
+    Returns:
+        True se a construção foi iniciada
+    """
+    socketio.start_background_task(_reconciliacao_periodica, app, socketio, intervalo)
+    with app.app_context():
+        if _versao_atual():
+            return False
+    socketio.start_background_task(_construir_inicial, app)
+    return True
+
+# ==================== LINHA DE COMANDO ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Resumos diários dos painéis')
+    parser.add_argument('--reconstruir', action='store_true', help='Recalcula os resumos a partir das tabelas de origem')
+    parser.add_argument('--reconciliar', action='store_true', help='Corrige só as linhas que divergem das tabelas de origem')
+    parser.add_argument('--desde', help='Primeiro dia recalculado (AAAA-MM-DD)')
+    args = parser.parse_args(argv)
+
+    from flask import Flask
+    from config import get_config
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    db.init_app(app)
+
+    desde = datetime.strptime(args.desde, '%Y-%m-%d').date() if args.desde else None
+    with app.app_context():
+        if args.reconstruir:
+            with manter_trava(app, TRAVA_CONSTRUCAO, TEMPO_TRAVA_CONSTRUCAO) as concessao:
+                if not concessao:
+                    print("Reconstrução já em andamento em outro processo")
+                    return
+                resultado = reconstruir(desde)
+                _gravar_versao()
+            for tabela, linhas in resultado.items():
+                print(f"{tabela}: {linhas} linhas")
+        elif args.reconciliar:
+            for tabela, linhas in reconciliar(desde).items():
+                print(f"{tabela}: {linhas} linhas corrigidas")
+
+if __name__ == '__main__':
+    main()
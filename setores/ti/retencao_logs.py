@@ -0,0 +1,268 @@
+"""
+Retenção dos logs de acesso e de ações (tabelas logs_acesso e logs_acoes)
+
+A remoção é feita em lotes de chaves primárias: cada lote seleciona até
+TAMANHO_LOTE_RETENCAO ids com "data < limite" (predicado de intervalo que usa
+o índice da coluna de data), apaga esses ids e faz commit, com uma pausa
+curta entre lotes. Nenhuma transação segura as tabelas por muito tempo.
+
+Opcionalmente (LOGS_PARTICIONADOS=true, apenas MySQL) as tabelas ficam
+particionadas por mês na coluna de data; a expiração remove as partições
+inteiras com ALTER TABLE ... DROP PARTITION e só o mês da fronteira é apagado
+em lotes. As partições mensais começam no mês do log mais antigo; logs sem
+data ficam numa única partição anterior a elas. A conversão de uma tabela
+existente é explícita:
+
+    python -m setores.ti.retencao_logs --particionar
+
+Com DIAS_RETENCAO_LOGS definido, a retenção roda periodicamente em segundo
+plano, em um processo por vez (trava NOME_TRAVA, ver setores/ti/travas.py).
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import delete, func, inspect, select, text, update
+
+from database import db, LogAcao, LogAcesso, get_brazil_time
+from setores.ti.travas import manter_trava
+
+logger = logging.getLogger(__name__)
+
+DIAS_RETENCAO_LOGS = int(os.getenv('DIAS_RETENCAO_LOGS', '0'))  # 0 = sem retenção automática
+LOGS_PARTICIONADOS = os.getenv('LOGS_PARTICIONADOS', 'false').lower() == 'true'
+TAMANHO_LOTE_RETENCAO = 5000
+PAUSA_ENTRE_LOTES = 0.1  # segundos
+INTERVALO_RETENCAO = 6 * 3600  # segundos entre execuções automáticas
+ESPERA_INICIAL_RETENCAO = 300  # segundos após a inicialização
+MESES_FUTUROS = 3  # partições criadas antecipadamente
+NOME_TRAVA = 'retencao_logs'
+TEMPO_TRAVA_RETENCAO = 120  # segundos; renovada enquanto a retenção roda
+DATA_SEM_DATA = datetime(1970, 1, 1)  # valor gravado nos logs sem data ao particionar
+PARTICAO_SEM_DATA = 'psemdata'
+
+# Tabela de log -> coluna de data usada na retenção e no particionamento
+TABELAS_LOG = {
+    'acesso': (LogAcesso.__table__, LogAcesso.__table__.c.data_acesso),
+    'acoes': (LogAcao.__table__, LogAcao.__table__.c.data_acao),
+}
+
+# ==================== REMOÇÃO EM LOTES ====================
+
+def garantir_indices():
+    """Cria, se faltarem, os índices das tabelas de log (tabelas já existentes)"""
+    from migracoes import criar_indices_faltantes
+    return criar_indices_faltantes([tabela for tabela, _ in TABELAS_LOG.values()])
+
+def _pausar(segundos: float):
+    """Pausa entre lotes; socketio.sleep não trava o laço de eventos (gevent/eventlet)"""
+    socketio = getattr(current_app, 'socketio', None)
+    if socketio:
+        socketio.sleep(segundos)
+    else:
+        time.sleep(segundos)
+
+def remover_em_lotes(tabela, coluna, limite: datetime, tamanho_lote: int = TAMANHO_LOTE_RETENCAO,
+                     pausa: float = PAUSA_ENTRE_LOTES) -> int:
+    """Apaga as linhas com coluna < limite, um lote de ids por transação"""
+    consulta = select(tabela.c.id).where(coluna < limite).order_by(coluna).limit(tamanho_lote)
+    removidas = 0
+    while True:
+        with db.engine.begin() as conn:
+            ids = conn.execute(consulta).scalars().all()
+            if not ids:
+                break
+            conn.execute(delete(tabela).where(tabela.c.id.in_(ids)))
+        removidas += len(ids)
+        if len(ids) < tamanho_lote:
+            break
+        if pausa:
+            _pausar(pausa)
+    return removidas
+
+# ==================== PARTIÇÕES (MYSQL) ====================
+
+def _to_days(dia: date) -> int:
+    """Equivalente ao TO_DAYS do MySQL (TO_DAYS('0001-01-01') = 366)"""
+    return dia.toordinal() + 365
+
+def _inicio_mes(dia: date, meses: int = 0) -> date:
+    indice = dia.year * 12 + dia.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+def _definicao_particao(mes: date) -> str:
+    proximo = _inicio_mes(mes, 1)
+    return f"PARTITION p{mes.strftime('%Y%m')} VALUES LESS THAN ({_to_days(proximo)})"
+
+def suporta_particoes() -> bool:
+    return db.engine.dialect.name == 'mysql'
+
+def listar_particoes(tabela) -> List[Tuple[str, Optional[int]]]:
+    """[(nome, limite TO_DAYS exclusivo ou None para MAXVALUE)] em ordem"""
+    with db.engine.connect() as conn:
+        linhas = conn.execute(text(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tabela AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION"
+        ), {'tabela': tabela.name}).all()
+    return [(nome, None if descricao == 'MAXVALUE' else int(descricao)) for nome, descricao in linhas]
+
+def particionar_tabela(tabela, coluna):
+    """
+    Converte uma tabela de log em particionada por mês (operação pesada, executar fora do horário)
+
+    O MySQL exige a coluna de partição em todas as chaves únicas e não aceita
+    chaves estrangeiras em tabelas particionadas: a chave primária passa a ser
+    (id, data) e a FK para user é removida. Linhas sem data recebem
+    DATA_SEM_DATA e ficam na partição PARTICAO_SEM_DATA; as mensais começam no
+    mês da data real mais antiga.
+    """
+    if not suporta_particoes():
+        raise RuntimeError('Particionamento disponível apenas no MySQL')
+    if listar_particoes(tabela):
+        return False
+
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for fk in inspector.get_foreign_keys(tabela.name):
+            if fk.get('name'):
+                conn.execute(text(f"ALTER TABLE `{tabela.name}` DROP FOREIGN KEY `{fk['name']}`"))
+        # Antes de preencher os logs sem data, para não partir de DATA_SEM_DATA
+        mais_antiga = conn.execute(select(func.min(coluna)).where(coluna > DATA_SEM_DATA)).scalar()
+        conn.execute(update(tabela).where(coluna.is_(None)).values({coluna.name: DATA_SEM_DATA}))
+        conn.execute(text(
+            f"ALTER TABLE `{tabela.name}` MODIFY `{coluna.name}` DATETIME NOT NULL, "
+            f"DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `{coluna.name}`)"
+        ))
+
+        hoje = get_brazil_time().date()
+        mes = _inicio_mes(mais_antiga.date() if mais_antiga else hoje)
+        ultimo = _inicio_mes(hoje, MESES_FUTUROS)
+        definicoes = [f"PARTITION {PARTICAO_SEM_DATA} VALUES LESS THAN ({_to_days(mes)})"]
+        while mes <= ultimo:
+            definicoes.append(_definicao_particao(mes))
+            mes = _inicio_mes(mes, 1)
+        definicoes.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        conn.execute(text(
+            f"ALTER TABLE `{tabela.name}` PARTITION BY RANGE (TO_DAYS(`{coluna.name}`)) ({', '.join(definicoes)})"
+        ))
+    logger.info(f"Tabela {tabela.name} particionada em {len(definicoes)} partições")
+    return True
+
+def manter_particoes(tabela, limite: datetime) -> List[str]:
+    """Remove as partições inteiramente anteriores ao limite e cria as dos próximos meses"""
+    particoes = listar_particoes(tabela)
+    if not particoes:
+        return []
+
+    limite_dias = _to_days(limite.date())
+    expiradas = [nome for nome, fim in particoes if fim is not None and fim <= limite_dias]
+
+    hoje = get_brazil_time().date()
+    limites = [fim for _, fim in particoes if fim is not None]
+    proximo = date.fromordinal(max(limites) - 365) if limites else _inicio_mes(hoje)
+    novas = []
+    while proximo <= _inicio_mes(hoje, MESES_FUTUROS):
+        novas.append(_definicao_particao(proximo))
+        proximo = _inicio_mes(proximo, 1)
+
+    with db.engine.begin() as conn:
+        if expiradas:
+            conn.execute(text(f"ALTER TABLE `{tabela.name}` DROP PARTITION {', '.join(expiradas)}"))
+        if novas and any(nome == 'pmax' for nome, _ in particoes):
+            # pmax fica vazia enquanto houver meses criados à frente, então a reorganização é barata
+            conn.execute(text(
+                f"ALTER TABLE `{tabela.name}` REORGANIZE PARTITION pmax INTO "
+                f"({', '.join(novas)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            ))
+    if expiradas:
+        logger.info(f"Partições removidas de {tabela.name}: {', '.join(expiradas)}")
+    return expiradas
+
+# ==================== RETENÇÃO ====================
+
+def aplicar_retencao(dias_manter: int, pausa: float = PAUSA_ENTRE_LOTES) -> Dict:
+    """
+    Remove logs de acesso e de ações anteriores a (hoje - dias_manter)
+
+    Returns:
+        {'acesso': n, 'acoes': n, 'particoes_removidas': [...], 'data_limite': date}
+    """
+    data_limite = get_brazil_time().date() - timedelta(days=dias_manter)
+    limite = datetime.combine(data_limite, datetime.min.time())
+    resultado = {'particoes_removidas': [], 'data_limite': data_limite}
+
+    for nome, (tabela, coluna) in TABELAS_LOG.items():
+        if LOGS_PARTICIONADOS and suporta_particoes():
+            try:
+                resultado['particoes_removidas'] += manter_particoes(tabela, limite)
+            except Exception as e:
+                logger.error(f"Erro ao manter partições de {tabela.name}: {str(e)}")
+        # Partições removidas não contam linhas; o restante (mês da fronteira) vai em lotes
+        resultado[nome] = remover_em_lotes(tabela, coluna, limite, pausa=pausa)
+    return resultado
+
+def _executar_com_trava(app, dias_manter: int) -> Optional[Dict]:
+    """Só um processo executa a retenção por vez; None se outro já está executando"""
+    with manter_trava(app, NOME_TRAVA, TEMPO_TRAVA_RETENCAO) as concessao:
+        if not concessao:
+            return None
+        return aplicar_retencao(dias_manter)
+
+def _retencao_periodica(app, socketio):
+    socketio.sleep(ESPERA_INICIAL_RETENCAO)
+    while True:
+        with app.app_context():
+            try:
+                garantir_indices()
+                resultado = _executar_com_trava(app, DIAS_RETENCAO_LOGS)
+                if resultado and (resultado['acesso'] or resultado['acoes'] or resultado['particoes_removidas']):
+                    logger.info(
+                        f"Retenção de logs: {resultado['acesso']} acessos e {resultado['acoes']} ações removidos, "
+                        f"{len(resultado['particoes_removidas'])} partições descartadas"
+                    )
+            except Exception as e:
+                logger.error(f"Erro na retenção de logs: {str(e)}")
+            finally:
+                db.session.remove()
+        socketio.sleep(INTERVALO_RETENCAO)
+
+def iniciar_retencao_logs(app, socketio):
+    """Inicia a retenção periódica se DIAS_RETENCAO_LOGS estiver definido"""
+    if DIAS_RETENCAO_LOGS <= 0:
+        return False
+    socketio.start_background_task(_retencao_periodica, app, socketio)
+    return True
+
+# ==================== LINHA DE COMANDO ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Retenção e particionamento dos logs de acesso e de ações')
+    parser.add_argument('--particionar', action='store_true', help='Converte as tabelas de log em particionadas por mês (MySQL)')
+    parser.add_argument('--dias', type=int, help='Remove logs anteriores a este número de dias')
+    args = parser.parse_args(argv)
+
+    from flask import Flask
+    from config import get_config
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    db.init_app(app)
+
+    with app.app_context():
+        garantir_indices()
+        if args.particionar:
+            for tabela, coluna in TABELAS_LOG.values():
+                convertida = particionar_tabela(tabela, coluna)
+                print(f"{tabela.name}: {'particionada' if convertida else 'já particionada'}")
+        if args.dias:
+            resultado = aplicar_retencao(args.dias)
+            print(f"Removidos {resultado['acesso']} logs de acesso e {resultado['acoes']} logs de ações "
+                  f"anteriores a {resultado['data_limite'].strftime('%d/%m/%Y')}; "
+                  f"partições descartadas: {', '.join(resultado['particoes_removidas']) or 'nenhuma'}")
+
+if __name__ == '__main__':
+    main()
@@ -14,10 +14,11 @@ import subprocess
 import csv
 import io
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify, current_app, send_file
+from flask import Blueprint, Response, request, jsonify, current_app, send_file, after_this_request, stream_with_context
 from flask_login import login_required, current_user
 from sqlalchemy import func, desc, case, extract, text, and_, or_
 from auth.auth_helpers import setor_required
+from security.csrf_protection import CSRFProtection
 from database import (
     db, Chamado, User, Unidade, ProblemaReportado, ItemInternet, 
     LogAcesso, LogAcao, ConfiguracaoAvancada, AlertaSistema, 
@@ -25,6 +26,16 @@ from database import (
     get_brazil_time, registrar_log_acao, criar_alerta_sistema,
     registrar_log_acesso, registrar_log_logout
 )
+from setores.ti.backup import agendar_backup, compressoes_disponiveis, progresso_backup
+from setores.ti.busca import filtro_busca
+from setores.ti.paginacao import CursorInvalido, paginar
+from setores.ti.registro_configuracoes import invalidar_configuracoes, valor_avancado
+from setores.ti.resumos_diarios import (
+    acima_de_24h, somar_acessos, somar_acoes, somar_chamados, tempo_medio_horas, usuarios_com_acesso
+)
+from setores.ti.relatorios_exportacao import (
+    FORMATOS, LIMITE_EXPORTACAO_DIRETA, agendar_exportacao, contar_registros, gerar_relatorio, nome_arquivo
+)
 
 # Configurar logging
 logging.basicConfig(level=logging.DEBUG)
@@ -36,6 +47,9 @@ BRAZIL_TZ = pytz.timezone('America/Sao_Paulo')
 # Criar blueprint
 rotas_bp = Blueprint('rotas', __name__, template_folder='templates')
 
+# Token CSRF das ações de manutenção que alteram o esquema do banco
+csrf = CSRFProtection()
+
 def json_response(data, status=200):
     """Wrapper para garantir resposta JSON válida"""
     try:
@@ -70,8 +84,6 @@ def get_client_info(request):
 def listar_logs_acesso():
     """Lista logs de acesso com filtros e paginação"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
         usuario_id = request.args.get('usuario_id', type=int)
         data_inicio = request.args.get('data_inicio')
         data_fim = request.args.get('data_fim')
@@ -97,18 +109,14 @@ def listar_logs_acesso():
             except ValueError:
                 pass
         
-        # Ordenar por data mais recente
-        query = query.order_by(desc(LogAcesso.data_acesso))
-        
-        # Paginar
-        logs_paginados = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        # Mais recentes primeiro (keyset com limit/cursor, page/per_page no formato legado)
+        try:
+            logs, paginacao = paginar(query, LogAcesso.data_acesso, LogAcesso.id)
+        except CursorInvalido:
+            return error_response('Cursor inválido', 400)
         
         logs_list = []
-        for log in logs_paginados.items:
+        for log in logs:
             data_acesso_brazil = log.get_data_acesso_brazil()
             data_logout_brazil = log.get_data_logout_brazil()
             
@@ -131,14 +139,7 @@ def listar_logs_acesso():
         
         return json_response({
             'logs': logs_list,
-            'pagination': {
-                'page': logs_paginados.page,
-                'pages': logs_paginados.pages,
-                'per_page': logs_paginados.per_page,
-                'total': logs_paginados.total,
-                'has_next': logs_paginados.has_next,
-                'has_prev': logs_paginados.has_prev
-            }
+            'pagination': paginacao
         })
         
     except Exception as e:
@@ -154,32 +155,20 @@ def estatisticas_logs_acesso():
         hoje = get_brazil_time().date()
         inicio_semana = hoje - timedelta(days=7)
         
-        # Acessos hoje
-        acessos_hoje = LogAcesso.query.filter(
-            func.date(LogAcesso.data_acesso) == hoje
-        ).count()
-        
-        # Acessos esta semana
-        acessos_semana = LogAcesso.query.filter(
-            LogAcesso.data_acesso >= inicio_semana
-        ).count()
+        # Acessos hoje e esta semana (resumos diários)
+        acessos_hoje = somar_acessos(desde=hoje, ate=hoje)[0]['quantidade']
+        acessos_semana = somar_acessos(desde=inicio_semana)[0]['quantidade']
         
         # Usuários únicos esta semana
-        usuarios_unicos = db.session.query(LogAcesso.usuario_id).filter(
-            LogAcesso.data_acesso >= inicio_semana
-        ).distinct().count()
+        usuarios_unicos = usuarios_com_acesso(inicio_semana)
         
         # Tempo médio de sessão (últimos 30 dias)
         inicio_mes = hoje - timedelta(days=30)
-        sessoes_com_duracao = LogAcesso.query.filter(
-            LogAcesso.data_acesso >= inicio_mes,
-            LogAcesso.duracao_sessao.isnot(None)
-        ).all()
+        sessoes = somar_acessos(desde=inicio_mes)[0]
         
         tempo_medio_sessao = 0
-        if sessoes_com_duracao:
-            total_tempo = sum(log.duracao_sessao for log in sessoes_com_duracao)
-            tempo_medio_sessao = total_tempo / len(sessoes_com_duracao)
+        if sessoes['sessoes_com_duracao']:
+            tempo_medio_sessao = sessoes['minutos_sessao'] / sessoes['sessoes_com_duracao']
         
         return json_response({
             'acessos_hoje': acessos_hoje,
@@ -200,10 +189,9 @@ def estatisticas_logs_acesso():
 def listar_logs_acoes():
     """Lista logs de ações com filtros e paginação"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
         usuario_id = request.args.get('usuario_id', type=int)
         acao = request.args.get('acao', '')
+        busca = request.args.get('busca', '').strip()
         categoria = request.args.get('categoria', '')
         data_inicio = request.args.get('data_inicio')
         data_fim = request.args.get('data_fim')
@@ -217,7 +205,10 @@ def listar_logs_acoes():
             query = query.filter(LogAcao.usuario_id == usuario_id)
         
         if acao:
-            query = query.filter(LogAcao.acao.ilike(f'%{acao}%'))
+            query = query.filter(filtro_busca('log_acao', acao, ('acao',)))
+
+        if busca:
+            query = query.filter(filtro_busca('log_acao', busca))
         
         if categoria:
             query = query.filter(LogAcao.categoria == categoria)
@@ -240,18 +231,14 @@ def listar_logs_acoes():
             except ValueError:
                 pass
         
-        # Ordenar por data mais recente
-        query = query.order_by(desc(LogAcao.data_acao))
-        
-        # Paginar
-        logs_paginados = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        # Mais recentes primeiro (keyset com limit/cursor, page/per_page no formato legado)
+        try:
+            logs, paginacao = paginar(query, LogAcao.data_acao, LogAcao.id)
+        except CursorInvalido:
+            return error_response('Cursor inválido', 400)
         
         logs_list = []
-        for log in logs_paginados.items:
+        for log in logs:
             data_acao_brazil = log.get_data_acao_brazil()
             
             logs_list.append({
@@ -274,14 +261,7 @@ def listar_logs_acoes():
         
         return json_response({
             'logs': logs_list,
-            'pagination': {
-                'page': logs_paginados.page,
-                'pages': logs_paginados.pages,
-                'per_page': logs_paginados.per_page,
-                'total': logs_paginados.total,
-                'has_next': logs_paginados.has_next,
-                'has_prev': logs_paginados.has_prev
-            }
+            'pagination': paginacao
         })
         
     except Exception as e:
@@ -316,29 +296,21 @@ def estatisticas_logs_acoes():
         inicio_semana = hoje - timedelta(days=7)
         inicio_mes = hoje - timedelta(days=30)
         
-        # Ações por categoria (último mês)
-        acoes_categoria = db.session.query(
-            LogAcao.categoria,
-            func.count(LogAcao.id).label('quantidade')
-        ).filter(
-            LogAcao.data_acao >= inicio_mes
-        ).group_by(LogAcao.categoria).all()
-        
-        # Ações com erro (última semana)
-        acoes_erro = LogAcao.query.filter(
-            LogAcao.data_acao >= inicio_semana,
-            LogAcao.sucesso == False
-        ).count()
-        
-        # Total de ações (última semana)
-        total_acoes = LogAcao.query.filter(
-            LogAcao.data_acao >= inicio_semana
-        ).count()
+        # Ações por categoria (último mês), a partir dos resumos diários
+        acoes_categoria = somar_acoes(('categoria',), desde=inicio_mes)
+        
+        # Total de ações e ações com erro (última semana)
+        total_acoes = 0
+        acoes_erro = 0
+        for linha in somar_acoes(('sucesso',), desde=inicio_semana):
+            total_acoes += linha['quantidade']
+            if not linha['sucesso']:
+                acoes_erro += linha['quantidade']
         
         return json_response({
             'acoes_categoria': [
-                {'categoria': cat[0] or 'Sem categoria', 'quantidade': cat[1]}
-                for cat in acoes_categoria
+                {'categoria': cat['categoria'] or 'Sem categoria', 'quantidade': cat['quantidade']}
+                for cat in acoes_categoria if cat['quantidade']
             ],
             'acoes_erro': acoes_erro,
             'total_acoes': total_acoes,
@@ -360,16 +332,13 @@ def analise_problemas_futuros():
         hoje = get_brazil_time().date()
         inicio_periodo = hoje - timedelta(days=30)
         
-        # Tendência de crescimento de chamados
-        chamados_periodo_atual = Chamado.query.filter(
-            Chamado.data_abertura >= inicio_periodo
-        ).count()
+        # Tendência de crescimento de chamados (resumos diários)
+        chamados_periodo_atual = somar_chamados(desde=inicio_periodo)[0]['quantidade']
         
         periodo_anterior = inicio_periodo - timedelta(days=30)
-        chamados_periodo_anterior = Chamado.query.filter(
-            Chamado.data_abertura >= periodo_anterior,
-            Chamado.data_abertura < inicio_periodo
-        ).count()
+        chamados_periodo_anterior = somar_chamados(
+            desde=periodo_anterior, ate=inicio_periodo - timedelta(days=1)
+        )[0]['quantidade']
         
         if chamados_periodo_anterior > 0:
             tendencia_crescimento = ((chamados_periodo_atual - chamados_periodo_anterior) / chamados_periodo_anterior) * 100
@@ -377,36 +346,22 @@ def analise_problemas_futuros():
             tendencia_crescimento = 0
         
         # Problemas mais frequentes
-        problemas_frequentes = db.session.query(
-            Chamado.problema,
-            func.count(Chamado.id).label('quantidade')
-        ).filter(
-            Chamado.data_abertura >= inicio_periodo
-        ).group_by(Chamado.problema).order_by(desc('quantidade')).limit(5).all()
+        problemas_frequentes = [
+            p for p in somar_chamados(('problema',), desde=inicio_periodo, ordenar='quantidade', limite=5)
+            if p['quantidade']
+        ]
         
         # Unidades com mais problemas
-        unidades_problematicas = db.session.query(
-            Chamado.unidade,
-            func.count(Chamado.id).label('quantidade')
-        ).filter(
-            Chamado.data_abertura >= inicio_periodo
-        ).group_by(Chamado.unidade).order_by(desc('quantidade')).limit(5).all()
-        
-        # Análise de violação de SLA
-        chamados_violacao_sla = Chamado.query.filter(
-            Chamado.data_abertura >= inicio_periodo,
-            Chamado.status.in_(['Concluido', 'Cancelado'])
-        ).all()
-        
-        violacoes_sla = 0
-        for chamado in chamados_violacao_sla:
-            if chamado.data_conclusao and chamado.data_abertura:
-                tempo_resolucao = (chamado.data_conclusao - chamado.data_abertura).total_seconds() / 3600
-                # Assumir SLA de 24 horas para análise geral
-                if tempo_resolucao > 24:
-                    violacoes_sla += 1
-        
-        taxa_violacao_sla = (violacoes_sla / len(chamados_violacao_sla) * 100) if chamados_violacao_sla else 0
+        unidades_problematicas = [
+            u for u in somar_chamados(('unidade',), desde=inicio_periodo, ordenar='quantidade', limite=5)
+            if u['quantidade']
+        ]
+        
+        # Análise de violação de SLA (assumir SLA de 24 horas para análise geral)
+        finalizados = somar_chamados(desde=inicio_periodo, status=['Concluido', 'Cancelado'])[0]
+        violacoes_sla = acima_de_24h(finalizados)
+        
+        taxa_violacao_sla = (violacoes_sla / finalizados['quantidade'] * 100) if finalizados['quantidade'] else 0
         
         # Previsões e alertas
         alertas_previstos = []
@@ -431,13 +386,13 @@ def analise_problemas_futuros():
         
         # Verificar se há problemas concentrados em poucas unidades
         if unidades_problematicas and len(unidades_problematicas) > 0:
-            total_chamados = sum([u.quantidade for u in unidades_problematicas])
-            if unidades_problematicas[0].quantidade / total_chamados > 0.4:
+            total_chamados = sum([u['quantidade'] for u in unidades_problematicas])
+            if unidades_problematicas[0]['quantidade'] / total_chamados > 0.4:
                 alertas_previstos.append({
                     'tipo': 'concentracao_problemas',
                     'severidade': 'media',
                     'titulo': 'Concentração de Problemas',
-                    'descricao': f'Unidade {unidades_problematicas[0].unidade} concentra muitos chamados',
+                    'descricao': f"Unidade {unidades_problematicas[0]['unidade']} concentra muitos chamados",
                     'recomendacao': 'Investigar problemas específicos desta unidade'
                 })
         
@@ -445,11 +400,11 @@ def analise_problemas_futuros():
             'tendencia_crescimento': round(tendencia_crescimento, 2),
             'taxa_violacao_sla': round(taxa_violacao_sla, 2),
             'problemas_frequentes': [
-                {'problema': p.problema, 'quantidade': p.quantidade}
+                {'problema': p['problema'], 'quantidade': p['quantidade']}
                 for p in problemas_frequentes
             ],
             'unidades_problematicas': [
-                {'unidade': u.unidade, 'quantidade': u.quantidade}
+                {'unidade': u['unidade'], 'quantidade': u['quantidade']}
                 for u in unidades_problematicas
             ],
             'alertas_previstos': alertas_previstos,
@@ -466,87 +421,40 @@ def analise_problemas_futuros():
 
 # ==================== RELATÓRIOS ====================
 
+def exportar_relatorio(tipo, filtros):
+    """Responde o relatório em streaming, ou agenda em segundo plano se for grande"""
+    formato = request.args.get('formato', 'json')
+    if formato not in FORMATOS:
+        return error_response('Formato inválido', 400)
+
+    assincrono = request.args.get('assincrono', '').lower() in ('1', 'true')
+    if assincrono or contar_registros(tipo, filtros) > LIMITE_EXPORTACAO_DIRETA:
+        relatorio = agendar_exportacao(
+            current_app._get_current_object(), current_app.socketio, tipo, formato, filtros, current_user.id
+        )
+        return json_response({
+            'message': 'Relatório grande: a geração continua em segundo plano',
+            'relatorio_id': relatorio.id,
+            'status': relatorio.status
+        }, 202)
+
+    mimetype, _ = FORMATOS[formato]
+    resposta = Response(stream_with_context(gerar_relatorio(tipo, formato, filtros)), mimetype=mimetype)
+    if formato != 'json':
+        resposta.headers['Content-Disposition'] = f'attachment; filename={nome_arquivo(tipo, formato)}'
+    return resposta
+
 @rotas_bp.route('/api/relatorios/usuarios')
 @login_required
 @setor_required('Administrador')
 def relatorio_usuarios():
     """Gera relatório detalhado de usuários"""
     try:
-        formato = request.args.get('formato', 'json')
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
-        
-        query = User.query
-        
-        # Filtros de data (baseado na data de criação)
-        if data_inicio:
-            try:
-                data_inicio_dt = datetime.strptime(data_inicio, '%Y-%m-%d')
-                query = query.filter(User.data_criacao >= data_inicio_dt)
-            except ValueError:
-                pass
-        
-        if data_fim:
-            try:
-                data_fim_dt = datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1)
-                query = query.filter(User.data_criacao < data_fim_dt)
-            except ValueError:
-                pass
-        
-        usuarios = query.order_by(User.data_criacao.desc()).all()
-        
-        relatorio_data = []
-        for usuario in usuarios:
-            # Buscar último acesso
-            ultimo_acesso = LogAcesso.query.filter_by(
-                usuario_id=usuario.id
-            ).order_by(desc(LogAcesso.data_acesso)).first()
-            
-            # Contar total de acessos
-            total_acessos = LogAcesso.query.filter_by(usuario_id=usuario.id).count()
-            
-            # Contar chamados criados
-            total_chamados = Chamado.query.filter_by(usuario_id=usuario.id).count()
-            
-            data_criacao_brazil = usuario.data_criacao
-            if data_criacao_brazil and data_criacao_brazil.tzinfo is None:
-                data_criacao_brazil = pytz.utc.localize(data_criacao_brazil).astimezone(BRAZIL_TZ)
-            
-            ultimo_acesso_brazil = None
-            if ultimo_acesso:
-                ultimo_acesso_brazil = ultimo_acesso.get_data_acesso_brazil()
-            
-            relatorio_data.append({
-                'id': usuario.id,
-                'nome_completo': f"{usuario.nome} {usuario.sobrenome}",
-                'usuario': usuario.usuario,
-                'email': usuario.email,
-                'nivel_acesso': usuario.nivel_acesso,
-                'setores': usuario.setores,
-                'bloqueado': usuario.bloqueado,
-                'data_criacao': data_criacao_brazil.strftime('%d/%m/%Y %H:%M:%S') if data_criacao_brazil else None,
-                'ultimo_acesso': ultimo_acesso_brazil.strftime('%d/%m/%Y %H:%M:%S') if ultimo_acesso_brazil else 'Nunca',
-                'total_acessos': total_acessos,
-                'total_chamados': total_chamados
-            })
-        
-        if formato == 'csv':
-            return gerar_csv_usuarios(relatorio_data)
-        elif formato == 'pdf':
-            return gerar_pdf_usuarios(relatorio_data)
-        
-        return json_response({
-            'relatorio': relatorio_data,
-            'resumo': {
-                'total_usuarios': len(relatorio_data),
-                'usuarios_ativos': len([u for u in relatorio_data if not u['bloqueado']]),
-                'usuarios_bloqueados': len([u for u in relatorio_data if u['bloqueado']]),
-                'periodo': {
-                    'inicio': data_inicio or 'Início dos registros',
-                    'fim': data_fim or 'Hoje'
-                }
-            }
-        })
+        filtros = {
+            'data_inicio': request.args.get('data_inicio'),
+            'data_fim': request.args.get('data_fim')
+        }
+        return exportar_relatorio('usuarios', filtros)
         
     except Exception as e:
         logger.error(f"Erro ao gerar relatório de usuários: {str(e)}")
@@ -558,190 +466,69 @@ def relatorio_usuarios():
 def relatorio_chamados():
     """Gera relatório detalhado de chamados"""
     try:
-        formato = request.args.get('formato', 'json')
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
-        status = request.args.get('status')
-        prioridade = request.args.get('prioridade')
-        unidade = request.args.get('unidade')
-        
-        query = Chamado.query
-        
-        # Aplicar filtros
-        if data_inicio:
-            try:
-                data_inicio_dt = datetime.strptime(data_inicio, '%Y-%m-%d')
-                query = query.filter(Chamado.data_abertura >= data_inicio_dt)
-            except ValueError:
-                pass
-        
-        if data_fim:
-            try:
-                data_fim_dt = datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1)
-                query = query.filter(Chamado.data_abertura < data_fim_dt)
-            except ValueError:
-                pass
-        
-        if status:
-            query = query.filter(Chamado.status == status)
-        
-        if prioridade:
-            query = query.filter(Chamado.prioridade == prioridade)
-        
-        if unidade:
-            query = query.filter(Chamado.unidade.ilike(f'%{unidade}%'))
-        
-        chamados = query.order_by(Chamado.data_abertura.desc()).all()
-        
-        relatorio_data = []
-        for chamado in chamados:
-            data_abertura_brazil = chamado.get_data_abertura_brazil()
-            data_conclusao_brazil = chamado.get_data_conclusao_brazil()
-            
-            # Calcular tempo de resolução
-            tempo_resolucao = None
-            if chamado.data_conclusao and chamado.data_abertura:
-                delta = chamado.data_conclusao - chamado.data_abertura
-                tempo_resolucao = round(delta.total_seconds() / 3600, 2)  # em horas
-            
-            relatorio_data.append({
-                'codigo': chamado.codigo,
-                'protocolo': chamado.protocolo,
-                'solicitante': chamado.solicitante,
-                'email': chamado.email,
-                'cargo': chamado.cargo,
-                'telefone': chamado.telefone,
-                'unidade': chamado.unidade,
-                'problema': chamado.problema,
-                'descricao': chamado.descricao or '',
-                'status': chamado.status,
-                'prioridade': chamado.prioridade,
-                'data_abertura': data_abertura_brazil.strftime('%d/%m/%Y %H:%M:%S') if data_abertura_brazil else None,
-                'data_conclusao': data_conclusao_brazil.strftime('%d/%m/%Y %H:%M:%S') if data_conclusao_brazil else None,
-                'tempo_resolucao_horas': tempo_resolucao,
-                'data_visita': chamado.data_visita.strftime('%d/%m/%Y') if chamado.data_visita else None
-            })
-        
-        if formato == 'csv':
-            return gerar_csv_chamados(relatorio_data)
-        elif formato == 'pdf':
-            return gerar_pdf_chamados(relatorio_data)
-        
-        # Estatísticas do relatório
-        total_chamados = len(relatorio_data)
-        chamados_concluidos = len([c for c in relatorio_data if c['status'] == 'Concluido'])
-        chamados_abertos = len([c for c in relatorio_data if c['status'] == 'Aberto'])
-        
-        # Tempo médio de resolução
-        tempos_resolucao = [c['tempo_resolucao_horas'] for c in relatorio_data if c['tempo_resolucao_horas']]
-        tempo_medio_resolucao = sum(tempos_resolucao) / len(tempos_resolucao) if tempos_resolucao else 0
-        
-        return json_response({
-            'relatorio': relatorio_data,
-            'resumo': {
-                'total_chamados': total_chamados,
-                'chamados_concluidos': chamados_concluidos,
-                'chamados_abertos': chamados_abertos,
-                'taxa_resolucao': round((chamados_concluidos / total_chamados * 100), 2) if total_chamados > 0 else 0,
-                'tempo_medio_resolucao_horas': round(tempo_medio_resolucao, 2),
-                'periodo': {
-                    'inicio': data_inicio or 'Início dos registros',
-                    'fim': data_fim or 'Hoje'
-                }
-            }
-        })
+        filtros = {
+            'data_inicio': request.args.get('data_inicio'),
+            'data_fim': request.args.get('data_fim'),
+            'status': request.args.get('status'),
+            'prioridade': request.args.get('prioridade'),
+            'unidade': request.args.get('unidade')
+        }
+        return exportar_relatorio('chamados', filtros)
         
     except Exception as e:
         logger.error(f"Erro ao gerar relatório de chamados: {str(e)}")
         return error_response('Erro interno no servidor')
 
-def gerar_csv_usuarios(dados):
-    """Gera arquivo CSV para relatório de usuários"""
+@rotas_bp.route('/api/relatorios/gerados/<int:relatorio_id>')
+@login_required
+@setor_required('Administrador')
+def status_relatorio_gerado(relatorio_id):
+    """Retorna o andamento de um relatório gerado em segundo plano"""
     try:
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Cabeçalho
-        writer.writerow([
-            'ID', 'Nome Completo', 'Usuário', 'Email', 'Nível de Acesso', 
-            'Setores', 'Bloqueado', 'Data Criação', 'Último Acesso', 
-            'Total Acessos', 'Total Chamados'
-        ])
-        
-        # Dados
-        for usuario in dados:
-            writer.writerow([
-                usuario['id'],
-                usuario['nome_completo'],
-                usuario['usuario'],
-                usuario['email'],
-                usuario['nivel_acesso'],
-                ', '.join(usuario['setores']) if isinstance(usuario['setores'], list) else usuario['setores'],
-                'Sim' if usuario['bloqueado'] else 'Não',
-                usuario['data_criacao'],
-                usuario['ultimo_acesso'],
-                usuario['total_acessos'],
-                usuario['total_chamados']
-            ])
-        
-        output.seek(0)
-        
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'relatorio_usuarios_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
+        relatorio = RelatorioGerado.query.get(relatorio_id)
+        if not relatorio:
+            return error_response('Relatório não encontrado', 404)
         
+        data_conclusao = relatorio.get_data_conclusao_brazil()
+        return json_response({
+            'id': relatorio.id,
+            'nome': relatorio.nome_relatorio,
+            'tipo': relatorio.tipo_relatorio,
+            'formato': relatorio.formato,
+            'status': relatorio.status,
+            'nome_arquivo': relatorio.nome_arquivo,
+            'tamanho_kb': relatorio.tamanho_kb,
+            'registros_processados': relatorio.registros_processados,
+            'tempo_execucao': relatorio.tempo_execucao,
+            'data_geracao': relatorio.get_data_geracao_brazil().strftime('%d/%m/%Y %H:%M:%S') if relatorio.data_geracao else None,
+            'data_conclusao': data_conclusao.strftime('%d/%m/%Y %H:%M:%S') if data_conclusao else None,
+            'erro': relatorio.erro_detalhes
+        })
     except Exception as e:
-        logger.error(f"Erro ao gerar CSV de usuários: {str(e)}")
-        return error_response('Erro ao gerar arquivo CSV')
+        logger.error(f"Erro ao obter relatório gerado: {str(e)}")
+        return error_response('Erro interno no servidor')
 
-def gerar_csv_chamados(dados):
-    """Gera arquivo CSV para relatório de chamados"""
+@rotas_bp.route('/api/relatorios/gerados/<int:relatorio_id>/download')
+@login_required
+@setor_required('Administrador')
+def download_relatorio_gerado(relatorio_id):
+    """Baixa o arquivo de um relatório gerado em segundo plano"""
     try:
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Cabeçalho
-        writer.writerow([
-            'Código', 'Protocolo', 'Solicitante', 'Email', 'Cargo', 'Telefone',
-            'Unidade', 'Problema', 'Descrição', 'Status', 'Prioridade',
-            'Data Abertura', 'Data Conclusão', 'Tempo Resolução (h)', 'Data Visita'
-        ])
-        
-        # Dados
-        for chamado in dados:
-            writer.writerow([
-                chamado['codigo'],
-                chamado['protocolo'],
-                chamado['solicitante'],
-                chamado['email'],
-                chamado['cargo'],
-                chamado['telefone'],
-                chamado['unidade'],
-                chamado['problema'],
-                chamado['descricao'],
-                chamado['status'],
-                chamado['prioridade'],
-                chamado['data_abertura'],
-                chamado['data_conclusao'],
-                chamado['tempo_resolucao_horas'],
-                chamado['data_visita']
-            ])
-        
-        output.seek(0)
+        relatorio = RelatorioGerado.query.get(relatorio_id)
+        if not relatorio:
+            return error_response('Relatório não encontrado', 404)
+        if relatorio.status != 'concluido' or not relatorio.caminho_arquivo or not os.path.exists(relatorio.caminho_arquivo):
+            return error_response('Arquivo do relatório não disponível', 409)
         
         return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8-sig')),
-            mimetype='text/csv',
+            relatorio.caminho_arquivo,
+            mimetype=FORMATOS.get(relatorio.formato, ('application/octet-stream',))[0],
             as_attachment=True,
-            download_name=f'relatorio_chamados_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+            download_name=relatorio.nome_arquivo
         )
-        
     except Exception as e:
-        logger.error(f"Erro ao gerar CSV de chamados: {str(e)}")
-        return error_response('Erro ao gerar arquivo CSV')
+        logger.error(f"Erro ao baixar relatório gerado: {str(e)}")
+        return error_response('Erro interno no servidor')
 
 # ==================== DASHBOARD AVANÇADO ====================
 
@@ -757,53 +544,33 @@ def metricas_avancadas():
         
         # Métricas de usuários
         total_usuarios = User.query.count()
-        usuarios_ativos_mes = db.session.query(LogAcesso.usuario_id).filter(
-            LogAcesso.data_acesso >= inicio_mes
-        ).distinct().count()
+        usuarios_ativos_mes = usuarios_com_acesso(inicio_mes)
         
         usuarios_bloqueados = User.query.filter_by(bloqueado=True).count()
         
-        # Métricas de chamados
-        total_chamados = Chamado.query.count()
-        chamados_mes = Chamado.query.filter(
-            Chamado.data_abertura >= inicio_mes
-        ).count()
+        # Métricas de chamados (resumos diários)
+        total_chamados = somar_chamados()[0]['quantidade']
+        chamados_semana = somar_chamados(desde=inicio_semana)[0]['quantidade']
         
-        chamados_semana = Chamado.query.filter(
-            Chamado.data_abertura >= inicio_semana
-        ).count()
+        chamados_mes = 0
+        chamados_abertos_mes = 0
+        resolvidos_mes = None
+        for linha in somar_chamados(('status',), desde=inicio_mes):
+            chamados_mes += linha['quantidade']
+            if linha['status'] == 'Aberto':
+                chamados_abertos_mes += linha['quantidade']
+            elif linha['status'] == 'Concluido':
+                resolvidos_mes = linha
         
         # Tempo médio de resolução
-        chamados_resolvidos = Chamado.query.filter(
-            Chamado.status == 'Concluido',
-            Chamado.data_conclusao.isnot(None),
-            Chamado.data_abertura >= inicio_mes
-        ).all()
-        
-        if chamados_resolvidos:
-            tempos_resolucao = []
-            for chamado in chamados_resolvidos:
-                tempo = (chamado.data_conclusao - chamado.data_abertura).total_seconds() / 3600
-                tempos_resolucao.append(tempo)
-            
-            tempo_medio_resolucao = sum(tempos_resolucao) / len(tempos_resolucao)
-        else:
-            tempo_medio_resolucao = 0
+        tempo_medio_resolucao = tempo_medio_horas(resolvidos_mes) if resolvidos_mes else 0
         
         # Distribuição por prioridade
-        distribuicao_prioridade = db.session.query(
-            Chamado.prioridade,
-            func.count(Chamado.id).label('quantidade')
-        ).filter(
-            Chamado.data_abertura >= inicio_mes
-        ).group_by(Chamado.prioridade).all()
+        distribuicao_prioridade = [
+            d for d in somar_chamados(('prioridade',), desde=inicio_mes) if d['quantidade']
+        ]
         
         # Taxa de resolução
-        chamados_abertos_mes = Chamado.query.filter(
-            Chamado.data_abertura >= inicio_mes,
-            Chamado.status == 'Aberto'
-        ).count()
-        
         taxa_resolucao = ((chamados_mes - chamados_abertos_mes) / chamados_mes * 100) if chamados_mes > 0 else 0
         
         # Alertas ativos
@@ -824,7 +591,7 @@ def metricas_avancadas():
                 'taxa_resolucao': round(taxa_resolucao, 2)
             },
             'distribuicao_prioridade': [
-                {'prioridade': d.prioridade, 'quantidade': d.quantidade}
+                {'prioridade': d['prioridade'], 'quantidade': d['quantidade']}
                 for d in distribuicao_prioridade
             ],
             'alertas_ativos': alertas_ativos,
@@ -904,6 +671,7 @@ def atualizar_configuracao_avancada(config_id):
         config.usuario_atualizacao = current_user.id
         
         db.session.commit()
+        invalidar_configuracoes()
         
         # Registrar log da ação
         client_info = get_client_info(request)
@@ -1135,19 +903,14 @@ def criar_alerta():
 def historico_backup():
     """Lista o histórico de backups"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
-        
-        backups_paginados = BackupHistorico.query.order_by(
-            desc(BackupHistorico.data_backup)
-        ).paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        # Mais recentes primeiro (keyset com limit/cursor, page/per_page no formato legado)
+        try:
+            backups, paginacao = paginar(BackupHistorico.query, BackupHistorico.data_backup, BackupHistorico.id)
+        except CursorInvalido:
+            return error_response('Cursor inválido', 400)
         
         backup_list = []
-        for backup in backups_paginados.items:
+        for backup in backups:
             data_backup_brazil = backup.get_data_backup_brazil()
             data_inicio_brazil = backup.get_data_inicio_brazil()
             data_fim_brazil = backup.get_data_fim_brazil()
@@ -1173,14 +936,7 @@ def historico_backup():
         
         return json_response({
             'backups': backup_list,
-            'pagination': {
-                'page': backups_paginados.page,
-                'pages': backups_paginados.pages,
-                'per_page': backups_paginados.per_page,
-                'total': backups_paginados.total,
-                'has_next': backups_paginados.has_next,
-                'has_prev': backups_paginados.has_prev
-            }
+            'pagination': paginacao
         })
         
     except Exception as e:
@@ -1205,12 +961,15 @@ def criar_backup():
         if tipo_backup not in tipos_validos:
             return error_response('Tipo de backup inválido', 400)
         
-        # Criar registro de backup
-        agora = get_brazil_time().replace(tzinfo=None)
-        nome_arquivo = f"backup_{tipo_backup}_{agora.strftime('%Y%m%d_%H%M%S')}.sql"
+        compressao = data.get('compressao', 'gzip')
+        if compressao not in compressoes_disponiveis():
+            return error_response('Compressão indisponível', 400)
+        incremental = bool(data.get('incremental', False))
         
+        # Criar registro de backup (nome e caminho definidos ao agendar)
+        agora = get_brazil_time().replace(tzinfo=None)
         backup = BackupHistorico(
-            nome_arquivo=nome_arquivo,
+            nome_arquivo=f"backup_{tipo_backup}_{agora.strftime('%Y%m%d_%H%M%S')}",
             tipo=tipo_backup,
             status='em_progresso',
             data_backup=agora,
@@ -1223,61 +982,52 @@ def criar_backup():
         db.session.add(backup)
         db.session.commit()
         
-        # Executar backup em background (simulação)
-        try:
-            # Aqui você implementaria a lógica real de backup
-            # Por enquanto, vamos simular um backup bem-sucedido
-            
-            import time
-            time.sleep(2)  # Simular tempo de processamento
-            
-            # Atualizar status do backup
-            backup.status = 'concluido'
-            backup.data_fim = get_brazil_time().replace(tzinfo=None)
-            backup.tamanho_mb = 15.5  # Tamanho simulado
-            backup.tempo_execucao = backup.calcular_duracao()
-            
-            db.session.commit()
-            
-            # Registrar log da ação
-            client_info = get_client_info(request)
-            registrar_log_acao(
-                usuario_id=current_user.id,
-                acao=f'Criar backup: {tipo_backup}',
-                categoria='backup',
-                detalhes=f'Backup {tipo_backup} criado com sucesso - Arquivo: {nome_arquivo}',
-                ip_address=client_info['ip_address'],
-                user_agent=client_info['user_agent'],
-                recurso_afetado=str(backup.id),
-                tipo_recurso='backup'
-            )
-            
-            return json_response({
-                'message': 'Backup criado com sucesso',
-                'backup': {
-                    'id': backup.id,
-                    'nome_arquivo': backup.nome_arquivo,
-                    'tipo': backup.tipo,
-                    'status': backup.status,
-                    'tamanho_mb': backup.tamanho_mb
-                }
-            }, 201)
-            
-        except Exception as backup_error:
-            # Atualizar status para erro
-            backup.status = 'erro'
-            backup.data_fim = get_brazil_time().replace(tzinfo=None)
-            backup.erro_detalhes = str(backup_error)
-            db.session.commit()
-            
-            logger.error(f"Erro durante execução do backup: {str(backup_error)}")
-            return error_response('Erro durante execução do backup')
+        # Gerar o arquivo em segundo plano
+        desde = agendar_backup(current_app._get_current_object(), current_app.socketio, backup, compressao, incremental)
+        
+        # Registrar log da ação
+        client_info = get_client_info(request)
+        registrar_log_acao(
+            usuario_id=current_user.id,
+            acao=f'Criar backup: {tipo_backup}',
+            categoria='backup',
+            detalhes=f'Backup {tipo_backup} iniciado - Arquivo: {backup.nome_arquivo}',
+            ip_address=client_info['ip_address'],
+            user_agent=client_info['user_agent'],
+            recurso_afetado=str(backup.id),
+            tipo_recurso='backup'
+        )
+        
+        return json_response({
+            'message': 'Backup iniciado',
+            'backup': {
+                'id': backup.id,
+                'nome_arquivo': backup.nome_arquivo,
+                'tipo': backup.tipo,
+                'status': backup.status,
+                'compressao': backup.compressao,
+                'incremental_desde': desde.strftime('%d/%m/%Y %H:%M:%S') if desde else None
+            }
+        }, 202)
         
     except Exception as e:
         db.session.rollback()
         logger.error(f"Erro ao criar backup: {str(e)}")
         return error_response('Erro interno no servidor')
 
+@rotas_bp.route('/api/backup/<int:backup_id>/progresso')
+@login_required
+@setor_required('Administrador')
+def progresso_backup_api(backup_id):
+    """Progresso de um backup em execução"""
+    try:
+        if not BackupHistorico.query.get(backup_id):
+            return error_response('Backup não encontrado', 404)
+        return json_response(progresso_backup(backup_id))
+    except Exception as e:
+        logger.error(f"Erro ao obter progresso do backup: {str(e)}")
+        return error_response('Erro interno no servidor')
+
 @rotas_bp.route('/api/manutencao/limpar-logs', methods=['POST'])
 @login_required
 @setor_required('Administrador')
@@ -1293,28 +1043,12 @@ def limpar_logs():
         if dias_manter < 7:
             return error_response('Deve manter pelo menos 7 dias de logs', 400)
         
-        # Calcular data limite
-        data_limite = get_brazil_time().date() - timedelta(days=dias_manter)
-        
-        # Contar logs que serão removidos
-        logs_acesso_antigos = LogAcesso.query.filter(
-            func.date(LogAcesso.data_acesso) < data_limite
-        ).count()
-        
-        logs_acoes_antigos = LogAcao.query.filter(
-            func.date(LogAcao.data_acao) < data_limite
-        ).count()
-        
-        # Remover logs antigos
-        LogAcesso.query.filter(
-            func.date(LogAcesso.data_acesso) < data_limite
-        ).delete()
-        
-        LogAcao.query.filter(
-            func.date(LogAcao.data_acao) < data_limite
-        ).delete()
-        
-        db.session.commit()
+        # Remoção em lotes de ids por transação (não trava as tabelas de log)
+        from setores.ti.retencao_logs import aplicar_retencao
+        resultado = aplicar_retencao(dias_manter)
+        data_limite = resultado['data_limite']
+        logs_acesso_antigos = resultado['acesso']
+        logs_acoes_antigos = resultado['acoes']
         
         # Registrar log da ação
         client_info = get_client_info(request)
@@ -1342,6 +1076,58 @@ def limpar_logs():
         logger.error(f"Erro ao limpar logs: {str(e)}")
         return error_response('Erro interno no servidor')
 
+@rotas_bp.route('/api/manutencao/indices')
+@login_required
+@setor_required('Administrador')
+def verificar_indices():
+    """
+    Índices declarados, se existem no banco e o autoteste EXPLAIN das consultas chave
+
+    Só leitura; o csrf_token devolvido é o exigido (cabeçalho X-CSRF-Token) pelo
+    POST que cria os índices faltantes.
+    """
+    try:
+        from migracoes import autoteste_explain, status_indices
+        autoteste = autoteste_explain()
+        return json_response({
+            'indices': status_indices(),
+            'autoteste': autoteste,
+            'consultas_sem_indice': [item['consulta'] for item in autoteste if not item['usa_indice']],
+            'csrf_token': csrf.generate_csrf_token()
+        })
+    except Exception as e:
+        logger.error(f"Erro ao verificar índices: {str(e)}")
+        return error_response('Erro interno no servidor')
+
+@rotas_bp.route('/api/manutencao/indices', methods=['POST'])
+@login_required
+@setor_required('Administrador')
+def criar_indices():
+    """Cria os índices declarados que faltam no banco"""
+    csrf.protect_request()
+    try:
+        from migracoes import criar_indices_faltantes, status_indices
+        criados = criar_indices_faltantes()
+
+        client_info = get_client_info(request)
+        registrar_log_acao(
+            usuario_id=current_user.id,
+            acao='Criação de índices do banco',
+            categoria='manutencao',
+            detalhes=f"Índices criados: {', '.join(criados) or 'nenhum'}",
+            ip_address=client_info['ip_address'],
+            user_agent=client_info['user_agent']
+        )
+
+        return json_response({
+            'message': 'Índices verificados',
+            'criados': criados,
+            'indices': status_indices()
+        })
+    except Exception as e:
+        logger.error(f"Erro ao criar índices: {str(e)}")
+        return error_response('Erro interno no servidor')
+
 @rotas_bp.route('/api/manutencao/otimizar-banco', methods=['POST'])
 @login_required
 @setor_required('Administrador')
@@ -1437,8 +1223,8 @@ def status_sistema():
         ultimo_backup = BackupHistorico.query.order_by(desc(BackupHistorico.data_backup)).first()
         
         # Configurações críticas
-        modo_manutencao = ConfiguracaoAvancada.query.filter_by(chave='sistema.manutencao_modo').first()
-        debug_mode = ConfiguracaoAvancada.query.filter_by(chave='sistema.debug_mode').first()
+        modo_manutencao = valor_avancado('sistema.manutencao_modo', False)
+        debug_mode = valor_avancado('sistema.debug_mode', False)
         
         # Informações do sistema
         import psutil
@@ -1452,8 +1238,8 @@ def status_sistema():
         
         status_info = {
             'sistema_online': True,
-            'modo_manutencao': modo_manutencao.get_valor_tipado() if modo_manutencao else False,
-            'debug_ativo': debug_mode.get_valor_tipado() if debug_mode else False,
+            'modo_manutencao': modo_manutencao,
+            'debug_ativo': debug_mode,
             'estatisticas': {
                 'total_usuarios': total_usuarios,
                 'total_chamados': total_chamados,
@@ -1511,8 +1297,8 @@ def log_request():
             elif '/api/manutencao' in request.path:
                 categoria = 'manutencao'
             
-            # Registrar após a resposta para capturar o resultado
-            @current_app.after_request
+            # Registrar após a resposta para capturar o resultado (só desta requisição)
+            @after_this_request
             def log_response(response):
                 try:
                     sucesso = 200 <= response.status_code < 400
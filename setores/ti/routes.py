@@ -7,8 +7,11 @@ from flask import Blueprint, render_template, request, jsonify, current_app, fla
 from flask_login import LoginManager, login_required, current_user
 from auth.auth_helpers import setor_required
 from database import db, Chamado, User, Unidade, ProblemaReportado, ItemInternet, seed_unidades, get_brazil_time
-import requests
-from msal import ConfidentialClientApplication
+from setores.ti.sla_utils import registrar_snapshot_sla
+from setores.ti.sequencias import proximo_codigo_chamado, proximo_protocolo
+from setores.ti.email_fila import enfileirar_email, enviar_email_agora, TRANSPORTE_GRAPH
+from setores.ti.paginacao import CursorInvalido, paginar
+from setores.ti.tempo_real import SALA_TI, emitir
 
 ti_bp = Blueprint('ti', __name__, template_folder='templates')
 
@@ -36,40 +39,11 @@ def get_access_token():
         current_app.logger.warning("⚠️  Tentativa de obter token com email desabilitado")
         return None
 
-    try:
-        current_app.logger.info(f"🔄 Configurando MSAL Client...")
-        current_app.logger.info(f"🔑 CLIENT_ID: {CLIENT_ID[:8]}...")
-        current_app.logger.info(f"🏢 TENANT_ID: {TENANT_ID}")
-        current_app.logger.info(f"🌐 Authority: https://login.microsoftonline.com/{TENANT_ID}")
-
-        app = ConfidentialClientApplication(
-            client_id=CLIENT_ID,
-            client_credential=CLIENT_SECRET,
-            authority=f"https://login.microsoftonline.com/{TENANT_ID}"
-        )
-
-        current_app.logger.info(f"📋 Scopes: {SCOPES}")
-        current_app.logger.info("🔄 Solicitando token...")
-
-        result = app.acquire_token_for_client(scopes=SCOPES)
-
-        current_app.logger.info(f"📥 Resultado recebido: {list(result.keys())}")
-
-        if "access_token" in result:
-            current_app.logger.info("✅ Token obtido com sucesso!")
-            return result["access_token"]
-        else:
-            current_app.logger.error(f"❌ Erro ao obter token:")
-            current_app.logger.error(f"   - Error: {result.get('error', 'N/A')}")
-            current_app.logger.error(f"   - Error Description: {result.get('error_description', 'N/A')}")
-            current_app.logger.error(f"   - Error Codes: {result.get('error_codes', 'N/A')}")
-            current_app.logger.error(f"   - Correlation ID: {result.get('correlation_id', 'N/A')}")
-            return None
-    except Exception as e:
-        current_app.logger.error(f"❌ Exceção ao obter token: {str(e)}")
-        import traceback
-        current_app.logger.error(f"🔍 Stack trace: {traceback.format_exc()}")
-        return None
+    # Cliente MSAL compartilhado: o token fica em cache até perto de expirar
+    token = TRANSPORTE_GRAPH.obter_token()
+    if not token:
+        current_app.logger.error("❌ Erro ao obter token do Microsoft Graph")
+    return token
 
 def testar_configuracao_email():
     """Função para testar se as configurações de e-mail estão funcionando"""
@@ -113,76 +87,25 @@ def testar_configuracao_email():
         return False
 
 def enviar_email(assunto, corpo, destinatarios=None):
+    """Coloca o e-mail na fila de envio; retorna True se foi enfileirado"""
     if destinatarios is None:
         destinatarios = [EMAIL_TI]
 
-    current_app.logger.info(f"📧 === INICIANDO ENVIO DE EMAIL ===")
-    current_app.logger.info(f"📧 Destinatários: {destinatarios}")
-    current_app.logger.info(f"📋 Assunto: {assunto}")
-    current_app.logger.info(f"📄 Tamanho do corpo: {len(corpo)} caracteres")
-
-    token = get_access_token()
-    if not token:
-        current_app.logger.error("❌ Token não obtido, não é possível enviar e-mail")
-        return False
-
-    current_app.logger.info(f"🔑 Token obtido: {token[:20]}...")
-    current_app.logger.info(f"🌐 Endpoint: {ENDPOINT}")
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-
-    email_data = {
-        "message": {
-            "subject": assunto,
-            "body": {
-                "contentType": "Text",
-                "content": corpo
-            },
-            "toRecipients": [
-                {"emailAddress": {"address": addr}} for addr in destinatarios
-            ]
-        },
-        "saveToSentItems": "false"
-    }
-
-    current_app.logger.info(f"📦 Email data preparado para: {[r['emailAddress']['address'] for r in email_data['message']['toRecipients']]}")
-
     try:
-        response = requests.post(ENDPOINT, headers=headers, json=email_data)
-        if response.status_code == 202:
-            current_app.logger.info("���� E-mail enviado com sucesso!")
-            return True
-        else:
-            current_app.logger.error(f"❌ Falha ao enviar e-mail. Status: {response.status_code}")
-            return False
+        email = enfileirar_email(assunto, corpo, destinatarios)
+        current_app.logger.info(f"📧 E-mail {email.id} enfileirado para {destinatarios}: {assunto}")
+        return True
     except Exception as e:
-        current_app.logger.error(f"❌ Erro na requisição: {str(e)}")
+        db.session.rollback()
+        current_app.logger.error(f"❌ Erro ao enfileirar e-mail: {str(e)}")
         return False
 
 def gerar_codigo_chamado():
-    ultimo_chamado = Chamado.query.order_by(Chamado.id.desc()).first()
-    if ultimo_chamado and ultimo_chamado.codigo.startswith("EVQ-"):
-        try:
-            ultimo_numero = int(ultimo_chamado.codigo.split("-")[1])
-        except:
-            ultimo_numero = 0
-    else:
-        ultimo_numero = 0
-    
-    novo_numero = ultimo_numero + 1
-    numero_formatado = str(novo_numero).zfill(4)
-    return f"EVQ-{numero_formatado}"
+    return proximo_codigo_chamado()
 
 def gerar_protocolo():
-    # Usar horário do Brasil para gerar protocolo
-    data_brazil = get_brazil_time()
-    data_str = data_brazil.strftime("%Y%m%d")
-    count = Chamado.query.filter(Chamado.protocolo.like(f"{data_str}-%")).count()
-    novo_num = count + 1
-    return f"{data_str}-{novo_num}"
+    # Protocolo diário com base no horário do Brasil
+    return proximo_protocolo()
 
 @ti_bp.route('/test-email')
 @login_required
@@ -210,7 +133,7 @@ Se você recebeu este e-mail, o sistema está funcionando corretamente!
 Sistema de Suporte TI - Evoque Fitness
 """
 
-            resultado = enviar_email(assunto, corpo, [current_user.email])
+            resultado = enviar_email_agora(assunto, corpo, [current_user.email])
 
             if resultado:
                 return jsonify({
@@ -405,15 +328,16 @@ def abrir_chamado():
                     db.session.add(historico_reabertura)
 
                     db.session.commit()
+                    registrar_snapshot_sla(chamado_similar.id)
 
                     # Emitir evento Socket.IO para reabertura
                     if hasattr(current_app, 'socketio'):
-                        current_app.socketio.emit('chamado_reaberto', {
+                        emitir('chamado_reaberto', {
                             'id': chamado_similar.id,
                             'codigo': chamado_similar.codigo,
                             'solicitante': chamado_similar.solicitante,
                             'qtd_reaberturas': chamado_similar.qtd_reaberturas
-                        })
+                        }, [SALA_TI])
 
                     return jsonify({
                         'status': 'success',
@@ -445,9 +369,10 @@ def abrir_chamado():
 
                 db.session.add(novo_chamado)
                 db.session.commit()
+                registrar_snapshot_sla(novo_chamado.id)
 
                 if hasattr(current_app, 'socketio'):
-                    current_app.socketio.emit('novo_chamado', {
+                    emitir('novo_chamado', {
                         'id': novo_chamado.id,
                         'codigo': codigo_gerado,
                         'protocolo': protocolo_gerado,
@@ -457,7 +382,7 @@ def abrir_chamado():
                         'status': 'Aberto',
                         'data_abertura': data_abertura_brazil.isoformat(),
                         'prioridade': dados_chamado['prioridade']
-                    })
+                    }, [SALA_TI])
 
                 visita_tecnica_texto = (
                     f"Sim, agendada para {data_visita.strftime('%d/%m/%Y')}"
@@ -543,24 +468,20 @@ Por favor, não responda este e-mail, essa é uma mensagem automática!
 @setor_required('ti')
 def api_meus_chamados():
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = 5  # 5 itens por página
+        # Chamados do usuário logado; os abertos sem vínculo de usuário entram pelo email
+        chamados_query = Chamado.query.filter(db.or_(
+            Chamado.usuario_id == current_user.id,
+            db.and_(Chamado.usuario_id.is_(None), Chamado.email == current_user.email)
+        ))
         
-        # Buscar chamados do usuário logado com paginação
-        chamados_query = Chamado.query.filter_by(usuario_id=current_user.id).order_by(Chamado.data_abertura.desc())
-        
-        # Se não encontrar pelo usuario_id, buscar pelo email (fallback)
-        if chamados_query.count() == 0:
-            chamados_query = Chamado.query.filter_by(email=current_user.email).order_by(Chamado.data_abertura.desc())
-        
-        chamados_paginados = chamados_query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        # 5 itens por página (keyset com limit/cursor, page no formato legado)
+        try:
+            chamados, paginacao = paginar(chamados_query, Chamado.data_abertura, Chamado.id, limite_padrao=5)
+        except CursorInvalido:
+            return jsonify({'error': 'Cursor inválido'}), 400
         
         chamados_list = []
-        for chamado in chamados_paginados.items:
+        for chamado in chamados:
             data_abertura_brazil = chamado.get_data_abertura_brazil()
             chamados_list.append({
                 'id': chamado.id,
@@ -578,14 +499,7 @@ def api_meus_chamados():
         
         return jsonify({
             'chamados': chamados_list,
-            'pagination': {
-                'page': chamados_paginados.page,
-                'pages': chamados_paginados.pages,
-                'per_page': chamados_paginados.per_page,
-                'total': chamados_paginados.total,
-                'has_next': chamados_paginados.has_next,
-                'has_prev': chamados_paginados.has_prev
-            }
+            'pagination': paginacao
         })
     except Exception as e:
         current_app.logger.error(f"Erro ao buscar chamados do usuário: {str(e)}")
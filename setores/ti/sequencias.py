@@ -0,0 +1,106 @@
+"""
+Alocação de identificadores de chamados (código EVQ-NNNN e protocolo AAAAMMDD-N)
+
+Cada processo reserva blocos de números em SequenciaIdentificador com um
+UPDATE atômico em transação própria e os entrega da memória, sem consultar a
+tabela de chamados. Números de um bloco não usados antes de o processo
+encerrar são descartados (a sequência pode ter lacunas, nunca repetições).
+"""
+import threading
+from typing import Callable, Dict
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import db, Chamado, SequenciaIdentificador, get_brazil_time
+
+BLOCO_CODIGO = 10
+BLOCO_PROTOCOLO = 10
+TENTATIVAS_RESERVA = 5
+
+def _maior_sufixo(conn, coluna, prefixo: str) -> int:
+    """Maior sufixo numérico já usado com o prefixo (executado só na criação da sequência)"""
+    maior = 0
+    for (valor,) in conn.execute(select(coluna).where(coluna.like(f'{prefixo}%'))):
+        try:
+            maior = max(maior, int(valor[len(prefixo):]))
+        except (TypeError, ValueError):
+            continue
+    return maior
+
+def reservar_bloco(nome: str, quantidade: int, valor_inicial: Callable) -> int:
+    """
+    Reserva atomicamente os próximos números de uma sequência
+
+    Args:
+        nome: Nome da sequência
+        quantidade: Tamanho do bloco
+        valor_inicial: Função (conn) -> int com o último número já usado,
+            chamada apenas quando a sequência ainda não existe
+
+    Returns:
+        Último número do bloco reservado (o bloco é (retorno - quantidade, retorno])
+    """
+    tabela = SequenciaIdentificador.__table__
+    for _ in range(TENTATIVAS_RESERVA):
+        try:
+            with db.engine.begin() as conn:
+                atualizados = conn.execute(
+                    update(tabela).where(tabela.c.nome == nome).values(valor=tabela.c.valor + quantidade)
+                ).rowcount
+                if atualizados:
+                    return conn.execute(select(tabela.c.valor).where(tabela.c.nome == nome)).scalar_one()
+
+                ultimo = valor_inicial(conn) + quantidade
+                conn.execute(tabela.insert().values(nome=nome, valor=ultimo))
+                return ultimo
+        except IntegrityError:
+            # Outro processo criou a sequência ao mesmo tempo: repetir com UPDATE
+            continue
+    raise RuntimeError(f'Não foi possível reservar números da sequência {nome}')
+
+class AlocadorSequencia:
+    """Entrega números de uma sequência a partir de blocos reservados no banco"""
+
+    def __init__(self, nome: str, tamanho_bloco: int, valor_inicial: Callable):
+        self.nome = nome
+        self.tamanho_bloco = tamanho_bloco
+        self.valor_inicial = valor_inicial
+        self._proximo = 1
+        self._limite = 0
+        self._lock = threading.Lock()
+
+    def proximo(self) -> int:
+        with self._lock:
+            if self._proximo > self._limite:
+                self._limite = reservar_bloco(self.nome, self.tamanho_bloco, self.valor_inicial)
+                self._proximo = self._limite - self.tamanho_bloco + 1
+            numero = self._proximo
+            self._proximo += 1
+            return numero
+
+_alocador_codigo = AlocadorSequencia(
+    'codigo_chamado', BLOCO_CODIGO,
+    lambda conn: _maior_sufixo(conn, Chamado.__table__.c.codigo, 'EVQ-')
+)
+_alocadores_protocolo: Dict[str, AlocadorSequencia] = {}
+_protocolo_lock = threading.Lock()
+
+def proximo_codigo_chamado() -> str:
+    """Próximo código de chamado no formato EVQ-NNNN"""
+    return f"EVQ-{str(_alocador_codigo.proximo()).zfill(4)}"
+
+def proximo_protocolo() -> str:
+    """Próximo protocolo do dia (horário do Brasil) no formato AAAAMMDD-N"""
+    data_str = get_brazil_time().strftime("%Y%m%d")
+    with _protocolo_lock:
+        alocador = _alocadores_protocolo.get(data_str)
+        if alocador is None:
+            # Um contador por dia; os de dias anteriores não são mais usados
+            _alocadores_protocolo.clear()
+            alocador = AlocadorSequencia(
+                f'protocolo_{data_str}', BLOCO_PROTOCOLO,
+                lambda conn: _maior_sufixo(conn, Chamado.__table__.c.protocolo, f'{data_str}-')
+            )
+            _alocadores_protocolo[data_str] = alocador
+    return f"{data_str}-{alocador.proximo()}"
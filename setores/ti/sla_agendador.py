@@ -0,0 +1,329 @@
+"""
+Agendador de limiares de SLA
+
+Mantém um heap com o próximo limiar de SLA (risco, primeira resposta e
+resolução) de cada chamado em aberto e só acorda quando o mais próximo vence,
+emitindo o evento Socket.IO 'sla_alerta' e registrando a notificação.
+
+Cada worker mantém o próprio heap (alimentado pelas escritas que ele atende),
+então o mesmo limiar pode vencer em vários processos. O alerta é gravado junto
+com uma linha de AlertaSLA de chave única (chamado, evento, limiar): só o
+processo que consegue inserir a linha notifica e emite o evento.
+"""
+import heapq
+import logging
+import threading
+import time as time_module
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from database import db, get_brazil_time, BRAZIL_TZ
+from setores.ti.sla_utils import (
+    calcular_limiares_sla_lote,
+    atualizar_snapshot_sla,
+    STATUS_EM_ABERTO
+)
+from setores.ti.tempo_real import SALA_TI, emitir
+
+logger = logging.getLogger(__name__)
+
+# Limiares acompanhados, na ordem em que normalmente vencem
+EVENTOS_SLA = ('risco', 'primeira_resposta', 'resolucao')
+
+ESPERA_MAXIMA = 300  # segundos; o agendador acorda ao menos nesse intervalo
+TAMANHO_LOTE_LIMIARES = 1000
+
+class AgendadorSLA:
+    """Heap de limiares de SLA com invalidação preguiçosa por geração de chamado"""
+
+    def __init__(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self._condicao = threading.Condition()
+        self._heap: List[tuple] = []  # (instante_unix, chamado_id, evento, geracao)
+        self._geracoes: Dict[int, int] = {}
+        self._entradas_validas = 0
+        self._pendentes_por_chamado: Dict[int, int] = {}
+        self._reconstruir = True
+        self._reagendados_na_reconstrucao = None  # chamados reagendados durante uma reconstrução
+
+    # ---------------------------------------------------------------- agenda
+
+    def reagendar(self, chamado_ids: Iterable[int]):
+        """Recalcula os limiares dos chamados informados (chamar após escritas no chamado)"""
+        from database import Chamado
+
+        chamado_ids = list(dict.fromkeys(chamado_ids))
+        if not chamado_ids:
+            return
+        linhas = db.session.query(
+            Chamado.id, Chamado.prioridade, Chamado.status, Chamado.data_abertura,
+            Chamado.data_primeira_resposta, Chamado.data_conclusao
+        ).filter(Chamado.id.in_(chamado_ids)).all()
+        limiares = calcular_limiares_sla_lote(linhas)
+
+        with self._condicao:
+            for chamado_id in chamado_ids:
+                self._descartar(chamado_id)
+            self._inserir(limiares, time_module.time())
+            self._compactar()
+            if self._reagendados_na_reconstrucao is not None:
+                self._reagendados_na_reconstrucao.update(chamado_ids)
+            self._condicao.notify()
+
+    def solicitar_reconstrucao(self):
+        """Reconstrói o heap a partir do banco (ex.: após mudança de configuração de SLA)"""
+        with self._condicao:
+            self._reconstruir = True
+            self._condicao.notify()
+
+    def _reconstruir_do_banco(self):
+        """
+        Carrega os limiares futuros de todos os chamados em aberto
+
+        O novo heap é montado fora da trava e trocado de uma vez; os chamados
+        reagendados enquanto isso mantêm as entradas do reagendamento, que são
+        mais recentes que as lidas pela reconstrução.
+        """
+        from database import Chamado
+
+        agora = time_module.time()
+        with self._condicao:
+            self._reconstruir = False
+            self._reagendados_na_reconstrucao = set()
+
+        novas = []
+        ultimo_id = 0
+        while True:
+            linhas = db.session.query(
+                Chamado.id, Chamado.prioridade, Chamado.status, Chamado.data_abertura,
+                Chamado.data_primeira_resposta, Chamado.data_conclusao
+            ).filter(
+                Chamado.status.in_(STATUS_EM_ABERTO),
+                Chamado.id > ultimo_id
+            ).order_by(Chamado.id).limit(TAMANHO_LOTE_LIMIARES).all()
+            if not linhas:
+                break
+            ultimo_id = linhas[-1][0]
+            novas.extend(self._limiares_futuros(calcular_limiares_sla_lote(linhas), agora))
+
+        with self._condicao:
+            reagendados = self._reagendados_na_reconstrucao
+            self._reagendados_na_reconstrucao = None
+            heap = [entrada for entrada in self._heap if entrada[1] in reagendados and self._valida(entrada)]
+            geracoes = {chamado_id: self._geracoes[chamado_id] for chamado_id in reagendados if chamado_id in self._geracoes}
+            pendentes: Dict[int, int] = {}
+            for entrada in heap:
+                pendentes[entrada[1]] = pendentes.get(entrada[1], 0) + 1
+            for instante, chamado_id, evento in novas:
+                if chamado_id in reagendados:
+                    continue
+                heap.append((instante, chamado_id, evento, 0))
+                pendentes[chamado_id] = pendentes.get(chamado_id, 0) + 1
+            heapq.heapify(heap)
+            self._heap = heap
+            self._geracoes = geracoes
+            self._pendentes_por_chamado = pendentes
+            self._entradas_validas = len(heap)
+            carregados = self._entradas_validas
+
+        logger.info(f"Agendador de SLA: {carregados} limiares carregados")
+
+    @staticmethod
+    def _limiares_futuros(limiares: Dict[str, list], agora: float):
+        """(instante, chamado_id, evento) dos limiares ainda não vencidos"""
+        for indice, chamado_id in enumerate(limiares['id']):
+            for evento in EVENTOS_SLA:
+                instante = limiares[evento][indice]
+                if instante is not None and instante > agora:
+                    yield instante, chamado_id, evento
+
+    def _inserir(self, limiares: Dict[str, list], agora: float):
+        """Insere no heap apenas os limiares ainda não vencidos"""
+        for instante, chamado_id, evento in self._limiares_futuros(limiares, agora):
+            heapq.heappush(self._heap, (instante, chamado_id, evento, self._geracoes.get(chamado_id, 0)))
+            self._entradas_validas += 1
+            self._pendentes_por_chamado[chamado_id] = self._pendentes_por_chamado.get(chamado_id, 0) + 1
+
+    def _descartar(self, chamado_id: int):
+        """Invalida as entradas existentes de um chamado (removidas quando chegarem ao topo)"""
+        self._geracoes[chamado_id] = self._geracoes.get(chamado_id, 0) + 1
+        self._entradas_validas -= self._pendentes_por_chamado.pop(chamado_id, 0)
+
+    def _compactar(self):
+        """Remove entradas invalidadas quando passam a dominar o heap"""
+        if len(self._heap) > 2 * self._entradas_validas + 1000:
+            self._heap = [entrada for entrada in self._heap if self._valida(entrada)]
+            heapq.heapify(self._heap)
+
+    def _valida(self, entrada: tuple) -> bool:
+        _, chamado_id, _, geracao = entrada
+        return self._geracoes.get(chamado_id, 0) == geracao
+
+    def _retirar_vencidos(self, agora: float) -> List[tuple]:
+        """Retira do topo do heap as entradas válidas já vencidas"""
+        vencidos = []
+        while self._heap and self._heap[0][0] <= agora:
+            entrada = heapq.heappop(self._heap)
+            if not self._valida(entrada):
+                continue
+            chamado_id = entrada[1]
+            self._entradas_validas -= 1
+            restantes = self._pendentes_por_chamado.get(chamado_id, 0) - 1
+            if restantes > 0:
+                self._pendentes_por_chamado[chamado_id] = restantes
+            else:
+                self._pendentes_por_chamado.pop(chamado_id, None)
+            vencidos.append(entrada)
+        return vencidos
+
+    def _proxima_espera(self, agora: float) -> float:
+        while self._heap and not self._valida(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return ESPERA_MAXIMA
+        return min(max(self._heap[0][0] - agora, 0.0), ESPERA_MAXIMA)
+
+    # ---------------------------------------------------------------- disparo
+
+    def _disparar(self, vencidos: List[tuple]):
+        """Confirma cada limiar vencido contra o estado atual do chamado e notifica"""
+        from database import Chamado, SlaChamado
+
+        chamado_ids = list(dict.fromkeys(entrada[1] for entrada in vencidos))
+        atualizar_snapshot_sla(chamado_ids)
+        registros = {
+            chamado.id: (chamado, snapshot)
+            for chamado, snapshot in db.session.query(Chamado, SlaChamado).join(
+                SlaChamado, SlaChamado.chamado_id == Chamado.id
+            ).filter(Chamado.id.in_(chamado_ids)).all()
+        }
+
+        limiares = {(entrada[1], entrada[2]): entrada[0] for entrada in vencidos}
+        for (chamado_id, evento), instante in limiares.items():
+            chamado, snapshot = registros.get(chamado_id, (None, None))
+            if chamado is None or chamado.status not in STATUS_EM_ABERTO:
+                continue
+            confirmado = {
+                'risco': snapshot.sla_status == 'Em Risco',
+                'primeira_resposta': snapshot.violacao_primeira_resposta,
+                'resolucao': snapshot.violacao_resolucao
+            }[evento]
+            if confirmado:
+                self._notificar(chamado, snapshot, evento, instante)
+
+    @staticmethod
+    def _reservar_alerta(chamado_id: int, evento: str, instante: float) -> bool:
+        """
+        Grava (sem confirmar) a linha de AlertaSLA do limiar
+
+        Returns:
+            False se outro processo já alertou este limiar
+        """
+        from database import AlertaSLA
+
+        limiar = datetime.fromtimestamp(instante, BRAZIL_TZ).replace(tzinfo=None, second=0, microsecond=0)
+        db.session.add(AlertaSLA(chamado_id=chamado_id, evento=evento, limiar=limiar))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        return True
+
+    def _notificar(self, chamado, snapshot, evento: str, instante: float):
+        """Emite o evento Socket.IO e registra notificação do agente ou alerta do sistema"""
+        from database import ChamadoAgente, NotificacaoAgente, criar_alerta_sistema
+
+        titulos = {
+            'risco': f'Chamado {chamado.codigo} em risco de violar o SLA',
+            'primeira_resposta': f'Chamado {chamado.codigo} sem primeira resposta no prazo',
+            'resolucao': f'SLA de resolução violado no chamado {chamado.codigo}'
+        }
+        titulo = titulos[evento]
+        prazo = snapshot.prazo_expiracao.strftime('%d/%m/%Y %H:%M') if snapshot.prazo_expiracao else 'N/A'
+        mensagem = (f'{chamado.solicitante} - {chamado.problema} (prioridade {chamado.prioridade}). '
+                    f'{snapshot.percentual_tempo_usado}% do SLA utilizado, prazo: {prazo}.')
+        dados = {
+            'chamado_id': chamado.id,
+            'codigo': chamado.codigo,
+            'evento': evento,
+            'sla_status': snapshot.sla_status,
+            'prioridade': chamado.prioridade,
+            'percentual_tempo_usado': snapshot.percentual_tempo_usado,
+            'prazo_expiracao': prazo,
+            'timestamp': get_brazil_time().isoformat()
+        }
+
+        try:
+            if not self._reservar_alerta(chamado.id, evento, instante):
+                return
+            atribuicao = ChamadoAgente.query.filter_by(chamado_id=chamado.id, ativo=True).first()
+            if atribuicao:
+                notificacao = NotificacaoAgente(
+                    agente_id=atribuicao.agente_id,
+                    titulo=titulo,
+                    mensagem=mensagem,
+                    tipo=f'sla_{evento}',
+                    chamado_id=chamado.id,
+                    prioridade='normal' if evento == 'risco' else 'alta'
+                )
+                notificacao.set_metadados(dados)
+                db.session.add(notificacao)
+                db.session.commit()
+            else:
+                criar_alerta_sistema(
+                    tipo='sla',
+                    titulo=titulo,
+                    descricao=mensagem,
+                    severidade='media' if evento == 'risco' else 'alta',
+                    categoria='chamados',
+                    dados_contexto=dados
+                )
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Erro ao registrar notificação de SLA do chamado {chamado.id}: {str(e)}")
+
+        try:
+            emitir('sla_alerta', dados, [SALA_TI], socketio=self.socketio)
+        except Exception as socket_error:
+            logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
+
+    # ---------------------------------------------------------------- laço
+
+    def executar(self):
+        """Laço principal: dorme até o próximo limiar e dispara os vencidos"""
+        while True:
+            with self.app.app_context():
+                try:
+                    if self._reconstruir:
+                        self._reconstruir_do_banco()
+
+                    with self._condicao:
+                        vencidos = self._retirar_vencidos(time_module.time())
+                    if vencidos:
+                        self._disparar(vencidos)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Erro no agendador de SLA: {str(e)}")
+                finally:
+                    db.session.remove()
+
+            with self._condicao:
+                if not self._reconstruir:
+                    self._condicao.wait(self._proxima_espera(time_module.time()))
+
+_agendador: Optional[AgendadorSLA] = None
+
+def iniciar_agendador_sla(app, socketio) -> AgendadorSLA:
+    """Cria o agendador de SLA e inicia sua tarefa de fundo"""
+    global _agendador
+    _agendador = AgendadorSLA(app, socketio)
+    socketio.start_background_task(_agendador.executar)
+    return _agendador
+
+def obter_agendador_sla() -> Optional[AgendadorSLA]:
+    """Retorna o agendador em execução (None se não iniciado)"""
+    return _agendador
@@ -1,11 +1,14 @@
 """
 Utilitários para cálculo correto de SLA considerando horário comercial
 """
-from datetime import datetime, timedelta, time
-from typing import Optional, Dict, Tuple
+from datetime import datetime, timedelta, time, date
+from typing import Optional, Dict, Tuple, Iterable, List
 import pytz
 import json
+import numpy as np
 from database import get_brazil_time, Configuracao, db
+from setores.ti.calendario_comercial import obter_calendario_comercial, CalendarioComercial, SEGUNDOS_DIA
+from setores.ti.registro_configuracoes import obter_configuracoes
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,15 +34,13 @@ SLA_PADRAO = {
 }
 
 def carregar_configuracoes_sla():
-    """Carrega configurações de SLA do banco ou retorna padrões"""
+    """Configurações de SLA do registro em memória ou padrões"""
     try:
-        from database import obter_configuracoes_sla_dict
-        config = obter_configuracoes_sla_dict()
+        config = obter_configuracoes().sla
         if config:
-            logger.info("Configurações SLA carregadas do banco de dados")
-            return config
+            return dict(config)
         else:
-            logger.warning("Nenhuma configuração SLA encontrada, usando padrões")
+            logger.debug("Nenhuma configuração SLA encontrada, usando padrões")
             return SLA_PADRAO
     except Exception as e:
         logger.error(f"Erro ao carregar configurações SLA: {str(e)}")
@@ -85,6 +86,9 @@ def salvar_configuracoes_sla(config_sla: Dict, usuario_id=None):
                 tipo_recurso='configuracao_sla'
             )
 
+        if alteracoes:
+            invalidar_snapshot_sla()
+
         logger.info(f"Configurações SLA salvas: {alteracoes}")
         return True
 
@@ -94,15 +98,13 @@ def salvar_configuracoes_sla(config_sla: Dict, usuario_id=None):
         return False
 
 def carregar_configuracoes_horario_comercial():
-    """Carrega configurações de horário comercial do banco ou retorna padrões"""
+    """Configurações de horário comercial do registro em memória ou padrões"""
     try:
-        from database import obter_horario_comercial_dict
-        config = obter_horario_comercial_dict()
+        config = obter_configuracoes().horario_comercial
         if config:
-            logger.info("Configurações de horário comercial carregadas do banco de dados")
-            return config
+            return dict(config)
         else:
-            logger.warning("Nenhuma configuração de horário comercial encontrada, usando padrões")
+            logger.debug("Nenhuma configuração de horário comercial encontrada, usando padrões")
             return HORARIO_COMERCIAL
     except Exception as e:
         logger.error(f"Erro ao carregar configurações de horário comercial: {str(e)}")
@@ -110,16 +112,7 @@ def carregar_configuracoes_horario_comercial():
 
 def eh_horario_comercial(dt: datetime, config_horario: Dict = None) -> bool:
     """Verifica se um datetime está dentro do horário comercial"""
-    if config_horario is None:
-        config_horario = carregar_configuracoes_horario_comercial()
-
-    # Verificar dia da semana (0=segunda, 6=domingo)
-    if dt.weekday() not in config_horario['dias_semana']:
-        return False
-
-    # Verificar horário - usar < em vez de <= para o fim (18:00 não é mais horário comercial)
-    hora_atual = dt.time()
-    return config_horario['inicio'] <= hora_atual < config_horario['fim']
+    return obter_calendario_comercial(config_horario).eh_horario_comercial(dt)
 
 def calcular_horas_uteis(inicio: datetime, fim: datetime, config_horario: Dict = None) -> float:
     """
@@ -133,127 +126,14 @@ def calcular_horas_uteis(inicio: datetime, fim: datetime, config_horario: Dict =
     Returns:
         Número de horas úteis como float
     """
-    if config_horario is None:
-        config_horario = carregar_configuracoes_horario_comercial()
-    
-    # Garantir que as datas estão no timezone correto
-    if inicio.tzinfo is None:
-        inicio = BRAZIL_TZ.localize(inicio)
-    elif inicio.tzinfo != BRAZIL_TZ:
-        inicio = inicio.astimezone(BRAZIL_TZ)
-    
-    if fim.tzinfo is None:
-        fim = BRAZIL_TZ.localize(fim)
-    elif fim.tzinfo != BRAZIL_TZ:
-        fim = fim.astimezone(BRAZIL_TZ)
-    
-    if inicio >= fim:
-        return 0.0
-    
-    horas_uteis = 0.0
-    data_atual = inicio.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    while data_atual.date() <= fim.date():
-        # Pular fins de semana e feriados
-        if data_atual.weekday() not in config_horario['dias_semana']:
-            data_atual += timedelta(days=1)
-            continue
-        
-        # Definir início e fim do horário comercial para este dia
-        inicio_comercial = data_atual.replace(
-            hour=config_horario['inicio'].hour,
-            minute=config_horario['inicio'].minute
-        )
-        fim_comercial = data_atual.replace(
-            hour=config_horario['fim'].hour,
-            minute=config_horario['fim'].minute
-        )
-        
-        # Ajustar para o período efetivo
-        periodo_inicio = max(inicio, inicio_comercial)
-        periodo_fim = min(fim, fim_comercial)
-        
-        if periodo_inicio < periodo_fim:
-            delta = periodo_fim - periodo_inicio
-            horas_uteis += delta.total_seconds() / 3600
-        
-        data_atual += timedelta(days=1)
-    
-    return round(horas_uteis, 2)
+    calendario = obter_calendario_comercial(config_horario)
+    return round(calendario.horas_uteis(inicio, fim), 2)
 
 def obter_proximo_horario_comercial(dt: datetime, config_horario: Dict = None) -> datetime:
     """
     Retorna o próximo horário comercial após a data informada
     """
-    if config_horario is None:
-        config_horario = carregar_configuracoes_horario_comercial()
-    
-    # Garantir timezone correto
-    if dt.tzinfo is None:
-        dt = BRAZIL_TZ.localize(dt)
-    elif dt.tzinfo != BRAZIL_TZ:
-        dt = dt.astimezone(BRAZIL_TZ)
-    
-    # Se já está em horário comercial, retornar a própria data
-    if eh_horario_comercial(dt, config_horario):
-        return dt
-    
-    # Procurar próximo horário comercial
-    data_teste = dt
-    max_tentativas = 14  # Máximo 2 semanas
-    tentativas = 0
-    
-    while tentativas < max_tentativas:
-        # Se é um dia útil mas fora do horário, ir para início do próximo horário comercial
-        if data_teste.weekday() in config_horario['dias_semana']:
-            inicio_comercial = data_teste.replace(
-                hour=config_horario['inicio'].hour,
-                minute=config_horario['inicio'].minute,
-                second=0,
-                microsecond=0
-            )
-            
-            if data_teste.time() < config_horario['inicio']:
-                return inicio_comercial
-            elif data_teste.time() > config_horario['fim']:
-                # Ir para próximo dia útil
-                data_teste += timedelta(days=1)
-                data_teste = data_teste.replace(
-                    hour=config_horario['inicio'].hour,
-                    minute=config_horario['inicio'].minute,
-                    second=0,
-                    microsecond=0
-                )
-            else:
-                return data_teste
-        else:
-            # Não é dia útil, ir para próximo dia
-            data_teste += timedelta(days=1)
-            data_teste = data_teste.replace(
-                hour=config_horario['inicio'].hour,
-                minute=config_horario['inicio'].minute,
-                second=0,
-                microsecond=0
-            )
-        
-        # Verificar se encontrou um horário comercial
-        if eh_horario_comercial(data_teste, config_horario):
-            return data_teste
-        
-        tentativas += 1
-    
-    # Se não encontrou, retornar segunda-feira mais próxima
-    dias_para_segunda = (7 - data_teste.weekday()) % 7
-    if dias_para_segunda == 0:
-        dias_para_segunda = 7
-    
-    proxima_segunda = data_teste + timedelta(days=dias_para_segunda)
-    return proxima_segunda.replace(
-        hour=config_horario['inicio'].hour,
-        minute=config_horario['inicio'].minute,
-        second=0,
-        microsecond=0
-    )
+    return obter_calendario_comercial(config_horario).proximo_horario_comercial(dt)
 
 def calcular_prazo_sla(data_inicio: datetime, horas_sla: float, config_horario: Dict = None) -> datetime:
     """
@@ -267,48 +147,7 @@ def calcular_prazo_sla(data_inicio: datetime, horas_sla: float, config_horario:
     Returns:
         Data/hora quando o SLA expira
     """
-    if config_horario is None:
-        config_horario = carregar_configuracoes_horario_comercial()
-    
-    # Garantir timezone correto
-    if data_inicio.tzinfo is None:
-        data_inicio = BRAZIL_TZ.localize(data_inicio)
-    elif data_inicio.tzinfo != BRAZIL_TZ:
-        data_inicio = data_inicio.astimezone(BRAZIL_TZ)
-    
-    # Se não está em horário comercial, mover para próximo horário comercial
-    if not eh_horario_comercial(data_inicio, config_horario):
-        data_inicio = obter_proximo_horario_comercial(data_inicio, config_horario)
-    
-    horas_restantes = horas_sla
-    data_atual = data_inicio
-    
-    while horas_restantes > 0:
-        # Se não é horário comercial, pular para próximo
-        if not eh_horario_comercial(data_atual, config_horario):
-            data_atual = obter_proximo_horario_comercial(data_atual, config_horario)
-            continue
-        
-        # Calcular quantas horas restam no dia comercial atual
-        fim_comercial_hoje = data_atual.replace(
-            hour=config_horario['fim'].hour,
-            minute=config_horario['fim'].minute,
-            second=0,
-            microsecond=0
-        )
-        
-        horas_disponiveis_hoje = (fim_comercial_hoje - data_atual).total_seconds() / 3600
-        
-        if horas_restantes <= horas_disponiveis_hoje:
-            # SLA expira hoje
-            return data_atual + timedelta(hours=horas_restantes)
-        else:
-            # Descontar horas de hoje e ir para próximo dia útil
-            horas_restantes -= horas_disponiveis_hoje
-            data_atual += timedelta(days=1)
-            data_atual = obter_proximo_horario_comercial(data_atual, config_horario)
-    
-    return data_atual
+    return obter_calendario_comercial(config_horario).adicionar_horas_uteis(data_inicio, horas_sla)
 
 def calcular_sla_chamado_correto(chamado, config_sla: Dict = None, config_horario: Dict = None) -> Dict:
     """
@@ -483,74 +322,573 @@ def calcular_sla_chamado_correto(chamado, config_sla: Dict = None, config_horari
         'percentual_tempo_usado': round(percentual_tempo_usado, 1)
     }
 
+# ==================== AVALIAÇÃO DE SLA EM LOTE ====================
+
+# Colunas esperadas (nesta ordem) em cada linha recebida por avaliar_sla_lote
+COLUNAS_SLA_LOTE = ('id', 'prioridade', 'status', 'data_abertura', 'data_primeira_resposta', 'data_conclusao')
+
+STATUS_FINALIZADOS = ('Concluido', 'Cancelado')
+
+# Segundos entre o ordinal 0 usado pelo calendário comercial e a época Unix
+_EPOCA_UNIX = date(1970, 1, 1).toordinal() * SEGUNDOS_DIA
+
+def _segundos_utc(valores: List) -> np.ndarray:
+    """
+    Converte datetimes do banco para segundos Unix (NaN quando ausentes)
+
+    Valores sem tzinfo são tratados como UTC, igual a Chamado.get_data_*_brazil.
+    """
+    valores = [
+        v.astimezone(pytz.utc).replace(tzinfo=None) if v is not None and v.tzinfo is not None else v
+        for v in valores
+    ]
+    datas = np.array(valores, dtype='datetime64[us]')
+    segundos = datas.astype('int64').astype(np.float64) / 1e6
+    segundos[np.isnat(datas)] = np.nan
+    return segundos
+
+def _deslocamentos_brasil(instantes_utc: np.ndarray) -> np.ndarray:
+    """Deslocamento UTC (segundos) de America/Sao_Paulo em cada instante informado"""
+    return np.array([
+        pytz.utc.localize(datetime(1970, 1, 1) + timedelta(seconds=float(t))).astimezone(BRAZIL_TZ).utcoffset().total_seconds()
+        for t in instantes_utc
+    ], dtype=np.float64)
+
+def _segundos_locais(segundos_utc: np.ndarray) -> np.ndarray:
+    """Converte segundos Unix UTC para segundos do calendário no horário de São Paulo"""
+    locais = np.full_like(segundos_utc, np.nan)
+    validos = ~np.isnan(segundos_utc)
+    if not validos.any():
+        return locais
+    utc = segundos_utc[validos]
+
+    # O pytz é consultado só no início e no fim de cada dia distinto do lote;
+    # apenas dias com transição de horário de verão são resolvidos hora a hora
+    dias_unicos, indices = np.unique(np.floor(utc / SEGUNDOS_DIA), return_inverse=True)
+    inicio_dia = _deslocamentos_brasil(dias_unicos * SEGUNDOS_DIA)
+    fim_dia = _deslocamentos_brasil((dias_unicos + 1) * SEGUNDOS_DIA)
+    deslocamentos = inicio_dia[indices]
+    transicao = (inicio_dia != fim_dia)[indices]
+    if transicao.any():
+        horas_unicas, indices_hora = np.unique(np.floor(utc[transicao] / 3600), return_inverse=True)
+        deslocamentos[transicao] = _deslocamentos_brasil(horas_unicas * 3600)[indices_hora]
+
+    locais[validos] = utc + deslocamentos + _EPOCA_UNIX
+    return locais
+
+def _posicoes_uteis(intervalos, segundos: np.ndarray) -> np.ndarray:
+    """Versão vetorizada de CalendarioComercial.posicao"""
+    inicios, fins, acumulado, _ = intervalos
+    if not len(inicios):
+        return np.zeros_like(segundos)
+    i = np.searchsorted(inicios, segundos, side='right') - 1
+    ic = np.clip(i, 0, None)
+    posicoes = acumulado[ic] + np.minimum(segundos, fins[ic]) - inicios[ic]
+    return np.where(i < 0, acumulado[0], posicoes)
+
+def _horas_uteis_entre(posicao_inicio: np.ndarray, posicao_fim: np.ndarray) -> np.ndarray:
+    """Horas úteis arredondadas como em calcular_horas_uteis"""
+    return np.round(np.maximum(posicao_fim - posicao_inicio, 0.0) / 3600, 2)
+
+def _para_datetimes(segundos_locais: np.ndarray) -> List[Optional[datetime]]:
+    """Converte segundos do calendário em datetimes locais sem tzinfo"""
+    validos = ~np.isnan(segundos_locais)
+    micros = np.zeros(len(segundos_locais), dtype='int64')
+    micros[validos] = np.round((segundos_locais[validos] - _EPOCA_UNIX) * 1e6).astype('int64')
+    datas = micros.astype('datetime64[us]').astype(object)
+    return [d if ok else None for d, ok in zip(datas, validos.tolist())]
+
+def _coluna_opcional(valores: np.ndarray) -> List[Optional[float]]:
+    """Arredonda para 2 casas e usa None para ausentes ou zero (como no cálculo unitário)"""
+    vazios = np.isnan(valores) | (valores == 0)
+    return [None if vazio else v for v, vazio in zip(np.round(valores, 2).tolist(), vazios.tolist())]
+
+def avaliar_sla_lote(linhas: Iterable, config_sla: Dict = None, config_horario: Dict = None, agora: datetime = None) -> Dict[str, list]:
+    """
+    Calcula o SLA de vários chamados de uma só vez
+
+    Equivale a chamar calcular_sla_chamado_correto para cada chamado, mas opera
+    sobre arrays NumPy contra o calendário comercial pré-calculado.
+
+    Args:
+        linhas: Sequência de tuplas (ou Rows do SQLAlchemy) cujas seis primeiras
+            colunas seguem COLUNAS_SLA_LOTE; colunas extras são ignoradas
+        config_sla: Configurações de SLA
+        config_horario: Configurações de horário comercial
+        agora: Instante de referência para chamados em aberto
+
+    Returns:
+        Dicionário colunar: cada chave de calcular_sla_chamado_correto (mais 'id',
+        'sla_prazo_expiracao_brazil', 'data_abertura_brazil' e 'data_conclusao_brazil')
+        mapeada para uma lista
+    """
+    if config_sla is None:
+        config_sla = carregar_configuracoes_sla()
+    calendario = obter_calendario_comercial(config_horario)
+    if agora is None:
+        agora = get_brazil_time()
+
+    linhas = list(linhas)
+    n = len(linhas)
+    if n:
+        ids, prioridades, status, aberturas, primeiras_respostas, conclusoes = (
+            list(coluna) for coluna in zip(*(tuple(linha)[:6] for linha in linhas))
+        )
+    else:
+        ids, prioridades, status, aberturas, primeiras_respostas, conclusoes = [], [], [], [], [], []
+
+    limite_padrao = config_sla.get('resolucao_normal', 24)
+    sla_map = {
+        'Crítica': config_sla.get('resolucao_critica', 2),
+        'Urgente': config_sla.get('resolucao_urgente', 2),
+        'Alta': config_sla.get('resolucao_alta', 8),
+        'Normal': limite_padrao,
+        'Baixa': config_sla.get('resolucao_baixa', 72)
+    }
+    limite_primeira_resposta = config_sla.get('primeira_resposta', 4)
+
+    limites_config = [sla_map.get(p, limite_padrao) for p in prioridades]
+    limites = np.array(limites_config, dtype=np.float64)
+    finalizado = np.fromiter((s in STATUS_FINALIZADOS for s in status), dtype=bool, count=n)
+    em_aberto = np.fromiter((s == 'Aberto' for s in status), dtype=bool, count=n)
+
+    abertura_utc = _segundos_utc(aberturas)
+    resposta_utc = _segundos_utc(primeiras_respostas)
+    conclusao_utc = _segundos_utc(conclusoes)
+    agora_utc = agora.timestamp()
+
+    abertura_local, resposta_local, conclusao_local = np.split(
+        _segundos_locais(np.concatenate([abertura_utc, resposta_utc, conclusao_utc])), 3
+    )
+    agora_local = CalendarioComercial.para_segundos(CalendarioComercial.para_local(agora))
+
+    tem_abertura = ~np.isnan(abertura_utc)
+    tem_resposta = ~np.isnan(resposta_utc)
+    tem_conclusao = ~np.isnan(conclusao_utc)
+    usa_conclusao = finalizado & tem_conclusao
+
+    fim_utc = np.where(usa_conclusao, conclusao_utc, agora_utc)
+    fim_local = np.where(usa_conclusao, conclusao_local, agora_local)
+
+    # Cobertura do calendário garantida antes de qualquer posição ser calculada,
+    # para que todas venham do mesmo snapshot de intervalos
+    todos = np.concatenate([abertura_local, resposta_local, conclusao_local, [agora_local]])
+    todos = todos[~np.isnan(todos)]
+    intervalos = calendario.intervalos_numpy(todos.min(), todos.max())
+
+    pos_abertura = _posicoes_uteis(intervalos, abertura_local)
+    pos_fim = _posicoes_uteis(intervalos, fim_local)
+    pos_resposta = _posicoes_uteis(intervalos, resposta_local)
+    pos_conclusao = _posicoes_uteis(intervalos, conclusao_local)
+
+    horas_decorridas = (fim_utc - abertura_utc) / 3600
+    horas_uteis = _horas_uteis_entre(pos_abertura, pos_fim)
+    percentual = np.where(limites > 0, horas_uteis / np.where(limites > 0, limites, 1) * 100, 0.0)
+
+    # Primeira resposta
+    tempo_resposta = np.where(tem_resposta, (resposta_utc - abertura_utc) / 3600,
+                              np.where(em_aberto, np.nan, horas_decorridas))
+    tempo_resposta_uteis = np.where(tem_resposta, _horas_uteis_entre(pos_abertura, pos_resposta),
+                                    np.where(em_aberto, np.nan, horas_uteis))
+    violacao_resposta = np.where(tem_resposta, tempo_resposta_uteis > limite_primeira_resposta,
+                                 horas_uteis > limite_primeira_resposta)
+
+    # Resolução
+    tempo_resolucao = np.where(finalizado, np.where(tem_conclusao, (conclusao_utc - abertura_utc) / 3600, horas_decorridas), np.nan)
+    tempo_resolucao_uteis = np.where(finalizado, np.where(tem_conclusao, _horas_uteis_entre(pos_abertura, pos_conclusao), horas_uteis), np.nan)
+    violacao_resolucao = np.where(finalizado, tempo_resolucao_uteis > limites, horas_uteis > limites)
+
+    sla_status = np.select(
+        [~tem_abertura, violacao_resolucao, finalizado, percentual >= 80],
+        ['Indefinido', 'Violado', 'Cumprido', 'Em Risco'],
+        default='Dentro do Prazo'
+    )
+
+    # Prazo de expiração: início + N horas úteis (ou próximo horário comercial se N <= 0)
+    inicios, fins, acumulado, acumulado_fim = intervalos
+    if len(inicios) and tem_abertura.any():
+        alvo = pos_abertura + limites * 3600
+        calendario.estender_ate_posicao(float(np.nanmax(alvo)))
+        inicios, fins, acumulado, acumulado_fim = calendario.intervalos_numpy()
+        ultimo = len(inicios) - 1
+        j = np.clip(np.searchsorted(acumulado_fim, alvo, side='left'), 0, ultimo)
+        prazo_local = inicios[j] + np.maximum(alvo - acumulado[j], 0.0)
+
+        i = np.searchsorted(inicios, abertura_local, side='right') - 1
+        dentro = (i >= 0) & (abertura_local < fins[np.clip(i, 0, None)])
+        proximo = np.where(dentro, abertura_local, inicios[np.clip(i + 1, 0, ultimo)])
+        prazo_local = np.where(limites > 0, prazo_local, proximo)
+    else:
+        prazo_local = abertura_local.copy()
+    prazo_local[~tem_abertura] = np.nan
+
+    # Chamados sem data de abertura recebem os valores padrão do cálculo unitário
+    horas_decorridas[~tem_abertura] = 0
+    horas_uteis[~tem_abertura] = 0
+    percentual[~tem_abertura] = 0
+    violacao_resposta[~tem_abertura] = False
+    violacao_resolucao[~tem_abertura] = False
+    limites_config = [limite_padrao if not ok else limite for limite, ok in zip(limites_config, tem_abertura.tolist())]
+    for coluna in (tempo_resposta, tempo_resposta_uteis, tempo_resolucao, tempo_resolucao_uteis):
+        coluna[~tem_abertura] = np.nan
+
+    prazos = _para_datetimes(prazo_local)
+
+    return {
+        'id': ids,
+        'horas_decorridas': np.round(horas_decorridas, 2).tolist(),
+        'horas_uteis_decorridas': np.round(horas_uteis, 2).tolist(),
+        'tempo_primeira_resposta': _coluna_opcional(tempo_resposta),
+        'tempo_primeira_resposta_uteis': _coluna_opcional(tempo_resposta_uteis),
+        'tempo_resolucao': _coluna_opcional(tempo_resolucao),
+        'tempo_resolucao_uteis': _coluna_opcional(tempo_resolucao_uteis),
+        'sla_limite': limites_config,
+        'sla_prazo_expiracao': [d.strftime('%d/%m/%Y %H:%M:%S') if d else None for d in prazos],
+        'sla_status': sla_status.tolist(),
+        'violacao_primeira_resposta': violacao_resposta.tolist(),
+        'violacao_resolucao': violacao_resolucao.tolist(),
+        'prioridade': prioridades,
+        'percentual_tempo_usado': np.round(percentual, 1).tolist(),
+        'sla_prazo_expiracao_brazil': prazos,
+        'data_abertura_brazil': _para_datetimes(abertura_local),
+        'data_conclusao_brazil': _para_datetimes(conclusao_local)
+    }
+
+# Campos de avaliar_sla_lote que compõem o dicionário de calcular_sla_chamado_correto
+CAMPOS_SLA = (
+    'horas_decorridas', 'horas_uteis_decorridas', 'tempo_primeira_resposta',
+    'tempo_primeira_resposta_uteis', 'tempo_resolucao', 'tempo_resolucao_uteis',
+    'sla_limite', 'sla_prazo_expiracao', 'sla_status', 'violacao_primeira_resposta',
+    'violacao_resolucao', 'prioridade', 'percentual_tempo_usado'
+)
+
+def sla_lote_item(lote: Dict[str, list], indice: int) -> Dict:
+    """Extrai de um resultado de avaliar_sla_lote o dicionário de SLA de um chamado"""
+    return {campo: lote[campo][indice] for campo in CAMPOS_SLA}
+
+# ==================== LIMIARES DE SLA ====================
+
+# Folga (segundos) somada a cada limiar para que, ao disparar, o valor
+# arredondado de horas úteis já tenha cruzado o limite
+MARGEM_LIMIAR = 1.0
+
+def _segundos_unix(segundos_locais: np.ndarray) -> np.ndarray:
+    """Converte segundos do calendário (horário de São Paulo) para segundos Unix UTC"""
+    estimativa = segundos_locais - _EPOCA_UNIX + 3 * 3600
+    return estimativa + (segundos_locais - _segundos_locais(estimativa))
+
+def calcular_limiares_sla_lote(linhas: Iterable, config_sla: Dict = None, config_horario: Dict = None) -> Dict[str, list]:
+    """
+    Calcula, para chamados em aberto, os instantes em que cada limiar de SLA é cruzado
+
+    Os limiares são: entrada em risco (80% do prazo), violação da primeira
+    resposta e violação da resolução, com a mesma regra de arredondamento de
+    calcular_sla_chamado_correto.
+
+    Args:
+        linhas: Sequência no formato de COLUNAS_SLA_LOTE
+        config_sla: Configurações de SLA
+        config_horario: Configurações de horário comercial
+
+    Returns:
+        Dicionário colunar com 'id', 'risco', 'primeira_resposta' e 'resolucao';
+        os instantes são timestamps Unix (None quando o limiar não se aplica)
+    """
+    if config_sla is None:
+        config_sla = carregar_configuracoes_sla()
+    calendario = obter_calendario_comercial(config_horario)
+
+    linhas = [tuple(linha)[:6] for linha in linhas]
+    ids = [linha[0] for linha in linhas]
+    vazios = [None] * len(linhas)
+    if not linhas or not calendario.possui_expediente:
+        return {'id': ids, 'risco': vazios, 'primeira_resposta': list(vazios), 'resolucao': list(vazios)}
+
+    _, prioridades, status, aberturas, primeiras_respostas, _ = (list(coluna) for coluna in zip(*linhas))
+
+    limite_padrao = config_sla.get('resolucao_normal', 24)
+    sla_map = {
+        'Crítica': config_sla.get('resolucao_critica', 2),
+        'Urgente': config_sla.get('resolucao_urgente', 2),
+        'Alta': config_sla.get('resolucao_alta', 8),
+        'Normal': limite_padrao,
+        'Baixa': config_sla.get('resolucao_baixa', 72)
+    }
+    limites = np.array([sla_map.get(p, limite_padrao) for p in prioridades], dtype=np.float64)
+    limite_primeira_resposta = float(config_sla.get('primeira_resposta', 4))
+
+    em_aberto = np.array([s not in STATUS_FINALIZADOS for s in status], dtype=bool)
+    sem_resposta = np.array([r is None for r in primeiras_respostas], dtype=bool)
+    abertura_local = _segundos_locais(_segundos_utc(aberturas))
+    validos = em_aberto & ~np.isnan(abertura_local)
+    if not validos.any():
+        return {'id': ids, 'risco': vazios, 'primeira_resposta': list(vazios), 'resolucao': list(vazios)}
+
+    intervalos = calendario.intervalos_numpy(np.nanmin(abertura_local[validos]), np.nanmax(abertura_local[validos]))
+    pos_abertura = _posicoes_uteis(intervalos, abertura_local)
+
+    # Horas úteis (antes do arredondamento para 2 casas) em que cada limiar é cruzado
+    horas_limiar = {
+        'risco': np.where(limites > 0, np.maximum(limites * 0.8 - 0.005, 0.0), np.nan),
+        'primeira_resposta': np.where(sem_resposta, limite_primeira_resposta + 0.005, np.nan),
+        'resolucao': limites + 0.005
+    }
+
+    alvos = np.concatenate([pos_abertura + horas * 3600 for horas in horas_limiar.values()])
+    alvos[~np.tile(validos, len(horas_limiar))] = np.nan
+    calendario.estender_ate_posicao(float(np.nanmax(alvos)))
+    inicios, _, acumulado, acumulado_fim = calendario.intervalos_numpy()
+
+    definidos = ~np.isnan(alvos)
+    j = np.clip(np.searchsorted(acumulado_fim, np.where(definidos, alvos, 0.0), side='left'), 0, len(inicios) - 1)
+    instantes_locais = np.where(definidos, inicios[j] + np.maximum(alvos - acumulado[j], 0.0), np.nan)
+    instantes = _segundos_unix(instantes_locais) + MARGEM_LIMIAR
+
+    resultado = {'id': ids}
+    for nome, coluna in zip(horas_limiar, np.split(instantes, len(horas_limiar))):
+        resultado[nome] = [None if np.isnan(v) else v for v in coluna.tolist()]
+    return resultado
+
+# ==================== SNAPSHOT DE SLA ====================
+
+STATUS_EM_ABERTO = ('Aberto', 'Aguardando')
+TAMANHO_LOTE_SNAPSHOT = 500
+INTERVALO_VARREDURA_SLA = 60  # segundos entre varreduras dos chamados em aberto
+TRAVA_VARREDURA_SLA = 'varredura_sla'  # só o processo que detém a trava executa a varredura
+
+def atualizar_snapshot_sla(chamado_ids: Iterable[int], config_sla: Dict = None, config_horario: Dict = None,
+                           agora: datetime = None, commit: bool = True) -> int:
+    """
+    Recalcula e grava o estado de SLA (SlaChamado) dos chamados informados
+
+    Args:
+        chamado_ids: IDs dos chamados a atualizar
+        config_sla: Configurações de SLA
+        config_horario: Configurações de horário comercial
+        agora: Instante de referência para chamados em aberto
+        commit: Se deve confirmar a transação ao final
+
+    Returns:
+        Quantidade de snapshots gravados
+    """
+    from database import Chamado, SlaChamado
+
+    chamado_ids = list(dict.fromkeys(chamado_ids))
+    if not chamado_ids:
+        return 0
+    if config_sla is None:
+        config_sla = carregar_configuracoes_sla()
+    if config_horario is None:
+        config_horario = carregar_configuracoes_horario_comercial()
+    if agora is None:
+        agora = get_brazil_time()
+    data_calculo = agora.replace(tzinfo=None)
+
+    total = 0
+    for inicio in range(0, len(chamado_ids), TAMANHO_LOTE_SNAPSHOT):
+        ids_lote = chamado_ids[inicio:inicio + TAMANHO_LOTE_SNAPSHOT]
+        chamados = db.session.query(
+            Chamado.id, Chamado.prioridade, Chamado.status, Chamado.data_abertura,
+            Chamado.data_primeira_resposta, Chamado.data_conclusao
+        ).filter(Chamado.id.in_(ids_lote)).all()
+        if not chamados:
+            continue
+
+        lote = avaliar_sla_lote(chamados, config_sla, config_horario, agora)
+        existentes = {
+            snapshot.chamado_id: snapshot
+            for snapshot in SlaChamado.query.filter(SlaChamado.chamado_id.in_(ids_lote)).all()
+        }
+
+        for indice, chamado in enumerate(chamados):
+            snapshot = existentes.get(chamado.id)
+            if snapshot is None:
+                snapshot = SlaChamado(chamado_id=chamado.id)
+                db.session.add(snapshot)
+
+            snapshot.prioridade = chamado.prioridade
+            snapshot.status_chamado = chamado.status
+            snapshot.sla_status = lote['sla_status'][indice]
+            snapshot.sla_limite = lote['sla_limite'][indice]
+            prazo = lote['sla_prazo_expiracao_brazil'][indice]
+            snapshot.prazo_expiracao = prazo.replace(tzinfo=None) if prazo else None
+            snapshot.horas_decorridas = lote['horas_decorridas'][indice]
+            snapshot.horas_uteis_decorridas = lote['horas_uteis_decorridas'][indice]
+            snapshot.percentual_tempo_usado = lote['percentual_tempo_usado'][indice]
+            snapshot.tempo_primeira_resposta_uteis = lote['tempo_primeira_resposta_uteis'][indice]
+            snapshot.tempo_resolucao_uteis = lote['tempo_resolucao_uteis'][indice]
+            snapshot.violacao_primeira_resposta = lote['violacao_primeira_resposta'][indice]
+            snapshot.violacao_resolucao = lote['violacao_resolucao'][indice]
+            snapshot.data_abertura = chamado.data_abertura
+            snapshot.data_calculo = data_calculo
+            snapshot.desatualizado = False
+            total += 1
+
+    if commit:
+        db.session.commit()
+    return total
+
+def registrar_snapshot_sla(*chamado_ids: int):
+    """
+    Atualiza o snapshot e os limiares agendados de SLA após uma escrita no chamado
+
+    Falhas são apenas registradas no log: o snapshot é derivado e será
+    corrigido pela próxima varredura.
+    """
+    try:
+        atualizar_snapshot_sla(chamado_ids)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Erro ao atualizar snapshot de SLA dos chamados {chamado_ids}: {str(e)}")
+
+    try:
+        from setores.ti.sla_agendador import obter_agendador_sla
+        agendador = obter_agendador_sla()
+        if agendador:
+            agendador.reagendar(chamado_ids)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Erro ao reagendar limiares de SLA dos chamados {chamado_ids}: {str(e)}")
+
+def varrer_sla_abertos(agora: datetime = None) -> int:
+    """
+    Atualiza o snapshot de SLA dos chamados em aberto, dos que ainda não têm
+    snapshot e dos marcados como desatualizados
+
+    Chamados finalizados não mudam de status de SLA com o tempo, então só são
+    recalculados quando alterados, quando faltam ou após mudança de configuração.
+
+    Returns:
+        Quantidade de snapshots gravados
+    """
+    from database import Chamado, SlaChamado
+
+    ids = [
+        chamado_id for (chamado_id,) in db.session.query(Chamado.id).outerjoin(
+            SlaChamado, SlaChamado.chamado_id == Chamado.id
+        ).filter(
+            db.or_(Chamado.status.in_(STATUS_EM_ABERTO), SlaChamado.id.is_(None),
+                   SlaChamado.desatualizado == True)
+        ).all()
+    ]
+    return atualizar_snapshot_sla(ids, agora=agora)
+
+def invalidar_snapshot_sla():
+    """
+    Marca todos os snapshots de SLA como desatualizados após mudanças de configuração
+
+    Os valores atuais continuam visíveis (a lista de chamados em risco não fica
+    vazia) até a próxima varredura recalculá-los no lugar; o agendador de
+    limiares recarrega o heap.
+    """
+    from database import SlaChamado
+
+    SlaChamado.query.update({'desatualizado': True}, synchronize_session=False)
+    db.session.commit()
+
+    from setores.ti.sla_agendador import obter_agendador_sla
+    agendador = obter_agendador_sla()
+    if agendador:
+        agendador.solicitar_reconstrucao()
+
+def iniciar_varredura_sla(app, socketio, intervalo: int = INTERVALO_VARREDURA_SLA):
+    """
+    Inicia a tarefa de fundo que mantém os snapshots de SLA dos chamados em aberto
+
+    Todos os workers iniciam a tarefa, mas só o que detém a trava de varredura
+    (renovada a cada ciclo) executa; se ele parar, outro assume quando a trava vence.
+    """
+    from setores.ti.travas import adquirir_trava
+
+    def _loop():
+        while True:
+            with app.app_context():
+                try:
+                    if adquirir_trava(TRAVA_VARREDURA_SLA, 3 * intervalo):
+                        atualizados = varrer_sla_abertos()
+                        logger.debug(f"Varredura de SLA: {atualizados} snapshots atualizados")
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Erro na varredura de SLA: {str(e)}")
+                finally:
+                    db.session.remove()
+            socketio.sleep(intervalo)
+
+    return socketio.start_background_task(_loop)
+
 def obter_metricas_sla_consolidadas(period_days: int = 30) -> Dict:
     """
     Obtém métricas consolidadas de SLA para o período especificado
     Violações só são contadas para chamados abertos (não concluídos/cancelados)
 
+    As métricas são agregadas a partir do snapshot de SLA (SlaChamado); chamados
+    do período ainda sem snapshot são calculados antes da agregação.
+
     Args:
         period_days: Número de dias para análise
 
     Returns:
         Dicionário com métricas consolidadas
     """
-    from database import Chamado
-    from sqlalchemy import func, and_
-
-    config_sla = carregar_configuracoes_sla()
-    config_horario = carregar_configuracoes_horario_comercial()
+    from database import Chamado, SlaChamado
+    from sqlalchemy import func
 
     # Data de corte
-    data_corte = get_brazil_time() - timedelta(days=period_days)
-
-    # Buscar chamados do período
-    chamados = Chamado.query.filter(
-        Chamado.data_abertura >= data_corte.replace(tzinfo=None)
-    ).all()
-
-    total_chamados = len(chamados)
-    chamados_cumpridos = 0
+    data_corte = get_brazil_time().replace(tzinfo=None) - timedelta(days=period_days)
+
+    # Garantir snapshot para os chamados do período que ainda não têm
+    faltantes = [
+        chamado_id for (chamado_id,) in db.session.query(Chamado.id).outerjoin(
+            SlaChamado, SlaChamado.chamado_id == Chamado.id
+        ).filter(
+            Chamado.data_abertura >= data_corte,
+            SlaChamado.id.is_(None)
+        ).all()
+    ]
+    if faltantes:
+        atualizar_snapshot_sla(faltantes)
+
+    contagens = db.session.query(
+        SlaChamado.status_chamado,
+        SlaChamado.sla_status,
+        func.count(SlaChamado.id)
+    ).filter(
+        SlaChamado.data_abertura >= data_corte
+    ).group_by(SlaChamado.status_chamado, SlaChamado.sla_status).all()
+
+    total_chamados = 0
     chamados_violados = 0  # Só chamados ABERTOS com violação
     chamados_em_risco = 0  # Só chamados ABERTOS em risco
     chamados_abertos = 0
     chamados_concluidos_no_prazo = 0
     chamados_concluidos_com_violacao = 0
 
-    tempo_total_resolucao = 0
-    tempo_total_primeira_resposta = 0
-    count_resolvidos = 0
-    count_primeira_resposta = 0
-
-    for chamado in chamados:
-        sla_info = calcular_sla_chamado_correto(chamado, config_sla, config_horario)
-
+    for status_chamado, sla_status, quantidade in contagens:
+        total_chamados += quantidade
         # Separar lógica entre chamados abertos e fechados
-        if chamado.status in ['Aberto', 'Aguardando']:
-            chamados_abertos += 1
+        if status_chamado in STATUS_EM_ABERTO:
+            chamados_abertos += quantidade
             # Para chamados abertos, contar violações e riscos
-            if sla_info['sla_status'] == 'Violado':
-                chamados_violados += 1
-            elif sla_info['sla_status'] == 'Em Risco':
-                chamados_em_risco += 1
+            if sla_status == 'Violado':
+                chamados_violados += quantidade
+            elif sla_status == 'Em Risco':
+                chamados_em_risco += quantidade
         else:
             # Para chamados fechados, só contar para estatísticas gerais
-            if sla_info['sla_status'] == 'Cumprido':
-                chamados_concluidos_no_prazo += 1
-            elif sla_info['sla_status'] == 'Violado':
-                chamados_concluidos_com_violacao += 1
-
-        # Métricas de tempo (todos os chamados)
-        if sla_info['tempo_resolucao_uteis']:
-            tempo_total_resolucao += sla_info['tempo_resolucao_uteis']
-            count_resolvidos += 1
-
-        if sla_info['tempo_primeira_resposta_uteis']:
-            tempo_total_primeira_resposta += sla_info['tempo_primeira_resposta_uteis']
-            count_primeira_resposta += 1
-    
-    # Calcular médias
-    tempo_medio_resolucao = (tempo_total_resolucao / count_resolvidos) if count_resolvidos > 0 else 0
-    tempo_medio_primeira_resposta = (tempo_total_primeira_resposta / count_primeira_resposta) if count_primeira_resposta > 0 else 0
+            if sla_status == 'Cumprido':
+                chamados_concluidos_no_prazo += quantidade
+            elif sla_status == 'Violado':
+                chamados_concluidos_com_violacao += quantidade
+
+    # Métricas de tempo (todos os chamados; tempos zerados são gravados como NULL)
+    tempo_medio_resolucao, tempo_medio_primeira_resposta = db.session.query(
+        func.avg(SlaChamado.tempo_resolucao_uteis),
+        func.avg(SlaChamado.tempo_primeira_resposta_uteis)
+    ).filter(
+        SlaChamado.data_abertura >= data_corte
+    ).one()
+    tempo_medio_resolucao = float(tempo_medio_resolucao or 0)
+    tempo_medio_primeira_resposta = float(tempo_medio_primeira_resposta or 0)
 
     # Calcular percentual de cumprimento baseado em chamados concluídos
     total_concluidos = chamados_concluidos_no_prazo + chamados_concluidos_com_violacao
@@ -0,0 +1,193 @@
+"""
+Entrega dos eventos Socket.IO por salas, fila de mensagens entre processos
+e agrupamento de atualizações em rajada
+
+Salas (entrada automática na conexão, conforme o usuário autenticado):
+  - admin: administradores
+  - ti: quem atende chamados (administradores, agentes ativos e setor TI)
+  - agentes / agente_<id>: agentes de suporte ativos
+  - usuario_<id> e setor_<nome>: cada usuário e cada setor dele
+
+Com SOCKETIO_MESSAGE_QUEUE definido (redis://, amqp://, ...), os emits de um
+processo chegam aos clientes conectados nos demais. O valor local:// usa uma
+fila em memória que liga servidores do mesmo processo (testes).
+
+Eventos listados em EVENTOS_AGRUPADOS são retidos por INTERVALO_AGRUPAMENTO_MS;
+as atualizações do mesmo registro são combinadas e saem juntas no evento
+lote_eventos ({'eventos': [{'evento': ..., 'dados': ...}]}).
+"""
+import json
+import logging
+import queue
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import socketio as python_socketio
+from flask import current_app
+from flask_socketio import join_room
+
+logger = logging.getLogger(__name__)
+
+SALA_ADMIN = 'admin'
+SALA_TI = 'ti'
+SALA_AGENTES = 'agentes'
+
+INTERVALO_AGRUPAMENTO_MS = 250
+EVENTO_LOTE = 'lote_eventos'
+
+# evento -> (campo que identifica o registro, campos que mantêm o primeiro valor)
+EVENTOS_AGRUPADOS = {
+    'status_atualizado': ('chamado_id', ('status_anterior',)),
+    'status_atualizado_setor': ('chamado_id', ('status_anterior',)),
+    'chamado_atualizado': ('chamado_id', ()),
+    'usuario_bloqueio_alterado': ('usuario_id', ('status_anterior',)),
+    'backup_progresso': ('id', ()),
+}
+
+def sala_agente(agente_id: int) -> str:
+    return f'agente_{agente_id}'
+
+def sala_usuario(usuario_id: int) -> str:
+    return f'usuario_{usuario_id}'
+
+def sala_setor(setor: str) -> str:
+    return f"setor_{(setor or '').strip().lower()}"
+
+# ==================== SALAS ====================
+
+def salas_do_usuario(usuario) -> List[str]:
+    """Salas em que o usuário recebe eventos"""
+    from database import AgenteSuporte
+
+    salas = [sala_usuario(usuario.id)]
+    salas += [sala_setor(setor) for setor in (usuario.setores or []) if setor]
+    if usuario.nivel_acesso == 'Administrador':
+        salas += [SALA_ADMIN, SALA_TI]
+    elif usuario.tem_acesso_setor('ti'):
+        salas.append(SALA_TI)
+
+    agente = AgenteSuporte.query.filter_by(usuario_id=usuario.id, ativo=True).first()
+    if agente:
+        salas += [SALA_AGENTES, sala_agente(agente.id)]
+        if SALA_TI not in salas:
+            salas.append(SALA_TI)
+    return salas
+
+def entrar_nas_salas(usuario) -> List[str]:
+    """Inscreve a conexão atual (handler Socket.IO) nas salas do usuário"""
+    salas = salas_do_usuario(usuario)
+    for sala in salas:
+        join_room(sala)
+    return salas
+
+# ==================== AGRUPAMENTO ====================
+
+class AgrupadorEventos:
+    """Retém eventos em rajada e emite as atualizações combinadas por registro"""
+
+    def __init__(self, intervalo_ms: int = INTERVALO_AGRUPAMENTO_MS):
+        self.intervalo = intervalo_ms / 1000.0
+        self.ativo = False
+        self._lock = threading.Lock()
+        # salas -> {(evento, chave): dados}, em ordem de chegada
+        self._pendentes: Dict[Tuple[str, ...], Dict[Tuple, Dict]] = {}
+        self._stats = {'recebidos': 0, 'emitidos': 0, 'lotes': 0}
+
+    def adicionar(self, evento: str, dados: Dict, salas: Tuple[str, ...]):
+        campo, preservados = EVENTOS_AGRUPADOS[evento]
+        chave = (evento, dados.get(campo))
+        with self._lock:
+            self._stats['recebidos'] += 1
+            pendentes = self._pendentes.setdefault(salas, {})
+            anterior = pendentes.get(chave)
+            if anterior:
+                combinado = dict(anterior, **dados)
+                for nome in preservados:
+                    if nome in anterior:
+                        combinado[nome] = anterior[nome]
+                dados = combinado
+            pendentes[chave] = dados
+
+    def descarregar(self, socketio) -> int:
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, {}
+        emitidos = 0
+        for salas, eventos in pendentes.items():
+            itens = [{'evento': evento, 'dados': dados} for (evento, _), dados in eventos.items()]
+            if len(itens) == 1:
+                socketio.emit(itens[0]['evento'], itens[0]['dados'], to=list(salas))
+            else:
+                socketio.emit(EVENTO_LOTE, {'eventos': itens}, to=list(salas))
+                with self._lock:
+                    self._stats['lotes'] += 1
+            emitidos += len(itens)
+        with self._lock:
+            self._stats['emitidos'] += emitidos
+        return emitidos
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def executar(self, socketio):
+        while True:
+            socketio.sleep(self.intervalo)
+            try:
+                self.descarregar(socketio)
+            except Exception as e:
+                logger.error(f"Erro ao emitir eventos agrupados: {str(e)}")
+
+agrupador_eventos = AgrupadorEventos()
+
+def emitir(evento: str, dados: Dict, salas: Iterable[str], socketio=None):
+    """
+    Emite um evento só para as salas indicadas
+
+    Args:
+        socketio: instância a usar fora do contexto da aplicação (tarefas de fundo)
+    """
+    socketio = socketio or current_app.socketio
+    salas = tuple(dict.fromkeys(salas))
+    if evento in EVENTOS_AGRUPADOS and agrupador_eventos.ativo:
+        agrupador_eventos.adicionar(evento, dados, salas)
+        return
+    socketio.emit(evento, dados, to=list(salas))
+
+def iniciar_tempo_real(app, socketio):
+    """Inicia o agrupamento de eventos em rajada"""
+    agrupador_eventos.ativo = True
+    socketio.start_background_task(agrupador_eventos.executar, socketio)
+
+# ==================== FILA DE MENSAGENS ====================
+
+class FilaLocal(python_socketio.PubSubManager):
+    """
+    Fila de mensagens em memória: liga os servidores Socket.IO do mesmo processo
+
+    Substitui o Redis/RabbitMQ em testes e em desenvolvimento com mais de um servidor.
+    """
+    name = 'local'
+    _canais: Dict[str, List[queue.Queue]] = {}
+    _lock_canais = threading.Lock()
+
+    def _publish(self, data):
+        mensagem = json.dumps(data)
+        with self._lock_canais:
+            assinantes = list(self._canais.get(self.channel, []))
+        for fila in assinantes:
+            fila.put(mensagem)
+
+    def _listen(self):
+        fila = queue.Queue()
+        with self._lock_canais:
+            self._canais.setdefault(self.channel, []).append(fila)
+        while True:
+            yield fila.get()
+
+def opcoes_fila_mensagens(url: Optional[str], canal: str = 'flask-socketio') -> Dict:
+    """Parâmetros do SocketIO para a fila configurada (vazio = processo único)"""
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': FilaLocal(channel=canal)}
+    return {'message_queue': url, 'channel': canal}
@@ -0,0 +1,124 @@
+"""
+Travas com prazo (leases) entre processos
+
+Com vários workers, cada processo executa as tarefas de fundo iniciadas no
+app.py. As que devem rodar em um único processo (varreduras, reconstruções,
+retomada de tarefas interrompidas) adquirem uma linha de TravaProcesso: um
+UPDATE condicional só a entrega se estiver livre, vencida ou já pertencer ao
+processo. O detentor renova a trava antes do prazo; se o processo morre, a
+trava vence e outro processo assume.
+"""
+import logging
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import db, TravaProcesso, get_brazil_time
+
+logger = logging.getLogger(__name__)
+
+def identidade_processo() -> str:
+    """Identificação do processo atual como dono de travas ('host:pid')"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def adquirir_trava(nome: str, duracao: float, apenas_vencida: bool = False) -> bool:
+    """
+    Adquire ou renova a trava por duracao segundos
+
+    Com apenas_vencida=True, só assume uma trava livre ou vencida, mesmo que
+    pertença a este processo (usado para recuperar tarefas interrompidas).
+
+    Returns:
+        True se a trava pertence a este processo até o novo prazo
+    """
+    tabela = TravaProcesso.__table__
+    dono = identidade_processo()
+    agora = get_brazil_time().replace(tzinfo=None)
+    valores = {'dono': dono, 'expira_em': agora + timedelta(seconds=duracao), 'atualizado_em': agora}
+    disponivel = tabela.c.expira_em < agora
+    if not apenas_vencida:
+        disponivel = or_(tabela.c.dono == dono, disponivel)
+    try:
+        with db.engine.begin() as conn:
+            atualizados = conn.execute(
+                update(tabela).where(tabela.c.nome == nome, disponivel).values(**valores)
+            ).rowcount
+            if atualizados:
+                return True
+            if conn.execute(select(tabela.c.nome).where(tabela.c.nome == nome)).first():
+                return False
+            conn.execute(tabela.insert().values(nome=nome, **valores))
+            return True
+    except IntegrityError:
+        # Outro processo criou a trava ao mesmo tempo
+        return False
+
+def liberar_trava(nome: str):
+    """Libera a trava, se pertencer a este processo"""
+    tabela = TravaProcesso.__table__
+    with db.engine.begin() as conn:
+        conn.execute(delete(tabela).where(tabela.c.nome == nome, tabela.c.dono == identidade_processo()))
+
+def trava_ativa(nome: str) -> bool:
+    """Verifica se algum processo detém a trava dentro do prazo"""
+    tabela = TravaProcesso.__table__
+    agora = get_brazil_time().replace(tzinfo=None)
+    with db.engine.connect() as conn:
+        return conn.execute(
+            select(tabela.c.nome).where(tabela.c.nome == nome, tabela.c.expira_em >= agora)
+        ).first() is not None
+
+class Concessao:
+    """Trava mantida por manter_trava; perdida é sinalizada se a renovação falhar"""
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.perdida = threading.Event()
+        self._parar = threading.Event()
+
+    @property
+    def valida(self) -> bool:
+        return not self.perdida.is_set()
+
+@contextmanager
+def manter_trava(app, nome: str, duracao: float):
+    """
+    Adquire a trava e a renova em segundo plano enquanto o bloco executa
+
+    Produz uma Concessao, ou None se a trava pertence a outro processo. Tarefas
+    longas devem consultar concessao.valida e parar se a trava for perdida.
+    """
+    if not adquirir_trava(nome, duracao):
+        yield None
+        return
+
+    concessao = Concessao(nome)
+
+    def _renovar():
+        with app.app_context():
+            while not concessao._parar.wait(duracao / 3):
+                try:
+                    if not adquirir_trava(nome, duracao):
+                        logger.warning(f"Trava {nome} assumida por outro processo")
+                        concessao.perdida.set()
+                        return
+                except Exception as e:
+                    logger.warning(f"Erro ao renovar a trava {nome}: {str(e)}")
+
+    renovacao = threading.Thread(target=_renovar, name=f'trava-{nome}', daemon=True)
+    renovacao.start()
+    try:
+        yield concessao
+    finally:
+        concessao._parar.set()
+        renovacao.join()
+        if concessao.valida:
+            try:
+                liberar_trava(nome)
+            except Exception as e:
+                logger.warning(f"Erro ao liberar a trava {nome}: {str(e)}")
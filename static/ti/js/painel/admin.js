@@ -1,20 +1,63 @@
 // ==================== SISTEMA DE ADMINISTRAÇÃO AVANÇADO ====================
 
 // Variáveis globais para o sistema de administração
-let currentLogsAcessoPage = 1;
-let currentLogsAcoesPage = 1;
 let currentAlertasPage = 1;
-let currentBackupsPage = 1;
+
+// Listagens paginadas por cursor: cursores[n - 1] abre a página n
+const estadoLogsAcesso = { cursores: [null], filtros: {}, total: null };
+const estadoLogsAcoes = { cursores: [null], filtros: {}, total: null };
+const estadoBackups = { cursores: [null], filtros: {}, total: null };
+
+// ==================== PAGINAÇÃO POR CURSOR ====================
+
+function parametrosPaginaCursor(estado, page, limite, filtros, manterFiltros) {
+    if (page === 1 && !manterFiltros) {
+        estado.cursores = [null];
+        estado.filtros = filtros;
+    }
+
+    const params = new URLSearchParams({ limit: limite, ...estado.filtros });
+    const cursor = estado.cursores[page - 1];
+    if (cursor) {
+        params.set('cursor', cursor);
+    } else {
+        // Primeira página: pede a contagem estimada (limitada no servidor)
+        params.set('total', 'estimado');
+    }
+    return params;
+}
+
+function renderizarPaginacaoCursor(containerId, funcao, estado, page, pagination) {
+    const container = document.getElementById(containerId);
+    if (!container) return;
+
+    if (pagination.proximo_cursor) {
+        estado.cursores[page] = pagination.proximo_cursor;
+    }
+    if (pagination.total_estimado !== undefined) {
+        estado.total = `${pagination.total_estimado}${pagination.total_limitado ? '+' : ''}`;
+    }
+
+    let html = '';
+
+    if (page > 1) {
+        html += `<button onclick="${funcao}(${page - 1}, {}, true)" class="btn btn-sm btn-outline-primary">Anterior</button>`;
+    }
+
+    html += `<span class="btn btn-sm disabled">Página ${page}${estado.total !== null ? ` · ${estado.total} registros` : ''}</span>`;
+
+    if (pagination.has_next) {
+        html += `<button onclick="${funcao}(${page + 1}, {}, true)" class="btn btn-sm btn-outline-primary">Próximo</button>`;
+    }
+
+    container.innerHTML = html;
+}
 
 // ==================== LOGS DE ACESSO ====================
 
-async function carregarLogsAcesso(page = 1, filtros = {}) {
+async function carregarLogsAcesso(page = 1, filtros = {}, manterFiltros = false) {
     try {
-        const params = new URLSearchParams({
-            page: page,
-            per_page: 20,
-            ...filtros
-        });
+        const params = parametrosPaginaCursor(estadoLogsAcesso, page, 20, filtros, manterFiltros);
 
         const response = await fetch(`/ti/painel/api/logs/acesso?${params}`);
         if (!response.ok) {
@@ -23,7 +66,7 @@ async function carregarLogsAcesso(page = 1, filtros = {}) {
 
         const data = await response.json();
         renderizarLogsAcesso(data.logs);
-        renderizarPaginacaoLogsAcesso(data.pagination);
+        renderizarPaginacaoCursor('paginationLogsAcesso', 'carregarLogsAcesso', estadoLogsAcesso, page, data.pagination);
         
         // Carregar estatísticas
         carregarEstatisticasAcessos();
@@ -63,30 +106,6 @@ function renderizarLogsAcesso(logs) {
     `).join('');
 }
 
-function renderizarPaginacaoLogsAcesso(pagination) {
-    const container = document.getElementById('paginationLogsAcesso');
-    if (!container) return;
-
-    let html = '';
-    
-    // Botão anterior
-    if (pagination.has_prev) {
-        html += `<button onclick="carregarLogsAcesso(${pagination.page - 1})" class="btn btn-sm btn-outline-primary">Anterior</button>`;
-    }
-    
-    // Números das páginas
-    for (let i = Math.max(1, pagination.page - 2); i <= Math.min(pagination.pages, pagination.page + 2); i++) {
-        html += `<button onclick="carregarLogsAcesso(${i})" class="btn btn-sm ${i === pagination.page ? 'btn-primary' : 'btn-outline-primary'}">${i}</button>`;
-    }
-    
-    // Botão próximo
-    if (pagination.has_next) {
-        html += `<button onclick="carregarLogsAcesso(${pagination.page + 1})" class="btn btn-sm btn-outline-primary">Próximo</button>`;
-    }
-    
-    container.innerHTML = html;
-}
-
 async function carregarEstatisticasAcessos() {
     try {
         const response = await fetch('/ti/painel/api/logs/acesso/estatisticas');
@@ -108,13 +127,9 @@ async function carregarEstatisticasAcessos() {
 
 // ==================== LOGS DE AÇÕES ====================
 
-async function carregarLogsAcoes(page = 1, filtros = {}) {
+async function carregarLogsAcoes(page = 1, filtros = {}, manterFiltros = false) {
     try {
-        const params = new URLSearchParams({
-            page: page,
-            per_page: 20,
-            ...filtros
-        });
+        const params = parametrosPaginaCursor(estadoLogsAcoes, page, 20, filtros, manterFiltros);
 
         const response = await fetch(`/ti/painel/api/logs/acoes?${params}`);
         if (!response.ok) {
@@ -123,7 +138,7 @@ async function carregarLogsAcoes(page = 1, filtros = {}) {
 
         const data = await response.json();
         renderizarLogsAcoes(data.logs);
-        renderizarPaginacaoLogsAcoes(data.pagination);
+        renderizarPaginacaoCursor('paginationLogsAcoes', 'carregarLogsAcoes', estadoLogsAcoes, page, data.pagination);
         
     } catch (error) {
         console.error('Erro ao carregar logs de ações:', error);
@@ -155,27 +170,6 @@ function renderizarLogsAcoes(logs) {
     `).join('');
 }
 
-function renderizarPaginacaoLogsAcoes(pagination) {
-    const container = document.getElementById('paginationLogsAcoes');
-    if (!container) return;
-
-    let html = '';
-    
-    if (pagination.has_prev) {
-        html += `<button onclick="carregarLogsAcoes(${pagination.page - 1})" class="btn btn-sm btn-outline-primary">Anterior</button>`;
-    }
-    
-    for (let i = Math.max(1, pagination.page - 2); i <= Math.min(pagination.pages, pagination.page + 2); i++) {
-        html += `<button onclick="carregarLogsAcoes(${i})" class="btn btn-sm ${i === pagination.page ? 'btn-primary' : 'btn-outline-primary'}">${i}</button>`;
-    }
-    
-    if (pagination.has_next) {
-        html += `<button onclick="carregarLogsAcoes(${pagination.page + 1})" class="btn btn-sm btn-outline-primary">Próximo</button>`;
-    }
-    
-    container.innerHTML = html;
-}
-
 async function carregarTiposAcoes() {
     try {
         const response = await fetch('/ti/admin/api/logs/acoes/tipos');
@@ -371,7 +365,7 @@ async function gerarRelatorioUsuarios() {
             data_fim: dataFim
         });
 
-        const response = await fetch(`/ti/admin/api/relatorios/usuarios?${params}`);
+        const response = await fetch(`/ti/painel/api/relatorios/usuarios?${params}`);
         if (!response.ok) {
             throw new Error('Erro ao gerar relatório');
         }
@@ -553,21 +547,18 @@ async function carregarBackupManutencao() {
     carregarHistoricoBackups();
 }
 
-async function carregarHistoricoBackups(page = 1) {
+async function carregarHistoricoBackups(page = 1, filtros = {}, manterFiltros = false) {
     try {
-        const params = new URLSearchParams({
-            page: page,
-            per_page: 10
-        });
+        const params = parametrosPaginaCursor(estadoBackups, page, 10, filtros, manterFiltros);
 
-        const response = await fetch(`/ti/admin/api/backup/historico?${params}`);
+        const response = await fetch(`/ti/painel/api/backup/historico?${params}`);
         if (!response.ok) {
             throw new Error('Erro ao carregar histórico de backups');
         }
 
         const data = await response.json();
         renderizarHistoricoBackups(data.backups);
-        renderizarPaginacaoBackups(data.pagination);
+        renderizarPaginacaoCursor('paginationBackups', 'carregarHistoricoBackups', estadoBackups, page, data.pagination);
         
     } catch (error) {
         console.error('Erro ao carregar histórico de backups:', error);
@@ -612,33 +603,12 @@ function getStatusBackupClass(status) {
     return classes[status] || 'secondary';
 }
 
-function renderizarPaginacaoBackups(pagination) {
-    const container = document.getElementById('paginationBackups');
-    if (!container) return;
-
-    let html = '';
-    
-    if (pagination.has_prev) {
-        html += `<button onclick="carregarHistoricoBackups(${pagination.page - 1})" class="btn btn-sm btn-outline-primary">Anterior</button>`;
-    }
-    
-    for (let i = Math.max(1, pagination.page - 2); i <= Math.min(pagination.pages, pagination.page + 2); i++) {
-        html += `<button onclick="carregarHistoricoBackups(${i})" class="btn btn-sm ${i === pagination.page ? 'btn-primary' : 'btn-outline-primary'}">${i}</button>`;
-    }
-    
-    if (pagination.has_next) {
-        html += `<button onclick="carregarHistoricoBackups(${pagination.page + 1})" class="btn btn-sm btn-outline-primary">Próximo</button>`;
-    }
-    
-    container.innerHTML = html;
-}
-
 async function criarBackup() {
     try {
         const tipo = document.getElementById('tipoBackup').value;
         const observacoes = document.getElementById('observacoesBackup').value;
 
-        const response = await fetch('/ti/admin/api/backup/criar', {
+        const response = await fetch('/ti/painel/api/backup/criar', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -656,7 +626,7 @@ async function criarBackup() {
         const data = await response.json();
         
         if (window.advancedNotificationSystem) {
-            window.advancedNotificationSystem.showSuccess('Backup Criado', data.message);
+            window.advancedNotificationSystem.showSuccess('Backup Iniciado', data.message);
         }
         
         // Limpar formulário
@@ -664,6 +634,7 @@ async function criarBackup() {
         
         // Recarregar histórico
         carregarHistoricoBackups();
+        acompanharBackup(data.backup.id);
         
     } catch (error) {
         console.error('Erro ao criar backup:', error);
@@ -673,6 +644,38 @@ async function criarBackup() {
     }
 }
 
+// Atualizar o histórico enquanto o backup estiver em andamento
+function acompanharBackup(backupId) {
+    if (!backupId) return;
+    
+    const intervalo = setInterval(async () => {
+        try {
+            const response = await fetch(`/ti/painel/api/backup/${backupId}/progresso`);
+            if (!response.ok) throw new Error('Erro ao consultar progresso do backup');
+            
+            const progresso = await response.json();
+            
+            if (progresso.status !== 'em_progresso') {
+                clearInterval(intervalo);
+                carregarHistoricoBackups();
+                if (window.advancedNotificationSystem) {
+                    if (progresso.status === 'concluido') {
+                        window.advancedNotificationSystem.showSuccess(
+                            'Backup Concluído',
+                            `${progresso.registros} registros, ${progresso.tamanho_mb} MB`
+                        );
+                    } else {
+                        window.advancedNotificationSystem.showError('Erro', progresso.erro_detalhes || 'Erro durante execução do backup');
+                    }
+                }
+            }
+        } catch (error) {
+            console.error('Erro ao acompanhar backup:', error);
+            clearInterval(intervalo);
+        }
+    }, 3000);
+}
+
 // ==================== CONFIGURAÇÕES AVANÇADAS ====================
 
 async function carregarConfiguracoesAvancadas() {
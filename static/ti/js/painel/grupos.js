@@ -495,13 +495,14 @@ async function enviarEmailGrupo() {
         
         if (window.advancedNotificationSystem) {
             window.advancedNotificationSystem.showSuccess(
-                'Email Enviado', 
-                `${result.sucessos} emails enviados com sucesso${result.falhas > 0 ? `, ${result.falhas} falharam` : ''}`
+                'Envio Iniciado', 
+                `${result.total} emails sendo enviados em segundo plano`
             );
         }
         
         fecharModalEnviarEmail();
         carregarEmailsHistorico();
+        acompanharEnvioEmail(result.email_massa_id);
         
     } catch (error) {
         console.error('Erro ao enviar email:', error);
@@ -511,6 +512,34 @@ async function enviarEmailGrupo() {
     }
 }
 
+// Atualizar o histórico enquanto o envio em massa estiver em andamento
+function acompanharEnvioEmail(emailMassaId) {
+    if (!emailMassaId) return;
+    
+    const intervalo = setInterval(async () => {
+        try {
+            const response = await fetch(`/ti/painel/api/grupos/emails-massa/${emailMassaId}/progresso`);
+            if (!response.ok) throw new Error('Erro ao consultar progresso do envio');
+            
+            const progresso = await response.json();
+            carregarEmailsHistorico();
+            
+            if (progresso.status !== 'enviando' && progresso.status !== 'preparando') {
+                clearInterval(intervalo);
+                if (window.advancedNotificationSystem) {
+                    window.advancedNotificationSystem.showSuccess(
+                        'Email Enviado', 
+                        `${progresso.enviados_count} emails enviados com sucesso${progresso.falhas_count > 0 ? `, ${progresso.falhas_count} falharam` : ''}`
+                    );
+                }
+            }
+        } catch (error) {
+            console.error('Erro ao acompanhar envio de email:', error);
+            clearInterval(intervalo);
+        }
+    }, 3000);
+}
+
 // Carregar usuários para seleção no grupo
 async function carregarUsuariosParaGrupo() {
     try {
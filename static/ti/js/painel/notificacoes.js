@@ -144,6 +144,13 @@ class AdvancedNotificationSystem {
                 timeout: 20000
             });
 
+            // Atualizações agrupadas pelo servidor: repassa cada uma ao handler do evento
+            this.socket.on('lote_eventos', (lote) => {
+                (lote.eventos || []).forEach(({ evento, dados }) => {
+                    this.socket.listeners(evento).forEach((handler) => handler(dados));
+                });
+            });
+
             this.socket.on('connect', () => {
                 console.log('Socket.IO conectado para notificações');
                 this.updateConnectionStatus('connected');
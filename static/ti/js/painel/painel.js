@@ -2934,6 +2934,15 @@ function initializeSocketIO() {
             maxReconnectionAttempts: 10
         });
 
+        // Atualizações agrupadas pelo servidor: repassa cada uma ao handler do evento
+        socket.on('lote_eventos', function(lote) {
+            (lote.eventos || []).forEach(function(item) {
+                socket.listeners(item.evento).forEach(function(handler) {
+                    handler(item.dados);
+                });
+            });
+        });
+
         socket.on('connect', function() {
             console.log('Socket.IO conectado com sucesso!');
             updateSocketStatus('Conectado', 'success');
@@ -0,0 +1,77 @@
+"""
+Testes do cache do usuário autenticado (auth/cache_usuarios.py)
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+from flask_login import LoginManager
+from werkzeug.security import generate_password_hash
+
+from auth import auth_bp
+from auth.cache_usuarios import carregar_usuario, invalidar_cache_usuario
+from database import db, User
+
+SENHA_ANTIGA = 'Antiga123'
+SENHA_NOVA = 'Nova12345'
+
+
+class AlterarSenhaTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config.update(
+            SECRET_KEY='teste', TESTING=True,
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.diretorio, 'usuarios.db'),
+        )
+        db.init_app(self.app)
+        login_manager = LoginManager()
+        login_manager.init_app(self.app)
+        login_manager.user_loader(lambda user_id: carregar_usuario(int(user_id)))
+        self.app.register_blueprint(auth_bp)
+
+        with self.app.app_context():
+            db.create_all()
+            usuario = User(nome='Ana', sobrenome='Souza', usuario='ana', email='ana@exemplo.com',
+                           senha_hash=generate_password_hash(SENHA_ANTIGA), nivel_acesso='Usuário')
+            db.session.add(usuario)
+            db.session.commit()
+            self.user_id = usuario.id
+        invalidar_cache_usuario()
+
+        self.cliente = self.app.test_client()
+        with self.cliente.session_transaction() as sessao:
+            sessao['_user_id'] = str(self.user_id)
+            sessao['_fresh'] = True
+
+    def tearDown(self):
+        invalidar_cache_usuario()
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def _alterar(self, senha_atual):
+        return self.cliente.post('/auth/alterar_senha', data={
+            'senha_atual': senha_atual, 'nova_senha': SENHA_NOVA, 'confirmar_senha': SENHA_NOVA,
+        })
+
+    def test_senha_alterada_vale_na_proxima_requisicao(self):
+        self.assertEqual(self._alterar(SENHA_ANTIGA).status_code, 302)
+
+        with self.app.test_request_context():
+            usuario = carregar_usuario(self.user_id)
+            self.assertTrue(usuario.check_password(SENHA_NOVA))
+            self.assertFalse(usuario.check_password(SENHA_ANTIGA))
+
+        # A senha antiga não autentica mais a troca de senha
+        self._alterar(SENHA_ANTIGA)
+        with self.cliente.session_transaction() as sessao:
+            mensagens = [mensagem for _, mensagem in sessao.get('_flashes', [])]
+        self.assertIn('Senha atual incorreta', mensagens)
+
+
+if __name__ == '__main__':
+    unittest.main()
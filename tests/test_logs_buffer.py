@@ -0,0 +1,79 @@
+"""
+Testes da gravação em lote dos logs (setores/ti/logs_buffer.py)
+"""
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from flask import Flask
+
+from database import db, LogAcao
+from setores.ti.logs_buffer import BufferLogs, PREFIXO_CONTINGENCIA
+
+
+def _acao(acao):
+    return {'usuario_id': 1, 'acao': acao, 'categoria': 'teste', 'sucesso': True,
+            'data_acao': datetime(2026, 1, 2, 10, 0)}
+
+
+class GravacaoTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.diretorio, 'logs.db')
+        db.init_app(self.app)
+        self.contexto = self.app.app_context()
+        self.contexto.push()
+        db.create_all()
+        self.buffer = BufferLogs(diretorio=self.diretorio)
+        self.buffer.ativo = True
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.contexto.pop()
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def _contingencia(self):
+        return glob.glob(os.path.join(self.diretorio, PREFIXO_CONTINGENCIA + '*'))
+
+    def test_linha_invalida_nao_leva_o_lote_para_a_contingencia(self):
+        for acao in ('primeira', None, 'terceira'):  # acao é NOT NULL
+            self.buffer.adicionar(LogAcao.__tablename__, _acao(acao))
+
+        self.assertEqual(self.buffer.gravar(), 2)
+        self.assertEqual(sorted(a for (a,) in db.session.query(LogAcao.acao)), ['primeira', 'terceira'])
+        self.assertEqual(self._contingencia(), [])
+        stats = self.buffer.get_stats()
+        self.assertEqual((stats['gravados'], stats['descartados'], stats['contingencia']), (2, 1, 0))
+
+    def test_contingencia_com_linha_invalida_e_esvaziada(self):
+        self.buffer._salvar_contingencia([
+            (LogAcao.__tablename__, _acao('salva')), (LogAcao.__tablename__, _acao(None))
+        ])
+
+        self.assertEqual(self.buffer.gravar(), 1)
+        self.assertEqual([a for (a,) in db.session.query(LogAcao.acao)], ['salva'])
+        self.assertEqual(self._contingencia(), [])
+        self.assertEqual(self.buffer.gravar(), 0)
+
+    def test_banco_inacessivel_usa_a_contingencia(self):
+        inacessivel = Flask(__name__)
+        inacessivel.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.diretorio, 'nao', 'existe.db')
+        db.init_app(inacessivel)
+        with inacessivel.app_context():
+            self.buffer.adicionar(LogAcao.__tablename__, _acao('adiada'))
+            self.assertEqual(self.buffer.gravar(), 0)
+            db.engine.dispose()
+        self.assertEqual(len(self._contingencia()), 1)
+
+        self.assertEqual(self.buffer.gravar(), 1)
+        self.assertEqual([a for (a,) in db.session.query(LogAcao.acao)], ['adiada'])
+        self.assertEqual(self._contingencia(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+Testes da triagem de entrada (security/screening.py)
+"""
+import unittest
+
+from security.input_validator import MALICIOUS_RULES
+from security.middleware import SUSPICIOUS_RULES
+from security.screening import ScreeningEngine, RULE_MAX_DEPTH
+
+
+class ScanTest(unittest.TestCase):
+    def setUp(self):
+        self.middleware = ScreeningEngine(SUSPICIOUS_RULES)
+        self.validator = ScreeningEngine(MALICIOUS_RULES)
+
+    def test_script_em_varias_linhas_e_bloqueado(self):
+        payload = {'descricao': '<script>\nalert(1)\n</script>'}
+        self.assertEqual(self.middleware.scan(payload), 'xss_script')
+        self.assertIsNotNone(self.validator.scan(payload))
+
+    def test_script_em_varias_linhas_em_lista_aninhada(self):
+        payload = {'itens': [{'texto': 'ok'}, ['<SCRIPT>\r\nx\n</script>']]}
+        self.assertEqual(self.middleware.scan(payload), 'xss_script')
+
+    def test_strings_vizinhas_nao_formam_acerto(self):
+        self.assertIsNone(self.middleware.scan({'a': ['=1', 'Monica']}))
+        self.assertIsNone(self.middleware.scan({'union': 'select'}))
+        self.assertIsNone(self.middleware.scan(['drop', 'table']))
+
+    def test_chave_suspeita_e_bloqueada(self):
+        self.assertEqual(self.middleware.scan({'onclick=': 1}), 'xss_event_handler')
+
+    def test_limite_de_profundidade(self):
+        engine = ScreeningEngine(SUSPICIOUS_RULES, max_depth=3)
+        self.assertEqual(engine.scan([[[[['x']]]]]), RULE_MAX_DEPTH)
+
+    def test_estrutura_segura(self):
+        self.assertIsNone(self.middleware.scan({'titulo': 'Impressora', 'tags': ['rede', 'andar 2'], 'n': 3}))
+
+
+class CheckValuesTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = ScreeningEngine(SUSPICIOUS_RULES)
+
+    def test_chave_e_valor_verificados_separadamente(self):
+        self.assertIsNone(self.engine.check_values([('union', 'select x'), ('a', '=1'), ('b', 'Monica')]))
+
+    def test_valor_suspeito(self):
+        self.assertEqual(self.engine.check_values([('q', 'x union select 1')]), 'sql_union_select')
+        self.assertEqual(self.engine.get_stats(), {'sql_union_select': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()